@@ -0,0 +1,172 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import json
+import tempfile
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Exercise the execution history
+outbox (kpf.observatoryAPIs.outbox) against a local stand-in of the
+proposals API which can be slow or down. Compares the time RunOB spends
+submitting history directly with queueing it, and the delivery once the
+API comes back. The outbox behaviour is covered by tests/test_outbox.py.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=50,
+               help="Number of history records (default: 50)")
+p.add_argument("-l", "--latency", dest="latency", type=float, default=0.1,
+               help="API latency per request in seconds (default: 0.1)")
+args = p.parse_args()
+
+tmpdir = Path(tempfile.mkdtemp())
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+os.environ['KPF_OUTBOX'] = str(tmpdir / 'outbox.sqlite')
+os.environ['APIHASH'] = 'standin'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import cfg
+from kpf import httpclient
+from kpf import observatoryAPIs
+from kpf.observatoryAPIs import outbox as outbox_module
+from kpf.observatoryAPIs.outbox import Outbox
+
+
+##-------------------------------------------------------------------------
+## Stand-in proposals API
+##-------------------------------------------------------------------------
+class StandIn(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.down = False
+        self.received = []
+        self.keys = set()
+
+standin = StandIn()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length))
+        key = self.headers.get('Idempotency-Key')
+        time.sleep(args.latency)
+        if standin.down is True:
+            status, result = 503, {}
+        else:
+            status, result = 200, {'status': 'COMPLETE'}
+            with standin.lock:
+                # A repeated key is acknowledged but not recorded twice
+                if key not in standin.keys:
+                    standin.keys.add(key)
+                    standin.received.append((key, body))
+        data = json.dumps(result).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def history(OBID, i):
+    return {'id': OBID, 'observer': 'Observer',
+            'exposure_start_times': [f"2026-10-18T10:{i//60:02d}:{i%60:02d}.00"],
+            'exposure_times': [30.0]}
+
+
+def restart(**settings):
+    '''A new process: a new Outbox on the same file.'''
+    for key, value in settings.items():
+        cfg.set('outbox', key, str(value))
+    if outbox_module.outbox is not None:
+        outbox_module.outbox.stopping = True
+        outbox_module.outbox.wake.set()
+    outbox_module.outbox = Outbox()
+    return outbox_module.outbox
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cfg.set('ObservatoryAPIs', 'proposal_url',
+            f"http://127.0.0.1:{server.server_address[1]}/api/proposals/")
+    cfg.set('httpclient', 'retries', '0')
+    cfg.set('httpclient', 'failure_threshold', '1000')
+    # The wrappers skip the query when the simulated KTL backend is in use
+    observatoryAPIs.simulate = False
+    OBIDs = [f"{i:024x}" for i in range(5)]
+    records = [history(OBIDs[i % len(OBIDs)], i) for i in range(args.number)]
+    print(f"{args.number} history records, {args.latency*1000:.0f} ms API latency")
+
+    # Direct submission, as RunOB used to
+    tick = time.perf_counter()
+    for h in records[:10]:
+        observatoryAPIs.addObservingBlockHistory(dict(h))
+    direct = (time.perf_counter() - tick)/10
+    standin.received.clear()
+    standin.keys.clear()
+
+    # Queued while the API is down
+    outbox = restart(backoff=0.1, max_backoff=1)
+    standin.down = True
+    tick = time.perf_counter()
+    keys = [observatoryAPIs.queueObservingBlockHistory(dict(h)) for h in records]
+    queued = (time.perf_counter() - tick)/len(records)
+    print(f"direct submission {direct*1000:8.2f} ms/record")
+    print(f"queued            {queued*1000:8.2f} ms/record")
+    assert len(set(keys)) == len(records)
+    heads = lambda: [r for r in outbox.records() if r.seq <= len(OBIDs)]
+    wait_for(lambda: all([r.attempts >= 2 for r in heads()]))
+    counts = outbox.counts()
+    assert len(standin.received) == 0
+    assert counts['pending'] + counts['sending'] == len(records)
+    # Only the first record of each OB is attempted while the API is down
+    attempted = [r for r in outbox.records() if r.attempts > 0]
+    assert len(attempted) == len(OBIDs)
+    print(f"API down: {len(attempted)} records attempted, {args.number} waiting")
+
+    # Delivered when the API comes back, in order within each OB
+    standin.down = False
+    wait_for(lambda: outbox.counts()['sent'] == len(records))
+    assert [k for k, body in standin.received] != []
+    for OBID in OBIDs:
+        sent = [body['exposure_start_times'] for k, body in standin.received if body['id'] == OBID]
+        expected = [h['exposure_start_times'] for h in records if h['id'] == OBID]
+        assert sent == expected
+    assert sorted([k for k, body in standin.received]) == sorted(keys)
+    print(f"API back: {len(standin.received)} records delivered in order")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import json
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Exercise the shared HTTP client
+(kpf.httpclient) through the observatory API and MAGIQ wrappers against a
+local stand-in server with a fixed latency. Compares pooled keep-alive
+requests with a new connection per call. Retries, timeouts, and circuit
+breaking are covered by tests/test_httpclient.py.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=200,
+               help="Number of API calls for the keep-alive comparison (default: 200)")
+p.add_argument("-l", "--latency", dest="latency", type=float, default=0.002,
+               help="Server latency per request in seconds (default: 0.002)")
+args = p.parse_args()
+
+os.environ['KPF_METRICS'] = '0'
+os.environ['APIHASH'] = 'standin'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import requests
+
+from kpf import cfg
+from kpf import httpclient
+from kpf import observatoryAPIs
+
+
+##-------------------------------------------------------------------------
+## Stand-in server
+##-------------------------------------------------------------------------
+class StandIn(object):
+    '''Sleeps for latency seconds before each response and counts the
+    requests and connections.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, latency=0):
+        with self.lock:
+            self.latency = latency
+            self.requests = 0
+            self.connections = 0
+            self.received = []
+
+standin = StandIn()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with standin.lock:
+            standin.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, body):
+        with standin.lock:
+            standin.requests += 1
+            n = standin.requests
+            standin.received.append((self.command, self.path, body))
+        time.sleep(standin.latency)
+        url = urlparse(self.path)
+        data = json.dumps({'query': url.path, 'params': parse_qs(url.query),
+                           'body': body, 'n': n}).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_GET(self):
+        self.respond(None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.respond(self.rfile.read(length).decode())
+
+
+def configure(**settings):
+    '''Apply httpclient settings and start with a new client.'''
+    for key, value in settings.items():
+        cfg.set('httpclient', key, str(value))
+    if httpclient.client is not None:
+        httpclient.client.close()
+    httpclient.client = None
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    cfg.set('ObservatoryAPIs', 'proposal_url', f"{base}/api/proposals/")
+    cfg.set('ObservatoryAPIs', 'schedule_url', f"{base}/api/schedule/")
+    # The wrappers skip the query when the simulated KTL backend is in use
+    observatoryAPIs.simulate = False
+    configure(backoff=0.01, max_backoff=0.05, retries=2,
+              failure_threshold=5, reset_time=0.5)
+
+    # Keep-alive: one connection per call vs the pooled session
+    standin.reset(latency=args.latency)
+    url = f"{base}/api/proposals/getPI"
+    tick = time.perf_counter()
+    for i in range(args.number):
+        requests.get(url, params={'semid': '2026B_N123', 'hash': 'standin'}).json()
+    unpooled = time.perf_counter() - tick
+    unpooled_connections = standin.connections
+    standin.reset(latency=args.latency)
+    tick = time.perf_counter()
+    for i in range(args.number):
+        result = observatoryAPIs.getPI('2026B_N123')
+    pooled = time.perf_counter() - tick
+    print(f"new connection per call {unpooled/args.number*1000:6.2f} ms/call "
+          f"({unpooled_connections} connections)")
+    print(f"pooled session          {pooled/args.number*1000:6.2f} ms/call "
+          f"({standin.connections} connections)")
+    assert result['params']['semid'] == ['2026B_N123']
+    assert standin.connections == 1
+
+    for name, stats in httpclient.get_client().stats().items():
+        print(f"{name:9s} {stats['requests']:4d} requests {stats['attempts']:4d} attempts "
+              f"{stats['failed']:3d} failed {stats['rejected']:3d} rejected "
+              f"p50={stats['p50']*1000:.2f}ms p95={stats['p95']*1000:.2f}ms state={stats['state']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from pathlib import Path
+import argparse
+import statistics
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Compare the wall clock time of
+`kpfdo` invocations started cold (new interpreter, full imports) with those
+forwarded to a warm kpfdo server.
+''')
+p.add_argument('command', nargs='*', default=['--dry-run', 'WaitForReady'],
+               help="kpfdo arguments to time (default: --dry-run WaitForReady)")
+p.add_argument("-r", "--repeat", dest="repeat", type=int, default=10,
+               help="Number of invocations for each path")
+args = p.parse_args()
+
+kpfdo = Path(__file__).parent.parent / 'kpf' / 'kpfdo'
+kpfdo_server = Path(__file__).parent.parent / 'kpf' / 'kpfdo_server'
+
+
+def time_invocations(env):
+    times = []
+    for i in range(args.repeat):
+        tick = time.perf_counter()
+        subprocess.run([sys.executable, str(kpfdo)] + args.command, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - tick)
+    return times
+
+
+def report(label, times):
+    print(f"{label:5s}: median {statistics.median(times)*1000:8.1f} ms, "
+          f"min {min(times)*1000:8.1f} ms, max {max(times)*1000:8.1f} ms")
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    print(f"Timing {args.repeat} invocations of: kpfdo {' '.join(args.command)}")
+    cold_env = dict(os.environ, KPFDO_NOSERVER='1')
+    cold = time_invocations(cold_env)
+
+    socket_file = Path(tempfile.mkdtemp()) / 'kpfdo_benchmark.sock'
+    warm_env = dict(os.environ, KPFDO_SOCKET=str(socket_file))
+    server = subprocess.Popen([sys.executable, str(kpfdo_server), '--preload',
+                               '--socket', str(socket_file)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for i in range(600):
+            if socket_file.exists():
+                break
+            time.sleep(0.1)
+        else:
+            print('kpfdo server failed to start')
+            return
+        warm = time_invocations(warm_env)
+    finally:
+        server.terminate()
+        server.wait()
+
+    report('cold', cold)
+    report('warm', warm)
+    print(f"speed up: {statistics.median(cold)/statistics.median(warm):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
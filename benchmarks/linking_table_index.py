@@ -0,0 +1,72 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Time `kpfdo -l` and `kpfdo -h` for
+every entry in the linking table with and without the compiled linking table
+index, and the first `kpfdo -h` with an empty index (which captures the
+arguments of every function in a separate interpreter). Each invocation is a
+separate cold process (the warm kpfdo server is bypassed).
+''')
+p.add_argument("-e", "--entries", dest="entries", type=int, default=None,
+               help="Only time help for the first N entries")
+args = p.parse_args()
+
+kpfdo = Path(__file__).parent.parent / 'kpf' / 'kpfdo'
+linking_table = Path(__file__).parent.parent / 'kpf' / 'linking_table.yml'
+
+
+def run(kpfdo_args, env):
+    tick = time.perf_counter()
+    subprocess.run([sys.executable, str(kpfdo)] + kpfdo_args, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - tick
+
+
+def time_all(entries, env):
+    list_time = run(['-l'], env)
+    help_times = [run(['-h', entry], env) for entry in entries]
+    return list_time, help_times
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    with open(linking_table) as f:
+        entries = list(yaml.safe_load(f)['links'].keys())
+    if args.entries is not None:
+        entries = entries[:args.entries]
+    print(f"Timing kpfdo -l and kpfdo -h for {len(entries)} entries")
+
+    env = dict(os.environ, KPFDO_NOSERVER='1', KPFDO_INDEX='none')
+    before = time_all(entries, env)
+
+    index_file = Path(tempfile.mkdtemp()) / 'linking_table_index.json'
+    env = dict(os.environ, KPFDO_NOSERVER='1', KPFDO_INDEX=str(index_file))
+    build = run(['-h', entries[0]], env)
+    after = time_all(entries, env)
+
+    for label, (list_time, help_times) in [('before', before), ('after', after)]:
+        print(f"{label:6s}: list {list_time*1000:7.1f} ms, "
+              f"help total {sum(help_times):6.1f} s, "
+              f"mean {sum(help_times)/len(help_times)*1000:7.1f} ms, "
+              f"max {max(help_times)*1000:7.1f} ms")
+    print(f"first help with an empty index (builds it): {build:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
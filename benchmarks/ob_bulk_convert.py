@@ -0,0 +1,123 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import json
+import time
+import tempfile
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Bulk conversion of a synthetic
+archive of legacy OB files (kpf.ObservingBlocks.conversion, kpfdo
+ConvertOBs). Writes a corpus of v1 science, v1 calibration, and v2 OBs (YAML
+and JSON, with a few broken files) in a nested directory tree, then converts
+it serially and with a process pool and reports the throughput and per
+stage timing. Target names are resolved offline from a pre-filled target
+resolver cache so no network is needed. The conversion itself is tested
+by tests/test_conversion.py.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=10000,
+               help="Number of OB files in the corpus (default: 10000)")
+p.add_argument("-p", "--processes", dest="processes", type=int,
+               default=os.cpu_count(),
+               help="Number of worker processes (default: CPU count)")
+p.add_argument("-s", "--serial", dest="serial", type=int, default=500,
+               help="Number of files to convert serially for comparison (default: 500)")
+args = p.parse_args()
+
+tmpdir = Path(tempfile.mkdtemp())
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+os.environ['KPF_RESOLVER_CACHE'] = str(tmpdir / 'target_resolver.sqlite')
+os.environ['KPF_RESOLVER_OFFLINE'] = '1'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf.ObservingBlocks import TargetResolver
+from kpf.ObservingBlocks.conversion import convert_tree, ConversionReport, stages
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+def write_corpus(directory, number):
+    '''Write the synthetic corpus.'''
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    with open(exampleOBs / 'Calibrations.yaml') as f:
+        calibrations = yaml.safe_load(f)
+    science['Target']['RA'] = '12:23:11.79'
+    science['Target']['Dec'] = '-67:37:49.47'
+    cache = TargetResolver.get_cache()
+    for i in range(number):
+        subdir = directory / f"semester{i % 4}" / f"program{i % 37:02d}"
+        subdir.mkdir(parents=True, exist_ok=True)
+        kind = i % 20
+        if kind < 12:
+            # v1 science OB, target resolved by Gaia ID
+            GaiaID = f"DR3 {5859393710380907776 + i % 500}"
+            cache.write('simbad', f"Gaia {GaiaID}",
+                        dict(science['Target'], GaiaID=GaiaID))
+            OB = {'Template_Name': 'kpf_sci', 'Template_Version': 1.0,
+                  'TargetName': f"Target{i % 500:03d}", 'GaiaID': GaiaID,
+                  'SEQ_Observations': [dict(obs, ExpMeterBin=604)
+                                       for obs in science['Observations']]}
+        elif kind < 16:
+            OB = {'Template_Name': 'kpf_cal', 'Template_Version': 1.0,
+                  'SEQ_Calibrations': calibrations['Calibrations'][:1+i % 8]}
+        elif kind < 19:
+            OB = dict(science, id=f"{i:024x}")
+        else:
+            OB = dict(calibrations, id=f"{i:024x}")
+        if i % 100 == 98:
+            with open(subdir / f"OB{i:05d}.yaml", 'w') as f:
+                f.write(yaml.dump(OB)[:-40] + '\n  : [unbalanced\n')
+        elif i % 2 and kind >= 16:
+            with open(subdir / f"OB{i:05d}.json", 'w') as f:
+                json.dump(OB, f)
+        else:
+            with open(subdir / f"OB{i:05d}.yaml", 'w') as f:
+                yaml.dump(OB, f)
+
+
+def run(input_directory, output_directory, processes):
+    report = ConversionReport(output_directory / 'conversion_report.jsonl')
+    for result in convert_tree(input_directory, output_directory,
+                               processes=processes, overwrite=True):
+        report.add(result)
+    return report.close()
+
+
+def show(label, summary):
+    print(f"{label:10s} {summary['files']:6d} files {summary['elapsed']:7.1f} s "
+          f"{summary['OBs_per_s']:8.1f} OBs/s  "
+          + ' '.join([f"{stage}={summary['stage_mean'][stage]*1000:.2f}ms" for stage in stages]))
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    corpus = tmpdir / 'corpus'
+    tick = time.perf_counter()
+    write_corpus(corpus, args.number)
+    print(f"Wrote {args.number} OB files to {corpus} in {time.perf_counter()-tick:.1f} s")
+
+    subset = tmpdir / 'subset'
+    subset.mkdir()
+    files = sorted(corpus.rglob('*.yaml'))[:args.serial]
+    for file in files:
+        (subset / file.name).symlink_to(file)
+    show('serial', run(subset, tmpdir / 'serial', 1))
+
+    show(f"{args.processes} procs", run(corpus, tmpdir / 'converted', args.processes))
+
+
+if __name__ == '__main__':
+    main()
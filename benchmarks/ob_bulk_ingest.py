@@ -0,0 +1,112 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import json
+import tempfile
+import tracemalloc
+from pathlib import Path
+import argparse
+
+import numpy as np
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Compare building every
+ObservingBlock in a KPF-CC API response (get_OBs_from_KPFCC_API) with the
+columnar OBTable, which parses only the key fields up front and builds OBs
+on access. Uses a recorded getKPFObservingBlock response if one is given,
+otherwise records a synthetic one built from the example science OB.
+''')
+p.add_argument("-f", "--file", dest="file", type=str, default=None,
+               help="Recorded API response (JSON)")
+p.add_argument("-n", "--number", dest="number", type=int, default=5000,
+               help="Number of OBs in the synthetic response (default: 5000)")
+p.add_argument("--access", dest="access", type=int, default=20,
+               help="Number of rows to access after sorting (default: 20)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf.ObservingBlocks.OBTable import OBTable
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+def record_response(number, file):
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    rng = np.random.default_rng(42)
+    response = []
+    for i in range(number):
+        ra = rng.uniform(0, 24)
+        dec = rng.uniform(-40, 89)
+        target = dict(science['Target'],
+                      TargetName=f"Target{i:05d}",
+                      RA=f"{int(ra):02d}:{int(ra*60%60):02d}:{ra*3600%60:05.2f}",
+                      Dec=f"{'-' if dec < 0 else '+'}{int(abs(dec)):02d}:{int(abs(dec)*60%60):02d}:{abs(dec)*3600%60:04.1f}",
+                      PMRA=float(rng.normal(0, 100)),
+                      PMDEC=float(rng.normal(0, 100)),
+                      Gmag=float(rng.uniform(4, 14)),
+                      Epoch='2016.0')
+        response.append({'id': f"{i:024x}", 'semid': '2026B_K000', 'status': 'OB_FOUND',
+                         'Target': target, 'Observations': science['Observations']})
+    with open(file, 'w') as f:
+        json.dump(response, f)
+
+
+def measure(function):
+    tracemalloc.start()
+    tick = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - tick
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current, peak
+
+
+def load(file):
+    with open(file) as f:
+        return json.load(f)
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    file = args.file
+    if file is None:
+        file = Path(tempfile.mkdtemp()) / 'getKPFObservingBlock.json'
+        record_response(args.number, file)
+    # Warm up imports and schemas
+    OBTable(load(file)[:1]).get_OBs()
+
+    def columnar():
+        table = OBTable(load(file))
+        # Typical GUI use: sort by RA, show the first few rows
+        for i in table.argsort('RA')[:args.access]:
+            table[i]
+        return table
+
+    def full():
+        return OBTable(load(file)).get_OBs()
+
+    print(f"{'method':22s} {'time [s]':>9s} {'held [MB]':>10s} {'peak [MB]':>10s}")
+    table, elapsed, current, peak = measure(columnar)
+    print(f"{f'columnar + {args.access} OBs':22s} {elapsed:9.2f} "
+          f"{current/1024**2:10.1f} {peak/1024**2:10.1f}")
+    (OBs, failures), elapsed, current, peak = measure(full)
+    print(f"{'all OBs':22s} {elapsed:9.2f} "
+          f"{current/1024**2:10.1f} {peak/1024**2:10.1f}")
+    print(f"{len(table)} OBs in response, {len(OBs)} valid")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import json
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Cold and warm loading of a
+night plan through the persistent OB cache (kpf.ObservingBlocks.OBCache),
+as the OB GUI does with GetObservingBlocks, against a local fake of the
+proposals API with a fixed latency: cold, warm, revalidated with and
+without ETag support, and with the API down. The cache behaviour is
+covered by tests/test_ob_cache.py.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=60,
+               help="Number of OBs in the night plan (default: 60)")
+p.add_argument("-l", "--latency", dest="latency", type=float, default=0.1,
+               help="API latency per request in seconds (default: 0.1)")
+args = p.parse_args()
+
+tmpdir = Path(tempfile.mkdtemp())
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+os.environ['KPF_OB_STORE'] = str(tmpdir / 'OBstore')
+os.environ['APIHASH'] = 'fake'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import cfg
+from kpf import httpclient
+from kpf import observatoryAPIs
+from kpf.observatoryAPIs import fetch_concurrently
+from kpf.observatoryAPIs.GetObservingBlocks import GetObservingBlocks
+from kpf.ObservingBlocks import OBCache as OBCacheModule
+from kpf.ObservingBlocks.OBCache import OBCache
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+##-------------------------------------------------------------------------
+## Fake proposals API
+##-------------------------------------------------------------------------
+class FakeAPI(object):
+    def __init__(self, number):
+        with open(exampleOBs / 'Science.yaml') as f:
+            science = yaml.safe_load(f)
+        science['Target']['RA'] = '12:23:11.79'
+        science['Target']['Dec'] = '-67:37:49.47'
+        self.entries = {}
+        for i in range(number):
+            target = dict(science['Target'], TargetName=f"Target{i:03d}")
+            OBID = f"{i:024x}"
+            self.entries[OBID] = dict(science, Target=target, id=OBID,
+                                      status='OB_FOUND', semid='2026B_N123')
+        self.etags = True
+        self.down = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.not_modified = 0
+
+    def modify(self, OBID, comment):
+        entry = dict(self.entries[OBID], comment=comment)
+        self.entries[OBID] = entry
+
+
+api = FakeAPI(args.number)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, data=b'', etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if api.down is True:
+            self.send(503)
+            return
+        with api.lock:
+            api.requests += 1
+        time.sleep(args.latency)
+        OBID = parse_qs(urlparse(self.path).query).get('id', [''])[0]
+        entry = api.entries.get(OBID, {'id': OBID, 'status': 'OB_NOT_FOUND'})
+        data = json.dumps([entry]).encode()
+        etag = f'"{hashlib.md5(data).hexdigest()}"' if api.etags is True else None
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            with api.lock:
+                api.not_modified += 1
+            self.send(304, etag=etag)
+        else:
+            self.send(200, data, etag=etag)
+
+
+def timed(function, *args):
+    tick = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - tick, result
+
+
+def gui_load(OBIDs):
+    '''What load_OBs_from_schedule does after a restart (empty OBcache).'''
+    OBcache = {}
+    fetch = lambda obid: GetObservingBlocks.execute({'OBid': obid})
+    for obid, result, err in fetch_concurrently(fetch, OBIDs):
+        assert err is None
+        OBcache[obid] = result[0][0]
+    return OBcache
+
+
+def restart(**kwargs):
+    '''A new process: a new OBCache on the same directory.'''
+    OBCacheModule.cache = OBCache(**kwargs)
+    return OBCacheModule.cache
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cfg.set('ObservatoryAPIs', 'proposal_url',
+            f"http://127.0.0.1:{server.server_address[1]}/api/proposals/")
+    cfg.set('httpclient', 'backoff', '0.01')
+    cfg.set('httpclient', 'max_backoff', '0.01')
+    # The wrappers skip the query when the simulated KTL backend is in use
+    observatoryAPIs.simulate = False
+    OBIDs = list(api.entries.keys())
+    print(f"{len(OBIDs)} OBs, {args.latency*1000:.0f} ms API latency")
+
+    # Cold: empty cache, every OB is downloaded
+    cache = restart()
+    elapsed, cold = timed(gui_load, OBIDs)
+    print(f"cold GUI load:        {elapsed:6.2f} s ({api.requests} requests)")
+    assert api.requests == len(OBIDs) and cache.stats['downloaded'] == len(OBIDs)
+
+    # Warm: restart within the TTL, nothing goes to the network
+    api.reset()
+    cache = restart()
+    elapsed, warm = timed(gui_load, OBIDs)
+    print(f"warm GUI load:        {elapsed:6.2f} s ({api.requests} requests)")
+    assert api.requests == 0 and cache.stats['hits'] == len(OBIDs)
+    for OBID in OBIDs:
+        assert warm[OBID].to_dict() == cold[OBID].to_dict()
+
+    # Expired: revalidated with If-None-Match, nothing is rebuilt
+    api.reset()
+    cache = restart(ttl=0)
+    elapsed, revalidated = timed(gui_load, OBIDs)
+    print(f"revalidate (ETag):    {elapsed:6.2f} s ({api.requests} requests, "
+          f"{api.not_modified} not modified)")
+    assert api.not_modified == len(OBIDs) and cache.stats['revalidated'] == len(OBIDs)
+
+    # Expired and no ETag support: downloaded, but only rebuilt if changed
+    api.etags = False
+    for OBID in OBIDs[:5]:
+        api.modify(OBID, 'Updated')
+    api.reset()
+    cache = restart(ttl=0)
+    elapsed, revalidated = timed(gui_load, OBIDs)
+    print(f"revalidate (hash):    {elapsed:6.2f} s ({api.requests} requests, "
+          f"{cache.stats['downloaded']} changed)")
+    assert cache.stats['downloaded'] == 5
+    assert cache.stats['revalidated'] == len(OBIDs) - 5
+    for OBID in OBIDs[:5]:
+        assert revalidated[OBID].CommentToObserver == 'Updated'
+
+    # API down: the cached copies are used
+    api.down = True
+    cache = restart(ttl=0)
+    cfg.set('httpclient', 'failure_threshold', '1000')
+    httpclient.client = None
+    elapsed, stale = timed(gui_load, OBIDs)
+    print(f"API down:             {elapsed:6.2f} s ({cache.stats['stale']} cached copies used)")
+    assert cache.stats['stale'] == len(OBIDs)
+    api.down = False
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import json
+import tempfile
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Compare downloading the OBs of a
+KPF-CC night plan (and the OBs of all KPF-CC programs) one at a time, as the
+OB GUI used to, with the concurrent fetch layer
+(kpf.observatoryAPIs.fetch_concurrently), against a local mock of the
+proposals API which adds a fixed latency to every request. Checks that both
+give the same OBs and that each OB is requested only once.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=40,
+               help="Number of unique OBs in the night plan (default: 40)")
+p.add_argument("-p", "--programs", dest="programs", type=int, default=12,
+               help="Number of KPF-CC programs (default: 12)")
+p.add_argument("-l", "--latency", dest="latency", type=float, default=0.2,
+               help="API latency per request in seconds (default: 0.2)")
+p.add_argument("-w", "--workers", dest="workers", type=int, default=8,
+               help="Number of concurrent requests (default: 8)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+os.environ['APIHASH'] = 'mock'
+os.environ['KPF_OB_STORE'] = tempfile.mkdtemp()
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import cfg
+from kpf import observatoryAPIs
+from kpf.observatoryAPIs import fetch_concurrently
+from kpf.observatoryAPIs.GetObservingBlocks import GetObservingBlocks
+from kpf.observatoryAPIs.GetObservingBlocksByProgram import GetObservingBlocksByProgram
+from kpf.ObservingBlocks.OBCache import get_cache
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+##-------------------------------------------------------------------------
+## Mock proposals API
+##-------------------------------------------------------------------------
+with open(exampleOBs / 'Science.yaml') as f:
+    science = yaml.safe_load(f)
+science['Target']['RA'] = '12:23:11.79'
+science['Target']['Dec'] = '-67:37:49.47'
+
+
+def OB_entry(i):
+    program = f"N{i % args.programs:03d}"
+    target = dict(science['Target'], TargetName=f"Target{i:03d}")
+    return dict(science, Target=target, id=f"{i:024x}", status='OB_FOUND',
+                semid=f"2026B_{program}")
+
+
+entries = [OB_entry(i) for i in range(args.number)]
+requested = []
+requested_lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        params = {k: v[0] for k,v in parse_qs(urlparse(self.path).query).items()}
+        with requested_lock:
+            requested.append(params.get('id', params.get('semid')))
+        time.sleep(args.latency)
+        if 'id' in params.keys():
+            result = [e for e in entries if e['id'] == params['id']]
+        else:
+            result = [e for e in entries if e['semid'] == params.get('semid')]
+        data = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def night_plan():
+    '''Three weather bands which share most of their OBs.'''
+    ids = [e['id'] for e in entries]
+    return {'1': ids[:int(len(ids)*0.8)],
+            '2': ids[int(len(ids)*0.2):],
+            '3': ids[::2]}
+
+
+def timed(function, *args):
+    tick = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - tick, result
+
+
+def load_serial(plan, OBcache):
+    '''The old OB GUI loop: one request per schedule line not yet cached.'''
+    for WB, ids in plan.items():
+        for obid in ids:
+            if obid not in OBcache.keys():
+                OBs, failures = GetObservingBlocks.execute({'OBid': obid})
+                OBcache[obid] = OBs[0]
+    return OBcache
+
+
+def load_concurrent(plan, OBcache):
+    progress = []
+    ids = [obid for WB in plan.keys() for obid in plan[WB]]
+    fetch = lambda obid: GetObservingBlocks.execute({'OBid': obid})
+    for obid, result, err in fetch_concurrently(fetch, ids, skip=OBcache.keys(),
+                                                max_workers=args.workers):
+        assert err is None
+        OBcache[obid] = result[0][0]
+        progress.append(obid)
+    return OBcache, progress
+
+
+def load_programs(progIDs, concurrent):
+    fetch = lambda progID: GetObservingBlocksByProgram.execute({'program': progID,
+                                                                'semester': '2026B'})
+    OBs = []
+    if concurrent is True:
+        for progID, result, err in fetch_concurrently(fetch, progIDs, max_workers=args.workers):
+            OBs.extend(result[0])
+    else:
+        for progID in progIDs:
+            OBs.extend(fetch(progID)[0])
+    return sorted(OBs, key=lambda OB: OB.OBID)
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    cfg.set('ObservatoryAPIs', 'proposal_url', f"{base}/api/proposals/")
+    # The wrappers skip the query when the simulated KTL backend is in use
+    observatoryAPIs.simulate = False
+
+    plan = night_plan()
+    nlines = sum([len(ids) for ids in plan.values()])
+    # A few OBs were downloaded earlier in the night
+    cached_ids = [e['id'] for e in entries[:3]]
+    print(f"night plan: {nlines} lines, {args.number} unique OBs, "
+          f"{len(cached_ids)} already cached, {args.latency*1000:.0f} ms latency")
+
+    elapsed, serial = timed(load_serial, plan, {})
+    print(f"serial:      {elapsed:6.2f} s ({len(requested)} requests)")
+    requested.clear()
+    # Start from an empty OB cache, as the serial run filled it
+    get_cache().invalidate()
+    cached = {obid: serial[obid] for obid in cached_ids}
+    elapsed, (concurrent, progress) = timed(load_concurrent, plan, dict(cached))
+    print(f"concurrent:  {elapsed:6.2f} s ({len(requested)} requests, {args.workers} workers)")
+    assert len(requested) == len(set(requested)) == args.number - len(cached_ids)
+    assert len(progress) == len(requested)
+    assert set(concurrent.keys()) == set(serial.keys())
+    for obid in serial.keys():
+        assert concurrent[obid].to_dict() == serial[obid].to_dict()
+
+    progIDs = [f"N{i:03d}" for i in range(args.programs)]
+    elapsed, serial_OBs = timed(load_programs, progIDs, False)
+    print(f"programs serial:     {elapsed:6.2f} s")
+    elapsed, concurrent_OBs = timed(load_programs, progIDs, True)
+    print(f"programs concurrent: {elapsed:6.2f} s")
+    assert [OB.OBID for OB in serial_OBs] == [OB.OBID for OB in concurrent_OBs]
+    assert len(concurrent_OBs) == args.number
+    server.shutdown()
+    print('checks passed')
+
+
+if __name__ == '__main__':
+    main()
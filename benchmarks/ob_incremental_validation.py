@@ -0,0 +1,96 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Simulate interactive editing of a
+large calibration OB in the OB GUI. Each edit changes one property of one
+calibration, then the OB is validated, its summary is rendered, and its
+duration is estimated, as the GUI does after every edit. Validation results
+are cached per component revision, so only the edited component is
+re-checked. The --no-cache option discards the cached results before every
+validation to show the cost of re-checking every component.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=40,
+               help="Number of calibration exposures in the OB (default: 40)")
+p.add_argument("-e", "--edits", dest="edits", type=int, default=1000,
+               help="Number of edits to simulate (default: 1000)")
+p.add_argument("--no-cache", dest="nocache",
+               default=False, action="store_true",
+               help="Discard cached validation results before every validation")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.scripts.EstimateOBDuration import EstimateOBDuration
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+def forget(OB):
+    for component in OB.Observations + OB.Calibrations:
+        component.checked = None
+    if OB.Target is not None:
+        OB.Target.checked = None
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    with open(exampleOBs / 'Calibrations.yaml') as f:
+        calibrations = yaml.safe_load(f)
+    cals = calibrations['Calibrations']
+    OBdict = dict(calibrations, Calibrations=[cals[i % len(cals)] for i in range(args.number)])
+    OB = ObservingBlock(OBdict)
+    assert OB.validate() is True
+
+    # An invalid edit must be seen by validation and an undo must clear it
+    ExpMeterBin = OB.Calibrations[-1].get('ExpMeterBin')
+    OB.Calibrations[-1].set('ExpMeterBin', 5)
+    assert OB.validate() is False
+    errors = OB.validation_results(errors_only=True)
+    assert [(r.component, r.property) for r in errors] == [(f'Calibration {args.number}', 'ExpMeterBin')]
+    OB.Calibrations[-1].set('ExpMeterBin', ExpMeterBin)
+    assert OB.validate() is True
+
+    validate = summary = duration = 0
+    for i in range(args.edits):
+        calibration = OB.Calibrations[i % len(OB.Calibrations)]
+        calibration.set('ExpTime', float(calibration.get('ExpTime')) + 1)
+        if args.nocache is True:
+            forget(OB)
+        tick = time.perf_counter()
+        assert OB.validate() is True
+        tock = time.perf_counter()
+        OB.summary()
+        tack = time.perf_counter()
+        EstimateOBDuration.execute({}, OB=OB)
+        validate += tock - tick
+        summary += tack - tock
+        duration += time.perf_counter() - tack
+
+    print(f"{args.edits} edits of a {len(OB.Calibrations)} calibration OB"
+          f"{' (no validation cache)' if args.nocache else ''}")
+    for name, elapsed in [('validate', validate), ('summary', summary),
+                          ('EstimateOBDuration', duration)]:
+        print(f"{name:20s} {elapsed/args.edits*1e3:8.3f} ms/edit")
+    total = validate + summary + duration
+    print(f"{'total':20s} {total/args.edits*1e3:8.3f} ms/edit")
+
+
+if __name__ == '__main__':
+    main()
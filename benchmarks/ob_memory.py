@@ -0,0 +1,89 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import resource
+import tracemalloc
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Memory use of a large collection
+of ObservingBlocks, e.g. a full semester of programs as held by the OB GUI.
+Builds the OBs from the example Science and Calibrations OBs (with a unique
+target name for each science OB) and reports the time to build them, the
+memory they hold (tracemalloc), the tracemalloc peak while building them, and
+the peak RSS of the process.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=10000,
+               help="Number of OBs to build (default: 10000)")
+p.add_argument("-c", "--calibration-fraction", dest="calfraction", type=float,
+               default=0.1,
+               help="Fraction of the OBs which are calibration OBs (default: 0.1)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+def semester_OBs(number):
+    '''OB dictionaries as they would arrive from the database.'''
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    with open(exampleOBs / 'Calibrations.yaml') as f:
+        calibrations = yaml.safe_load(f)
+    ncal = int(number*args.calfraction)
+    OBs = []
+    for i in range(number):
+        if i < ncal:
+            OB = dict(calibrations)
+        else:
+            OB = dict(science)
+            OB['Target'] = dict(science['Target'], TargetName=f"Target{i:05d}")
+        OB['id'] = f"{i:024x}"
+        OBs.append(OB)
+    return OBs
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    OBdicts = semester_OBs(args.number)
+    # Build one OB first so one time setup (imports, schemas, metadata) is
+    # not counted
+    ObservingBlock(OBdicts[-1])
+
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    tick = time.perf_counter()
+    OBs = [ObservingBlock(OBdict) for OBdict in OBdicts]
+    elapsed = time.perf_counter() - tick
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    held = current - start
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on linux and in bytes on macOS
+    maxrss_MB = maxrss/1024**2 if sys.platform == 'darwin' else maxrss/1024
+
+    print(f"{len(OBs)} OBs ({int(args.number*args.calfraction)} calibration)")
+    print(f"build time:       {elapsed:8.2f} s ({elapsed/len(OBs)*1000:.2f} ms/OB)")
+    print(f"memory held:      {held/1024**2:8.1f} MB ({held/len(OBs)/1024:.1f} kB/OB)")
+    print(f"tracemalloc peak: {(peak-start)/1024**2:8.1f} MB")
+    print(f"peak RSS:         {maxrss_MB:8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Time constructing ObservingBlocks
+with and without the instrument metadata cache (kpf.metadata). Runs against
+the simulated KTL backend with a fixed round trip time added to every keyword
+read, so the uncached case pays for the WAVEBINS and ND enumerator reads in
+every Observation and Calibration.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=1000,
+               help="Number of OBs to construct (default: 1000)")
+p.add_argument("-l", "--latency", dest="latency", type=float, default=0.002,
+               help="Simulated KTL round trip time in seconds (default: 0.002)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_SIMULATE_READ_LATENCY'] = str(args.latency)
+os.environ['KPF_METRICS'] = '0'
+os.environ['KPF_METADATA_CACHE'] = str(Path(tempfile.mkdtemp()) / 'metadata_cache.json')
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import metadata
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+def build(OBdicts, number):
+    tick = time.perf_counter()
+    for i in range(number):
+        ObservingBlock(OBdicts[i % len(OBdicts)])
+    return time.perf_counter() - tick
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    OBdicts = []
+    for OBfile in ['Science.yaml', 'Calibrations.yaml']:
+        with open(exampleOBs / OBfile) as f:
+            OBdicts.append(yaml.safe_load(f))
+
+    cache = metadata.get_cache()
+    cache.persist = True
+    print(f"Constructing {args.number} OBs, {args.latency*1000:.1f} ms per KTL read")
+
+    cache.ttl = 0
+    uncached = build(OBdicts, args.number)
+    ktl_reads = cache.stats['ktl']
+    print(f"without cache: {uncached:7.2f} s ({uncached/args.number*1000:.2f} ms/OB, "
+          f"{ktl_reads} KTL reads)")
+
+    cache.ttl = 3600
+    cache.invalidate()
+    cache.stats['ktl'] = 0
+    cached = build(OBdicts, args.number)
+    print(f"with cache:    {cached:7.2f} s ({cached/args.number*1000:.2f} ms/OB, "
+          f"{cache.stats['ktl']} KTL reads)")
+    print(f"speed up: {uncached/cached:.1f}x")
+
+    # Cold start without KTL, e.g. an offline tool
+    metadata.ktl = None
+    metadata.cache = None
+    cold = metadata.get_cache()
+    build(OBdicts, 1)
+    print(f"offline cold start: {cold.stats['disk']} values read from {cold.cache_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import threading
+import contextlib
+from io import StringIO
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Scaling of OB construction and
+validation (OBTable.get_OBs) from 1 to N worker processes for a large
+KPF-CC program download. Checks every number of processes gives the same
+OBs and failure messages, in the same order, as the serial path, including
+entries which fail validation or can not be built at all, and that a
+failure of the process pool falls back to the serial path.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=600,
+               help="Number of OBs (default: 600)")
+p.add_argument("-p", "--processes", dest="processes", type=int,
+               default=max(os.cpu_count() or 1, 4),
+               help="Maximum number of processes (default: the number of CPUs, at least 4)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import cfg
+from kpf.ObservingBlocks.OBTable import OBTable
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+def program_download(number):
+    '''Database entries for a large program, with a few bad ones.'''
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    science['Target']['RA'] = '12:23:11.79'
+    science['Target']['Dec'] = '-67:37:49.47'
+    entries = []
+    for i in range(number):
+        target = dict(science['Target'], TargetName=f"Target{i:04d}",
+                      PMRA=i/10, Gmag=5+i%10)
+        observation = dict(science['Observations'][0], ExpTime=30+i%300)
+        if i % 97 == 13:
+            observation['ExpTime'] = -1 # fails validation
+        if i % 101 == 17:
+            observation['nExp'] = 'x' # can not be built
+        entries.append(dict(science, Target=target, Observations=[observation],
+                            id=f"{i:024x}", status='OB_FOUND', semid='2026B_N123'))
+    entries.insert(5, 'not an OB')
+    return entries
+
+
+def build(entries, processes):
+    # The serial path prints entries which can not be built
+    with contextlib.redirect_stdout(StringIO()):
+        tick = time.perf_counter()
+        OBs, failures = OBTable(entries).get_OBs(processes=processes)
+    return time.perf_counter() - tick, [OB.to_dict() for OB in OBs], failures
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    entries = program_download(args.number)
+    print(f"{args.number} OBs, {os.cpu_count()} CPUs")
+    cfg.set('OBTable', 'min_parallel', '2')
+    serial, OBs, failures = build(entries, 1)
+    print(f"  1 process   {serial:7.2f} s")
+    nfailed = len([f for f in failures if 'validataion' in f])
+    assert nfailed > 0 and len(failures) > nfailed + 1
+    for processes in range(2, args.processes+1):
+        elapsed, parallel_OBs, parallel_failures = build(entries, processes)
+        print(f"{processes:3d} processes {elapsed:7.2f} s ({serial/elapsed:.1f}x)")
+        assert parallel_OBs == OBs and parallel_failures == failures
+    print(f"same {len(OBs)} OBs and {len(failures)} failures from every number of processes")
+
+    # Small tables are built serially
+    cfg.set('OBTable', 'min_parallel', '200')
+    elapsed, small_OBs, small_failures = build(entries[:20], args.processes)
+    assert small_OBs == OBs[:len(small_OBs)]
+
+    # If the process pool can not be used the serial path gives the results
+    cfg.set('OBTable', 'min_parallel', '2')
+    cfg.set('OBTable', 'start_method', 'no-such-method')
+    elapsed, fallback_OBs, fallback_failures = build(entries, args.processes)
+    assert fallback_OBs == OBs and fallback_failures == failures
+    print('fallback to the serial path gives the same results')
+
+    # Never fork while other threads run (they may hold locks), build
+    # serially unless a thread safe start method is configured
+    cfg.set('OBTable', 'start_method', 'auto')
+    table = OBTable(entries)
+    pools = []
+    table.build_parallel = lambda *args, **kwargs: pools.append(kwargs)
+    running = threading.Event()
+    thread = threading.Thread(target=running.wait)
+    thread.start()
+    try:
+        with contextlib.redirect_stdout(StringIO()):
+            threaded_OBs, threaded_failures = table.get_OBs(processes=args.processes)
+    finally:
+        running.set()
+        thread.join()
+    assert pools == []
+    assert [OB.to_dict() for OB in threaded_OBs] == OBs and threaded_failures == failures
+    cfg.set('OBTable', 'start_method', 'forkserver')
+    running.clear()
+    thread = threading.Thread(target=running.wait)
+    thread.start()
+    try:
+        elapsed, forkserver_OBs, forkserver_failures = build(entries, args.processes)
+    finally:
+        running.set()
+        thread.join()
+    assert forkserver_OBs == OBs and forkserver_failures == failures
+    print(f"other threads running: serial with auto, forkserver {elapsed:.2f} s")
+    print('checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Micro benchmarks for the OB
+component classes (Target, Observation, Calibration): construct, validate,
+and serialise (to_dict and to_lines) many components. The property schemas
+are compiled once per process (see kpf.ObservingBlocks.get_schema), the
+--reparse option clears the schema registry before every construction to
+show the cost of reading the properties files each time.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=10000,
+               help="Number of components of each type (default: 10000)")
+p.add_argument("--reparse", dest="reparse",
+               default=False, action="store_true",
+               help="Re-read the properties files for every component")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import ObservingBlocks
+from kpf.ObservingBlocks.Target import Target
+from kpf.ObservingBlocks.Observation import Observation
+from kpf.ObservingBlocks.Calibration import Calibration
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+def timeit(function, items):
+    tick = time.perf_counter()
+    for item in items:
+        if args.reparse is True:
+            ObservingBlocks.schemas.clear()
+        function(item)
+    return time.perf_counter() - tick
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    with open(exampleOBs / 'Calibrations.yaml') as f:
+        calibrations = yaml.safe_load(f)
+    inputs = {Target: [science['Target']],
+              Observation: science['Observations'],
+              Calibration: calibrations['Calibrations']}
+
+    print(f"{args.number} components of each type"
+          f"{' (re-reading properties files)' if args.reparse else ''}")
+    print(f"{'component':12s} {'construct':>10s} {'validate':>10s} "
+          f"{'to_dict':>10s} {'to_lines':>10s}  [us per component]")
+    for component_class, dicts in inputs.items():
+        dicts = [dicts[i % len(dicts)] for i in range(args.number)]
+        components = []
+        construct = timeit(lambda d: components.append(component_class(dict(d))), dicts)
+        validate = timeit(lambda c: c.validate(), components)
+        to_dict = timeit(lambda c: c.to_dict(), components)
+        to_lines = timeit(lambda c: c.to_lines(), components)
+        print(f"{component_class.__name__:12s} "
+              f"{construct/args.number*1e6:10.1f} {validate/args.number*1e6:10.1f} "
+              f"{to_dict/args.number*1e6:10.1f} {to_lines/args.number*1e6:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
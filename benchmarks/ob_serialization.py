@@ -0,0 +1,102 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import random
+import tempfile
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Compare the throughput of
+reading and writing randomly generated OBs as YAML (ObservingBlock.__repr__
+and yaml.safe_load) with the JSON serialization and the content addressed
+OB store. The round trips are covered by tests/test_serialization.py.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=1000,
+               help="Number of OBs (default: 1000)")
+p.add_argument("--seed", dest="seed", type=int, default=0,
+               help="Random seed for the generated OBs (default: 0)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf.ObservingBlocks import get_schema
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.ObservingBlocks.OBStore import OBStore
+from kpf.ObservingBlocks.serialization import canonical_dumps, dumps, loads, backend
+
+
+def random_value(spec, rng):
+    if spec.valuetype == bool:
+        return rng.random() > 0.5
+    elif spec.valuetype == int:
+        return rng.randint(1, 4)
+    elif spec.valuetype == float:
+        return round(rng.uniform(0, 100), spec.precision or 3)
+    else:
+        return rng.choice(['', 'abc', "quote's", 'ünïcode', 'two words', '12:34:56.7'])
+
+
+def random_component(schema, rng):
+    return {spec.textname: random_value(spec, rng) for spec in schema.properties
+            if rng.random() > 0.2}
+
+
+def random_OB(i, rng):
+    OB = {'id': f"{i:024x}", 'ProgramID': rng.choice(['', 'K123', 'N456']),
+          'semester': '2026B', 'semid': '2026B_K123', 'comment': rng.choice(['', 'note'])}
+    if rng.random() > 0.3:
+        OB['Target'] = random_component(get_schema('TargetProperties.yaml'), rng)
+        OB['Observations'] = [random_component(get_schema('ObservationProperties.yaml'), rng)
+                              for j in range(rng.randint(1, 3))]
+    else:
+        OB['Calibrations'] = [random_component(get_schema('CalibrationProperties.yaml'), rng)
+                              for j in range(rng.randint(1, 5))]
+    if rng.random() > 0.8:
+        OB['History'] = [{'observer': 'someone', 'timestamp': '2026-10-18T10:00:00',
+                          'exposure_times': [30.0, 30.0]}]
+    return ObservingBlock(OB)
+
+
+def timeit(function, items):
+    tick = time.perf_counter()
+    result = [function(item) for item in items]
+    return time.perf_counter() - tick, result
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    rng = random.Random(args.seed)
+    OBs = [random_OB(i, rng) for i in range(args.number)]
+
+    # Throughput
+    print(f"JSON backend: {backend()}")
+    print(f"{'':20s} {'write [ms/OB]':>14s} {'read [ms/OB]':>13s}")
+    write, texts = timeit(lambda OB: OB.__repr__(), OBs)
+    read, _ = timeit(lambda text: ObservingBlock(yaml.safe_load(text)), texts)
+    print(f"{'YAML':20s} {write/args.number*1000:14.3f} {read/args.number*1000:13.3f}")
+    write, blobs = timeit(lambda OB: dumps(OB.to_dict()), OBs)
+    read, _ = timeit(lambda blob: ObservingBlock(loads(blob)), blobs)
+    print(f"{'JSON':20s} {write/args.number*1000:14.3f} {read/args.number*1000:13.3f}")
+    write, blobs = timeit(lambda OB: canonical_dumps(OB.to_dict()), OBs)
+    print(f"{'canonical JSON':20s} {write/args.number*1000:14.3f}")
+    store = OBStore(directory=tempfile.mkdtemp())
+    write, _ = timeit(store.put, OBs)
+    read, _ = timeit(lambda OB: store.get(OBID=OB.OBID), OBs)
+    print(f"{'OB store':20s} {write/args.number*1000:14.3f} {read/args.number*1000:13.3f}")
+
+
+if __name__ == '__main__':
+    main()
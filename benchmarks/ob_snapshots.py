@@ -0,0 +1,102 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import copy
+import time
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Time the OB GUI refresh path
+(EstimateOBDuration, OB summary, and star list line for every OB in the
+list) with and without memoisation of derived quantities on the content
+hash of immutable component snapshots (kpf.ObservingBlocks.memoize), and
+time copying OBs. The behaviour of snapshots and memoised values is
+tested in tests/test_snapshots.py.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=1000,
+               help="Number of OBs (default: 1000)")
+p.add_argument("-r", "--refreshes", dest="refreshes", type=int, default=5,
+               help="Number of refreshes of the OB list (default: 5)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import ObservingBlocks
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.scripts.EstimateOBDuration import EstimateOBDuration
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+def build_OBs(number):
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    with open(exampleOBs / 'Calibrations.yaml') as f:
+        calibrations = yaml.safe_load(f)
+    science['Target']['RA'] = '12:23:11.79'
+    science['Target']['Dec'] = '-67:37:49.47'
+    OBs = []
+    for i in range(number):
+        if i % 10 == 0:
+            OB = ObservingBlock(calibrations)
+        else:
+            # A semester has many OBs on the same targets
+            target = dict(science['Target'], TargetName=f"Target{i % 300:03d}")
+            OB = ObservingBlock(dict(science, Target=target))
+        OBs.append(OB)
+    return OBs
+
+
+def refresh(OBs):
+    lines = []
+    for OB in OBs:
+        duration = EstimateOBDuration.execute({}, OB=OB)
+        line = f"{OB.summary()} {duration:.1f} min"
+        if OB.Target is not None:
+            line += f" {OB.Target.to_star_list()}"
+        lines.append(line)
+    return lines
+
+
+def timeit(function, *args):
+    tick = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - tick, result
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    OBs = build_OBs(args.number)
+    print(f"{args.number} OBs, {args.refreshes} refreshes")
+
+    for memoization in [False, True]:
+        ObservingBlocks.memoization = memoization
+        elapsed = 0
+        for i in range(args.refreshes):
+            t, lines = timeit(refresh, OBs)
+            elapsed += t
+        label = 'memoised' if memoization else 'not memoised'
+        print(f"refresh {label:14s} {elapsed/args.refreshes*1000:8.1f} ms "
+              f"({elapsed/args.refreshes/args.number*1e6:.1f} us/OB)")
+
+    t, copies = timeit(lambda: [copy.deepcopy(OB) for OB in OBs])
+    print(f"deepcopy of all OBs      {t*1000:8.1f} ms")
+    t, snapshots = timeit(lambda: [[c.snapshot() for c in OB.Observations + OB.Calibrations]
+                                   for OB in OBs])
+    print(f"snapshots of all OBs     {t*1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import json
+import tempfile
+import threading
+import tracemalloc
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Peak memory and time to first OB
+when downloading a large KPF-CC program, parsing the whole response before
+building OBs (as query_observatoryAPI does) compared with the streaming
+parser (stream_observatoryAPI and iter_OBs_from_KPFCC_API). The response is
+recorded to a file and served by a local stand-in of the proposals API at a
+fixed bandwidth. That both give the same OBs, and the handling of error and
+incomplete responses, are tested in tests/test_ob_stream.py.
+''')
+p.add_argument("-s", "--size", dest="size", type=float, default=50,
+               help="Size of the recorded response in MB (default: 50)")
+p.add_argument("-b", "--bandwidth", dest="bandwidth", type=float, default=100,
+               help="Bandwidth of the stand-in server in MB/s (default: 100)")
+args = p.parse_args()
+
+tmpdir = Path(tempfile.mkdtemp())
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+os.environ['APIHASH'] = 'standin'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import cfg
+from kpf import observatoryAPIs
+from kpf.observatoryAPIs import (query_observatoryAPI, stream_observatoryAPI,
+                                 iter_OBs_from_KPFCC_API)
+from kpf.ObservingBlocks.OBTable import OBTable
+from kpf.ObservingBlocks.serialization import stream_backend
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+##-------------------------------------------------------------------------
+## Recorded responses and the stand-in server
+##-------------------------------------------------------------------------
+def record(filename, size):
+    '''Write a getKPFObservingBlock response of about size MB to a file,
+    returns the number of OBs.
+    '''
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    science['Target']['RA'] = '12:23:11.79'
+    science['Target']['Dec'] = '-67:37:49.47'
+    written = 0
+    i = 0
+    with open(filename, 'w') as f:
+        f.write('[')
+        while written < size*1024**2:
+            target = dict(science['Target'], TargetName=f"Target {i:05d} é")
+            entry = dict(science, Target=target, id=f"{i:024x}", status='OB_FOUND',
+                         semid='2026B_N123')
+            text = (',\n' if i > 0 else '') + json.dumps(entry)
+            written += f.write(text)
+            i += 1
+        f.write(']')
+    return i
+
+
+responses = {}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        params = {k: v[0] for k,v in parse_qs(urlparse(self.path).query).items()}
+        filename = responses[params.get('semid')]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(filename.stat().st_size))
+        self.end_headers()
+        chunk = 256*1024
+        try:
+            with open(filename, 'rb') as f:
+                while True:
+                    data = f.read(chunk)
+                    if not data:
+                        break
+                    self.wfile.write(data)
+                    time.sleep(len(data)/(args.bandwidth*1024**2))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+##-------------------------------------------------------------------------
+## Old and new ways of getting the OBs
+##-------------------------------------------------------------------------
+def parse_all(semid):
+    '''The whole response is downloaded and parsed before any OB is built.'''
+    result = query_observatoryAPI('proposal', 'getKPFObservingBlock', {'semid': semid})
+    return OBTable(result)
+
+
+def first_OB_parse_all(semid):
+    return parse_all(semid)[0]
+
+
+def first_OB_streamed(semid):
+    stream = iter_OBs_from_KPFCC_API({'semid': semid})
+    OBs, failures = next(stream)
+    stream.close()
+    return OBs[0]
+
+
+def count_streamed(semid):
+    '''A consumer which does not keep the entries (e.g. a summary).'''
+    return sum([1 for entry in stream_observatoryAPI('proposal', 'getKPFObservingBlock',
+                                                     {'semid': semid})])
+
+
+def count_parse_all(semid):
+    return len(query_observatoryAPI('proposal', 'getKPFObservingBlock', {'semid': semid}))
+
+
+def timed(function, *args):
+    tick = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - tick, result
+
+
+def peak_memory(function, *args):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = function(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak/1024**2
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cfg.set('ObservatoryAPIs', 'proposal_url',
+            f"http://127.0.0.1:{server.server_address[1]}/api/proposals/")
+    cfg.set('httpclient', 'read_timeout', '120')
+    # The wrappers skip the query when the simulated KTL backend is in use
+    observatoryAPIs.simulate = False
+
+    responses['large'] = tmpdir / 'large.json'
+    nlarge = record(responses['large'], args.size)
+    size = responses['large'].stat().st_size/1024**2
+    print(f"recorded response: {size:.1f} MB, {nlarge} OBs, served at "
+          f"{args.bandwidth:.0f} MB/s, stream parser: {stream_backend()}")
+
+    elapsed, first = timed(first_OB_parse_all, 'large')
+    print(f"time to first OB, parse all:  {elapsed:7.3f} s")
+    elapsed, streamed = timed(first_OB_streamed, 'large')
+    print(f"time to first OB, streamed:   {elapsed:7.3f} s")
+
+    peak = peak_memory(count_parse_all, 'large')
+    print(f"peak memory, parse all:       {peak:7.1f} MB")
+    peak = peak_memory(count_streamed, 'large')
+    print(f"peak memory, streamed:        {peak:7.1f} MB")
+    peak = peak_memory(parse_all, 'large')
+    print(f"peak memory, OBTable (parse all): {peak:7.1f} MB")
+    peak = peak_memory(observatoryAPIs.get_OB_table_from_KPFCC_API, {'semid': 'large'})
+    print(f"peak memory, OBTable (streamed):  {peak:7.1f} MB")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import json
+import random
+import sqlite3
+import datetime
+import tempfile
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Repeated schedule lookups (the
+semester schedule for the OB GUI, tonight's programs for
+SetObserverFromSchedule and the current program for RunOB) against a local
+stand-in of the schedule API, querying the API every time as before
+compared with the schedule store (kpf.observatoryAPIs.schedule). Checks the
+store gives the same answers, only refreshes the nights which are out of
+date, picks up schedule changes, survives a restart, and falls back to the
+stored nights when the API is down.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=20,
+               help="Number of repetitions of each lookup (default: 20)")
+p.add_argument("-l", "--latency", dest="latency", type=float, default=0.1,
+               help="API latency per request in seconds (default: 0.1)")
+args = p.parse_args()
+
+tmpdir = Path(tempfile.mkdtemp())
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+os.environ['KPF_SCHEDULE_CACHE'] = str(tmpdir / 'schedule.sqlite')
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from kpf import cfg
+from kpf import observatoryAPIs
+from kpf.observatoryAPIs import get_semester_dates, query_observatoryAPI
+from kpf.observatoryAPIs import schedule as schedule_module
+from kpf.observatoryAPIs.schedule import ScheduleStore
+from kpf.observatoryAPIs.GetScheduledPrograms import GetScheduledPrograms
+from kpf.observatoryAPIs.GetCurrentScheduledProgram import GetCurrentScheduledProgram
+
+
+##-------------------------------------------------------------------------
+## Stand-in schedule API
+##-------------------------------------------------------------------------
+class StandIn(object):
+    '''Two semesters of KPF nights: whole, half and split nights.'''
+    def __init__(self):
+        random.seed(0)
+        self.lock = threading.Lock()
+        self.down = False
+        self.requests = []
+        self.nights = {}
+        date = datetime.date(2026, 2, 1)
+        while date < datetime.date(2027, 2, 1):
+            semester = get_semester_dates(datetime.datetime(date.year, date.month, date.day))[0]
+            entries = []
+            if random.random() < 0.5:
+                times = random.choice([[('05:00', '15:30')],
+                                       [('05:00', '10:15'), ('10:15', '15:30')],
+                                       [('05:00', '08:00'), ('08:00', '12:00'), ('12:00', '15:30')]])
+                for start, end in times:
+                    instrument = random.choice(['KPF', 'KPF-CC'])
+                    entries.append({'Date': date.strftime('%Y-%m-%d'),
+                                    'StartTime': start, 'EndTime': end,
+                                    'Instrument': instrument, 'Semester': semester,
+                                    'ProjCode': f"{'N' if instrument == 'KPF' else 'C'}{random.randint(1, 300):03d}",
+                                    'Observers': 'Observer'})
+            self.nights[date.strftime('%Y-%m-%d')] = entries
+            date += datetime.timedelta(days=1)
+
+standin = StandIn()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        params = {k: v[0] for k,v in parse_qs(urlparse(self.path).query).items()}
+        if standin.down is True:
+            status, result = 503, {}
+        else:
+            with standin.lock:
+                standin.requests.append(params)
+            time.sleep(args.latency)
+            first = datetime.datetime.strptime(params['date'], '%Y-%m-%d')
+            dates = [(first + datetime.timedelta(days=i)).strftime('%Y-%m-%d')
+                     for i in range(int(params['numdays']))]
+            status = 200
+            result = [e for date in dates for e in standin.nights.get(date, [])]
+        data = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+##-------------------------------------------------------------------------
+## The lookups as they were done before the schedule store
+##-------------------------------------------------------------------------
+def direct_programs(semester_arg):
+    utnow = datetime.datetime.utcnow()
+    semester, semester_start, semester_end = get_semester_dates(utnow)
+    if semester_arg == 'current':
+        start = semester_start
+        numdays = (semester_end-start).days + 2
+    else:
+        start = utnow - datetime.timedelta(days=1)
+        numdays = 1
+    params = {'date': start.strftime('%Y-%m-%d'), 'numdays': numdays,
+              'telnr': 1, 'instrument': 'KPF'}
+    all_programs = query_observatoryAPI('schedule', 'getSchedule', params)
+    classical = [p for p in all_programs if p['Instrument'] == 'KPF' and p['Semester'] == semester]
+    cadence = [p for p in all_programs if p['Instrument'] == 'KPF-CC' and p['Semester'] == semester]
+    return classical, cadence
+
+
+def old_current_program(inputdateUT, schedule):
+    '''GetCurrentScheduledProgram's original search of one night.'''
+    startdate = (inputdateUT - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    UTdecimal_hour = inputdateUT.hour + inputdateUT.minute/60
+    progname = None
+    for program in schedule.get(startdate, []):
+        h, m = program['StartTime'].split(':')
+        prog_start = int(h) + int(m)/60
+        h, m = program['EndTime'].split(':')
+        prog_end = int(h) + int(m)/60
+        if UTdecimal_hour >= prog_start and UTdecimal_hour <= prog_end:
+            progname = program.get('ProjCode')
+    return progname
+
+
+def lookups():
+    '''One round of what the tools ask for during a night.'''
+    GetScheduledPrograms.execute({'semester': 'current'})
+    GetScheduledPrograms.execute({'semester': 'tonight'})
+    GetCurrentScheduledProgram.execute({})
+
+
+def direct_lookups():
+    direct_programs('current')
+    direct_programs('tonight')
+    start = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    query_observatoryAPI('schedule', 'getSchedule',
+                         {'date': start.strftime('%Y-%m-%d'), 'numdays': 1,
+                          'telnr': 1, 'instrument': 'KPF'})
+
+
+def restart(**kwargs):
+    '''A new process: a new ScheduleStore on the same file.'''
+    schedule_module.store = ScheduleStore(**kwargs)
+    return schedule_module.store
+
+
+def timed(function, n):
+    tick = time.perf_counter()
+    for i in range(n):
+        function()
+    return time.perf_counter() - tick
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cfg.set('ObservatoryAPIs', 'schedule_url',
+            f"http://127.0.0.1:{server.server_address[1]}/api/schedule/")
+    cfg.set('httpclient', 'retries', '0')
+    cfg.set('httpclient', 'failure_threshold', '1000')
+    # The wrappers skip the query when the simulated KTL backend is in use
+    observatoryAPIs.simulate = False
+    print(f"{args.number} rounds of lookups, {args.latency*1000:.0f} ms API latency")
+
+    elapsed = timed(direct_lookups, args.number)
+    print(f"direct API queries: {elapsed:6.2f} s ({len(standin.requests)} requests)")
+    standin.requests.clear()
+    store = restart()
+    elapsed = timed(lookups, args.number)
+    print(f"schedule store:     {elapsed:6.2f} s ({len(standin.requests)} requests)")
+    assert len(standin.requests) == 1
+
+    # Same answers as before
+    for semester_arg in ['current', 'tonight']:
+        classical, cadence = GetScheduledPrograms.execute({'semester': semester_arg})
+        assert (classical, cadence) == direct_programs(semester_arg)
+    t = datetime.datetime(2026, 8, 1, 0, 0)
+    n = 0
+    while t < datetime.datetime(2027, 1, 31):
+        HST = (t - datetime.timedelta(hours=10)).strftime('%Y-%m-%dT%H:%M:%S')
+        progname = GetCurrentScheduledProgram.execute({'datetime': HST})
+        assert progname == old_current_program(t, standin.nights)
+        n += progname is not None
+        t += datetime.timedelta(minutes=37)
+    print(f"current program: same as the original search at "
+          f"{(t - datetime.datetime(2026, 8, 1)).days*24*60//37} times ({n} scheduled)")
+
+    # Only the nights about to happen are refreshed when their TTL expires
+    standin.requests.clear()
+    store.ttl = 0
+    GetScheduledPrograms.execute({'semester': 'current'})
+    assert len(standin.requests) == 1
+    assert standin.requests[0]['numdays'] == str(store.near_days + 1)
+    print(f"expired: refreshed {standin.requests[0]['numdays']} nights from "
+          f"{standin.requests[0]['date']}")
+
+    # A change to tonight's schedule is picked up once tonight expires
+    store.ttl = 900
+    tonight = (datetime.datetime.utcnow() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    standin.nights[tonight] = [{'Date': tonight, 'StartTime': '00:00', 'EndTime': '23:59',
+                                'Instrument': 'KPF', 'Semester': get_semester_dates(datetime.datetime.utcnow())[0],
+                                'ProjCode': 'N999', 'Observers': 'Observer'}]
+    assert GetCurrentScheduledProgram.execute({}) != 'N999'
+    store.ttl = 0
+    assert GetCurrentScheduledProgram.execute({}) == 'N999'
+    print('schedule change: picked up after the TTL')
+
+    # Restart: nothing is queried
+    standin.requests.clear()
+    store = restart()
+    lookups()
+    assert len(standin.requests) == 0
+    print('restart: answered from the stored schedule')
+
+    # API down: the stored nights are used
+    standin.down = True
+    store = restart(ttl=0, future_ttl=0, past_ttl=0)
+    classical, cadence = GetScheduledPrograms.execute({'semester': 'current'})
+    assert GetCurrentScheduledProgram.execute({}) == 'N999'
+    assert store.stats['stale'] > 0 and len(classical) > 0
+    print(f"API down: stored schedule used ({len(classical)} classical, "
+          f"{len(cadence)} cadence entries)")
+    standin.down = False
+
+    # A corrupt stored night is fetched again
+    with sqlite3.connect(tmpdir / 'schedule.sqlite') as connection:
+        connection.execute("UPDATE nights SET entries='[{' WHERE date=?", (tonight,))
+    standin.requests.clear()
+    store = restart()
+    assert GetCurrentScheduledProgram.execute({}) == 'N999'
+    assert len(standin.requests) == 1 and standin.requests[0]['date'] == tonight
+
+    # An unusable store directory: every lookup goes to the API
+    standin.requests.clear()
+    schedule_module.store = ScheduleStore(cache_file='/proc/nonexistent/schedule.sqlite')
+    assert GetCurrentScheduledProgram.execute({}) == 'N999'
+    assert GetScheduledPrograms.execute({'semester': 'current'}) == direct_programs('current')
+    assert len(standin.requests) > 0 and schedule_module.store.stats['stale'] == 0
+    print('corrupt night and unusable directory handled')
+    server.shutdown()
+    print('checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import json
+import time
+import builtins
+import subprocess
+from pathlib import Path
+import argparse
+
+import yaml
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+p = argparse.ArgumentParser(description='''Run full OBs through RunOB against
+the simulated KTL backend (KPF_SIMULATE), each in its own process, and report
+the exposure time, the wall clock time, and the difference, which is the
+overhead of the OB (motions, time shims, and the translator itself). The
+simulator scales its latencies and exposures by the time scale but not the
+time.sleep calls in the translator, so those are scaled here as well to keep
+everything in one time base. All times are wall clock seconds at the time
+scale.
+''')
+p.add_argument('OBfiles', nargs='*',
+               default=[str(exampleOBs / 'Calibrations.yaml'),
+                        str(exampleOBs / 'Science.yaml')],
+               help="OB files to run (default: the example OBs)")
+p.add_argument("-s", "--time-scale", dest="time_scale", type=float, default=0.01,
+               help="Simulated time scale (default: 0.01)")
+p.add_argument("-v", "--verbose", dest="verbose",
+               default=False, action="store_true",
+               help="Show the output of RunOB")
+p.add_argument("--run", dest="run", type=str, default=None,
+               help=argparse.SUPPRESS)
+args = p.parse_args()
+
+def exposure_time(OBfile):
+    '''Sum of nExp * ExpTime over the calibrations and observations.'''
+    with open(OBfile) as f:
+        OB = yaml.safe_load(f)
+    total = 0
+    for entry in (OB.get('Calibrations', []) or []) + (OB.get('Observations', []) or []):
+        total += float(entry.get('nExp', 1)) * float(entry.get('ExpTime', 0))
+    return total
+
+
+def run_in_process(OBfile):
+    '''Run the OB with RunOB in this process, with time.sleep scaled by the
+    time scale, and print the timings as JSON on the last line.
+    '''
+    os.environ['KPF_SIMULATE'] = '1'
+    os.environ['KPF_SIMULATE_TIME_SCALE'] = str(args.time_scale)
+    os.environ['KPF_METRICS'] = '0'
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    slept = []
+    sleep = time.sleep
+    def scaled_sleep(seconds):
+        tick = time.perf_counter()
+        sleep(seconds * args.time_scale)
+        slept.append(time.perf_counter() - tick)
+    time.sleep = scaled_sleep
+    # Answer any confirmation prompts (e.g. target name mismatch) with Enter
+    builtins.input = lambda prompt='': ''
+
+    from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+    from kpf.scripts.RunOB import RunOB
+    OB = ObservingBlock(OBfile)
+    tick = time.perf_counter()
+    try:
+        RunOB.execute({}, OB=OB)
+        status = 'ok'
+    except Exception:
+        status = 'FAILED'
+    wall = time.perf_counter() - tick
+    print(json.dumps({'wall': wall, 'sleep': sum(slept), 'status': status}))
+
+
+def run_OB(OBfile):
+    output = None if args.verbose else subprocess.DEVNULL
+    result = subprocess.run([sys.executable, __file__, '--run', str(OBfile),
+                             '-s', str(args.time_scale)],
+                            stdout=subprocess.PIPE, stderr=output)
+    lines = result.stdout.decode().splitlines()
+    if args.verbose:
+        print('\n'.join(lines[:-1]))
+    try:
+        return json.loads(lines[-1])
+    except (IndexError, json.JSONDecodeError):
+        return {'wall': float('nan'), 'sleep': float('nan'), 'status': 'FAILED'}
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    if args.run is not None:
+        run_in_process(args.run)
+        return
+    print(f"Time scale: {args.time_scale}, all times in wall clock seconds")
+    print(f"{'OB':30s} {'exposure':>9s} {'sleep':>9s} {'wall':>9s} "
+          f"{'overhead':>9s} {'status':>6s}")
+    for OBfile in args.OBfiles:
+        exposure = exposure_time(OBfile) * args.time_scale
+        result = run_OB(OBfile)
+        print(f"{Path(OBfile).name:30s} {exposure:9.1f} {result['sleep']:9.1f} "
+              f"{result['wall']:9.1f} {result['wall']-exposure:9.1f} "
+              f"{result['status']:>6s}")
+
+if __name__ == '__main__':
+    main()
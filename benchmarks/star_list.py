@@ -0,0 +1,142 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+from pathlib import Path
+import argparse
+
+import numpy as np
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Compare generating a Keck star
+list with proper motions applied to a given epoch one target at a time
+(apply_space_motion and to_string on each Target's SkyCoord) with the
+vectorised kpf.ObservingBlocks.StarList.star_list_lines. Checks the output
+byte for byte against the golden files in benchmarks/golden, that the per
+target and batch coordinates agree, and that star lists parse back to the
+same lines.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=5000,
+               help="Number of targets (default: 5000)")
+p.add_argument("-s", "--sample", dest="sample", type=int, default=100,
+               help="Number of targets to time one at a time, the result is "
+                    "scaled to the full number (default: 100)")
+p.add_argument("--update-golden", dest="update_golden",
+               default=False, action="store_true",
+               help="Rewrite the golden files instead of checking them")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import astropy.units as u
+from astropy.time import Time
+
+from kpf.ObservingBlocks.Target import Target
+from kpf.ObservingBlocks.TargetCatalog import TargetCatalog
+from kpf.ObservingBlocks.StarList import star_list_lines, parse_star_list
+
+golden = Path(__file__).parent / 'golden'
+epoch = 2026.8
+ngolden = 500
+
+
+def random_targets(number):
+    rng = np.random.default_rng(42)
+    targets = []
+    for i in range(number):
+        ra = rng.uniform(0, 24)
+        dec = rng.uniform(-40, 89)
+        target = {'TargetName': f"Target{i:05d}",
+            'RA': f"{int(ra):02d}:{int(ra*60%60):02d}:{ra*3600%60:05.2f}",
+            'Dec': f"{'-' if dec < 0 else '+'}{int(abs(dec)):02d}:{int(abs(dec)*60%60):02d}:{abs(dec)*3600%60:04.1f}",
+            'PMRA': float(rng.normal(0, 0.01)),
+            'PMDEC': float(rng.normal(0, 0.1)),
+            'Epoch': '2016.0'}
+        if i % 10 == 0:
+            target['PMRA'] = 0
+            target['PMDEC'] = 0
+            target['Epoch'] = '2000.0'
+        if i % 97 == 0:
+            target['DRA'] = float(rng.normal(0, 1))
+            target['DDEC'] = float(rng.normal(0, 1))
+        targets.append(Target(target))
+    return targets
+
+
+def per_target_lines(targets, obstime):
+    '''The star list as built one target at a time from each SkyCoord.'''
+    lines = []
+    for target in targets:
+        coord = target.coord.apply_space_motion(new_obstime=obstime)
+        rastr = coord.ra.to_string(unit=u.hourangle, sep=' ', precision=2, pad=True)
+        decstr = coord.dec.to_string(unit=u.deg, sep=' ', precision=1,
+                                     alwayssign=True, pad=True)
+        lines.append(f"{target.TargetName.value:15s} {rastr} {decstr} 2000")
+    return lines
+
+
+def check_golden(name, lines):
+    file = golden / name
+    text = '\n'.join(lines)+'\n'
+    if args.update_golden is True:
+        golden.mkdir(exist_ok=True)
+        file.write_text(text)
+        print(f"wrote {file}")
+    else:
+        assert file.read_text() == text, f"{file} does not match"
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    targets = random_targets(args.number)
+    obstime = Time(epoch, format='decimalyear')
+    print(f"{args.number} targets, proper motion to {epoch}")
+
+    # One target at a time
+    sample = targets[:args.sample]
+    tick = time.perf_counter()
+    per_target = per_target_lines(sample, obstime)
+    elapsed = (time.perf_counter() - tick) * args.number / len(sample)
+    print(f"per target:  {elapsed:8.3f} s (scaled from {len(sample)} targets)")
+
+    # Whole list
+    tick = time.perf_counter()
+    lines = star_list_lines(targets, epoch=epoch)
+    vectorized = time.perf_counter() - tick
+    print(f"batch:       {vectorized:8.3f} s")
+    print(f"speed up:    {elapsed/vectorized:8.1f}x")
+
+    # Checks
+    check_golden('star_list.txt', star_list_lines(targets[:ngolden]))
+    check_golden(f"star_list_{epoch}.txt", lines[:ngolden])
+    # Same coordinates as astropy's formatting to within the last digit
+    catalog = TargetCatalog(sample)
+    coord = catalog.propagate(obstime)
+    for line, expected, ra, dec in zip(lines, per_target, coord.ra.hour, coord.dec.deg):
+        if line[:43] != expected[:43]:
+            fields = [float(f) for f in line[16:43].split()]
+            ra_line = fields[0] + fields[1]/60 + fields[2]/3600
+            dec_line = abs(fields[3]) + fields[4]/60 + fields[5]/3600
+            assert abs(ra_line - ra)*3600 <= 0.005
+            assert abs(dec_line - abs(dec))*3600 <= 0.05
+    mismatched = sum([l[:43] != e[:43] for l,e in zip(lines, per_target)])
+    print(f"lines differing from astropy to_string in last digit: {mismatched} of {len(sample)}")
+    # Round trip
+    assert star_list_lines(parse_star_list(lines), epoch=epoch) == lines
+    no_epoch = star_list_lines(targets)
+    assert star_list_lines(parse_star_list(no_epoch)) == no_epoch
+    assert targets[1].to_star_list() == no_epoch[1]
+    print('checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+from pathlib import Path
+import argparse
+
+import numpy as np
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Compare AltAz and horizon checks
+for many targets over a time grid computed one target at a time (using each
+Target's own SkyCoord, as the OB GUI does) with the array valued
+TargetCatalog.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=2000,
+               help="Number of targets (default: 2000)")
+p.add_argument("-t", "--times", dest="ntimes", type=int, default=100,
+               help="Number of time steps over the night (default: 100)")
+p.add_argument("-s", "--sample", dest="sample", type=int, default=50,
+               help="Number of targets to time one at a time, the result is "
+                    "scaled to the full number (default: 50)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import astropy.units as u
+from astropy.time import Time
+from astropy.coordinates import AltAz
+
+from kpf.telescope import get_location, above_horizon
+from kpf.ObservingBlocks.Target import Target
+from kpf.ObservingBlocks.TargetCatalog import TargetCatalog
+
+
+def random_targets(number):
+    rng = np.random.default_rng(42)
+    targets = []
+    for i in range(number):
+        ra = rng.uniform(0, 24)
+        dec = rng.uniform(-40, 89)
+        targets.append(Target({'TargetName': f"Target{i:05d}",
+            'RA': f"{int(ra):02d}:{int(ra*60%60):02d}:{ra*3600%60:05.2f}",
+            'Dec': f"{'-' if dec < 0 else '+'}{int(abs(dec)):02d}:{int(abs(dec)*60%60):02d}:{abs(dec)*3600%60:04.1f}",
+            'PMRA': float(rng.normal(0, 0.01)),
+            'PMDEC': float(rng.normal(0, 0.1)),
+            'Epoch': '2016.0'}))
+    return targets
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    targets = random_targets(args.number)
+    times = Time('2026-10-18T05:00:00') + np.linspace(0, 12, args.ntimes)*u.hour
+    location = get_location()
+    print(f"{args.number} targets x {args.ntimes} time steps")
+
+    # One target at a time
+    sample = targets[:args.sample]
+    tick = time.perf_counter()
+    frame = AltAz(obstime=times, location=location,
+                  pressure=620*u.mbar, temperature=0*u.Celsius)
+    per_target = []
+    for target in sample:
+        altaz = target.coord.transform_to(frame)
+        per_target.append(above_horizon(altaz.az.deg, altaz.alt.deg))
+    elapsed = (time.perf_counter() - tick) * args.number / len(sample)
+    print(f"per target:  {elapsed:8.2f} s (scaled from {len(sample)} targets)")
+
+    # Whole catalog
+    tick = time.perf_counter()
+    catalog = TargetCatalog(targets)
+    built = time.perf_counter() - tick
+    altaz = catalog.altaz(times)
+    observable = catalog.above_horizon(altaz=altaz)
+    catalog.airmass(altaz=altaz)
+    catalog.hour_angle(times)
+    vectorized = time.perf_counter() - tick
+    print(f"catalog:     {vectorized:8.2f} s (of which {built:.2f} s to build, "
+          f"includes airmass and hour angle)")
+    print(f"speed up:    {elapsed/vectorized:8.1f}x")
+
+    # Check the two agree (the catalog applies proper motion, the per
+    # target SkyCoords do not, so allow for a few arcsec)
+    diff = np.abs(np.array([a for a in per_target]) != observable[:len(sample)])
+    print(f"horizon disagreements in sample: {np.sum(diff)} of {diff.size}")
+
+
+if __name__ == '__main__':
+    main()
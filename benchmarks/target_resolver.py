@@ -0,0 +1,144 @@
+#!python3
+
+## Import General Tools
+import os
+import sys
+import time
+import types
+import tempfile
+import importlib
+import threading
+from pathlib import Path
+import argparse
+
+
+##-------------------------------------------------------------------------
+## Parse Command Line Arguments
+##-------------------------------------------------------------------------
+p = argparse.ArgumentParser(description='''Resolve a list of target names
+(with repeats, as in a semester of OBs) through the target resolution cache
+(kpf.ObservingBlocks.TargetResolver). The Simbad and Vizier queries are
+answered by a local fake astroquery backend with a fixed latency, so no
+network is needed. Compares uncached serial resolution with a cold and a
+warm batch resolve. The cache behaviour (TTLs, negative caching, offline
+mode, failures) is covered by tests/test_target_resolver.py.
+''')
+p.add_argument("-n", "--number", dest="number", type=int, default=200,
+               help="Number of names to resolve (default: 200)")
+p.add_argument("-u", "--unique", dest="unique", type=int, default=50,
+               help="Number of distinct targets among the names (default: 50)")
+p.add_argument("-l", "--latency", dest="latency", type=float, default=0.05,
+               help="Simulated catalog query time in seconds (default: 0.05)")
+args = p.parse_args()
+
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+os.environ['KPF_RESOLVER_CACHE'] = str(Path(tempfile.mkdtemp()) / 'target_resolver.sqlite')
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from astropy.table import Table, MaskedColumn
+
+from kpf.ObservingBlocks import TargetResolver
+from kpf.ObservingBlocks.Target import Target
+TargetModule = importlib.import_module('kpf.ObservingBlocks.Target')
+
+
+##-------------------------------------------------------------------------
+## Fake astroquery backend
+##-------------------------------------------------------------------------
+class FakeCatalogs(object):
+    '''Stands in for the astroquery.simbad and astroquery.vizier modules.
+    Target i is HD i, with Gaia DR3 ID 1000+i and 2MASS ID J0000000i.
+    '''
+    def __init__(self, latency):
+        self.latency = latency
+        self.queries = 0
+        self.fail = False
+        self.lock = threading.Lock()
+        fake = self
+        class Simbad(object):
+            @staticmethod
+            def query_objectids(name):
+                i = fake.query(name)
+                if i is None:
+                    return None
+                return Table({'ID': [f"HD {i}", f"Gaia DR3 {1000+i}", f"2MASS J{i:08d}"]})
+            @staticmethod
+            def query_object(name):
+                return Table({'RA': ['01 02 03.4'], 'DEC': ['+05 06 07.8']})
+        class Vizier(object):
+            def __init__(self, catalog=None):
+                self.catalog = catalog
+            def query_constraints(self, Source=None):
+                i = int(Source) - 1000
+                fake.query(f"HD {i}")
+                row = {'RA_ICRS': i % 360, 'DE_ICRS': i % 90, 'pmRA': 10.0,
+                       'pmDE': -5.0, 'Plx': 20.0, 'RVDR2': 0.0, 'Gmag': 6.0,
+                       'Tefftemp': 5000.0}
+                table = Table({k: MaskedColumn([v]) for k,v in row.items()})
+                table['RVDR2'].mask[0] = True
+                return [table]
+            def query_object(self, twomassid, radius=None):
+                fake.query(f"HD {int(twomassid[1:])}")
+                return [Table({'Jmag': MaskedColumn([5.0])})]
+        self.simbad = types.SimpleNamespace(Simbad=Simbad)
+        self.vizier = types.SimpleNamespace(Vizier=Vizier)
+
+    def query(self, name):
+        with self.lock:
+            self.queries += 1
+        if self.fail is True:
+            raise ConnectionError('Simulated network failure')
+        time.sleep(self.latency)
+        if not name.upper().startswith('HD '):
+            return None
+        return int(name[3:])
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    fake = FakeCatalogs(args.latency)
+    TargetModule.simbad = fake.simbad
+    TargetModule.vizier = fake.vizier
+    cache = TargetResolver.get_cache()
+    names = [f"HD {i % args.unique + 1}" if i % 2 else f"hd  {i % args.unique + 1}"
+             for i in range(args.number)]
+    print(f"Resolving {len(names)} names ({args.unique} targets), "
+          f"{args.latency*1000:.0f} ms per catalog query")
+
+    # Uncached, serial: the behaviour without the resolver cache
+    cache.ttl = cache.negative_ttl = 0
+    nserial = min(len(names), 20)
+    tick = time.perf_counter()
+    serial = [Target.resolve_name(name) for name in names[:nserial]]
+    elapsed = (time.perf_counter() - tick)/nserial*len(names)
+    print(f"uncached serial:  {elapsed:7.2f} s (extrapolated from {nserial} names)")
+
+    cache.ttl = cache.negative_ttl = 3600
+    cache.invalidate()
+    fake.queries = 0
+    tick = time.perf_counter()
+    targets = Target.resolve_names(names)
+    cold = time.perf_counter() - tick
+    print(f"cold batch:       {cold:7.2f} s ({fake.queries} catalog queries)")
+    assert fake.queries == 3*args.unique
+    for name, target in zip(names, targets):
+        assert target.get('TargetName') == name
+        assert target.get('GaiaID') == f"DR3 {1000+int(name.split()[-1])}"
+        assert target.get('Jmag') == 5.0
+    assert serial[0].to_dict() == targets[0].to_dict()
+
+    fake.queries = 0
+    tick = time.perf_counter()
+    Target.resolve_names(names)
+    warm = time.perf_counter() - tick
+    print(f"warm batch:       {warm:7.2f} s ({fake.queries} catalog queries)")
+    assert fake.queries == 0
+
+    print(f"cache stats: {cache.stats}")
+
+
+if __name__ == '__main__':
+    main()
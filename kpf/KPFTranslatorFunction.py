@@ -3,7 +3,7 @@ from argparse import Namespace, ArgumentTypeError
 
 from kpf import log
 from kpf.exceptions import *
-from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.metrics import ExecutionTimer
 
 
 class KPFFunction(object):
@@ -42,30 +42,42 @@ class KPFFunction(object):
             The arguments in dictionary form
         """
         cls._check_args(args)
-
-        # PRE CONDITION #
-        try:
-            cls.pre_condition(args)
-        except Exception as e:
-            log.error(f"Exception encountered in pre-condition: {e}", exc_info=True)
-            raise e
-
-        # PERFORM #
+        timer = ExecutionTimer(cls.__name__, args)
         try:
-            return_value = cls.perform(args)
-        except Exception as e:
-            log.error(f"Exception encountered in perform: {e}", exc_info=True)
-            raise e
-
-        # POST CONDITION #
-        try:
-            cls.post_condition(args)
-        except Exception as e:
-            log.error(f"Exception encountered in post-condition: {e}")
-            log.error(traceback.format_exc(), exc_info=True)
-            raise e
-
-        return return_value
+            # PRE CONDITION #
+            try:
+                cls.pre_condition(args)
+            except Exception as e:
+                timer.fail('pre_condition', e)
+                log.error(f"Exception encountered in pre-condition: {e}", exc_info=True)
+                raise e
+            timer.mark('pre_condition')
+
+            # PERFORM #
+            try:
+                return_value = cls.perform(args)
+            except Exception as e:
+                timer.fail('perform', e)
+                log.error(f"Exception encountered in perform: {e}", exc_info=True)
+                raise e
+            timer.mark('perform')
+
+            # POST CONDITION #
+            try:
+                cls.post_condition(args)
+            except Exception as e:
+                timer.fail('post_condition', e)
+                log.error(f"Exception encountered in post-condition: {e}")
+                log.error(traceback.format_exc(), exc_info=True)
+                raise e
+            timer.mark('post_condition')
+            timer.finish()
+
+            return return_value
+        finally:
+            # Closes the trace span if the call was interrupted (e.g. by
+            # KeyboardInterrupt) rather than finished or failed
+            timer.close()
 
 
     """
@@ -118,36 +130,47 @@ class KPFScript(KPFFunction):
         args : dict
             The arguments in dictionary form
         """
-        # Read the OB
-        if isinstance(OB, dict):
-            OB = ObservingBlock(OB)
-        elif isinstance(OB, ObservingBlock):
-            pass
-        elif OB is None:
-            pass
-        else:
-            raise FailedPreCondition('Input must be dict or ObservingBlock')
-
-        # PRE CONDITION #
+        # Read the OB. The OB data model (and numpy) is only imported when
+        # there is an OB, so that importing a function stays cheap.
+        if OB is not None:
+            from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+            if isinstance(OB, dict):
+                OB = ObservingBlock(OB)
+            elif not isinstance(OB, ObservingBlock):
+                raise FailedPreCondition('Input must be dict or ObservingBlock')
+        timer = ExecutionTimer(cls.__name__, args, OB=OB)
         try:
-            cls.pre_condition(args, OB=OB)
-        except Exception as e:
-            log.error(f"Exception encountered in pre-condition: {e}", exc_info=True)
-            raise e
-
-        # PERFORM #
-        try:
-            return_value = cls.perform(args, OB=OB)
-        except Exception as e:
-            log.error(f"Exception encountered in perform: {e}", exc_info=True)
-            raise e
-
-        # POST CONDITION #
-        try:
-            cls.post_condition(args, OB=OB)
-        except Exception as e:
-            log.error(f"Exception encountered in post-condition: {e}")
-            logger.error(traceback.format_exc(), exc_info=True)
-            raise e
-
-        return return_value
+            # PRE CONDITION #
+            try:
+                cls.pre_condition(args, OB=OB)
+            except Exception as e:
+                timer.fail('pre_condition', e)
+                log.error(f"Exception encountered in pre-condition: {e}", exc_info=True)
+                raise e
+            timer.mark('pre_condition')
+
+            # PERFORM #
+            try:
+                return_value = cls.perform(args, OB=OB)
+            except Exception as e:
+                timer.fail('perform', e)
+                log.error(f"Exception encountered in perform: {e}", exc_info=True)
+                raise e
+            timer.mark('perform')
+
+            # POST CONDITION #
+            try:
+                cls.post_condition(args, OB=OB)
+            except Exception as e:
+                timer.fail('post_condition', e)
+                log.error(f"Exception encountered in post-condition: {e}")
+                log.error(traceback.format_exc(), exc_info=True)
+                raise e
+            timer.mark('post_condition')
+            timer.finish()
+
+            return return_value
+        finally:
+            # Closes the trace span if the call was interrupted (e.g. by
+            # KeyboardInterrupt) rather than finished or failed
+            timer.close()
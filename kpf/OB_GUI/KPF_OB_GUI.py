@@ -45,7 +45,8 @@ from kpf.spectrograph.SetObserver import SetObserver
 from kpf.spectrograph.SetProgram import SetProgram
 from kpf.utils.StartOfNight import StartOfNight
 from kpf.utils.EndOfNight import EndOfNight
-from kpf.observatoryAPIs import get_semester_dates
+from kpf.observatoryAPIs import (get_semester_dates, fetch_concurrently,
+                                 iter_OBs_from_KPFCC_API)
 from kpf.observatoryAPIs.GetScheduledPrograms import GetScheduledPrograms
 from kpf.observatoryAPIs.GetTelescopeRelease import GetTelescopeRelease
 from kpf.fiu.ConfigureFIU import ConfigureFIU
@@ -986,11 +987,22 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.KPFCC = False
                 self.clear_OB_selection()
                 self.OBListHeader.setText(self.hdr)
-                OBs, failures = GetObservingBlocksByProgram.execute({'program': progID})
-                msg = f"Retrieved {len(OBs)} OBs for program {progID}"
+                self.OBListModel.clear_list()
+                # Show the OBs as they arrive rather than after the whole
+                # response has been downloaded
+                semester, start, end = get_semester_dates(datetime.datetime.now())
+                params = {'semid': f"{semester}_{progID}"}
+                try:
+                    for OBs, failures in iter_OBs_from_KPFCC_API(params):
+                        self.OBListModel.extend(OBs, sort=False)
+                        QtWidgets.QApplication.processEvents()
+                except Exception as e:
+                    self.log.error(f'Failed to retrieve OBs for {progID}: {e}')
+                msg = f"Retrieved {len(self.OBListModel.OBs)} OBs for program {progID}"
                 self.GUITaskLabel.setText(msg)
                 self.log.debug(msg)
-                self.OBListModel.set_list(OBs)
+                self.OBListModel.sort()
+                self.OBListModel.update_star_list()
                 self.set_SortOrWeather()
 #                 ConfirmationPopup('Retrieved OBs from Database', msg, info_only=True).exec_()
             else:
@@ -1014,13 +1026,20 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ProgressBar.setVisible(True)
         self.ProgressBar.setValue(0)
         self.GUITaskLabel.setText(f'Retrieving OBs from all {len(progIDs)} KPF-CC programs.')
-        # Iterate of KPF-CC programIDs and retrieve their OBs from DB
-        for i,progID in enumerate(progIDs):
-            self.log.debug(f'Retrieving OBs for {progID}')
-            programOBs, failures = GetObservingBlocksByProgram.execute({'program': progID})
-            self.OBListModel.extend(programOBs)
-            self.log.debug(f'  Got {len(programOBs)} for {progID}, total KPF-CC OB count is now {len(self.OBListModel.OBs)}')
+        # Retrieve the OBs for all KPF-CC programIDs from the DB concurrently,
+        # adding them to the list as they arrive and sorting once at the end
+        fetch = lambda progID: GetObservingBlocksByProgram.execute({'program': progID})
+        for i,(progID, result, err) in enumerate(fetch_concurrently(fetch, progIDs)):
+            if err is not None:
+                self.log.error(f'Failed to retrieve OBs for {progID}: {err}')
+            else:
+                programOBs, failures = result
+                self.OBListModel.extend(programOBs, sort=False)
+                self.log.debug(f'  Got {len(programOBs)} for {progID}, total KPF-CC OB count is now {len(self.OBListModel.OBs)}')
             self.ProgressBar.setValue(int((i+1)/len(progIDs)*100))
+            QtWidgets.QApplication.processEvents()
+        self.OBListModel.sort()
+        self.OBListModel.update_star_list()
         self.GUITaskLabel.setText(f'Retrieved {len(self.OBListModel.OBs)} OBs from all {len(progIDs)} KPF-CC programs.')
         self.set_SortOrWeather()
 
@@ -1081,54 +1100,70 @@ class MainWindow(QtWidgets.QMainWindow):
         scheduledOBcount = 0
         retrievedOBcount = 0
         errs = []
+        # Read the OB IDs and start times from the schedules
+        scheduled = {}
         for i,WB in enumerate(self.KPFCC_weather_bands):
-            nOBs_this_WB = len(schedule_file_contents[WB])
-            self.log.debug(f'Getting {nOBs_this_WB} OBs for weather band {WB}')
-            # Pre-load a slewcal OB for convienience
-            if self.OBcache['slewcal'] is not None:
-                self.KPFCC_OBs[WB] = ['slewcal']
-                self.KPFCC_start_times[WB] = [0]
-            else:
-                self.KPFCC_OBs[WB] = []
-                self.KPFCC_start_times[WB] = []
+            scheduled[WB] = []
             for schedind,entry in enumerate(schedule_file_contents[WB]):
                 scheduledOBcount += 1
-                obid = entry[id_column_name]
                 if id_column_name not in entry.keys():
                     errmsg = f"band {WB}, line={schedind}, {entry['Target']}: Failed no id column"
                     self.log.error(errmsg)
                     errs.append(errmsg)
-                    self.GUITaskLabel.setText('\n'.join(GUImsg))
-                elif obid in ['', None, 'None']:
+                    continue
+                obid = entry[id_column_name]
+                if obid in ['', None, 'None']:
                     errmsg = f"{WB} line={schedind}, {entry['Target']}: Failed no id value"
                     self.log.error(errmsg)
                     errs.append(errmsg)
-                    self.GUITaskLabel.setText('\n'.join(GUImsg))
+                    continue
+                start = entry['StartExposure'].split(':')
+                start_decimal = int(start[0]) + int(start[1])/60
+                if obid in self.OBcache.keys():
+                    self.log.info(f"{WB} line={schedind}, {entry['Target']}: Already downloaded")
+                scheduled[WB].append((obid, start_decimal, f"{WB} line={schedind}, {entry['Target']}"))
+        self.GUITaskLabel.setText('\n'.join(GUImsg))
+        # Download the OBs we do not have yet concurrently, each only once
+        # even if it is scheduled in several weather bands
+        toget = list(dict.fromkeys([obid for WB in scheduled.keys() for obid,start,label in scheduled[WB]
+                                    if obid not in self.OBcache.keys()]))
+        self.log.info(f"Downloading {len(toget)} OBs")
+        fetch = lambda obid: GetObservingBlocks.execute({'OBid': obid})
+        for i,(obid, result, err) in enumerate(fetch_concurrently(fetch, toget)):
+            if err is not None:
+                result = [], [f"{obid}: {err}"]
+            # GetObservingBlocks goes through the persistent OB cache, which
+            # falls back to the cached copy if the database can not be reached
+            OBs, failure_messages = result
+            if len(OBs) > 0:
+                self.OBcache[obid] = OBs[0]
+            else:
+                errs += failure_messages
+            self.ProgressBar.setValue(int((i+1)/len(toget)*100))
+            self.GUITaskLabel.setText('\n'.join(GUImsg + [f"Downloaded {i+1}/{len(toget)}"]))
+            QtWidgets.QApplication.processEvents()
+        # Build the OB list for each weather band in schedule order
+        for i,WB in enumerate(self.KPFCC_weather_bands):
+            self.log.debug(f'Got {len(scheduled[WB])} OBs for weather band {WB}')
+            # Pre-load a slewcal OB for convienience
+            if self.OBcache['slewcal'] is not None:
+                self.KPFCC_OBs[WB] = ['slewcal']
+                self.KPFCC_start_times[WB] = [0]
+            else:
+                self.KPFCC_OBs[WB] = []
+                self.KPFCC_start_times[WB] = []
+            for obid, start_decimal, label in scheduled[WB]:
+                if obid in self.OBcache.keys():
+                    self.KPFCC_OBs[WB].append(obid)
+                    self.KPFCC_start_times[WB].append(start_decimal)
+                    retrievedOBcount += 1
                 else:
-                    start = entry['StartExposure'].split(':')
-                    start_decimal = int(start[0]) + int(start[1])/60
-                    # See if we have downloaded this before
-                    if obid in self.OBcache.keys():
-                        self.log.info(f"{WB} line={schedind}, {entry['Target']}: Already downloaded")
-                        OB = self.OBcache[obid]
-                        self.KPFCC_OBs[WB].append(obid)
-                        self.KPFCC_start_times[WB].append(start_decimal)
-                        retrievedOBcount += 1
-                    else:
-                        self.log.info(f"{WB} line={schedind}, {entry['Target']}: Downloading ...")
-                        result, failure_messages = GetObservingBlocks.execute({'OBid': obid})
-                        if len(result) > 0:
-                            self.OBcache[obid] = result[0]
-                            self.KPFCC_OBs[WB].append(obid)
-                            self.KPFCC_start_times[WB].append(start_decimal)
-                            retrievedOBcount += 1
-                        else:
-                            errs += failure_messages
-                self.ProgressBar.setValue(int(scheduledOBcount/Nsched*100))
+                    self.log.error(f"{label}: Failed to retrieve {obid}")
             # Append a slewcal OB for convienience
             if self.OBcache['slewcal'] is not None:
                 self.KPFCC_OBs[WB].append('slewcal')
                 self.KPFCC_start_times[WB].append(24)
+        self.ProgressBar.setValue(100)
         msg = [f"Retrieved {retrievedOBcount} (out of {scheduledOBcount}) OBs for all weather bands"]
         self.GUITaskLabel.setText("".join(msg))
         self.set_weather_band(self.KPFCC_weather_band)
@@ -1812,6 +1847,9 @@ if __name__ == '__main__':
         default=False, action="store_true",
         help="Load KPF-CC schedule on startup.")
     clargs = p.parse_args()
+    # The GUI fetches OBs in threads, so OBTable workers can't be forked
+    if cfg.get('OBTable', 'start_method', fallback='auto') == 'auto':
+        cfg.set('OBTable', 'start_method', 'forkserver')
 
     guilog = create_GUI_log(verbose=clargs.verbose)
     guilog.info(f"-----------------------------")
@@ -8,6 +8,7 @@ import ktl
 
 from kpf import cfg
 from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.ObservingBlocks.StarList import star_list_lines
 from kpf.observatoryAPIs.GetTelescopeRelease import GetTelescopeRelease
 from kpf.observatoryAPIs.GetObservingBlocks import GetObservingBlocks
 from kpf.magiq.RemoveTarget import RemoveTarget, RemoveAllTargets
@@ -35,6 +36,7 @@ class OBListModel(QtCore.QAbstractListModel):
         super(OBListModel, self).__init__(*args, **kwargs)
         self.OBs = []
         self.start_times = None
+        self.sent_star_list = None
         self.update_observed_status()
         self.currentOB = -1
         self.nextOB = -1
@@ -206,8 +208,13 @@ class OBListModel(QtCore.QAbstractListModel):
             if self.telescope_interactions_allowed() and self.magiq_enabled:
                 self.log.info(f"Adding {targetname} to Magiq star list")
                 AddTarget.execute(OB.Target.to_dict())
+                self.sent_star_list = None
 
-    def extend(self, OBs, start_times=None):
+    def extend(self, OBs, start_times=None, sort=True):
+        '''Add OBs to the list. With sort=False the list is neither sorted
+        nor sent to MAGIQ, so that OBs can be added as they arrive and
+        sort and update_star_list called once at the end.
+        '''
         self.log.debug('OBListModel.extend')
         self.OBs.extend(OBs)
         if self.start_times is not None:
@@ -216,6 +223,9 @@ class OBListModel(QtCore.QAbstractListModel):
             else:
                 self.start_times.extend(start_times)
             self.sort_key = 'time'
+        if sort is False:
+            self.layoutChanged.emit()
+            return
         self.sort()
         self.update_star_list()
 
@@ -231,6 +241,7 @@ class OBListModel(QtCore.QAbstractListModel):
             if self.telescope_interactions_allowed() and self.magiq_enabled:
                 self.log.info(f"Removing {targetname} from Magiq star list")
                 RemoveTarget.execute({'TargetName': targetname})
+                self.sent_star_list = None
 
     def updateOB(self, ind, newOB):
         self.log.debug('OBListModel.updateOB')
@@ -257,9 +268,19 @@ class OBListModel(QtCore.QAbstractListModel):
     def update_star_list(self):
         if self.telescope_interactions_allowed() and self.magiq_enabled:
             self.log.debug('update_star_list')
-            star_list = [OB.Target.to_star_list() for OB in self.OBs
-                         if OB.Target is not None]
-            for line in star_list:
+            # Apply proper motions to today for all targets at once
+            now = datetime.utcnow()
+            epoch = round(now.year + (now.timetuple().tm_yday-0.5)/365.25, 2)
+            star_list = star_list_lines([OB.Target for OB in self.OBs
+                                         if OB.Target is not None],
+                                        epoch=epoch)
+            star_list = '\n'.join(star_list)
+            # Don't resend an unchanged list
+            if star_list == self.sent_star_list:
+                self.log.debug('Star list is unchanged')
+                return
+            for line in star_list.split('\n'):
                 self.log.debug(line)
             RemoveAllTargets.execute({})
-            SetTargetList.execute({'StarList': '\n'.join(star_list)})
+            SetTargetList.execute({'StarList': star_list})
+            self.sent_star_list = star_list
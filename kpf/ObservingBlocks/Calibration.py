@@ -1,46 +1,26 @@
-from pathlib import Path
-import yaml
-
-from kpf.ObservingBlocks import BaseOBComponent
-
-try:
-    import ktl
-except ModuleNotFoundError:
-    ktl = None
+from kpf.ObservingBlocks import (BaseOBComponent, get_schema,
+                                 get_instrument_options)
 
 
 class Calibration(BaseOBComponent):
+    __slots__ = ['expmeter_bands', 'ND_values']
+    calsources = ['Dark', 'Home', 'dark', 'WideFlat', 'BrdbandFiber',
+                  'U_gold', 'U_daily', 'Th_daily', 'Th_gold',
+                  'LFCFiber', 'EtalonFiber',
+                  'SoCal-CalFib', 'SoCal-SciSky']
+    skip_if_dark = ['IntensityMonitor', 'CalND1', 'CalND2',
+                    'OpenScienceShutter', 'OpenSkyShutter',
+                    'TakeSimulCal', 'WideFlatPos', 'ExpMeterMode',
+                    'ExpMeterExpTime', 'ExpMeterBin',
+                    'ExpMeterThreshold']
+
     def __init__(self, input_dict):
-        properties_file = Path(__file__).parent / 'CalibrationProperties.yaml'
-        with open(properties_file, 'r') as f:
-            properties = yaml.safe_load(f.read())
-        super().__init__('Calibration', '2.0', properties=properties)
+        super().__init__('Calibration', '2.0', properties=get_schema('CalibrationProperties.yaml'))
         self.list_element = True
-        self.calsources = ['Dark', 'Home', 'dark', 'WideFlat', 'BrdbandFiber',
-                           'U_gold', 'U_daily', 'Th_daily', 'Th_gold',
-                           'LFCFiber', 'EtalonFiber',
-                           'SoCal-CalFib', 'SoCal-SciSky']
-        try:
-            WAVEBINS = ktl.cache('kpf_expmeter', 'WAVEBINS')
-            self.expmeter_bands = [f"{float(b):.0f}nm" for b in WAVEBINS.read().split()]
-            ND1POS = ktl.cache('kpfcal', 'ND1POS')
-            ND2POS = ktl.cache('kpfcal', 'ND2POS')
-            self.ND_values = {'CalND1': list(ND1POS._getEnumerators()),
-                              'CalND2': list(ND2POS._getEnumerators())}
-            for nd in ['CalND1', 'CalND2']:
-                if 'Unknown' in self.ND_values[nd]:
-                    self.ND_values[nd].pop(self.ND_values[nd].index('Unknown'))
-        except:
-            self.expmeter_bands = [f"{float(b):.0f}nm" for b in [498.12, 604.38, 710.62, 816.88]]
-            self.ND_values = {'CalND1': ['OD 0.1', 'OD 1.0', 'OD 1.3', 'OD 2.0', 'OD 3.0', 'OD 4.0'],
-                              'CalND2': ['OD 0.1', 'OD 0.3', 'OD 0.5', 'OD 0.8', 'OD 1.0', 'OD 4.0']}
-        self.skip_if_dark = ['IntensityMonitor', 'CalND1', 'CalND2',
-                             'OpenScienceShutter', 'OpenSkyShutter',
-                             'TakeSimulCal', 'WideFlatPos', 'ExpMeterMode',
-                             'ExpMeterExpTime', 'ExpMeterBin',
-                             'ExpMeterThreshold']
+        self.expmeter_bands, self.ND_values = get_instrument_options()
         # Handle different defaults for dark frame
         if input_dict.get('CalSource') in ['Dark', 'dark', 'Home', 'home']:
+            input_dict = dict(input_dict)
             if 'IntensityMonitor' not in input_dict.keys():
                 input_dict['IntensityMonitor'] = False
             if 'OpenScienceShutter' not in input_dict.keys():
@@ -96,8 +76,7 @@ class Calibration(BaseOBComponent):
 
 
     def add_comment(self, pname):
-        error, comment = self.check_property(pname)
-        return comment
+        return self.check_properties()[pname].comment
 
 
     def __str__(self):
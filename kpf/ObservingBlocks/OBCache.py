@@ -0,0 +1,308 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+
+from kpf import log, cfg
+from kpf.ObservingBlocks.OBStore import get_store
+from kpf.ObservingBlocks.OBTable import OBTable
+from kpf.ObservingBlocks.serialization import canonical_dumps
+
+
+CacheEntry = namedtuple('CacheEntry', ['OBID', 'revision', 'digest', 'etag',
+                                       'checked', 'accessed', 'size'])
+
+
+def entry_digest(entry):
+    '''ETag style hash of an OB as returned by the database, used to tell
+    whether it changed without building the ObservingBlock. None if the
+    entry is not valid JSON (e.g. contains NaN), so it is always rebuilt.
+    '''
+    try:
+        return hashlib.sha256(canonical_dumps(entry)).hexdigest()
+    except ValueError:
+        return None
+
+
+##-------------------------------------------------------------------------
+## OBCache
+##-------------------------------------------------------------------------
+class OBCache(object):
+    '''Persistent cache of the OBs in the KPF-CC database, keyed by OBID.
+
+    The OBs are kept in the OB store (see OBStore) and an SQLite index in the
+    same directory records, for each OBID, the stored revision, the hash of
+    the database entry it was built from, the server's ETag (if it sent
+    one), and when it was last checked and last used.
+
+    An entry checked less than ttl seconds ago is used without going to the
+    network. An older entry is revalidated: the request carries the ETag so
+    a server which supports it can answer "304 Not Modified", otherwise the
+    entry is downloaded and only rebuilt if its hash changed. If the
+    database can not be reached the stored copy is used regardless of its
+    age. In offline mode the network is never used. If the cache itself can
+    not be used (e.g. its directory is missing or not writable) every OB is
+    queried directly from the database.
+
+    The least recently used entries are evicted when there are more than
+    max_entries or they take more than max_bytes on disk.
+    '''
+    def __init__(self, store=None, ttl=None, max_entries=None, max_bytes=None,
+                 offline=None):
+        self.store = store if store is not None else get_store()
+        self.index_file = self.store.directory / 'index.sqlite'
+        if ttl is None:
+            ttl = cfg.getfloat('OBstore', 'ttl', fallback=300)
+        self.ttl = ttl
+        if max_entries is None:
+            max_entries = cfg.getint('OBstore', 'max_entries', fallback=5000)
+        self.max_entries = max_entries
+        if max_bytes is None:
+            max_bytes = cfg.getint('OBstore', 'max_bytes', fallback=256*1024**2)
+        self.max_bytes = max_bytes
+        if offline is None:
+            offline = os.getenv('KPF_OB_CACHE_OFFLINE', default=None)
+            if offline is None:
+                offline = cfg.getboolean('OBstore', 'offline', fallback=False)
+            else:
+                offline = offline.lower() in ['1', 'true', 'yes']
+        self.offline = offline
+        self.lock = threading.RLock()
+        self.connection = None
+        self.stats = {'hits': 0, 'revalidated': 0, 'downloaded': 0,
+                      'stale': 0, 'evicted': 0, 'uncached': 0}
+
+    def connect(self):
+        '''Open (once) the index database, creating it if needed.'''
+        with self.lock:
+            if self.connection is None:
+                self.index_file.parent.mkdir(parents=True, exist_ok=True)
+                self.connection = sqlite3.connect(self.index_file, timeout=10,
+                                                  check_same_thread=False)
+                self.connection.execute('''CREATE TABLE IF NOT EXISTS entries
+                                           (OBID TEXT PRIMARY KEY, revision TEXT,
+                                            digest TEXT, etag TEXT, checked REAL,
+                                            accessed REAL, size INTEGER)''')
+                self.connection.commit()
+            return self.connection
+
+    def read(self, OBID):
+        with self.lock:
+            row = self.connect().execute('SELECT * FROM entries WHERE OBID=?',
+                                         (OBID,)).fetchone()
+        return CacheEntry(*row) if row is not None else None
+
+    def touch(self, OBID, checked=False):
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            if checked is True:
+                connection.execute('UPDATE entries SET accessed=?, checked=? WHERE OBID=?',
+                                   (now, now, OBID))
+            else:
+                connection.execute('UPDATE entries SET accessed=? WHERE OBID=?',
+                                   (now, OBID))
+            connection.commit()
+
+    def load(self, entry):
+        '''The stored OB for an index entry, or None if it has gone.'''
+        self.touch(entry.OBID)
+        try:
+            return self.store.get(revision=entry.revision)
+        except Exception as e:
+            log.warning(f"Unable to read OB {entry.OBID} from the OB store: {e}")
+            # Remove a corrupt copy so it is written again when downloaded
+            try:
+                self.store.object_file(entry.revision).unlink(missing_ok=True)
+            except OSError:
+                pass
+            return None
+
+    def put(self, OB, digest=None, etag=None):
+        '''Store an OB and index it under its OBID.'''
+        OBdict = OB.to_dict()
+        revision, data = self.store.revision_of(OBdict)
+        now = time.time()
+        with self.lock:
+            previous = self.read(OB.OBID)
+            self.store.put(OBdict)
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (OB.OBID, revision, digest, etag, now, now, len(data)))
+            connection.commit()
+            if previous is not None and previous.revision != revision:
+                self.remove_object(previous.revision)
+            self.evict()
+        return revision
+
+    def remove_object(self, revision):
+        '''Delete a stored revision which no index entry refers to.'''
+        with self.lock:
+            used = self.connect().execute('SELECT COUNT(*) FROM entries WHERE revision=?',
+                                          (revision,)).fetchone()[0]
+            if used == 0:
+                self.store.object_file(revision).unlink(missing_ok=True)
+
+    def invalidate(self, OBID=None):
+        '''Remove one OB, or every OB, from the cache.'''
+        with self.lock:
+            connection = self.connect()
+            if OBID is None:
+                entries = connection.execute('SELECT OBID, revision FROM entries').fetchall()
+            else:
+                entries = connection.execute('SELECT OBID, revision FROM entries WHERE OBID=?',
+                                             (OBID,)).fetchall()
+            for OBID, revision in entries:
+                connection.execute('DELETE FROM entries WHERE OBID=?', (OBID,))
+                self.store.ref_file(OBID).unlink(missing_ok=True)
+                self.remove_object(revision)
+            connection.commit()
+
+    def evict(self):
+        '''Drop the least recently used OBs until the cache is within its
+        size bounds.
+        '''
+        with self.lock:
+            connection = self.connect()
+            count, size = connection.execute('SELECT COUNT(*), TOTAL(size) FROM entries').fetchone()
+            if count <= self.max_entries and size <= self.max_bytes:
+                return
+            rows = connection.execute('SELECT OBID, size FROM entries ORDER BY accessed').fetchall()
+            for OBID, entry_size in rows:
+                if count <= self.max_entries and size <= self.max_bytes:
+                    break
+                self.invalidate(OBID)
+                self.stats['evicted'] += 1
+                count -= 1
+                size -= entry_size
+        log.debug(f"OB cache holds {count} OBs ({size/1024**2:.1f} MB)")
+
+    def query(self, OBID, etag=None):
+        '''Ask the database for an OB, returns the result and the response
+        (both None if the database could not be reached).
+        '''
+        from kpf.observatoryAPIs import query_observatoryAPI
+        headers = {'If-None-Match': etag} if etag is not None else None
+        try:
+            return query_observatoryAPI('proposal', 'getKPFObservingBlock', {'id': OBID},
+                                        headers=headers, full_response=True)
+        except Exception as e:
+            log.warning(f"Unable to query database for OB {OBID}: {e}")
+            return None, None
+
+    def get(self, OBID, refresh=False):
+        '''Return the OB for a database ID, from the cache if it is fresh,
+        otherwise revalidated against (or downloaded from) the database.
+
+        Parameters
+        ----------
+        OBID : str
+        refresh : bool
+            Revalidate even if the cached copy is within its TTL.
+
+        Returns
+        -------
+        Tuple[ObservingBlock, List]
+            The OB (or None if it could not be retrieved) and any failure
+            messages.
+        '''
+        OBID = str(OBID)
+        try:
+            return self.lookup(OBID, refresh=refresh)
+        except (OSError, sqlite3.Error) as e:
+            # An unusable cache is a miss, not a failure
+            log.warning(f"OB cache {self.index_file} unavailable: {e}")
+            self.stats['uncached'] += 1
+            if self.offline is True:
+                return None, [f"{OBID}: OB cache unavailable (offline)"]
+            from kpf.observatoryAPIs import get_OBs_from_KPFCC_API
+            OBs, failures = get_OBs_from_KPFCC_API({'id': OBID})
+            return (OBs[0] if len(OBs) > 0 else None), failures
+
+    def lookup(self, OBID, refresh=False):
+        '''The body of get, which raises OSError or sqlite3.Error if the
+        index or the store can not be used.
+        '''
+        entry = self.read(OBID)
+        if entry is not None and (self.offline is True or
+                                  (refresh is False and time.time() - entry.checked < self.ttl)):
+            OB = self.load(entry)
+            if OB is not None:
+                self.stats['hits'] += 1
+                return OB, []
+            entry = None
+        if self.offline is True:
+            return None, [f"{OBID}: not in the OB cache (offline)"]
+
+        result, response = self.query(OBID, etag=entry.etag if entry is not None else None)
+        if entry is not None and response is not None and response.status_code == 304:
+            OB = self.load(entry)
+            if OB is not None:
+                self.touch(OBID, checked=True)
+                self.stats['revalidated'] += 1
+                return OB, []
+            # Not modified, but the stored copy has gone: ask for the OB
+            log.warning(f"Stored copy of OB {OBID} is unreadable, downloading it again")
+            entry = None
+            result, response = self.query(OBID)
+        results = [r for r in result if isinstance(r, dict) and r.get('id', OBID) == OBID]\
+                  if isinstance(result, list) else []
+        if len(results) == 0:
+            # No answer from the database: use the stored copy if there is one
+            OB = self.load(entry) if entry is not None else None
+            if OB is not None:
+                log.warning(f"Using the stored copy of OB {OBID}")
+                self.stats['stale'] += 1
+                return OB, []
+            return None, [f"{OBID}: unable to retrieve OB"]
+        digest = entry_digest(results[0])
+        etag = response.headers.get('ETag', None) if response is not None else None
+        if entry is not None and digest is not None and entry.digest == digest:
+            OB = self.load(entry)
+            if OB is not None:
+                if etag != entry.etag:
+                    with self.lock:
+                        self.connect().execute('UPDATE entries SET etag=? WHERE OBID=?', (etag, OBID))
+                self.touch(OBID, checked=True)
+                self.stats['revalidated'] += 1
+                return OB, []
+        OBs, failures = OBTable(results).get_OBs()
+        if len(OBs) == 0:
+            # The database no longer has this OB
+            if entry is not None:
+                self.invalidate(OBID)
+            return None, failures
+        self.stats['downloaded'] += 1
+        try:
+            self.put(OBs[0], digest=digest, etag=etag)
+        except (OSError, sqlite3.Error, ValueError) as e:
+            log.warning(f"Unable to store OB {OBID} in the OB cache: {e}")
+        return OBs[0], failures
+
+    def get_many(self, OBIDs, refresh=False, max_workers=None):
+        '''Get several OBs, downloading or revalidating them concurrently
+        (see kpf.observatoryAPIs.fetch_concurrently).
+
+        Returns
+        -------
+        Dict
+            (OB, failure messages) for each unique OBID.
+        '''
+        from kpf.observatoryAPIs import fetch_concurrently
+        results = {}
+        for OBID, result, err in fetch_concurrently(lambda OBID: self.get(OBID, refresh=refresh),
+                                                    OBIDs, max_workers=max_workers):
+            results[OBID] = result if err is None else (None, [f"{OBID}: {err}"])
+        return results
+
+
+cache = None
+
+
+def get_cache():
+    global cache
+    if cache is None:
+        cache = OBCache()
+    return cache
@@ -0,0 +1,121 @@
+import os
+import hashlib
+import threading
+from pathlib import Path
+
+from kpf import log, cfg
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.ObservingBlocks.serialization import canonical_dumps, loads
+
+
+##-------------------------------------------------------------------------
+## OBStore
+##-------------------------------------------------------------------------
+class OBStore(object):
+    '''Content addressed on disk store of ObservingBlocks.
+
+    Each OB is stored once per revision as canonical JSON (see
+    ObservingBlock.to_dict) under the hash of that JSON:
+
+        objects/ab/abcdef...json
+
+    and the latest revision for each database ID is recorded in:
+
+        refs/<OBID>
+
+    so OBs can be read back by ID or by revision without parsing YAML.
+    Writes go through a temporary file and a rename so readers in other
+    processes never see partial files.
+    '''
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.getenv('KPF_OB_STORE', default=None)
+        if directory is None:
+            directory = cfg.get('OBstore', 'directory',
+                                fallback='~/.kpftranslator/OBstore')
+        self.directory = Path(directory).expanduser()
+        self.lock = threading.Lock()
+
+    def object_file(self, revision):
+        return self.directory / 'objects' / revision[:2] / f"{revision}.json"
+
+    def ref_file(self, OBID):
+        OBID = str(OBID)
+        if OBID in ['', '.', '..'] or Path(OBID).name != OBID:
+            raise ValueError(f"Invalid OB ID: {OBID}")
+        return self.directory / 'refs' / OBID
+
+    def write(self, file, data):
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = file.with_name(f".{file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+        tmp_file.replace(file)
+
+    @staticmethod
+    def revision_of(OBdict):
+        '''The revision hash and the serialized form of an OB dictionary.'''
+        data = canonical_dumps(OBdict)
+        return hashlib.sha256(data).hexdigest(), data
+
+    def put(self, OB):
+        '''Store an ObservingBlock (or its dictionary form) and, if it has a
+        database ID, make it the latest revision for that ID.
+
+        Returns
+        -------
+        str
+            The revision hash.
+        '''
+        OBdict = OB.to_dict() if isinstance(OB, ObservingBlock) else OB
+        revision, data = self.revision_of(OBdict)
+        with self.lock:
+            object_file = self.object_file(revision)
+            if object_file.exists() is False:
+                self.write(object_file, data)
+            OBID = OBdict.get('id', '')
+            if OBID not in ['', None]:
+                self.write(self.ref_file(OBID), revision.encode())
+        log.debug(f"Stored OB {OBdict.get('id', '')} revision {revision[:12]}")
+        return revision
+
+    def latest_revision(self, OBID):
+        try:
+            with open(self.ref_file(OBID), 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def get_dict(self, OBID=None, revision=None):
+        '''The dictionary form of an OB by revision, or the latest revision
+        for a database ID. Returns None if it is not in the store.
+        '''
+        if revision is None:
+            revision = self.latest_revision(OBID)
+            if revision is None:
+                return None
+        try:
+            with open(self.object_file(revision), 'rb') as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def get(self, OBID=None, revision=None):
+        '''An ObservingBlock by revision, or the latest revision for a
+        database ID. Returns None if it is not in the store.
+        '''
+        OBdict = self.get_dict(OBID=OBID, revision=revision)
+        return None if OBdict is None else ObservingBlock(OBdict)
+
+    def __contains__(self, OBID):
+        return self.ref_file(OBID).exists()
+
+
+store = None
+
+
+def get_store():
+    global store
+    if store is None:
+        store = OBStore()
+    return store
@@ -0,0 +1,283 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from kpf import log, cfg
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+
+
+def sexagesimal_to_float(value):
+    '''Convert a sexagesimal string (e.g. "12:23:11.79" or "-67 37 49.47") to
+    a float in the units of its first field. Numbers are returned as they are.
+    Returns nan if the value can not be parsed.
+    '''
+    if value is None:
+        return np.nan
+    if not isinstance(value, str):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+    value = value.strip()
+    sign = -1.0 if value.startswith('-') else 1.0
+    try:
+        fields = [abs(float(f)) for f in value.replace(':', ' ').split()]
+    except ValueError:
+        return np.nan
+    if len(fields) == 0 or len(fields) > 3:
+        return np.nan
+    result = 0.0
+    for i,field in enumerate(fields):
+        result += field / 60**i
+    return sign * result
+
+
+def pool_start_method():
+    '''The multiprocessing start method for the build_parallel workers, or
+    None if the OBs should be built serially.
+
+    The OBTable start_method config value "auto" (the default) forks while
+    this is the only thread. Forking while other threads run (e.g. the
+    fetch_concurrently threads in the OB GUI) can leave the child waiting
+    forever on a lock one of them held, such as a logging handler's, so
+    then the OBs are built serially. forkserver and spawn are safe with
+    threads, but import the main script in the workers, so are only for
+    programs which are import safe (the OB GUI sets forkserver, kpfdo is
+    not import safe).
+    '''
+    start_method = cfg.get('OBTable', 'start_method', fallback='auto')
+    if start_method in ['auto', 'fork']:
+        return 'fork' if threading.active_count() == 1 else None
+    return start_method
+
+
+def build_OBs(entries):
+    '''Build and validate the OBs for a chunk of database entries, in a
+    worker process. Returns (OB, valid, error message) for each entry, an
+    entry which can not be built does not stop the rest of the chunk.
+    '''
+    results = []
+    for entry in entries:
+        try:
+            OB = ObservingBlock(entry)
+        except Exception as e:
+            results.append((None, False, f"{e}"))
+            continue
+        results.append((OB, OB.validate(), None))
+    return results
+
+
+##-------------------------------------------------------------------------
+## OBTable
+##-------------------------------------------------------------------------
+class OBTable(object):
+    '''Columnar view of a list of OBs as returned by the KPF-CC database API
+    (getKPFObservingBlock).
+
+    The scalar fields most consumers need (for sorting, filtering, and star
+    lists) are parsed for all entries at once into a numpy structured array,
+    with the unit conversions done on whole columns. Full ObservingBlock
+    objects are only built when a row is accessed (table[i]) and are then
+    kept.
+
+    Proper motions in the database are in mas/yr, in the table (and in the
+    OBs built from it) PMRA is in seconds of RA per year and PMDEC is in
+    arcsec per year, as in a Keck star list.
+
+    Entries which are not OBs (status other than OB_FOUND, or not a dict) are
+    not included in the table, they are listed in the failures attribute.
+    '''
+    columns = [('OBID', str), ('semid', str), ('ProgramID', str),
+               ('TargetName', str), ('RA', float), ('Dec', float),
+               ('PMRA', float), ('PMDEC', float), ('Gmag', float),
+               ('Jmag', float), ('nExp', int), ('ExpTime', float),
+               ('WeatherBand', int)]
+
+    def __init__(self, result):
+        self.entries = []
+        self.failures = []
+        for entry in result:
+            if not isinstance(entry, dict):
+                self.failures.append([f'{entry}', 'Entry is not dict'])
+            elif entry.get('status', None) not in ['OB_FOUND']:
+                self.failures.append([entry.get('id', None), entry.get('status', None)])
+            else:
+                self.entries.append(entry)
+        self.OBs = [None]*len(self.entries)
+        self.data = self.build_columns(self.entries)
+
+    @classmethod
+    def build_columns(cls, entries):
+        values = {name: [] for name,t in cls.columns}
+        for entry in entries:
+            target = entry.get('Target', None) or {}
+            observations = entry.get('Observations', None) or []
+            schedule = entry.get('Schedule', None) or {}
+            ProgramID = entry.get('ProgramID', None)
+            if ProgramID is None:
+                ProgramID = entry.get('progid', '')
+            values['OBID'].append(entry.get('id', ''))
+            values['semid'].append(entry.get('semid', ''))
+            values['ProgramID'].append(ProgramID)
+            values['TargetName'].append(target.get('TargetName', ''))
+            values['RA'].append(sexagesimal_to_float(target.get('RA', None)))
+            values['Dec'].append(sexagesimal_to_float(target.get('Dec', None)))
+            for name in ['PMRA', 'PMDEC', 'Gmag', 'Jmag']:
+                values[name].append(sexagesimal_to_float(target.get(name, None)))
+            try:
+                nExp = [int(obs.get('nExp', 1)) for obs in observations]
+                ExpTime = sum([n*float(obs.get('ExpTime', 0)) for n,obs in zip(nExp, observations)])
+            except (TypeError, ValueError):
+                nExp, ExpTime = [0], np.nan
+            values['nExp'].append(sum(nExp))
+            values['ExpTime'].append(ExpTime)
+            try:
+                values['WeatherBand'].append(int(schedule.get('WeatherBand', 7)))
+            except (TypeError, ValueError):
+                values['WeatherBand'].append(7)
+
+        arrays = []
+        for name,coltype in cls.columns:
+            if coltype == str:
+                column = np.array([f"{v}" if v is not None else '' for v in values[name]], dtype=str)
+                if len(column) == 0:
+                    column = column.astype('U1')
+            elif coltype == float:
+                column = np.array(values[name], dtype=float)
+            else:
+                column = np.array(values[name], dtype=int)
+            arrays.append(column)
+        data = np.rec.fromarrays(arrays, names=[name for name,t in cls.columns])
+
+        # Convert hours to degrees
+        data['RA'] *= 15
+        # Convert proper motions from database units (mas/yr) to keck star
+        # list units (seconds of RA/yr and arcsec/yr)
+        data['PMRA'] /= 1000*15*np.cos(np.radians(data['Dec']))
+        data['PMDEC'] /= 1000
+        # As for a single OB, unknown conversions give zero proper motion
+        for pm in ['PMRA', 'PMDEC']:
+            bad = ~np.isfinite(data[pm])
+            if np.any(bad):
+                log.debug(f'Setting {pm} to 0 for {np.sum(bad)} OBs')
+                data[pm][bad] = 0
+        return data
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, key):
+        '''table['Gmag'] returns a column, table[i] returns the ObservingBlock
+        for row i.
+        '''
+        if isinstance(key, str):
+            return self.data[key]
+        return self.get_OB(key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_OB(i)
+
+    def OB_input(self, i):
+        '''The entry for row i with the proper motions converted.'''
+        entry = self.entries[i]
+        if entry.get('Target', None) is not None:
+            target = dict(entry['Target'])
+            for pm in ['PMRA', 'PMDEC']:
+                if target.get(pm, None) is not None:
+                    target[pm] = float(self.data[pm][i])
+            entry = dict(entry, Target=target)
+        return entry
+
+    def get_OB(self, i):
+        '''Build (once) and return the ObservingBlock for row i.'''
+        if self.OBs[i] is None:
+            self.OBs[i] = ObservingBlock(self.OB_input(i))
+        return self.OBs[i]
+
+    def argsort(self, column, reverse=False):
+        '''Row indices sorted by the values in the column.'''
+        order = np.argsort(self.data[column], kind='stable')
+        return order[::-1] if reverse is True else order
+
+    def build_parallel(self, rows, processes, start_method='fork'):
+        '''Build and validate the OBs for the given rows in a pool of worker
+        processes, the rows are sent in chunks. Returns (OB, valid, error)
+        for each row, in order.
+        '''
+        chunk_size = cfg.getint('OBTable', 'chunk_size', fallback=0)
+        if chunk_size < 1:
+            # A few chunks per process to balance the load
+            chunk_size = min(max(len(rows)//(processes*4), 1), 64)
+        chunks = [[self.OB_input(i) for i in rows[j:j+chunk_size]]
+                  for j in range(0, len(rows), chunk_size)]
+        context = multiprocessing.get_context(start_method)
+        log.debug(f'Building {len(rows)} OBs in {processes} processes '
+                  f'({len(chunks)} chunks)')
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks)),
+                                 mp_context=context) as pool:
+            return [result for chunk in pool.map(build_OBs, chunks)
+                           for result in chunk]
+
+    def get_OBs(self, processes=None):
+        '''Build and validate every OB in the table.
+
+        Large tables are built in parallel in worker processes (see
+        build_parallel), the number of processes defaults to the OBTable
+        processes config value (0 for one per CPU). Tables with fewer than
+        min_parallel OBs to build, processes=1, other threads running (see
+        pool_start_method), or a failure of the process pool use the serial
+        path, both give the same results.
+
+        Returns
+        -------
+        Tuple[List[ObservingBlock], List]
+            The valid OBs, and the failure messages (including those for
+            entries which were not OBs).
+        '''
+        if processes is None:
+            processes = cfg.getint('OBTable', 'processes', fallback=0)
+        if processes < 1:
+            processes = os.cpu_count() or 1
+        min_parallel = cfg.getint('OBTable', 'min_parallel', fallback=200)
+        built = {}
+        rows = [i for i,OB in enumerate(self.OBs) if OB is None]
+        start_method = pool_start_method()
+        if start_method is None:
+            log.debug('Other threads are running, building OBs serially')
+        elif processes > 1 and len(rows) >= max(min_parallel, 2):
+            try:
+                built = dict(zip(rows, self.build_parallel(rows, processes,
+                                                           start_method=start_method)))
+            except Exception as e:
+                log.warning(f'Unable to build OBs in parallel, building serially: {e}')
+                built = {}
+
+        OBs = []
+        failures = list(self.failures)
+        for i,entry in enumerate(self.entries):
+            semid = entry.get('semid', '')
+            if i in built.keys():
+                OB, valid, error = built[i]
+                if error is not None:
+                    failures.append(f"{entry.get('id', None)} ({semid}): {error}")
+                    print(entry)
+                    continue
+                self.OBs[i] = OB
+            else:
+                log.debug(f'Parsing entry {i+1} of {len(self)}')
+                try:
+                    OB = self.get_OB(i)
+                except Exception as e:
+                    failures.append(f"{entry.get('id', None)} ({semid}): {e}")
+                    print(entry)
+                    continue
+                valid = OB.validate()
+            if valid:
+                OBs.append(OB)
+            else:
+                failures.append(f"{entry.get('id', None)} ({semid}): Failed validataion")
+        return OBs, failures
@@ -1,35 +1,15 @@
-from pathlib import Path
-import yaml
-
-try:
-    import ktl
-except:
-    ktl = None
-from kpf.ObservingBlocks import BaseOBComponent
+from kpf.ObservingBlocks import (BaseOBComponent, get_schema,
+                                 get_instrument_options)
 
 
 class Observation(BaseOBComponent):
+    __slots__ = ['expmeter_bands', 'ND_values']
+
     def __init__(self, input_dict):
-        properties_file = Path(__file__).parent / 'ObservationProperties.yaml'
-        with open(properties_file, 'r') as f:
-            properties = yaml.safe_load(f.read())
-        super().__init__('Observation', '2.0', properties=properties)
+        super().__init__('Observation', '2.0', properties=get_schema('ObservationProperties.yaml'))
         self.list_element = True
         self.from_dict(input_dict)
-        try:
-            WAVEBINS = ktl.cache('kpf_expmeter', 'WAVEBINS')
-            self.expmeter_bands = [f"{float(b):.0f}nm" for b in WAVEBINS.read().split()]
-            ND1POS = ktl.cache('kpfcal', 'ND1POS')
-            ND2POS = ktl.cache('kpfcal', 'ND2POS')
-            self.ND_values = {'CalND1': list(ND1POS._getEnumerators()),
-                              'CalND2': list(ND2POS._getEnumerators())}
-            for nd in ['CalND1', 'CalND2']:
-                if 'Unknown' in self.ND_values[nd]:
-                    self.ND_values[nd].pop(self.ND_values[nd].index('Unknown'))
-        except:
-            self.expmeter_bands = [f"{float(b):.0f}nm" for b in [498.12, 604.38, 710.62, 816.88]]
-            self.ND_values = {'CalND1': ['OD 0.1', 'OD 1.0', 'OD 1.3', 'OD 2.0', 'OD 3.0', 'OD 4.0'],
-                              'CalND2': ['OD 0.1', 'OD 0.3', 'OD 0.5', 'OD 0.8', 'OD 1.0', 'OD 4.0']}
+        self.expmeter_bands, self.ND_values = get_instrument_options()
 
     def get_pruning_guide(self):
         return [(self.get('ExpMeterMode') in ['off', False], ['AutoExpMeter', 'ExpMeterExpTime']),
@@ -90,8 +70,7 @@ class Observation(BaseOBComponent):
 
 
     def add_comment(self, pname):
-        error, comment = self.check_property(pname)
-        return comment
+        return self.check_properties()[pname].comment
 
 
     def summary(self):
@@ -8,15 +8,28 @@ from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.ObservingBlocks.Calibration import Calibration
 from kpf.ObservingBlocks.Observation import Observation
+from kpf.ObservingBlocks import ValidationResult
 from kpf.ObservingBlocks.Target import Target
+from kpf.ObservingBlocks.serialization import dumps, loads
+
+
+def quote(value):
+    '''Escape a value for use in a single quoted YAML string.'''
+    return f"{value}".replace("'", "''")
+
+
+# Version of the dictionary form of an OB (see ObservingBlock.to_dict)
+OB_VERSION = '2.0'
 
 
 class ObservingBlock(object):
     def __init__(self, OBinput):
         if isinstance(OBinput, dict):
-            OBdict = copy.deepcopy(OBinput)
+            # The components copy what they use, only the top level is
+            # modified here (the v1 conversions below take a deep copy)
+            OBdict = dict(OBinput)
         elif isinstance(OBinput, ObservingBlock):
-            self = OBinput
+            OBdict = OBinput.to_dict()
         elif OBinput in ['', None]:
             OBdict = {}
         elif isinstance(OBinput, str) or isinstance(OBinput, Path):
@@ -24,7 +37,10 @@ class ObservingBlock(object):
             if file.exists() is True:
                 try:
                     with open(file, 'r') as f:
-                        OBdict = yaml.safe_load(f)
+                        if file.suffix == '.json':
+                            OBdict = loads(f.read())
+                        else:
+                            OBdict = yaml.safe_load(f)
                 except Exception as e:
                     log.error(f'Unable to parse input as yaml file')
                     log.error(f'{OBinput}')
@@ -52,8 +68,11 @@ class ObservingBlock(object):
         self.semid = OBdict.pop('semid', '')
         self.OBID = OBdict.pop('id', '')
         self.CommentToObserver = OBdict.pop('comment', '')
-        self.History = OBdict.pop('History', [])
+        self.History = copy.deepcopy(OBdict.pop('History', []))
         self.query_status = OBdict.pop('status', [])
+        version = OBdict.pop('version', OB_VERSION)
+        if str(version).split('.')[0] != OB_VERSION.split('.')[0]:
+            log.warning(f'Unsupported OB dictionary version: {version}')
         # Metadata for OB GUI
         self.executed = False
         self.edited = False
@@ -62,19 +81,22 @@ class ObservingBlock(object):
         ## ----------------------------------------------------------------
         # v1 Science Observing Block
         if OBdict.get('Template_Name', None) == 'kpf_sci':
+            OBdict = copy.deepcopy(OBdict)
+            OBdict.pop('Template_Name')
+            OBdict.pop('Template_Version', None)
             # Target
-            GaiaID = OBdict.get('GaiaID', None)
+            GaiaID = OBdict.pop('GaiaID', None)
             if GaiaID is None:
                 self.Target = Target.resolve_name(OBdict.get('TargetName'))
             elif str(GaiaID)[:2] == 'DR':
                 self.Target = Target.resolve_name(f"Gaia {GaiaID}")
             else:
                 self.Target = Target.resolve_name(f"Gaia DR3 {GaiaID}")
-            self.Target.TargetName.set(OBdict.get('TargetName'))
+            self.Target.TargetName.set(OBdict.pop('TargetName', None))
             # Observations
             self.Observations = []
             self.Calibrations = []
-            for obs_v1 in OBdict.get('SEQ_Observations', []):
+            for obs_v1 in OBdict.pop('SEQ_Observations', []):
                 original_ExpMeterBin = obs_v1.get('ExpMeterBin', None)
                 if original_ExpMeterBin is not None:
                     print(f"Original ExpMeterBin: {original_ExpMeterBin}")
@@ -90,11 +112,13 @@ class ObservingBlock(object):
                 self.Observations.append(obs)
         # v1 Calibration Observing Block
         elif OBdict.get('Template_Name', None) == 'kpf_cal':
+            OBdict.pop('Template_Name')
+            OBdict.pop('Template_Version', None)
             # Calibrations
             self.Target = None
             self.Observations = []
             self.Calibrations = []
-            for cal_v1 in OBdict.get('SEQ_Calibrations', []):
+            for cal_v1 in OBdict.pop('SEQ_Calibrations', []):
                 cal = Calibration(cal_v1)
                 self.Calibrations.append(cal)
         ## ----------------------------------------------------------------
@@ -119,50 +143,82 @@ class ObservingBlock(object):
             log.warning(OBdict.keys())
             log.warning(OBdict)
 
-    def validate(self, verbose=False):
-        valid = True
-        # Check that components are the correct types and are individually valid
+    def validation_results(self, errors_only=False):
+        '''Check the OB and each of its components.
+
+        Components are only re-checked if they have changed since they were
+        last checked (see BaseOBComponent.check_properties).
+
+        Returns
+        -------
+        List[ValidationResult]
+            The problems found. The component field names the component
+            (e.g. "Observation 2"), the property field is None for problems
+            with the structure of the OB. With errors_only=False, comments on
+            valid properties (e.g. unused values) are included too.
+        '''
+        results = []
+        components = []
         if self.Target is not None:
-            if not isinstance(self.Target, Target):
-                log.debug('Target component is not a Target object')
-                valid = False
-            if not self.Target.validate(verbose=verbose):
-                log.debug('Target component is not a valid Target object')
-                valid = False
-        for i,observation in enumerate(self.Observations):
-            if not isinstance(observation, Observation):
-                log.debug(f'Observation component {i+1} is not a Observation object')
-                valid = False
-            if observation.validate(verbose=verbose) != True:
-                log.debug(f'Observation component {i+1} is not a valid Observation object')
-                valid = False
-        for i,calibration in enumerate(self.Calibrations):
-            if not isinstance(calibration, Calibration):
-                log.debug(f'Calibration component {i+1} is not a Calibration object')
-                valid = False
-            if not calibration.validate(verbose=verbose):
-                log.debug(f'Calibration component {i+1} is not a valid Calibration object')
-                valid = False
+            components.append(('Target', Target, self.Target))
+        components.extend([(f'Observation {i+1}', Observation, o)
+                           for i,o in enumerate(self.Observations)])
+        components.extend([(f'Calibration {i+1}', Calibration, c)
+                           for i,c in enumerate(self.Calibrations)])
+        # Check that components are the correct types and are individually valid
+        for name, component_type, component in components:
+            if not isinstance(component, component_type):
+                results.append(ValidationResult(name, None, True,
+                               f'{name} is not a {component_type.__name__} object'))
+                continue
+            for r in component.validation_results(errors_only=errors_only):
+                results.append(ValidationResult(name, r.property, r.error, r.comment))
         # If we have science observations, we must have a target
-        if len(self.Observations) > 0:
-            if self.Target is None:
-                log.debug(f"contains observations without a target")
-                valid = False
+        if len(self.Observations) > 0 and self.Target is None:
+            results.append(ValidationResult('ObservingBlock', None, True,
+                           'contains observations without a target'))
         # We should have at least one observation or calibration
         if len(self.Observations) == 0 and len(self.Calibrations) == 0:
-            log.debug(f"contains no observations and no calibrations")
+            results.append(ValidationResult('ObservingBlock', None, True,
+                           'contains no observations and no calibrations'))
+        return results
+
+    def validate(self, verbose=False):
+        valid = True
+        for result in self.validation_results(errors_only=True):
             valid = False
+            if result.property is None:
+                log.debug(result.comment)
+            elif verbose:
+                print(f"{result.property} is INVALID: {result.comment}")
         return valid
 
 
     def to_dict(self):
-        OB = {}
+        '''Complete dictionary form of the OB, from which an identical OB can
+        be built with ObservingBlock(OBdict) or ObservingBlock.from_dict.
+        Values are plain python types, so the result can be written as JSON.
+        '''
+        OB = {'version': OB_VERSION,
+              'id': self.OBID,
+              'ProgramID': self.ProgramID,
+              'semester': self.semester,
+              'semid': self.semid,
+              'comment': self.CommentToObserver,
+              }
+        if len(self.History) > 0:
+            OB['History'] = copy.deepcopy(self.History)
         if self.Target is not None:
             OB['Target'] = self.Target.to_dict()
         if len(self.Observations) > 0:
             OB['Observations'] = [o.to_dict() for o in self.Observations]
         if len(self.Calibrations) > 0:
             OB['Calibrations'] = [c.to_dict() for c in self.Calibrations]
+        return OB
+
+    @classmethod
+    def from_dict(cls, OBdict):
+        return cls(OBdict)
 
 
     def write_to(self, file, overwrite=False):
@@ -174,7 +230,10 @@ class ObservingBlock(object):
             else:
                 file.unlink()
         with open(file, 'w')as f:
-            f.write(self.__repr__()+'\n')
+            if file.suffix == '.json':
+                f.write(dumps(self.to_dict()).decode())
+            else:
+                f.write(self.__repr__()+'\n')
 
 
     def summary(self):
@@ -239,11 +298,11 @@ class ObservingBlock(object):
                 lines.append(f'# Observation {i+1}')
                 lines += obs.__repr__(prune=prune).strip('\n').split('\n')
         lines += [f"# Metadata:"]
-        lines += [f"id: '{self.OBID}'",
-                  f"ProgramID: '{self.ProgramID}'",
-                  f"semester: '{self.semester}'",
-                  f"semid: '{self.semid}'",
-                  f"comment: '{self.CommentToObserver}'",
+        lines += [f"id: '{quote(self.OBID)}'",
+                  f"ProgramID: '{quote(self.ProgramID)}'",
+                  f"semester: '{quote(self.semester)}'",
+                  f"semid: '{quote(self.semid)}'",
+                  f"comment: '{quote(self.CommentToObserver)}'",
                   ]
 #         if len(self.History) > 0:
 #             lines += [f"# History"]
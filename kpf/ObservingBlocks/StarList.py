@@ -0,0 +1,133 @@
+import numpy as np
+
+from kpf import cfg, lazy_import
+from kpf.ObservingBlocks.TargetCatalog import TargetCatalog
+
+apt = lazy_import('astropy.time')
+
+
+def format_sexagesimal(values, precision, wrap=None, sign=False):
+    '''Format an array of values (hours or degrees) as space separated
+    sexagesimal strings, e.g. "12 23 11.79" or "-67 37 49.5". Rounding is
+    done on the whole array in integer units of the last digit, so a value
+    never formats as 60 seconds.
+    '''
+    values = np.asarray(values, dtype=float)
+    negative = values < 0
+    scale = 10**precision
+    total = np.round(np.abs(values)*3600*scale).astype(np.int64)
+    if wrap is not None:
+        total %= wrap*3600*scale
+    whole, frac = np.divmod(total, scale)
+    degrees, rest = np.divmod(whole, 3600)
+    minutes, seconds = np.divmod(rest, 60)
+    strings = []
+    for i in range(len(values)):
+        s = f"{degrees[i]:02d} {minutes[i]:02d} {seconds[i]:02d}"
+        if precision > 0:
+            s += f".{frac[i]:0{precision}d}"
+        if sign is True:
+            s = ('-' if negative[i] and total[i] > 0 else '+') + s
+        strings.append(s)
+    return strings
+
+
+def star_list_lines(targets, epoch=None, raprecision=None, decprecision=None):
+    '''Keck star list lines for a list of Targets (or target dicts, or a
+    TargetCatalog).
+
+    Coordinates are given in J2000. If epoch (a decimal year, or anything
+    astropy Time accepts) is given, the proper motion of all targets is
+    applied to that epoch in one vectorised operation. Otherwise the
+    coordinates are those at each target's own epoch. Targets with proper
+    motion get pmra, pmdec and epoch keywords.
+
+    Targets whose coordinates can not be parsed are written with their RA
+    and Dec strings as they are.
+    '''
+    if raprecision is None:
+        raprecision = cfg.getint('StarList', 'raprecision', fallback=2)
+    if decprecision is None:
+        decprecision = cfg.getint('StarList', 'decprecision', fallback=1)
+    catalog = targets if isinstance(targets, TargetCatalog) else TargetCatalog(targets)
+    if len(catalog) == 0:
+        return []
+    if epoch is None:
+        ra = catalog.coord.ra.hour
+        dec = catalog.coord.dec.deg
+        epochs = catalog.epoch.decimalyear
+    else:
+        if isinstance(epoch, (int, float)):
+            epoch = apt.Time(epoch, format='decimalyear')
+        epoch = apt.Time(epoch)
+        coord = catalog.propagate(epoch)
+        ra = coord.ra.hour
+        dec = coord.dec.deg
+        epochs = np.full(len(catalog), epoch.decimalyear)
+    rastrs = format_sexagesimal(ra, raprecision, wrap=24)
+    decstrs = format_sexagesimal(dec, decprecision, sign=True)
+
+    lines = []
+    for i,target in enumerate(catalog.targets):
+        name = f"{target.get('TargetName')}"[:15]
+        if catalog.valid[i]:
+            line = f"{name:15s} {rastrs[i]} {decstrs[i]} 2000"
+            pmra, pmdec = catalog.PMRA[i], catalog.PMDEC[i]
+            epochstr = f"{epochs[i]:.2f}"
+        else:
+            rastr = f"{target.get('RA')}".replace(':', ' ')
+            decstr = f"{target.get('Dec')}".replace(':', ' ')
+            line = f"{name:15s} {rastr} {decstr} {target.get('Equinox')}"
+            pmra, pmdec = target.get('PMRA') or 0, target.get('PMDEC') or 0
+            epochstr = f"{target.get('Epoch')}"
+        if abs(pmra) > 0 or abs(pmdec) > 0:
+            line += f" pmra={pmra:.4f} pmdec={pmdec:.3f} epoch={epochstr}"
+        dra = target.get('DRA') or 0
+        ddec = target.get('DDEC') or 0
+        if abs(dra) > 0 or abs(ddec) > 0:
+            line += f" dra={dra:.3f} ddec={ddec:.3f}"
+        lines.append(line)
+    return lines
+
+
+def parse_equinox(value):
+    if value in ['2000', '2000.0']:
+        return 'J2000'
+    elif value in ['1950', '1950.0']:
+        return 'B1950'
+    return value
+
+
+star_list_keywords = {'pmra': ('PMRA', float),
+                      'pmdec': ('PMDEC', float),
+                      'epoch': ('Epoch', str),
+                      'dra': ('DRA', float),
+                      'ddec': ('DDEC', float)}
+
+
+def parse_star_list(text):
+    '''Parse Keck star list lines in to target dicts (TargetName, RA, Dec,
+    Equinox, and PMRA, PMDEC, Epoch, DRA, and DDEC if given). Blank lines and
+    comments are skipped, as are keywords which are not Target properties.
+    '''
+    if isinstance(text, str):
+        text = text.splitlines()
+    targets = []
+    for line in text:
+        if line.strip() == '' or line.lstrip().startswith('#'):
+            continue
+        line = line.split('#')[0]
+        fields = line[15:].split()
+        if len(fields) < 7:
+            raise ValueError(f"Unable to parse star list line: {line}")
+        target = {'TargetName': line[:15].strip(),
+                  'RA': ':'.join(fields[0:3]),
+                  'Dec': ':'.join(fields[3:6]),
+                  'Equinox': parse_equinox(fields[6])}
+        for field in fields[7:]:
+            keyword, _, value = field.partition('=')
+            if keyword.lower() in star_list_keywords.keys():
+                name, valuetype = star_list_keywords[keyword.lower()]
+                target[name] = valuetype(value)
+        targets.append(target)
+    return targets
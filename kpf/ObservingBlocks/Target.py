@@ -1,14 +1,14 @@
-from pathlib import Path
-import yaml
 import numpy as np
-from astropy import units as u
-from astropy.time import Time
-from astropy.coordinates import SkyCoord, Angle, ICRS, FK5
-from astroquery.vizier import Vizier
-from astroquery.simbad import Simbad
 
+from kpf import lazy_import
+from kpf.ObservingBlocks import BaseOBComponent, get_schema, memoize
+from kpf.ObservingBlocks.TargetResolver import get_cache
 
-from kpf.ObservingBlocks import BaseOBComponent
+u = lazy_import('astropy.units')
+apt = lazy_import('astropy.time')
+apc = lazy_import('astropy.coordinates')
+vizier = lazy_import('astroquery.vizier')
+simbad = lazy_import('astroquery.simbad')
 
 
 def parse_time_input(input_value):
@@ -19,20 +19,26 @@ def parse_time_input(input_value):
         timeformat = 'byear_str'
     else:
         timeformat = 'decimalyear'
-    return Time(input_value, format=timeformat)
+    return apt.Time(input_value, format=timeformat)
 
 
 class Target(BaseOBComponent):
+    __slots__ = ['coord']
+
     def __init__(self, input_dict):
-        properties_file = Path(__file__).parent / 'TargetProperties.yaml'
-        with open(properties_file, 'r') as f:
-            properties = yaml.safe_load(f.read())
-        super().__init__('Target', '2.0', properties=properties)
+        super().__init__('Target', '2.0', properties=get_schema('TargetProperties.yaml'))
         self.from_dict(input_dict)
         self.coord = None
         self.build_SkyCoord()
 
 
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        target = super().from_snapshot(snapshot)
+        target.build_SkyCoord()
+        return target
+
+
     def get_pruning_guide(self):
         return [(abs(self.get('DRA')) < 0.001 and abs(self.get('DDEC')) < 0.001, ['DRA', 'DDEC']),
                 ]
@@ -41,12 +47,12 @@ class Target(BaseOBComponent):
     def build_SkyCoord(self):
         # Build astropy.coordinates.SkyCoord
         try:
-            ra = Angle(self.RA.value, unit=u.hourangle)
-            dec = Angle(self.Dec.value, unit=u.degree)
+            ra = apc.Angle(self.RA.value, unit=u.hourangle)
+            dec = apc.Angle(self.Dec.value, unit=u.degree)
             pm_ra_cosdec = self.PMRA.value*15*u.arcsec/u.yr
             equinox = parse_time_input(self.Equinox.value)
             epoch = parse_time_input(self.Epoch.value)
-            self.coord = SkyCoord(ra, dec, frame=FK5(equinox=equinox),
+            self.coord = apc.SkyCoord(ra, dec, frame=apc.FK5(equinox=equinox),
                                   pm_ra_cosdec=pm_ra_cosdec,
                                   pm_dec=self.PMDEC.value*u.arcsec/u.yr,
                                   obstime=epoch,
@@ -54,6 +60,8 @@ class Target(BaseOBComponent):
         except Exception as e:
 #             print(e)
             self.coord = None
+        # The coordinate is used by check_property
+        self.touch()
 
 
     def check_property(self, pname):
@@ -78,8 +86,7 @@ class Target(BaseOBComponent):
 
 
     def add_comment(self, pname):
-        error, comment = self.check_property(pname)
-        return comment
+        return self.check_properties()[pname].comment
 
 
     def __str__(self, raprecision=1, decprecision=0, magprecision=1):
@@ -97,38 +104,38 @@ class Target(BaseOBComponent):
         return out
 
 
-    def to_star_list(self):
-        '''Return a string which is a Keck formatted star list line
+    @memoize
+    def to_star_list(self, epoch=None):
+        '''Return a string which is a Keck formatted star list line (see
+        kpf.ObservingBlocks.StarList.star_list_lines).
         '''
-        try:
-#             pmcoord = self.coord.apply_space_motion(new_obstime=Time.now())
-            rastr = self.coord.ra.to_string(unit=u.hourangle,
-                                            sep=' ', precision=raprecision)
-            decstr = self.coord.dec.to_string(unit=u.deg,
-                                              sep=' ', precision=decprecision,
-                                              alwayssign=True)
-        except:
-            rastr = str(self.RA).replace(':', ' ')
-            decstr = str(self.Dec).replace(':', ' ')
-        out = f"{self.TargetName.value:15s} {rastr} {decstr}"
-        if str(self.Equinox) == 'J2000':
-            out += f" 2000"
-        else:
-            out += f" {self.Equinox}"
-        if abs(self.PMRA.value) > 0 or abs(self.PMDEC.value) > 0:
-               out += f" pmra={self.PMRA.value:.4f} pmdec={self.PMDEC.value:.3f}"
-        if abs(self.DRA.value) > 0 or abs(self.DDEC.value) > 0:
-               out += f" dra={self.DRA.value:.3f} ddec={self.DDEC.value:.3f}"
-#         out += f" # Gmag={str(self.Gmag)} Jmag={str(self.Jmag)}"
-        return out
+        from kpf.ObservingBlocks.StarList import star_list_lines
+        return star_list_lines([self], epoch=epoch)[0]
+
+    @classmethod
+    def query_gaia(self, gaiaid):
+        '''Query the Gaia catalog (via Vizier) for a DR3 source ID. Returns
+        None if there is no such source.
+        '''
+        result = vizier.Vizier(catalog='I/350/gaiaedr3').query_constraints(Source=gaiaid)
+        if len(result) == 0:
+            return None
+        r = result[0]
+        def value(column):
+            return float(r[column]) if r[column].mask[0] == False else None
+        return {column: value(column) for column in
+                ['RA_ICRS', 'DE_ICRS', 'pmRA', 'pmDE', 'Plx', 'RVDR2', 'Gmag', 'Tefftemp']}
+
 
     @classmethod
     def get_gaia_parameters(self, gaiaid):
-        r = Vizier(catalog='I/350/gaiaedr3').query_constraints(Source=gaiaid)[0]
-        plx = f"{float(r['Plx']):.2f}" if r['Plx'].mask[0] == False else '0'
-        rv = f"{float(r['RVDR2']):.2f}" if r['RVDR2'].mask[0] == False else '0'
-        Gmag = f"{float(r['Gmag']):.2f}" if r['Gmag'].mask[0] == False else ''
-        Teff = f"{float(r['Tefftemp']):.0f}" if r['Tefftemp'].mask[0] == False else '45000'
+        r = get_cache().get('gaia', gaiaid, lambda: self.query_gaia(gaiaid))
+        if r is None:
+            return None, {}
+        plx = f"{r['Plx']:.2f}" if r['Plx'] is not None else '0'
+        rv = f"{r['RVDR2']:.2f}" if r['RVDR2'] is not None else '0'
+        Gmag = f"{r['Gmag']:.2f}" if r['Gmag'] is not None else ''
+        Teff = f"{r['Tefftemp']:.0f}" if r['Tefftemp'] is not None else '45000'
 
         gaia_params = {'Parallax': plx,
                        'RadialVelocity': rv,
@@ -137,10 +144,10 @@ class Target(BaseOBComponent):
                        }
 
         try:
-            target_coord = SkyCoord(float(r['RA_ICRS']), float(r['DE_ICRS']),
-                                    pm_ra_cosdec=float(r['pmRA'])*u.mas/u.yr,
-                                    pm_dec=float(r['pmDE'])*u.mas/u.yr,
-                                    obstime=Time(2016.0, format='decimalyear'),
+            target_coord = apc.SkyCoord(r['RA_ICRS'], r['DE_ICRS'],
+                                    pm_ra_cosdec=r['pmRA']*u.mas/u.yr,
+                                    pm_dec=r['pmDE']*u.mas/u.yr,
+                                    obstime=apt.Time(2016.0, format='decimalyear'),
                                     unit=(u.deg, u.deg),
                                     )
         except:
@@ -149,8 +156,8 @@ class Target(BaseOBComponent):
 
 
     @classmethod
-    def get_Jmag(self, twomassid):
-        result = Vizier(catalog='II/246/out').query_object(twomassid, radius=1*u.arcsec)
+    def query_Jmag(self, twomassid):
+        result = vizier.Vizier(catalog='II/246/out').query_object(twomassid, radius=1*u.arcsec)
         if len(result) == 0:
             return None
         if result[0]['Jmag'].mask[0] == True:
@@ -159,15 +166,24 @@ class Target(BaseOBComponent):
 
 
     @classmethod
-    def resolve_name(self, target_name):
+    def get_Jmag(self, twomassid):
+        return get_cache().get('2mass', twomassid, lambda: self.query_Jmag(twomassid))
+
+
+    @classmethod
+    def query_simbad(self, target_name):
+        '''Resolve a target name with Simbad, then look up the Gaia DR3
+        parameters and 2MASS J magnitude. Returns the target as a dict, or
+        None if Simbad does not know the name.
+        '''
         target_dict = {'TargetName': target_name}
 
-        names = Simbad.query_objectids(target_name)
+        names = simbad.Simbad.query_objectids(target_name)
         GaiaDR3 = None
         gaia_params = {}
-        if names is None:
+        if names is None or len(names) == 0:
             print(f'Simbad query returned no objects for "{target_name}"')
-            return Target({})
+            return None
         else:
             for objid in names['ID']:
                 if objid.find('Gaia DR3') >= 0:
@@ -177,16 +193,11 @@ class Target(BaseOBComponent):
             target_dict['GaiaID'] = f"DR3 {GaiaDR3}"
             target_coord, gaia_params = self.get_gaia_parameters(GaiaDR3)
         else:
-            try:
-                simbad_results = Simbad.query_object(target_name)
-                target_coord = SkyCoord(f"{simbad_results['RA'][0]} {simbad_results['DEC'][0]}",
-                                        unit=(u.hourangle, u.deg)
-                                        )
-                print(target_coord)
-            except Exception as e:
-                print('Simbad query failed')
-                print(e)
-                return Target({})
+            simbad_results = simbad.Simbad.query_object(target_name)
+            target_coord = apc.SkyCoord(f"{simbad_results['RA'][0]} {simbad_results['DEC'][0]}",
+                                    unit=(u.hourangle, u.deg)
+                                    )
+            print(target_coord)
 
         twoMASSID = None
         Jmag = None
@@ -202,13 +213,53 @@ class Target(BaseOBComponent):
             target_dict['RA'] = ra_dec_string.split()[0]
             target_dict['Dec'] = ra_dec_string.split()[1]
             target_dict['Equinox'] = 'J2000'
-            target_dict['PMRA'] = target_coord.pm_ra_cosdec.to(u.arcsec/u.year).value/15#/np.cos(target_coord.dec.to(u.radian).value)
-            target_dict['PMDEC'] = target_coord.pm_dec.to(u.arcsec/u.year).value
-            target_dict['Epoch'] = target_coord.obstime.decimalyear
+            target_dict['PMRA'] = float(target_coord.pm_ra_cosdec.to(u.arcsec/u.year).value/15)#/np.cos(target_coord.dec.to(u.radian).value)
+            target_dict['PMDEC'] = float(target_coord.pm_dec.to(u.arcsec/u.year).value)
+            target_dict['Epoch'] = float(target_coord.obstime.decimalyear)
         except:
             pass
 
         target_dict.update(gaia_params)
-        newtarg = Target(target_dict)
+        return target_dict
+
+
+    @classmethod
+    def resolve_name(self, target_name):
+        try:
+            target_dict = get_cache().get('simbad', target_name,
+                                          lambda: self.query_simbad(target_name))
+        except Exception as e:
+            print('Simbad query failed')
+            print(e)
+            return Target({})
+        if target_dict is None:
+            return Target({})
+        return Target(dict(target_dict, TargetName=target_name))
 
-        return newtarg
+
+    @classmethod
+    def resolve_names(self, target_names, max_workers=None):
+        '''Resolve a list of target names, as resolve_name does. Names are
+        only resolved once and those which are not in the resolver cache are
+        queried concurrently.
+
+        Returns
+        -------
+        List[Target]
+            One Target per input name, empty Targets for names which could not
+            be resolved.
+        '''
+        target_dicts = get_cache().get_many('simbad', target_names, self.query_simbad,
+                                            max_workers=max_workers)
+        targets = []
+        for target_name in target_names:
+            target_dict = target_dicts[target_name]
+            if isinstance(target_dict, Exception):
+                print(f'Simbad query failed for "{target_name}"')
+                print(target_dict)
+                target_dict = None
+            if target_dict is None:
+                targets.append(Target({}))
+            else:
+                targets.append(Target(dict(target_dict, TargetName=target_name)))
+        return targets
@@ -0,0 +1,202 @@
+import warnings
+
+import numpy as np
+
+from kpf import lazy_import
+from kpf.telescope import get_location, above_horizon, near_horizon
+from kpf.ObservingBlocks.OBTable import sexagesimal_to_float
+
+u = lazy_import('astropy.units')
+apt = lazy_import('astropy.time')
+apc = lazy_import('astropy.coordinates')
+
+
+def parse_epochs(values):
+    '''Convert a list of epoch or equinox strings (e.g. "J2000", "B1950",
+    "2016.0") to a single astropy Time array. Values which can not be parsed
+    are returned as J2000 and flagged in the second return value.
+    '''
+    formats = {'J': 'jyear', 'B': 'byear'}
+    jd = np.full(len(values), 2451545.0)
+    valid = np.ones(len(values), dtype=bool)
+    groups = {}
+    for i,value in enumerate(values):
+        value = str(value).strip()
+        timeformat = formats.get(value[:1], 'decimalyear')
+        try:
+            year = float(value[1:] if timeformat in ['jyear', 'byear'] else value)
+        except ValueError:
+            valid[i] = False
+            continue
+        groups.setdefault(timeformat, ([], []))
+        groups[timeformat][0].append(i)
+        groups[timeformat][1].append(year)
+    for timeformat, (index, years) in groups.items():
+        jd[index] = apt.Time(years, format=timeformat).jd
+    return apt.Time(jd, format='jd'), valid
+
+
+##-------------------------------------------------------------------------
+## TargetCatalog
+##-------------------------------------------------------------------------
+class TargetCatalog(object):
+    '''All targets of a list of OBs held as a single array valued SkyCoord
+    (FK5 J2000, with proper motions and per target epochs), so that epoch
+    propagation, AltAz, airmass, hour angle, and horizon checks are computed
+    for every target (and every time in a time grid) in one transform.
+
+    Targets may be Target objects or target dicts (missing proper motions
+    and epochs take the Target defaults). Targets whose coordinates can not
+    be parsed are kept (so rows line up with the input list) but flagged in
+    the valid array, and give nan results.
+
+    Example:
+
+        catalog = TargetCatalog.from_OBs(OBs)
+        times = Time.now() + np.linspace(0, 10, 100)*u.hour
+        observable = catalog.above_horizon(times)  # shape (nOBs, 100)
+    '''
+    def __init__(self, targets):
+        self.targets = list(targets)
+        n = len(self.targets)
+        values = {name: [] for name in ['RA', 'Dec', 'PMRA', 'PMDEC', 'Epoch', 'Equinox']}
+        # Defaults (as for a Target) for values missing from target dicts
+        defaults = {'PMRA': 0, 'PMDEC': 0, 'Epoch': 'J2000', 'Equinox': 'J2000'}
+        for target in self.targets:
+            for name in values.keys():
+                value = target.get(name)
+                values[name].append(defaults.get(name) if value is None else value)
+        self.TargetName = np.array([t.get('TargetName') for t in self.targets], dtype=str)
+        ra = np.array([sexagesimal_to_float(v) for v in values['RA']], dtype=float)*15
+        dec = np.array([sexagesimal_to_float(v) for v in values['Dec']], dtype=float)
+        # Proper motions are in star list units, seconds of RA/yr and arcsec/yr
+        pmra = np.array(values['PMRA'], dtype=float)*15
+        pmdec = np.array(values['PMDEC'], dtype=float)
+        self.epoch, valid_epoch = parse_epochs(values['Epoch'])
+        equinox, valid_equinox = parse_epochs(values['Equinox'])
+        with np.errstate(invalid='ignore'):
+            self.valid = ((ra >= 0) & (ra < 360) & (np.abs(dec) <= 90)
+                          & np.isfinite(pmra) & np.isfinite(pmdec)
+                          & valid_epoch & valid_equinox)
+        for array in [ra, dec, pmra, pmdec]:
+            array[~self.valid] = 0
+        if n > 0:
+            # Precess any targets not in J2000 coordinates, one transform per
+            # distinct equinox
+            J2000 = apt.Time('J2000')
+            for jd in np.unique(equinox.jd):
+                index = np.where((equinox.jd == jd) & self.valid)[0]
+                if abs(jd - J2000.jd) < 1e-6 or len(index) == 0:
+                    continue
+                group = apc.SkyCoord(ra[index]*u.deg, dec[index]*u.deg,
+                                     pm_ra_cosdec=pmra[index]*u.arcsec/u.yr,
+                                     pm_dec=pmdec[index]*u.arcsec/u.yr,
+                                     obstime=self.epoch[index],
+                                     frame=apc.FK5(equinox=apt.Time(jd, format='jd')))
+                group = group.transform_to(apc.FK5(equinox=J2000))
+                ra[index] = group.ra.deg
+                dec[index] = group.dec.deg
+                pmra[index] = group.pm_ra_cosdec.to(u.arcsec/u.yr).value
+                pmdec[index] = group.pm_dec.to(u.arcsec/u.yr).value
+        # Proper motions in star list units, after any precession
+        self.PMRA = pmra/15
+        self.PMDEC = pmdec
+        self.coord = apc.SkyCoord(ra*u.deg, dec*u.deg,
+                                  pm_ra_cosdec=pmra*u.arcsec/u.yr,
+                                  pm_dec=pmdec*u.arcsec/u.yr,
+                                  obstime=self.epoch,
+                                  frame=apc.FK5(equinox='J2000'))
+        self.location = get_location()
+
+    @classmethod
+    def from_OBs(cls, OBs):
+        '''Catalog of the targets of a list of OBs. OBs without a target are
+        skipped, the OB_index attribute gives the index in to OBs of each
+        row.
+        '''
+        OB_index = [i for i,OB in enumerate(OBs) if OB.Target is not None]
+        catalog = cls([OBs[i].Target for i in OB_index])
+        catalog.OB_index = np.array(OB_index, dtype=int)
+        return catalog
+
+    def __len__(self):
+        return len(self.targets)
+
+    ##---------------------------------------------------------------------
+    ## Epoch propagation
+    ##---------------------------------------------------------------------
+    def propagate(self, obstime):
+        '''Apply proper motion to all targets to the given time. Returns an
+        array valued SkyCoord (FK5 J2000) without velocities.
+        '''
+        obstime = apt.Time(obstime)
+        with warnings.catch_warnings():
+            # Targets have no distance, which is fine for proper motion only
+            warnings.filterwarnings('ignore', message='.*distance overridden.*')
+            moved = self.coord.apply_space_motion(new_obstime=obstime)
+        return apc.SkyCoord(moved.ra, moved.dec, frame=apc.FK5(equinox='J2000'))
+
+    ##---------------------------------------------------------------------
+    ## Time grid calculations
+    ##---------------------------------------------------------------------
+    def altaz(self, times, pressure=620*u.mbar, temperature=0*u.Celsius):
+        '''AltAz coordinates of every target at every time.
+
+        Proper motion is applied once, to the first time. The result has
+        shape (ntargets, ntimes), or (ntargets,) for a scalar time.
+        '''
+        times = apt.Time(times)
+        coord = self.propagate(times.ravel()[0])
+        frame = apc.AltAz(obstime=times if times.isscalar else times[np.newaxis,:],
+                          location=self.location,
+                          pressure=pressure, temperature=temperature)
+        if times.isscalar is False:
+            coord = coord[:,np.newaxis]
+        return coord.transform_to(frame)
+
+    def airmass(self, times=None, altaz=None):
+        '''Airmass (sec z) of every target at every time, nan below the
+        horizon.
+        '''
+        if altaz is None:
+            altaz = self.altaz(times)
+        alt = altaz.alt.deg
+        airmass = np.where(alt > 0, 1/np.sin(np.radians(np.clip(alt, 1e-3, 90))), np.nan)
+        return self.nan_invalid_rows(airmass)
+
+    def hour_angle(self, times):
+        '''Hour angle in hours (-12 to +12) of every target at every time.'''
+        times = apt.Time(times)
+        coord = self.propagate(times.ravel()[0])
+        lst = np.asarray(times.sidereal_time('mean', longitude=self.location.lon).hour)
+        if times.isscalar is True:
+            ha = lst - coord.ra.hour
+        else:
+            ha = lst[np.newaxis,:] - coord.ra.hour[:,np.newaxis]
+        ha = (ha + 12) % 24 - 12
+        return self.nan_invalid_rows(ha)
+
+    def above_horizon(self, times=None, altaz=None):
+        '''Boolean array, True where a target is above the Keck horizon.'''
+        if altaz is None:
+            altaz = self.altaz(times)
+        result = np.asarray(above_horizon(altaz.az.deg, altaz.alt.deg))
+        return result & self.valid_rows(result)
+
+    def near_horizon(self, times=None, altaz=None, margin=5):
+        '''Boolean array, True where a target is above the Keck horizon minus
+        the margin (in degrees).
+        '''
+        if altaz is None:
+            altaz = self.altaz(times)
+        result = np.asarray(near_horizon(altaz.az.deg, altaz.alt.deg, margin=margin))
+        return result & self.valid_rows(result)
+
+    def valid_rows(self, result):
+        '''The valid array, broadcastable against a (ntargets, ...) result.'''
+        return self.valid.reshape(self.valid.shape + (1,)*(np.ndim(result)-1))
+
+    def nan_invalid_rows(self, result):
+        result = np.array(result, dtype=float)
+        result[~np.broadcast_to(self.valid_rows(result), result.shape)] = np.nan
+        return result
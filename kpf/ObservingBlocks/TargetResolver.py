@@ -0,0 +1,214 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from kpf import log, cfg
+
+
+def normalise_key(key):
+    '''Cache key for a target name or catalog ID: case and white space are
+    not significant ("hd  10700" and "HD 10700" are the same target).
+    '''
+    return ' '.join(str(key).split()).upper()
+
+
+##-------------------------------------------------------------------------
+## Target resolution cache
+##-------------------------------------------------------------------------
+class ResolverCache(object):
+    '''Persistent (SQLite) cache of catalog lookups used to build Targets:
+    Simbad name resolution, Gaia DR3 parameters, and 2MASS J magnitudes.
+
+    Entries are keyed by catalog ("simbad", "gaia", "2mass") and normalised
+    name or ID. A lookup which found nothing is cached as well (as None),
+    with its own, shorter, TTL so that typos and unknown names do not go
+    back to the network on every OB build.
+
+    If a query fails (e.g. no network) an expired entry is used regardless
+    of its age. In offline mode the network is never used: cached entries
+    of any age are returned and anything not in the cache resolves to None.
+    If the cache file can not be used (e.g. its directory is missing or not
+    writable) every lookup is a miss and goes to the catalog.
+    '''
+    def __init__(self, cache_file=None, ttl=None, negative_ttl=None,
+                 offline=None):
+        if cache_file is None:
+            cache_file = os.getenv('KPF_RESOLVER_CACHE', default=None)
+        if cache_file is None:
+            cache_file = cfg.get('TargetResolver', 'cache_file',
+                                 fallback='~/.kpftranslator/target_resolver.sqlite')
+        self.cache_file = Path(cache_file).expanduser()
+        if ttl is None:
+            ttl = cfg.getfloat('TargetResolver', 'ttl', fallback=30*24*3600)
+        self.ttl = ttl
+        if negative_ttl is None:
+            negative_ttl = cfg.getfloat('TargetResolver', 'negative_ttl', fallback=24*3600)
+        self.negative_ttl = negative_ttl
+        if offline is None:
+            offline = os.getenv('KPF_RESOLVER_OFFLINE', default=None)
+            if offline is None:
+                offline = cfg.getboolean('TargetResolver', 'offline', fallback=False)
+            else:
+                offline = offline.lower() in ['1', 'true', 'yes']
+        self.offline = offline
+        self.max_workers = cfg.getint('TargetResolver', 'max_workers', fallback=8)
+        self.lock = threading.RLock()
+        self.connection = None
+        self.stats = {'hits': 0, 'queries': 0, 'stale': 0, 'offline': 0,
+                      'uncached': 0}
+
+    def connect(self):
+        '''Open (once) the cache database, creating it if needed.'''
+        with self.lock:
+            if self.connection is None:
+                self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+                self.connection = sqlite3.connect(self.cache_file, timeout=10,
+                                                  check_same_thread=False)
+                self.connection.execute('''CREATE TABLE IF NOT EXISTS resolutions
+                                           (catalog TEXT, key TEXT, value TEXT, time REAL,
+                                            PRIMARY KEY (catalog, key))''')
+                self.connection.commit()
+            return self.connection
+
+    def read(self, catalog, key):
+        '''The cached (value, time) for the key regardless of age, or None.'''
+        with self.lock:
+            row = self.connect().execute('SELECT value, time FROM resolutions '
+                                         'WHERE catalog=? AND key=?',
+                                         (catalog, normalise_key(key))).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0]) if row[0] is not None else None
+        return value, row[1]
+
+    def write(self, catalog, key, value):
+        data = json.dumps(value) if value is not None else None
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?)',
+                               (catalog, normalise_key(key), data, time.time()))
+            connection.commit()
+
+    def lookup(self, catalog, key):
+        '''Look for a usable cache entry without going to the network.
+
+        Returns
+        -------
+        Tuple[bool, object]
+            Whether a usable entry was found and its value.
+        '''
+        entry = self.read(catalog, key)
+        if entry is None:
+            return False, None
+        value, written = entry
+        ttl = self.negative_ttl if value is None else self.ttl
+        if self.offline is True or time.time() - written < ttl:
+            return True, value
+        return False, None
+
+    def get(self, catalog, key, loader):
+        '''Return the cached value for the key, calling loader() to query the
+        catalog if there is no usable entry. The loader should return None if
+        the catalog has no match and raise an exception if the query failed.
+
+        Raises the loader's exception if the query fails and there is no
+        cached entry of any age.
+        '''
+        try:
+            found, value = self.lookup(catalog, key)
+        except (OSError, sqlite3.Error) as e:
+            # An unusable cache is a miss: query, and don't write back
+            log.debug(f"Target resolver cache {self.cache_file} unavailable: {e}")
+            self.stats['uncached'] += 1
+            if self.offline is True:
+                return None
+            self.stats['queries'] += 1
+            return loader()
+        if found is True:
+            self.stats['hits'] += 1
+            return value
+        if self.offline is True:
+            self.stats['offline'] += 1
+            log.debug(f"Offline: no cached {catalog} entry for {key}")
+            return None
+        try:
+            self.stats['queries'] += 1
+            value = loader()
+        except Exception as e:
+            entry = self.read(catalog, key)
+            if entry is None:
+                raise e
+            log.debug(f"{catalog} query for {key} failed, using cached entry: {e}")
+            self.stats['stale'] += 1
+            return entry[0]
+        try:
+            self.write(catalog, key, value)
+        except (OSError, sqlite3.Error) as e:
+            log.debug(f"Unable to write target resolver cache {self.cache_file}: {e}")
+        return value
+
+    def get_many(self, catalog, keys, loader, max_workers=None):
+        '''Look up several keys at once. Keys which are the same once
+        normalised are only looked up once and cache misses are queried
+        concurrently, loader(key) is called for each miss.
+
+        Returns
+        -------
+        Dict
+            The value for each key, or the exception raised by the loader for
+            keys whose query failed.
+        '''
+        if max_workers is None:
+            max_workers = self.max_workers
+        unique = {}
+        for key in keys:
+            unique.setdefault(normalise_key(key), key)
+        values = {}
+        misses = []
+        for key in unique.values():
+            try:
+                found, value = self.lookup(catalog, key)
+            except (OSError, sqlite3.Error):
+                found = False
+            if found is True:
+                self.stats['hits'] += 1
+                values[key] = value
+            else:
+                misses.append(key)
+        if len(misses) > 0:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(misses)))) as pool:
+                futures = {key: pool.submit(self.get, catalog, key, lambda k=key: loader(k))
+                           for key in misses}
+            for key, future in futures.items():
+                try:
+                    values[key] = future.result()
+                except Exception as e:
+                    values[key] = e
+        return {key: values[unique[normalise_key(key)]] for key in keys}
+
+    def invalidate(self, catalog=None, key=None):
+        '''Remove cached entries: one key, one catalog, or everything.'''
+        with self.lock:
+            connection = self.connect()
+            if catalog is None:
+                connection.execute('DELETE FROM resolutions')
+            elif key is None:
+                connection.execute('DELETE FROM resolutions WHERE catalog=?', (catalog,))
+            else:
+                connection.execute('DELETE FROM resolutions WHERE catalog=? AND key=?',
+                                   (catalog, normalise_key(key)))
+            connection.commit()
+
+
+cache = None
+
+
+def get_cache():
+    global cache
+    if cache is None:
+        cache = ResolverCache()
+    return cache
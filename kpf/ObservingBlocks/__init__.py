@@ -1,38 +1,247 @@
-class OBProperty(object):
-    def __init__(self, name='', defaultvalue=None, valuetype=None,
-                 comment='', precision=None, altname=None):
-        self.name = name if altname is None else altname
-        self.valuetype = eval(valuetype)
-        self._value = None if defaultvalue is None else self.valuetype(defaultvalue)
-        self.comment = comment
-        self.precision = precision
-        self.defaultvalue = defaultvalue
+import hashlib
+import functools
+import threading
+from pathlib import Path
+from collections import namedtuple, OrderedDict
+from types import MappingProxyType
 
-    def get(self, string=False):
-        if self._value is not None and string == False:
-            return self.valuetype(self._value)
-        elif self._value is not None and string == True:
-            return self.__str__()
-        else:
-            return self._value
+import yaml
 
-    def set(self, input_value):
+from kpf.metadata import get_enumerators, get_value
+from kpf.ObservingBlocks.serialization import canonical_dumps
+
+
+##-------------------------------------------------------------------------
+## Compiled property schemas
+##-------------------------------------------------------------------------
+# Types which may appear as the valuetype in a *Properties.yaml file
+valuetypes = {'str': str, 'int': int, 'float': float, 'bool': bool}
+
+
+class PropertySpec(namedtuple('PropertySpec', ['index', 'name', 'textname',
+                                               'valuetype', 'defaultvalue',
+                                               'default', 'comment',
+                                               'precision', 'altname',
+                                               'format'])):
+    '''Definition of a single OB component property.'''
+    __slots__ = ()
+
+    def convert(self, input_value):
+        '''Return the value to store when the property is set to input_value.'''
         if input_value is None:
-            self._value = self.defaultvalue
-            return
+            return self.defaultvalue
         if type(input_value) == str:
             if input_value.lower() in ['none', '', 'unknown']:
-                self._value = self.defaultvalue
-                return
+                return self.defaultvalue
         try:
-            self._value = self.valuetype(input_value)
+            return self.valuetype(input_value)
         except TypeError:
             raise TypeError(f"Input {input_value} can not be cast as {self.valuetype}")
 
+    def to_string(self, value):
+        if self.format is not None:
+            return self.format.format(value)
+        return f"{value}"
+
+
+# Result of checking one property of an OB component. error is True if the
+# value is invalid, comment explains the problem (or notes why the property
+# is unused) and is empty if there is nothing to report.
+ValidationResult = namedtuple('ValidationResult', ['component', 'property',
+                                                   'error', 'comment'])
+
+
+class OBSchema(object):
+    '''Immutable compiled form of a list of property definitions (the
+    contents of a *Properties.yaml file).
+
+    Holds one PropertySpec per property, in file order, with the value type
+    resolved and the default value already cast, plus a lookup table which
+    maps both the name and the altname of each property to its spec.
+    '''
+    __slots__ = ['source', 'properties', 'names', 'lookup']
+
+    def __init__(self, properties, source=None):
+        specs = []
+        lookup = {}
+        for p in properties:
+            valuetype = p.get('valuetype', None)
+            if isinstance(valuetype, str):
+                try:
+                    valuetype = valuetypes[valuetype]
+                except KeyError:
+                    raise TypeError(f"Unknown valuetype {valuetype} for {p.get('name')}")
+            defaultvalue = p.get('defaultvalue', None)
+            default = None if defaultvalue is None else valuetype(defaultvalue)
+            precision = p.get('precision', None)
+            altname = p.get('altname', None)
+            spec = PropertySpec(index=len(specs),
+                                name=p['name'],
+                                textname=p['name'] if altname is None else altname,
+                                valuetype=valuetype,
+                                defaultvalue=defaultvalue,
+                                default=default,
+                                comment=p.get('comment', None),
+                                precision=precision,
+                                altname=altname,
+                                format=None if (valuetype != float or precision is None) else f'{{0:.{precision:d}f}}',
+                                )
+            specs.append(spec)
+            lookup[spec.name] = spec
+            if altname is not None:
+                lookup[altname] = spec
+        object.__setattr__(self, 'source', source)
+        object.__setattr__(self, 'properties', tuple(specs))
+        object.__setattr__(self, 'names', tuple([s.name for s in specs]))
+        object.__setattr__(self, 'lookup', MappingProxyType(lookup))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('OBSchema is immutable')
+
+    # Copies of components share the schema
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        if self.source is not None:
+            return (get_schema, (self.source,))
+        return (OBSchema, ([spec._asdict() for spec in self.properties],))
+
+    def __iter__(self):
+        return iter(self.properties)
+
+    def __len__(self):
+        return len(self.properties)
+
+    def __contains__(self, name):
+        return name in self.lookup
+
+    def __getitem__(self, name):
+        return self.lookup[name]
+
+
+schemas = {}
+schemas_lock = threading.Lock()
+
+
+def get_schema(properties_file):
+    '''Return the compiled schema for a properties file. Each file is read
+    and parsed only once per process. Relative paths are taken relative to
+    this directory.
+    '''
+    properties_file = Path(__file__).parent / properties_file
+    with schemas_lock:
+        schema = schemas.get(properties_file, None)
+        if schema is None:
+            with open(properties_file, 'r') as f:
+                properties = yaml.safe_load(f.read())
+            schema = OBSchema(properties, source=properties_file)
+            schemas[properties_file] = schema
+    return schema
+
+
+##-------------------------------------------------------------------------
+## Instrument options
+##-------------------------------------------------------------------------
+instrument_options = {}
+
+
+def get_instrument_options():
+    '''Exposure meter bands and ND filter positions used to check
+    Observation and Calibration components.
+
+    The same (read only) objects are returned to every component for as long
+    as the underlying instrument metadata is unchanged, so large collections
+    of OBs do not each carry their own copies.
+    '''
+    try:
+        WAVEBINS = get_value('kpf_expmeter', 'WAVEBINS')
+        key = (WAVEBINS,
+               tuple(get_enumerators('kpfcal', 'ND1POS')),
+               tuple(get_enumerators('kpfcal', 'ND2POS')))
+    except:
+        key = None
+    options = instrument_options.get(key, None)
+    if options is None:
+        if key is None:
+            bands = [498.12, 604.38, 710.62, 816.88]
+            ND1 = ('OD 0.1', 'OD 1.0', 'OD 1.3', 'OD 2.0', 'OD 3.0', 'OD 4.0')
+            ND2 = ('OD 0.1', 'OD 0.3', 'OD 0.5', 'OD 0.8', 'OD 1.0', 'OD 4.0')
+        else:
+            bands = key[0].split()
+            ND1 = tuple([nd for nd in key[1] if nd != 'Unknown'])
+            ND2 = tuple([nd for nd in key[2] if nd != 'Unknown'])
+        expmeter_bands = tuple([f"{float(b):.0f}nm" for b in bands])
+        ND_values = {'CalND1': ND1, 'CalND2': ND2}
+        options = (expmeter_bands, ND_values)
+        instrument_options[key] = options
+    return options
+
+
+##-------------------------------------------------------------------------
+## OB components
+##-------------------------------------------------------------------------
+class UnknownProperty(TypeError, AttributeError):
+    '''Raised by from_dict for a key which is not in the component's schema.
+    It is a TypeError, which is what callers of from_dict have always caught
+    for unknown keys, as well as an AttributeError.
+    '''
+    pass
+
+
+class OBProperty(object):
+    '''View of a single property of an OB component. The value itself is
+    stored in the component, the rest comes from the shared schema, so these
+    are cheap to create on attribute access (e.g. Target.RA).
+    '''
+    __slots__ = ['component', 'spec']
+
+    def __init__(self, component, spec):
+        self.component = component
+        self.spec = spec
+
+    @property
+    def name(self):
+        return self.spec.textname
+
+    @property
+    def valuetype(self):
+        return self.spec.valuetype
+
+    @property
+    def comment(self):
+        return self.spec.comment
+
+    @property
+    def precision(self):
+        return self.spec.precision
+
+    @property
+    def defaultvalue(self):
+        return self.spec.defaultvalue
+
+    @property
+    def _value(self):
+        return self.component.values[self.spec.index]
+
+    def get(self, string=False):
+        value = self.component.values[self.spec.index]
+        if value is not None and string == False:
+            return self.spec.valuetype(value)
+        elif value is not None and string == True:
+            return self.__str__()
+        else:
+            return value
+
+    def set(self, input_value):
+        self.component.values[self.spec.index] = self.spec.convert(input_value)
+        self.component.revision += 1
+
     def __str__(self):
-        if self.valuetype == float and self.precision is not None:
-            return ('{0:.%df}' % self.precision).format(self._value)
-        return f"{self._value}"
+        return self.spec.to_string(self.component.values[self.spec.index])
 
     def __repr__(self):
         return f"{self._value}"
@@ -42,69 +251,137 @@ class OBProperty(object):
 
 
 class BaseOBComponent(object):
+    '''Base class for OB components (Target, Observation, Calibration).
+
+    Each instance stores only a list of property values, in schema order.
+    Everything else about a property lives once in the shared schema.
+    Properties are available as attributes, which return an OBProperty view,
+    so self.RA.value and self.get('RA') are equivalent.
+
+    Every change to a value increments revision. The results of checking the
+    properties (see check_properties) and the immutable snapshot of the
+    values (see snapshot) are kept until the next change, so repeated
+    validation of an unchanged component is free.
+    '''
+    __slots__ = ['type', 'version', 'schema', 'values', 'list_element',
+                 'revision', 'checked', 'frozen']
+
     def __init__(self, component_type, version, properties=[]):
+        '''properties is either a compiled OBSchema (see get_schema) or a
+        list of property definitions as read from a properties file.
+        '''
         self.type = component_type
         self.version = version
-        self.properties = properties
-        for p in properties:
-            all_properties = ['name', 'defaultvalue', 'valuetype',
-                              'comment', 'precision', 'altname']
-            for pname in all_properties:
-                if pname not in p.keys():
-                    p[pname] = None
-            setattr(self, p['name'], OBProperty(**p))
+        if not isinstance(properties, OBSchema):
+            properties = OBSchema(properties)
+        self.schema = properties
+        self.values = [spec.default for spec in properties.properties]
         self.list_element = False
+        self.revision = 0
+        self.checked = None
+        self.frozen = None
+
+    def __getattr__(self, name):
+        # Only called when normal attribute lookup fails
+        if name in ('schema', 'values'):
+            raise AttributeError(name)
+        spec = self.schema.lookup.get(name, None)
+        if spec is None or spec.name != name:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        return OBProperty(self, spec)
+
+    @property
+    def properties(self):
+        return self.schema.properties
 
     def get_pruning_guide(self):
         return []
 
     def get_property_name(self, name):
-        for p in self.properties:
-            if name in [p['name'], p['altname']]:
-                return p['name']
+        spec = self.schema.lookup.get(name, None)
+        return None if spec is None else spec.name
 
     def get_text_name(self, name):
-        for p in self.properties:
-            if name in [p['name'], p['altname']]:
-                return p['altname'] if p['altname'] is not None else p['name']
+        spec = self.schema.lookup.get(name, None)
+        return None if spec is None else spec.textname
 
     def get(self, name, string=False):
-        name = self.get_property_name(name)
-        this_property = getattr(self, name)
-        if string == True and this_property.valuetype != str:
-            return this_property.__str__()
-        elif string == True and this_property.valuetype == str:
-            return f"'{this_property.__str__()}'"
+        spec = self.schema.lookup[name]
+        value = self.values[spec.index]
+        if string == True and spec.valuetype != str:
+            return spec.to_string(value)
+        elif string == True and spec.valuetype == str:
+            # YAML single quoted string, quotes are escaped by doubling them
+            return "'" + spec.to_string(value).replace("'", "''") + "'"
+        elif value is not None:
+            return spec.valuetype(value)
         else:
-            return this_property.value
+            return value
 
     def set(self, name, value):
-        name = self.get_property_name(name)
-        if name in [p['name'] for p in self.properties]:
-            this_property = getattr(self, name)
-            this_property.set(value)
+        spec = self.schema.lookup.get(name, None)
+        if spec is not None:
+            self.values[spec.index] = spec.convert(value)
+            self.revision += 1
 
     def from_dict(self, input_dict):
+        lookup = self.schema.lookup
         for dictkey in input_dict.keys():
             input_value = input_dict[dictkey]
-            key = self.get_property_name(dictkey)
+            spec = lookup.get(dictkey, None)
+            if spec is None:
+                print(f'Failed while parsing {dictkey}')
+                raise UnknownProperty(f"No property named {dictkey}")
             try:
-                this_property = getattr(self, key)
-                this_property.set(input_value)
-            except AttributeError as e:
-                print(f"No property named {key}")
+                self.values[spec.index] = spec.convert(input_value)
             except Exception as e:
-                print(f'Failed while parsing {key}')
+                print(f'Failed while parsing {spec.name}')
                 raise e
+        self.revision += 1
         return self
 
+    def touch(self):
+        '''Mark the component as modified, for changes to state other than
+        the property values which affects check_property.
+        '''
+        self.revision += 1
+
+    def snapshot(self):
+        '''Immutable ComponentSnapshot of the current values. The same
+        snapshot is returned until the component is next modified.
+        '''
+        if self.frozen is None or self.frozen[0] != self.revision:
+            self.frozen = (self.revision, ComponentSnapshot(self))
+        return self.frozen[1]
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        '''New (mutable) component with the values of a snapshot.'''
+        component = cls({})
+        component.values = list(snapshot.values)
+        component.touch()
+        return component
+
+    def __copy__(self):
+        # The schema, cached check results, snapshot, and (for a Target) the
+        # SkyCoord are never modified in place, so they are shared. Only the
+        # list of values is copied.
+        new = object.__new__(type(self))
+        for klass in type(self).__mro__:
+            for slot in getattr(klass, '__slots__', []):
+                if hasattr(self, slot):
+                    setattr(new, slot, getattr(self, slot))
+        new.values = list(self.values)
+        return new
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
     def to_dict(self):
         output = {}
-        for p in self.properties:
-            name = self.get_text_name(p['name'])
-            if self.get(p['name']) is not None:
-                outname = p['name'] if p['altname'] is None else p['altname']
-                output[outname] = self.get(p['name'])
+        for spec, value in zip(self.schema.properties, self.values):
+            if value is not None:
+                output[spec.textname] = spec.valuetype(value)
         return output
 
     def to_lines(self, prune=True, comment=False):
@@ -114,26 +391,47 @@ class BaseOBComponent(object):
                 if prune[0] == True:
                     prune_list.extend(prune[1])
         lines = []
-        for i,p in enumerate(self.properties):
-            if self.get(p['name']) is not None and p['name'] not in prune_list:
-                outname = p['name'] if p['altname'] is None else p['altname']
-                outtext = f"{self.get(p['name'], string=True)}"
+        for i,spec in enumerate(self.schema.properties):
+            if self.values[i] is not None and spec.name not in prune_list:
+                outtext = f"{self.get(spec.name, string=True)}"
                 prepend = '- ' if self.list_element == True and i == 0 else '  '
-                comment_text = self.add_comment(p['name']) if comment == True else ''
-                lines.append(f"{prepend}{outname}: {outtext}{comment_text}")
+                comment_text = self.add_comment(spec.name) if comment == True else ''
+                lines.append(f"{prepend}{spec.textname}: {outtext}{comment_text}")
         return lines
 
     def add_comment(self, pname):
         return ''
 
+    def check_property(self, pname):
+        '''Return (error, comment) for one property.'''
+        return False, ''
+
+    def check_properties(self):
+        '''ValidationResult for every property, as a dict keyed by property
+        name. Cached until the component is next modified.
+        '''
+        if self.checked is None or self.checked[0] != self.revision:
+            results = {}
+            for name in self.schema.names:
+                error, comment = self.check_property(name)
+                results[name] = ValidationResult(self.type, name, error == True, comment)
+            self.checked = (self.revision, results)
+        return self.checked[1]
+
+    def validation_results(self, errors_only=False):
+        '''List of ValidationResult for the properties which have an error or
+        a comment.
+        '''
+        return [r for r in self.check_properties().values()
+                if r.error is True or (errors_only is False and r.comment != '')]
+
     def validate(self, verbose=False):
         '''
         '''
         valid = True
-        for p in self.properties:
-            error, comment = self.check_property(p['name'])
-            if error == True:
-                if verbose: print(f"{p['name']} is INVALID: {comment}")
+        for result in self.check_properties().values():
+            if result.error is True:
+                if verbose: print(f"{result.property} is INVALID: {result.comment}")
                 valid = False
         return valid
 
@@ -151,3 +449,132 @@ class BaseOBComponent(object):
         for line in self.to_lines(prune=prune, comment=comment):
             output += line+'\n'
         return output
+
+
+##-------------------------------------------------------------------------
+## Immutable snapshots of OB components
+##-------------------------------------------------------------------------
+def restore_snapshot(component_class, component_type, version, schema, values, digest):
+    snapshot = object.__new__(ComponentSnapshot)
+    for name, value in zip(ComponentSnapshot.__slots__,
+                           [component_class, component_type, version, schema, values, digest]):
+        object.__setattr__(snapshot, name, value)
+    return snapshot
+
+
+class ComponentSnapshot(object):
+    '''Immutable copy of the property values of an OB component (Target,
+    Observation, or Calibration), as returned by component.snapshot().
+
+    The snapshot shares the schema with the component and holds the values
+    as a tuple, so copying a snapshot is free (copy and deepcopy return the
+    snapshot itself). The digest is a SHA-256 hash of the component type,
+    version, and values, which is stable between processes and sessions.
+    Snapshots compare equal and hash equal when their content is the same,
+    so they can be used as keys for memoised derived quantities (see
+    memoize).
+    '''
+    __slots__ = ['component_class', 'type', 'version', 'schema', 'values', 'digest']
+
+    def __init__(self, component):
+        values = tuple(component.values)
+        try:
+            data = canonical_dumps([component.type, component.version, values])
+        except Exception:
+            data = repr([component.type, component.version, values]).encode()
+        object.__setattr__(self, 'component_class', type(component))
+        object.__setattr__(self, 'type', component.type)
+        object.__setattr__(self, 'version', component.version)
+        object.__setattr__(self, 'schema', component.schema)
+        object.__setattr__(self, 'values', values)
+        object.__setattr__(self, 'digest', hashlib.sha256(data).hexdigest())
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __hash__(self):
+        return int(self.digest[:16], 16)
+
+    def __eq__(self, other):
+        if not isinstance(other, ComponentSnapshot):
+            return NotImplemented
+        return self.digest == other.digest
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (restore_snapshot, (self.component_class, self.type, self.version,
+                                   self.schema, self.values, self.digest))
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.type} {self.digest[:12]}>"
+
+    get = BaseOBComponent.get
+    to_dict = BaseOBComponent.to_dict
+
+    def thaw(self):
+        '''New (mutable) component with these values.'''
+        return self.component_class.from_snapshot(self)
+
+
+##-------------------------------------------------------------------------
+## Memoisation of quantities derived from OB components
+##-------------------------------------------------------------------------
+# Set to False to disable all memoisation (e.g. for benchmarks)
+memoization = True
+
+
+def memo_key(value):
+    '''Hashable key for a function argument: components are replaced by
+    their snapshots and lists by tuples.
+    '''
+    if isinstance(value, BaseOBComponent):
+        return value.snapshot()
+    if isinstance(value, (list, tuple)):
+        return tuple([memo_key(v) for v in value])
+    return value
+
+
+def memoize(function=None, maxsize=4096):
+    '''Decorator which memoises a function (or method) of OB components on
+    the content of the components. Components, and lists of them, in the
+    arguments are keyed by their snapshots, so results are shared between
+    components with identical values and recomputed when a component
+    changes. Calls with arguments which can not be hashed are not memoised.
+
+    The function must depend only on the values of its arguments.
+    '''
+    if function is None:
+        return functools.partial(memoize, maxsize=maxsize)
+    results = OrderedDict()
+    lock = threading.Lock()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if memoization is False:
+            return function(*args, **kwargs)
+        try:
+            key = (memo_key(args), tuple(sorted([(k, memo_key(v)) for k,v in kwargs.items()])))
+            with lock:
+                result = results.get(key, results)
+                if result is not results:
+                    results.move_to_end(key)
+                    return result
+        except TypeError:
+            return function(*args, **kwargs)
+        result = function(*args, **kwargs)
+        with lock:
+            results[key] = result
+            if len(results) > maxsize:
+                results.popitem(last=False)
+        return result
+
+    wrapper.cache_clear = results.clear
+    return wrapper
@@ -0,0 +1,236 @@
+import io
+import os
+import time
+import json
+import logging
+import contextlib
+import multiprocessing
+from pathlib import Path
+
+import yaml
+
+from kpf import log
+from kpf.ObservingBlocks import TargetResolver
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.ObservingBlocks.OBTable import pool_start_method
+from kpf.ObservingBlocks.serialization import dumps, loads
+
+
+# Use the libyaml parser if PyYAML was built with it
+YAMLLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+OB_suffixes = ['.yaml', '.yml', '.json']
+stages = ['read', 'build', 'validate', 'write']
+
+
+def find_OB_files(directory, exclude=None):
+    '''All OB files (YAML or JSON) in a directory tree, in sorted order.
+    Files under the exclude directory (e.g. the output of a conversion) are
+    skipped.
+    '''
+    directory = Path(directory).expanduser().absolute()
+    exclude = Path(exclude).expanduser().absolute() if exclude is not None else None
+    files = []
+    for root, dirnames, filenames in os.walk(directory):
+        root = Path(root)
+        if exclude is not None:
+            dirnames[:] = [d for d in dirnames if root / d != exclude]
+        dirnames.sort()
+        files.extend([root / f for f in sorted(filenames)
+                      if Path(f).suffix in OB_suffixes])
+    return files
+
+
+class MessageCapture(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@contextlib.contextmanager
+def capture_messages():
+    '''Collect the warnings logged and the lines printed while converting an
+    OB instead of sending them to the console.
+    '''
+    capture = MessageCapture()
+    stdout = io.StringIO()
+    console = [(h, h.level) for h in log.handlers if isinstance(h, logging.StreamHandler)
+               and not isinstance(h, logging.FileHandler)]
+    for handler, level in console:
+        handler.setLevel(logging.CRITICAL)
+    log.addHandler(capture)
+    try:
+        with contextlib.redirect_stdout(stdout):
+            yield capture.messages
+    finally:
+        log.removeHandler(capture)
+        for handler, level in console:
+            handler.setLevel(level)
+        capture.messages.extend([line for line in stdout.getvalue().splitlines()
+                                 if line.strip() != ''])
+
+
+def write_atomic(file, text):
+    '''Write through a temporary file and a rename so that a partially
+    written OB is never left at the destination.
+    '''
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = file.with_name(f".{file.name}.{os.getpid()}.tmp")
+    with open(tmp_file, 'w') as f:
+        f.write(text)
+    tmp_file.replace(file)
+
+
+def convert_file(job):
+    '''Convert one OB file to the v2 format and validate it.
+
+    Parameters
+    ----------
+    job : Tuple[str, str, bool]
+        The input file, the output file, and whether to overwrite an
+        existing output file.
+
+    Returns
+    -------
+    Dict
+        The report entry for the file: status is "converted", "invalid" (the
+        v2 file is written, but does not validate), "skipped" (output exists),
+        or "failed" (nothing written).
+    '''
+    input_file, output_file, overwrite = job
+    input_file = Path(input_file)
+    output_file = Path(output_file)
+    result = {'file': str(input_file), 'output': str(output_file),
+              'status': 'failed', 'format': None, 'errors': [],
+              'warnings': [], 'timing': {}}
+    if output_file.exists() and overwrite is False:
+        result['status'] = 'skipped'
+        return result
+    tick = time.perf_counter()
+    with capture_messages() as messages:
+        try:
+            with open(input_file) as f:
+                if input_file.suffix == '.json':
+                    OBdict = loads(f.read())
+                else:
+                    OBdict = yaml.load(f, Loader=YAMLLoader)
+            if not isinstance(OBdict, dict):
+                raise TypeError('File does not contain a dictionary')
+            result['format'] = OBdict.get('Template_Name', 'v2')
+            tock = time.perf_counter()
+            result['timing']['read'] = tock - tick
+            OB = ObservingBlock(OBdict)
+            tick = time.perf_counter()
+            result['timing']['build'] = tick - tock
+            result['errors'] = [f"{r.component} {r.property}:{r.comment}"
+                                if r.property is not None else f"{r.component}: {r.comment}"
+                                for r in OB.validation_results(errors_only=True)]
+            tock = time.perf_counter()
+            result['timing']['validate'] = tock - tick
+            if output_file.suffix == '.json':
+                text = dumps(OB.to_dict()).decode()
+            else:
+                text = OB.__repr__()+'\n'
+            write_atomic(output_file, text)
+            result['timing']['write'] = time.perf_counter() - tock
+            result['status'] = 'converted' if len(result['errors']) == 0 else 'invalid'
+        except Exception as e:
+            result['errors'].append(f"{type(e).__name__}: {e}")
+    result['warnings'] = messages
+    return result
+
+
+def init_worker():
+    # Each worker opens its own connection to the target resolver cache
+    TargetResolver.cache = None
+
+
+def convert_tree(input_directory, output_directory, processes=None,
+                 overwrite=False, output_format=None, chunksize=16):
+    '''Convert every OB file in a directory tree, writing v2 files to the
+    same relative paths under the output directory. Files are converted in
+    a process pool and the result for each file (see convert_file) is
+    yielded as soon as it is available, in completion order.
+
+    The output_format ("yaml" or "json") defaults to that of each input file.
+    The pool uses the same start method as OBTable (see pool_start_method),
+    and files are converted serially if that is None (other threads are
+    running).
+    '''
+    input_directory = Path(input_directory).expanduser().absolute()
+    output_directory = Path(output_directory).expanduser().absolute()
+    jobs = []
+    for file in find_OB_files(input_directory, exclude=output_directory):
+        output_file = output_directory / file.relative_to(input_directory)
+        if output_format is not None:
+            output_file = output_file.with_suffix(f".{output_format}")
+        jobs.append((str(file), str(output_file), overwrite))
+    if processes is None:
+        processes = os.cpu_count()
+    start_method = pool_start_method()
+    if start_method is None:
+        log.debug('Other threads are running, converting OBs serially')
+    if processes <= 1 or len(jobs) <= 1 or start_method is None:
+        for job in jobs:
+            yield convert_file(job)
+        return
+    context = multiprocessing.get_context(start_method)
+    with context.Pool(processes=processes, initializer=init_worker) as pool:
+        for result in pool.imap_unordered(convert_file, jobs, chunksize=chunksize):
+            yield result
+
+
+##-------------------------------------------------------------------------
+## Conversion report
+##-------------------------------------------------------------------------
+class ConversionReport(object):
+    '''Accumulate conversion results and write them as JSON lines: one line
+    per file which was not cleanly converted (with errors or warnings) as
+    results arrive, then a final summary line with counts, throughput, and
+    total and mean time per stage. With verbose=True every file is listed.
+    '''
+    def __init__(self, report_file=None, verbose=False):
+        self.report_file = Path(report_file).expanduser() if report_file is not None else None
+        self.verbose = verbose
+        self.counts = {'converted': 0, 'invalid': 0, 'failed': 0, 'skipped': 0}
+        self.warnings = 0
+        self.timing = {stage: 0 for stage in stages}
+        self.start = time.perf_counter()
+        self.stream = None
+        if self.report_file is not None:
+            self.report_file.parent.mkdir(parents=True, exist_ok=True)
+            self.stream = open(self.report_file, 'w')
+
+    def add(self, result):
+        self.counts[result['status']] += 1
+        if len(result['warnings']) > 0:
+            self.warnings += 1
+        for stage, elapsed in result['timing'].items():
+            self.timing[stage] += elapsed
+        problem = result['status'] in ['invalid', 'failed'] or len(result['warnings']) > 0
+        if self.stream is not None and (problem or self.verbose is True):
+            self.stream.write(json.dumps(result)+'\n')
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        processed = self.counts['converted'] + self.counts['invalid'] + self.counts['failed']
+        return {'summary': True,
+                'files': sum(self.counts.values()),
+                **self.counts,
+                'with_warnings': self.warnings,
+                'elapsed': elapsed,
+                'OBs_per_s': processed/elapsed if elapsed > 0 else 0,
+                'stage_total': dict(self.timing),
+                'stage_mean': {stage: t/processed if processed > 0 else 0
+                               for stage,t in self.timing.items()},
+                }
+
+    def close(self):
+        summary = self.summary()
+        if self.stream is not None:
+            self.stream.write(json.dumps(summary)+'\n')
+            self.stream.close()
+            self.stream = None
+        return summary
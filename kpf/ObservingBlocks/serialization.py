@@ -0,0 +1,141 @@
+import json
+import codecs
+
+try:
+    import orjson
+except:
+    orjson = None
+
+try:
+    import ijson
+except:
+    ijson = None
+
+
+##-------------------------------------------------------------------------
+## JSON serialization of OB dictionaries
+##-------------------------------------------------------------------------
+def canonical_dumps(obj):
+    '''Serialize to canonical JSON bytes: sorted keys, compact separators,
+    UTF-8, and floats written as their shortest repr. Always uses the
+    standard library json module so the bytes do not depend on what is
+    installed, anything which is hashed (OB store revisions, OB cache
+    digests, component snapshots) must use this. NaN and infinity are not
+    valid JSON and raise ValueError.
+    '''
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'),
+                      ensure_ascii=False, allow_nan=False).encode()
+
+
+def dumps(obj):
+    '''Serialize to compact UTF-8 JSON bytes with sorted keys. Uses orjson
+    if it is installed, which is much faster than the standard library json
+    module, but writes some floats differently (e.g. 1e-5 rather than
+    1e-05), so use canonical_dumps for anything which is hashed.
+    '''
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return canonical_dumps(obj)
+
+
+def loads(data):
+    '''Parse JSON bytes or str.'''
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def backend():
+    return 'orjson' if orjson is not None else 'json'
+
+
+##-------------------------------------------------------------------------
+## Incremental parsing of JSON arrays
+##-------------------------------------------------------------------------
+class PrefixedStream(object):
+    '''File like object which returns some bytes already read from a
+    stream before reading the rest of it.
+    '''
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if len(self.prefix) > 0:
+            data, self.prefix = self.prefix, b''
+            return data
+        return self.stream.read(size)
+
+
+def iter_items(stream, chunk_size=65536):
+    '''Parse a JSON array from a file like object (e.g. the raw body of a
+    streamed HTTP response) and yield its items as each one is complete, so
+    the whole document is never held in memory at once. Uses ijson if it is
+    installed, otherwise an incremental parser built on the standard library
+    json decoder. If the document is not an array, the whole value is
+    yielded once.
+    '''
+    # Find the first character to see whether this is an array
+    head = b''
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        head += data
+        if len(head.lstrip()) > 0:
+            break
+    if head.lstrip()[:1] != b'[':
+        rest = [head]
+        while data:
+            data = stream.read(chunk_size)
+            rest.append(data)
+        document = b''.join(rest)
+        if len(document.strip()) > 0:
+            yield loads(document)
+        return
+
+    if ijson is not None:
+        yield from ijson.items(PrefixedStream(head, stream), 'item',
+                               use_float=True)
+        return
+
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = utf8.decode(head).lstrip()[1:]
+    position = 0
+    finished = False
+    while True:
+        # Skip to the start of the next item
+        while position < len(buffer) and buffer[position] in ' \t\r\n':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # The item is only complete once the delimiter after it has
+                # been read (e.g. "12" may be the start of "12.5e3")
+                after = end
+                while after < len(buffer) and buffer[after] in ' \t\r\n':
+                    after += 1
+                if after < len(buffer) and buffer[after] in ',]':
+                    yield item
+                    position = after + 1 if buffer[after] == ',' else after
+                    continue
+                if finished is True:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, after)
+            except json.JSONDecodeError as e:
+                if finished is True:
+                    raise e
+        elif finished is True:
+            raise json.JSONDecodeError('Unterminated array', buffer, position)
+        data = stream.read(chunk_size)
+        if not data:
+            finished = True
+        # Drop what has been parsed and add the new data
+        buffer = buffer[position:] + utf8.decode(data or b'', final=not data)
+        position = 0
+
+
+def stream_backend():
+    return 'ijson' if ijson is not None else 'json'
@@ -1,11 +1,12 @@
 import os
+import sys
+import importlib
 from pathlib import Path
 import configparser
 import logging
 from logging.handlers import RotatingFileHandler
 import datetime
 from packaging import version
-import yaml
 
 
 ##-------------------------------------------------------------------------
@@ -20,6 +21,66 @@ def load_config(instrument='kpf'):
 cfg = load_config(instrument='kpf')
 
 
+##-------------------------------------------------------------------------
+## Lazy imports of heavy optional dependencies
+##-------------------------------------------------------------------------
+class LazyModule(object):
+    '''Stand in for a module which is only imported the first time one of
+    its attributes is used. Heavy libraries (astropy, astroquery, matplotlib,
+    requests, ...) are bound this way at module level so that importing a
+    translator module does not pay for them unless the code path which needs
+    them is actually run. A missing library raises ImportError at that point
+    rather than when the translator module is imported.
+    '''
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<LazyModule '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    '''Return the module if it has already been imported, otherwise a
+    LazyModule which imports it on first use.
+    '''
+    module = sys.modules.get(name, None)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def get_login():
+    '''Login name of the user running the command. A command run by the
+    kpfdo server, which has no controlling terminal, gets the login of the
+    kpfdo client from the KPFDO_LOGIN environment variable.
+    '''
+    login = os.getenv('KPFDO_LOGIN', default=None)
+    if login is None:
+        try:
+            login = os.getlogin()
+        except OSError:
+            # No controlling terminal (e.g. run from a subprocess)
+            import getpass
+            login = getpass.getuser()
+    return login
+
+
 ##-------------------------------------------------------------------------
 ## Create logger object
 ##-------------------------------------------------------------------------
@@ -55,3 +116,13 @@ def create_KPF_log():
 
 
 log = create_KPF_log()
+
+
+##-------------------------------------------------------------------------
+## Simulated KTL backend
+##-------------------------------------------------------------------------
+simulate = os.getenv('KPF_SIMULATE', default='').lower() not in ['', '0', 'no', 'false']
+if simulate is True:
+    from kpf import simulator
+    sys.modules['ktl'] = simulator
+    log.warning('KPF_SIMULATE is set: using the simulated KTL backend')
@@ -3,6 +3,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 from kpf.calbench import standardize_lamp_name
 
 
@@ -34,8 +35,7 @@ class IsCalSourceEnabled(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        keyword = ktl.cache('kpfcal', 'OCTAGON')
-        allowed_values = list(keyword._getEnumerators())
+        allowed_values = get_enumerators('kpfcal', 'OCTAGON', fresh=True)
         if 'Unknown' in allowed_values:
             allowed_values.pop(allowed_values.index('Unknown'))
         allowed_values.append('SoCal-SciSky')
@@ -1,21 +1,21 @@
 from pathlib import Path
 import datetime
 import numpy as np
-from astropy.io import fits
-from astropy.modeling import models
-from astropy import units as u
-from astropy.table import Table
-import matplotlib.pyplot as plt
 
 import ktl
 
-from kpf_etc.etc import kpf_photon_noise_estimate, _findel
-
-from kpf import log, cfg
+from kpf import log, cfg, lazy_import
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
+from kpf.ObservingBlocks import memoize
 from kpf.calbench.SetND import SetND
 
+fits = lazy_import('astropy.io.fits')
+table = lazy_import('astropy.table')
+plt = lazy_import('matplotlib.pyplot')
+etc = lazy_import('kpf_etc.etc')
+
 
 ## ------------------------------
 ## Function from Sam Halversion
@@ -90,7 +90,7 @@ def get_simulcal_od(vmag, teff, exp_time, cal_fits, ref_wave=None,
     '''
 
     # run ETC to get approximate stellar SNR in SCI channels
-    _, wvl_arr, snr_rv_ord, _ = kpf_photon_noise_estimate(teff,
+    _, wvl_arr, snr_rv_ord, _ = etc.kpf_photon_noise_estimate(teff,
                                                           vmag,
                                                           exp_time,
                                                           quiet=True)
@@ -100,11 +100,11 @@ def get_simulcal_od(vmag, teff, exp_time, cal_fits, ref_wave=None,
 
     # get flux-averaged wavelength of stellar spectrum to match
     wav_avg = np.average(wvl_arr, weights=snr_rv_ord ** 2.)
-    peak_ord = _findel(wav_avg, wvl_arr)
+    peak_ord = etc._findel(wav_avg, wvl_arr)
 
     # if no user defined wavelength to match, use the flux-weighted wavelength
     if ref_wave is not None:
-        order_ref = _findel(ref_wave, wvl_arr*10.)
+        order_ref = etc._findel(ref_wave, wvl_arr*10.)
 #         print('----------------------------------')
 #         print('Using reference wavelength: ' + str(ref_wave) + ' Angstrom')
 #         print('----------------------------------')
@@ -145,7 +145,7 @@ def get_simulcal_od(vmag, teff, exp_time, cal_fits, ref_wave=None,
     ratio_flux = cal_flux_rate_native/stellar_flux_rate_slice # ratio
 
     # find the nearest OD filter to the computed flux rate
-    index_od_nearest = _findel(np.log10(ratio_flux), od_values)
+    index_od_nearest = etc._findel(np.log10(ratio_flux), od_values)
     od_nearest = od_values[index_od_nearest] # total OD
     
     # compute the cal flux rate at the nearest OD filter setting
@@ -196,9 +196,18 @@ def get_simulcal_od(vmag, teff, exp_time, cal_fits, ref_wave=None,
 
 
 
+@memoize
+def predict_simulcal_od(vmag, teff, exp_time, cal_fits, ref_wave, od_values,
+                        filter_configs):
+    '''Memoised get_simulcal_od (without plotting).'''
+    return get_simulcal_od(vmag, teff, exp_time, cal_fits, ref_wave=ref_wave,
+                           od_values=od_values, filter_configs=filter_configs)
+
+
 ## ------------------------------
 ## Convert from Gmag to Vmag
 ## ------------------------------
+@memoize
 def get_GminusV(Teff):
     '''Table of data from:
     https://www.pas.rochester.edu/~emamajek/EEM_dwarf_UBVIJHK_colors_Teff.txt
@@ -207,7 +216,7 @@ def get_GminusV(Teff):
     table_file = p / 'EEM_dwarf_UBVIJHK_colors_Teff.txt'
     if table_file.exists() is False:
         return 0
-    t = Table.read(table_file, format='ascii')
+    t = table.Table.read(table_file, format='ascii')
     filtered = t[t['G-V'] != '...']
     Teff_diff = abs(filtered['Teff'] - Teff)
     ind = np.argmin(Teff_diff)
@@ -275,23 +284,20 @@ class PredictNDFilters(KPFFunction):
 #         od_arr_scical = [0.1, 1.0, 1.3, 2., 3., 4.]
 #         od_arr_cal = [0.1, 0.3, 0.5, 0.8, 1.0, 4.0]
 
-        ND1POS = ktl.cache('kpfcal', 'ND1POS')
-        ND1POS_allowed_values = list(ND1POS._getEnumerators())
+        ND1POS_allowed_values = get_enumerators('kpfcal', 'ND1POS')
         if 'Unknown' in ND1POS_allowed_values:
             ND1POS_allowed_values.pop(ND1POS_allowed_values.index('Unknown'))
         od_arr_scical = [float(pos[3:]) for pos in ND1POS_allowed_values]
 
-        ND2POS = ktl.cache('kpfcal', 'ND2POS')
-        ND2POS_allowed_values = list(ND2POS._getEnumerators())
+        ND2POS_allowed_values = get_enumerators('kpfcal', 'ND2POS')
         if 'Unknown' in ND2POS_allowed_values:
             ND2POS_allowed_values.pop(ND2POS_allowed_values.index('Unknown'))
         od_arr_cal = [float(pos[3:]) for pos in ND2POS_allowed_values]
 
         od_vals_all, filter_configs_all = all_possible_sums_with_indices_sorted(od_arr_scical, od_arr_cal)
 
-        od, nd_config = get_simulcal_od(vmag, teff, obs_exp_time, cal_file,
-                            ref_wave=5500, od_values=od_vals_all,
-                            filter_configs=filter_configs_all)
+        od, nd_config = predict_simulcal_od(vmag, teff, obs_exp_time, cal_file,
+                            5500, od_vals_all, filter_configs_all)
 
         result = {'CalND1': f'OD {nd_config[0]}',
                   'CalND2': f'OD {nd_config[1]}'}
@@ -5,6 +5,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 
 
 class SetCalSource(KPFFunction):
@@ -22,8 +23,7 @@ class SetCalSource(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        keyword = ktl.cache('kpfcal', 'OCTAGON')
-        allowed_values = list(keyword._getEnumerators())
+        allowed_values = get_enumerators('kpfcal', 'OCTAGON', fresh=True)
         if 'Unknown' in allowed_values:
             allowed_values.pop(allowed_values.index('Unknown'))
         check_input(args, 'CalSource', allowed_values=allowed_values)
@@ -3,6 +3,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 
 
 class SetFlatFieldFiberPos(KPFFunction):
@@ -21,8 +22,7 @@ class SetFlatFieldFiberPos(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        FF_FIBERPOS = ktl.cache('kpfcal', 'FF_FIBERPOS')
-        allowed_values = list(FF_FIBERPOS._getEnumerators())
+        allowed_values = get_enumerators('kpfcal', 'FF_FIBERPOS', fresh=True)
         if 'Unknown' in allowed_values:
             allowed_values.pop(allowed_values.index('Unknown'))
         check_input(args, 'FF_FiberPos', allowed_values=allowed_values)
@@ -3,6 +3,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 
 
 class SetND1(KPFFunction):
@@ -23,8 +24,7 @@ class SetND1(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        keyword = ktl.cache('kpfcal', 'ND1POS')
-        allowed_values = list(keyword._getEnumerators())
+        allowed_values = get_enumerators('kpfcal', 'ND1POS', fresh=True)
         if 'Unknown' in allowed_values:
             allowed_values.pop(allowed_values.index('Unknown'))
         check_input(args, 'CalND1', allowed_values=allowed_values)
@@ -3,6 +3,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 
 
 class SetND2(KPFFunction):
@@ -22,8 +23,7 @@ class SetND2(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        keyword = ktl.cache('kpfcal', 'ND2POS')
-        allowed_values = list(keyword._getEnumerators())
+        allowed_values = get_enumerators('kpfcal', 'ND2POS')
         if 'Unknown' in allowed_values:
             allowed_values.pop(allowed_values.index('Unknown'))
         check_input(args, 'CalND2', allowed_values=allowed_values)
@@ -0,0 +1,93 @@
+import ktl
+
+from kpf import log, cfg
+from kpf.exceptions import *
+from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
+from kpf.wait import CompositeWait
+
+
+class WaitForCalBench(KPFFunction):
+    '''Wait for the octagon, both ND filter wheels, and the flat field fiber
+    aperture to reach their destinations. The moves are waited on
+    concurrently so the worst case is the slowest move rather than the sum of
+    the moves, and all stages which fail to arrive are reported together.
+    Only the stages given in the arguments are waited on.
+
+    Args:
+        CalSource (str): Which lamp to select? Allowed Values: Home,
+            EtalonFiber, BrdbandFiber, U_gold, U_daily, Th_daily, Th_gold,
+            SoCal-CalFib, LFCFiber
+        CalND1 (str): The neutral density filter in the first filter wheel.
+            Allowed Values: `OD 0.1`, `OD 1.0`, `OD 1.3`, `OD 2.0`, `OD 3.0`,
+            `OD 4.0`
+        CalND2 (str): The neutral density filter in the second filter wheel.
+            Allowed Values: `OD 0.1`, `OD 0.3`, `OD 0.5`, `OD 0.8`, `OD 1.0`,
+            `OD 4.0`
+        FF_FiberPos (str): The name of the flat field fiber position desired.
+            Allowed Values: "Blank", "6 mm f/5", "7.5 mm f/4", "10 mm f/3",
+            "13.2 mm f/2.3", "Open". A failure to reach this position is
+            logged but does not raise (as in WaitForFlatFieldFiberPos).
+
+    KTL Keywords Used:
+
+    - `kpfcal.OCTAGON`
+    - `kpfcal.ND1POS`
+    - `kpfcal.ND2POS`
+    - `kpfcal.FF_FIBERPOS`
+    '''
+    stages = {'CalSource': 'OCTAGON',
+              'CalND1': 'ND1POS',
+              'CalND2': 'ND2POS',
+              'FF_FiberPos': 'FF_FIBERPOS'}
+
+    @classmethod
+    def pre_condition(cls, args):
+        for arg, keyword in cls.stages.items():
+            if args.get(arg, None) is None:
+                continue
+            allowed_values = get_enumerators('kpfcal', keyword, fresh=True)
+            if 'Unknown' in allowed_values:
+                allowed_values.pop(allowed_values.index('Unknown'))
+            check_input(args, arg, allowed_values=allowed_values)
+
+    @classmethod
+    def perform(cls, args):
+        octagon_time = cfg.getfloat('times', 'octagon_move_time', fallback=60)
+        nd_time = cfg.getfloat('times', 'nd_move_time', fallback=20)
+        waits = CompositeWait()
+        if args.get('CalSource', None) is not None:
+            waits.add('kpfcal', 'OCTAGON', args.get('CalSource'), timeout=octagon_time)
+        if args.get('CalND1', None) is not None:
+            waits.add('kpfcal', 'ND1POS', args.get('CalND1'), timeout=nd_time)
+        if args.get('CalND2', None) is not None:
+            waits.add('kpfcal', 'ND2POS', args.get('CalND2'), timeout=nd_time)
+        if args.get('FF_FiberPos', None) is not None:
+            waits.add('kpfcal', 'FF_FIBERPOS', args.get('FF_FiberPos'),
+                      timeout=nd_time, required=False)
+        waits.wait_or_raise()
+
+    @classmethod
+    def post_condition(cls, args):
+        pass
+
+    @classmethod
+    def add_cmdline_args(cls, parser):
+        parser.add_argument('--CalSource', type=str, default=None,
+                            choices=['Home', 'EtalonFiber', 'BrdbandFiber',
+                                     'U_gold', 'U_daily', 'Th_daily', 'Th_gold',
+                                     'SoCal-CalFib', 'LFCFiber'],
+                            help='Octagon position to wait for')
+        parser.add_argument('--CalND1', type=str, default=None,
+                            choices=["OD 0.1", "OD 1.0", "OD 1.3", "OD 2.0",
+                                     "OD 3.0", "OD 4.0"],
+                            help='ND1 Filter to wait for')
+        parser.add_argument('--CalND2', type=str, default=None,
+                            choices=["OD 0.1", "OD 0.3", "OD 0.5", "OD 0.8",
+                                     "OD 1.0", "OD 4.0"],
+                            help='ND2 Filter to wait for')
+        parser.add_argument('--FF_FiberPos', type=str, default=None,
+                            choices=["Blank", "6 mm f/5", "7.5 mm f/4",
+                                     "10 mm f/3", "13.2 mm f/2.3", "Open"],
+                            help='Wide flat aperture to wait for')
+        return super().add_cmdline_args(parser)
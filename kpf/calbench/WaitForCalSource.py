@@ -5,6 +5,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 
 
 class WaitForCalSource(KPFFunction):
@@ -21,8 +22,7 @@ class WaitForCalSource(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        OCTAGON = ktl.cache('kpfcal', 'OCTAGON')
-        allowed_values = list(OCTAGON._getEnumerators())
+        allowed_values = get_enumerators('kpfcal', 'OCTAGON', fresh=True)
         if 'Unknown' in allowed_values:
             allowed_values.pop(allowed_values.index('Unknown'))
         check_input(args, 'CalSource', allowed_values=allowed_values)
@@ -3,6 +3,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 
 
 class WaitForFlatFieldFiberPos(KPFFunction):
@@ -21,8 +22,7 @@ class WaitForFlatFieldFiberPos(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        keyword = ktl.cache('kpfcal', 'FF_FiberPos')
-        allowed_values = list(keyword._getEnumerators())
+        allowed_values = get_enumerators('kpfcal', 'FF_FiberPos', fresh=True)
         if 'Unknown' in allowed_values:
             allowed_values.pop(allowed_values.index('Unknown'))
         check_input(args, 'FF_FiberPos', allowed_values=allowed_values)
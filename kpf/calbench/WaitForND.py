@@ -5,10 +5,12 @@ from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
 from kpf.calbench.WaitForND1 import WaitForND1
 from kpf.calbench.WaitForND2 import WaitForND2
+from kpf.wait import CompositeWait
 
 
 class WaitForND(KPFFunction):
-    '''Wait for both ND filter wheels.
+    '''Wait for both ND filter wheels. The two wheels are waited on
+    concurrently.
 
     Args:
         CalND1 (str): The neutral density filter to put in the first filter
@@ -21,19 +23,23 @@ class WaitForND(KPFFunction):
             calibration fiber. Allowed Values: `OD 0.1`, `OD 0.3`, `OD 0.5`,
             `OD 0.8`, `OD 1.0`, `OD 4.0`
 
-    Functions Called:
+    KTL Keywords Used:
 
-    - `kpf.calbench.WaitForND1`
-    - `kpf.calbench.WaitForND2`
+    - `kpfcal.ND1POS`
+    - `kpfcal.ND2POS`
     '''
     @classmethod
     def pre_condition(cls, args):
-        pass
+        WaitForND1.pre_condition(args)
+        WaitForND2.pre_condition(args)
 
     @classmethod
     def perform(cls, args):
-        WaitForND1.execute(args)
-        WaitForND2.execute(args)
+        timeout = cfg.getfloat('times', 'nd_move_time', fallback=20)
+        waits = CompositeWait()
+        waits.add('kpfcal', 'ND1POS', args.get('CalND1'), timeout=timeout)
+        waits.add('kpfcal', 'ND2POS', args.get('CalND2'), timeout=timeout)
+        waits.wait_or_raise()
 
     @classmethod
     def post_condition(cls, args):
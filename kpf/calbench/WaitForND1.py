@@ -3,6 +3,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 
 
 class WaitForND1(KPFFunction):
@@ -22,8 +23,7 @@ class WaitForND1(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        ND1POS = ktl.cache('kpfcal', 'ND1POS')
-        allowed_values = list(ND1POS._getEnumerators())
+        allowed_values = get_enumerators('kpfcal', 'ND1POS', fresh=True)
         if 'Unknown' in allowed_values:
             allowed_values.pop(allowed_values.index('Unknown'))
         check_input(args, 'CalND1', allowed_values=allowed_values)
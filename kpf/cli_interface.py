@@ -4,24 +4,168 @@ import sys
 import importlib
 import traceback
 import configparser
+import hashlib
+import json
+import tempfile
+import subprocess
 from pathlib import Path
 from argparse import ArgumentParser, ArgumentError
+import argparse
 import logging
 from datetime import datetime, timedelta
 import yaml
 from typing import Dict, List, Tuple
 
-from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
-from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf import cfg
+
+
+##-------------------------------------------------------------------------
+## Compiled linking table index
+##-------------------------------------------------------------------------
+INDEX_VERSION = 2
+action_names = {argparse._StoreAction: 'store',
+                argparse._StoreTrueAction: 'store_true',
+                argparse._StoreFalseAction: 'store_false',
+                argparse._HelpAction: 'help'}
+type_names = {None: None, str: 'str', int: 'int', float: 'float'}
+
+
+def get_index_file():
+    """Location of the compiled linking table index. The KPFDO_INDEX
+    environment variable overrides the configured location, a value of
+    "none" disables the index.
+
+    Returns
+    -------
+    Path or None
+    """
+    index_file = os.getenv('KPFDO_INDEX', default=None)
+    if index_file is None:
+        index_file = cfg.get('cli', 'index_file',
+                             fallback='~/.kpftranslator/linking_table_index.json')
+    if index_file.lower() in ['', 'none']:
+        return None
+    return Path(index_file).expanduser()
+
+
+def source_fingerprint(package_dir):
+    """Hash of the names, modification times, and sizes of the python and
+    config files in the package. The command line arguments of a function
+    can depend on any of them (base classes, shared helpers, config), so the
+    captured arguments are only used while this is unchanged.
+
+    Returns
+    -------
+    str
+    """
+    entries = []
+    directories = [str(package_dir)]
+    while len(directories) > 0:
+        with os.scandir(directories.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != '__pycache__':
+                        directories.append(entry.path)
+                elif entry.name.endswith(('.py', '.ini')):
+                    st = entry.stat()
+                    entries.append(f"{entry.path} {st.st_mtime_ns} {st.st_size}")
+    return hashlib.sha256('\n'.join(sorted(entries)).encode()).hexdigest()
+
+
+def capture_parser(parser):
+    """Describe the arguments attached to a parser as plain data so that an
+    equivalent parser can be built later without importing the function.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        The parser after the function's add_cmdline_args has been applied
+
+    Returns
+    -------
+    List[Dict] or None
+        One dict per argument, or None if the parser uses something which
+        can not be represented.
+    """
+    spec = []
+    for action in parser._actions:
+        if type(action) not in action_names or action.type not in type_names:
+            return None
+        entry = {'option_strings': list(action.option_strings),
+                 'dest': action.dest,
+                 'action': action_names[type(action)],
+                 'type': type_names[action.type],
+                 'nargs': action.nargs,
+                 'choices': None if action.choices is None else list(action.choices),
+                 'default': action.default,
+                 'required': action.required,
+                 'help': action.help,
+                 'metavar': action.metavar}
+        try:
+            json.dumps(entry)
+        except TypeError:
+            return None
+        spec.append(entry)
+    return spec
+
+
+def build_parser_from_spec(spec):
+    """Rebuild an ArgumentParser from the output of capture_parser.
+    """
+    types = {name: t for t,name in type_names.items()}
+    parser = ArgumentParser(add_help=False)
+    for arg in spec:
+        kwargs = {'help': arg['help'], 'default': arg['default']}
+        if arg['action'] == 'help':
+            parser.add_argument(*arg['option_strings'], action='help', **kwargs)
+            continue
+        if arg['action'] in ['store_true', 'store_false']:
+            kwargs['action'] = arg['action']
+        else:
+            kwargs['type'] = types[arg['type']]
+            if arg['nargs'] is not None: kwargs['nargs'] = arg['nargs']
+            if arg['choices'] is not None: kwargs['choices'] = arg['choices']
+            if arg['metavar'] is not None: kwargs['metavar'] = arg['metavar']
+        if len(arg['option_strings']) == 0:
+            parser.add_argument(arg['dest'], **kwargs)
+        else:
+            if arg['required'] is True: kwargs['required'] = True
+            parser.add_argument(*arg['option_strings'], dest=arg['dest'], **kwargs)
+    return parser
+
+
+def write_json_atomically(data, file):
+    """Write to a temporary file and rename it in to place so that concurrent
+    readers never see a partially written file.
+    """
+    file = Path(file)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmpname = tempfile.mkstemp(dir=file.parent, prefix=f'.{file.name}.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmpname, file)
+    except:
+        if Path(tmpname).exists():
+            os.unlink(tmpname)
+        raise
 
 
 class LinkingTable():
     """Class storing the contents of a linking table
     """
 
-    def __init__(self, filename, logger):
+    def __init__(self, filename, logger, index_file=None):
         """Create the LinkingTable
 
+        The parsed table is stored in a compiled index (see get_index_file)
+        keyed on the mtime and hash of the linking table file. If the index is
+        current the YAML is not parsed at all. The index also holds every
+        function's docstring and command line arguments, keyed on the
+        source_fingerprint of the package, so that listing, help, and
+        completion need no imports. These are captured for all functions at
+        once by build_function_index.
+
         Parameters
         ----------
         filename : str
@@ -29,22 +173,164 @@ class LinkingTable():
         
         logger : logging.Logger
             Python logging instance
+
+        index_file : Path, optional
+            Location of the compiled index, by default get_index_file()
         """
 
         self.logger = logger
+        self.filename = Path(filename)
+        self.index_file = get_index_file() if index_file is None else index_file
+        self.module_root = self.filename.parent.parent
+        self.functions = {}
+        self.functions_sources = None
+        self.sources = None
+        self.index_built = False
+        self.index_outdated = True
         logger.debug(f"Linking Table: Loading file at {filename}")
 
         try:
-            with open(filename) as f:
-                self.cfg = yaml.load(f, Loader=yaml.FullLoader)
+            index = self.load_index()
+            if index is None:
+                with open(filename) as f:
+                    self.cfg = yaml.load(f, Loader=yaml.FullLoader)
+            else:
+                self.cfg = {'common': index['common'], 'links': index['links']}
+                self.functions = index['functions']
+                self.functions_sources = index['sources']
         except:
             logger.error(f"Linking Table: Unable to load {filename}")
             return
         self.prefix = self.cfg['common']['prefix']
         self.suffix = self.cfg['common']['suffix']
         self.links = self.cfg['links']
+        if self.index_outdated is True:
+            self.save_index()
         logger.debug(f"Linking Table: Loading prefix: {self.prefix}, suffix: {self.suffix}, with {len(self.links)} links.")
 
+    def load_index(self):
+        """Read the compiled index if it matches the linking table file.
+
+        Returns
+        -------
+        Dict or None
+            The index contents or None if there is no usable index.
+        """
+        if self.index_file is None or not self.index_file.exists():
+            return None
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except Exception as e:
+            self.logger.debug(f"Linking Table: Unable to read index: {e}")
+            return None
+        if index.get('version') != INDEX_VERSION\
+           or index.get('table') != str(self.filename.absolute()):
+            return None
+        if index.get('mtime') == self.filename.stat().st_mtime:
+            self.index_outdated = False
+            return index
+        # mtime differs, but the contents may not (e.g. after a checkout)
+        if index.get('hash') == self.file_hash():
+            return index
+        return None
+
+    def file_hash(self):
+        with open(self.filename, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def save_index(self):
+        """Write the compiled index, silently giving up if the index location
+        is not writable.
+        """
+        if self.index_file is None:
+            return
+        index = {'version': INDEX_VERSION,
+                 'table': str(self.filename.absolute()),
+                 'mtime': self.filename.stat().st_mtime,
+                 'hash': self.file_hash(),
+                 'common': self.cfg['common'],
+                 'links': self.links,
+                 'sources': self.functions_sources,
+                 'functions': self.functions}
+        try:
+            write_json_atomically(index, self.index_file)
+        except Exception as e:
+            self.logger.debug(f"Linking Table: Unable to write index: {e}")
+
+    def get_sources(self):
+        """The source_fingerprint of the package, computed once per process.
+        """
+        if self.sources is None:
+            self.sources = source_fingerprint(self.filename.parent)
+        return self.sources
+
+    def functions_current(self):
+        """Whether the captured function descriptions match the sources.
+        """
+        return self.functions_sources == self.get_sources()
+
+    def build_function_index(self):
+        """Capture the description of every function in a separate
+        interpreter (see index_all_functions) and read the result, so that
+        this process does not import any of them. This is only tried once
+        per process.
+
+        Returns
+        -------
+        bool
+            True if the function descriptions are now current.
+        """
+        if self.index_file is None or self.index_built is True:
+            return self.functions_current()
+        self.index_built = True
+        self.logger.debug("Linking Table: Capturing function arguments")
+        code = ("import logging; from pathlib import Path; "
+                "from kpf.cli_interface import LinkingTable, index_all_functions; "
+                f"table = LinkingTable({str(self.filename)!r}, logging.getLogger('kpfdo_index'), "
+                f"index_file=Path({str(self.index_file)!r})); "
+                "index_all_functions(table, table.logger)")
+        timeout = cfg.getfloat('cli', 'index_timeout', fallback=300)
+        try:
+            subprocess.run([sys.executable, '-c', code], cwd=self.module_root,
+                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.logger.debug(f"Linking Table: Unable to capture functions: {e}")
+            return False
+        index = self.load_index()
+        if index is not None:
+            self.functions = index['functions']
+            self.functions_sources = index['sources']
+        return self.functions_current()
+
+    def get_function_info(self, entry_point):
+        """Return the captured description of a function. If the package
+        sources have changed since the descriptions were captured, they are
+        all captured again first (see build_function_index).
+
+        Returns
+        -------
+        Dict or None
+            Dict with doc, script, and args (see capture_parser) keys.
+        """
+        if not self.functions_current() and not self.build_function_index():
+            return None
+        return self.functions.get(entry_point, None)
+
+    def capture_function(self, entry_point, function, parser, script, save=True):
+        """Store the docstring and command line arguments of an imported
+        function in the index. This only adds to a current index, an out of
+        date one is replaced as a whole by build_function_index.
+        """
+        if not self.functions_current() or entry_point in self.functions:
+            return
+        self.functions[entry_point] = {'doc': function.__doc__,
+                                       'script': script,
+                                       'args': capture_parser(parser)}
+        if save is True:
+            self.save_index()
+
     def get_entry_points(self) -> List[str]:
         """Gets a list of all the entry points listed in the linking table
 
@@ -143,6 +429,52 @@ def get_linked_function(linking_tbl, key, logger):
         logger.error(traceback.format_exc())
         return None, None
 
+def index_function(linking_tbl, key, logger, save=True):
+    """Import a function and record its docstring and arguments in the
+    linking table index.
+
+    Returns
+    -------
+    class
+        The function class, or None if it could not be imported.
+    """
+    from kpf.KPFTranslatorFunction import KPFScript
+    function, link = get_linked_function(linking_tbl, key, logger)
+    if function is None:
+        return None
+    parser = function.add_cmdline_args(ArgumentParser(add_help=False))
+    script = function.__mro__[1] == KPFScript
+    if script is True:
+        add_script_args(parser)
+    linking_tbl.capture_function(key, function, parser, script, save=save)
+    return function
+
+
+def index_all_functions(linking_tbl, logger):
+    """Import every function in the linking table and replace the captured
+    descriptions in the index with theirs.
+
+    Returns
+    -------
+    List[str]
+        The entry points which could not be imported.
+    """
+    # Fingerprint the sources before importing anything, so that a change
+    # made while this runs leaves the index out of date.
+    linking_tbl.functions = {}
+    linking_tbl.functions_sources = linking_tbl.get_sources()
+    failed = []
+    for entry in linking_tbl.get_entry_points():
+        try:
+            function = index_function(linking_tbl, entry, logger, save=False)
+        except Exception as e:
+            function = None
+        if function is None:
+            failed.append(entry)
+    linking_tbl.save_index()
+    return failed
+
+
 def create_logger():
     log = logging.getLogger('cli_interface')
     log.setLevel(logging.DEBUG)
@@ -190,7 +522,90 @@ def create_logger():
     return log
 
 
-def main(table_loc, parsed_args, function_args, kpfdo_parser):
+def add_script_args(parser):
+    """Arguments which every KPFScript accepts on the command line.
+    """
+    parser.add_argument("-f", "--file", dest="file", type=str,
+        help="The OB file to run.")
+    parser.add_argument("-d", "--obid", "--id", dest="obid", type=str,
+        help="The unique database ID of the OB to run.")
+    return parser
+
+
+def print_function_help(entry_point, doc, parser):
+    print('    '+str(doc))
+    help_str = parser.format_help()
+    help_str = help_str.replace('usage: kpfdo', f'usage: kpfdo {entry_point}')
+    print(help_str)
+
+
+def get_completions(linking_tbl, words):
+    """Completion candidates for a partial kpfdo command line.
+
+    Parameters
+    ----------
+    linking_tbl : LinkingTable
+        Linking Table that should be searched
+    words : List[str]
+        The words typed after kpfdo, the last of which may be partial
+
+    Returns
+    -------
+    List[str]
+        Entry point names if the function has not been chosen yet, otherwise
+        the option strings and choices of that function's arguments (taken
+        from the index, the function is never imported here).
+    """
+    entries = linking_tbl.get_entry_points()
+    if len(words) <= 1:
+        partial = words[0] if len(words) == 1 else ''
+        return [e for e in entries if e.startswith(partial)]
+    if words[0] not in entries:
+        return []
+    info = linking_tbl.get_function_info(words[0])
+    if info is None or info['args'] is None:
+        return []
+    candidates = []
+    for arg in info['args']:
+        candidates.extend(arg['option_strings'])
+        if arg['choices'] is not None:
+            candidates.extend([str(c) for c in arg['choices']])
+    return [c for c in candidates if c.startswith(words[-1])]
+
+
+def build_kpfdo_parser():
+    """Build the ArgumentParser for the options kpfdo itself accepts (as
+    opposed to the arguments of the function being invoked).
+
+    Returns
+    -------
+    argparse.ArgumentParser
+    """
+    kpfdo_parser = ArgumentParser(add_help=False, description='''
+''')
+    ## add flags
+    kpfdo_parser.add_argument("-l", "--list", dest="list",
+        default=False, action="store_true",
+        help="List all scripts available.")
+    kpfdo_parser.add_argument("-h", "--help", dest="help",
+        default=False, action="store_true",
+        help="Print help text.")
+    kpfdo_parser.add_argument("-n", "--dry-run", dest="dry_run",
+        default=False, action="store_true",
+        help="Print what function would be called with what arguments, with no actual invocation.")
+    kpfdo_parser.add_argument("--complete", dest="complete",
+        default=False, action="store_true",
+        help="Print completion candidates for the rest of the command line.")
+    kpfdo_parser.add_argument("--import-profile", dest="import_profile",
+        default=False, action="store_true",
+        help="Report the import cost of the given functions (default all) and check them against the stored budget.")
+    kpfdo_parser.add_argument("--update-import-budget", dest="update_import_budget",
+        default=False, action="store_true",
+        help="Measure the import cost of the given functions (default all) and store it as their new budget.")
+    return kpfdo_parser
+
+
+def main(table_loc, parsed_args, function_args, kpfdo_parser, linking_tbl=None):
 
     # Logging
     logger = create_logger()
@@ -198,15 +613,18 @@ def main(table_loc, parsed_args, function_args, kpfdo_parser):
     invocation = ' '.join(sys.argv)
     logger.debug(f"Invocation: {invocation}")
 
-    # Build the linking table
-    table_loc = Path(table_loc)
-    if not table_loc.suffix in [".yml", ".yaml"]:
-        logger.error("Linking table must be a .yml or .yaml file! Exiting...")
-        sys.exit(1)
-    if not table_loc.exists():
-        logger.error(f"Failed to find a linking table at {str(table_loc)}. Exiting...")
-        sys.exit(1)
-    linking_tbl = LinkingTable(table_loc, logger)
+    # Build the linking table (a warm kpfdo server passes in its own copy)
+    if linking_tbl is None:
+        table_loc = Path(table_loc)
+        if not table_loc.suffix in [".yml", ".yaml"]:
+            logger.error("Linking table must be a .yml or .yaml file! Exiting...")
+            sys.exit(1)
+        if not table_loc.exists():
+            logger.error(f"Failed to find a linking table at {str(table_loc)}. Exiting...")
+            sys.exit(1)
+        linking_tbl = LinkingTable(table_loc, logger)
+    else:
+        linking_tbl.logger = logger
 
     # Handle list
     if parsed_args.list:
@@ -214,6 +632,24 @@ def main(table_loc, parsed_args, function_args, kpfdo_parser):
         linking_tbl.print_entry_points()
         return
 
+    # Handle completion
+    if parsed_args.complete:
+        logger.debug("Printing completions...")
+        for candidate in get_completions(linking_tbl, function_args):
+            print(candidate)
+        return
+
+    # Handle import profiling
+    if parsed_args.import_profile or parsed_args.update_import_budget:
+        logger.debug("Profiling import times...")
+        from kpf.import_profile import profile_entries
+        unknown = [f for f in function_args if f not in linking_tbl.get_entry_points()]
+        if len(unknown) > 0:
+            logger.error(f"Unknown functions: {', '.join(unknown)}")
+            sys.exit(1)
+        sys.exit(profile_entries(linking_tbl, entries=function_args,
+                                 update_budget=parsed_args.update_import_budget))
+
     if parsed_args.help is True and len(function_args) < 1:
         logger.debug('Printing kpfdo help')
         kpfdo_parser.print_help()
@@ -224,6 +660,17 @@ def main(table_loc, parsed_args, function_args, kpfdo_parser):
         kpfdo_parser.print_help()
         return
 
+    # Help can be answered from the index without importing the function
+    if parsed_args.help is True:
+        info = None
+        if function_args[0] in linking_tbl.get_entry_points():
+            info = linking_tbl.get_function_info(function_args[0])
+        if info is not None and info['args'] is not None:
+            logger.debug(f"Using indexed help for {function_args[0]}")
+            parser = build_parser_from_spec(info['args'])
+            print_function_help(function_args[0], info['doc'], parser)
+            return
+
     # Get the function
     try:
         logger.debug(f"Fetching {function_args[0]}...")
@@ -245,6 +692,7 @@ def main(table_loc, parsed_args, function_args, kpfdo_parser):
         sys.exit(1)
 
     # Build an ArgumentParser and attach the function's arguments
+    from kpf.KPFTranslatorFunction import KPFScript
     final_args = function_args[1:]
     parser = ArgumentParser(add_help=False)
     logger.debug(f"Adding CLI args to parser")
@@ -254,16 +702,11 @@ def main(table_loc, parsed_args, function_args, kpfdo_parser):
     script = function.__mro__[1] == KPFScript
     if script is True:
         logger.debug('Requested function is a script')
-        parser.add_argument("-f", "--file", dest="file", type=str,
-            help="The OB file to run.")
-        parser.add_argument("-d", "--obid", "--id", dest="obid", type=str,
-            help="The unique database ID of the OB to run.")
+        add_script_args(parser)
+    linking_tbl.capture_function(function_args[0], function, parser, script)
 
     if parsed_args.help is True:
-        print('    '+function.__doc__)
-        help_str = parser.format_help()
-        help_str = help_str.replace('usage: kpfdo', f'usage: kpfdo {function_args[0]}')
-        print(help_str)
+        print_function_help(function_args[0], function.__doc__, parser)
         return
 
     try:
@@ -317,10 +760,29 @@ def main(table_loc, parsed_args, function_args, kpfdo_parser):
                     return
                 try:
                     logger.debug(f"Froming an ObservingBlock object")
+                    from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
                     OB = ObservingBlock(OBdict)
                     logger.debug(f"  {OB.summary()}")
                 except Exception as e:
                     logger.error('Unable to parse input file as an OB')
+        OBID = parsed_func_args.get('obid', None)
+        if OB is None and OBID is not None:
+            # Retrieve the OB through the local OB cache. The cached copy is
+            # always revalidated before it is used (which is cheap if it has
+            # not changed), but is used if the database can not be reached.
+            from kpf.ObservingBlocks.OBCache import get_cache
+            logger.debug(f"Retrieving OB {OBID}")
+            try:
+                OB, failures = get_cache().get(OBID, refresh=True)
+            except Exception as e:
+                logger.error(f'Unable to retrieve OB {OBID}: {e}')
+                OB, failures = None, []
+            for failure in failures:
+                logger.error(f'{failure}')
+            if OB is None:
+                logger.error(f'Unable to retrieve OB {OBID}')
+            if OB is not None:
+                logger.debug(f"  {OB.summary()}")
 
     if parsed_args.dry_run:
         logger.info("Dry run:")
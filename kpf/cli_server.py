@@ -0,0 +1,225 @@
+import os
+import sys
+import socket
+import signal
+import struct
+import json
+import getpass
+import threading
+import traceback
+from pathlib import Path
+
+from kpf import log, cfg
+from kpf import cli_interface as cli
+from kpf import metrics
+
+
+##-------------------------------------------------------------------------
+## Warm kpfdo server
+##-------------------------------------------------------------------------
+def get_socket_file():
+    '''Return the path to the UNIX socket the kpfdo server listens on. The
+    KPFDO_SOCKET environment variable overrides the configured value.
+    '''
+    socket_file = os.getenv('KPFDO_SOCKET', default=None)
+    if socket_file is None:
+        socket_file = cfg.get('kpfdo_server', 'socket_file',
+                              fallback='/tmp/kpfdo_server_{user}.sock')
+        socket_file = socket_file.replace('{user}', getpass.getuser())
+    return Path(socket_file)
+
+
+def recv_exactly(conn, nbytes):
+    data = b''
+    while len(data) < nbytes:
+        chunk = conn.recv(nbytes-len(data))
+        if chunk == b'':
+            raise ConnectionError('kpfdo client closed connection')
+        data += chunk
+    return data
+
+
+class KPFDoServer(object):
+    '''Long lived process which keeps the linking table, the configuration,
+    and the imported translator modules in memory so that `kpfdo` commands do
+    not pay the interpreter and import start up cost each time.
+
+    Each request is handled in a forked copy of the server. The client hands
+    over its stdin, stdout, and stderr file descriptors, so the command reads
+    from and writes to the client's terminal exactly as it would if `kpfdo`
+    had been run directly. Only the exit code travels back over the socket.
+
+    The server never runs a function itself, it only imports them, so when
+    it forks the main thread is its only thread. That matters because a
+    lock held by any other thread at the time of the fork would stay locked
+    for ever in the child. It is checked before each fork: a request which
+    arrives while another thread is running is refused, and the client then
+    runs the command itself. A client has handshake_timeout seconds to send
+    its request, so one which stalls can not hold up the server.
+
+    Note that the server does not see changes to the python code made after
+    it started, it must be restarted after the translator is updated.
+    '''
+    def __init__(self, socket_file=None, preload=False):
+        self.socket_file = get_socket_file() if socket_file is None else Path(socket_file)
+        self.table_loc = Path(cli.__file__).parent / 'linking_table.yml'
+        self.logger = log
+        self.linking_tbl = None
+        self.table_mtime = None
+        self.load_linking_table()
+        if preload is True:
+            self.preload_functions()
+
+    def load_linking_table(self):
+        self.table_mtime = self.table_loc.stat().st_mtime
+        self.linking_tbl = cli.LinkingTable(self.table_loc, self.logger)
+
+    def preload_functions(self):
+        '''Import every module in the linking table so that the first call to
+        each function is as fast as subsequent ones. This also fills in the
+        linking table index.
+        '''
+        entries = self.linking_tbl.get_entry_points()
+        failed = cli.index_all_functions(self.linking_tbl, self.logger)
+        self.logger.info(f'kpfdo server preloaded {len(entries)-len(failed)} '
+                         f'of {len(entries)} functions')
+        if len(failed) > 0:
+            self.logger.warning(f'Failed to preload: {", ".join(failed)}')
+
+    def serve(self):
+        if not hasattr(socket, 'recv_fds'):
+            self.logger.error('The kpfdo server needs Python 3.9 or later')
+            return
+        if self.socket_file.exists():
+            self.socket_file.unlink()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(self.socket_file))
+        os.chmod(self.socket_file, 0o600)
+        listener.listen(16)
+        listener.settimeout(1)
+        handshake_timeout = cfg.getfloat('kpfdo_server', 'handshake_timeout',
+                                         fallback=2)
+        self.logger.info(f'kpfdo server (PID {os.getpid()}) listening on {self.socket_file}')
+
+        def shutdown(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            while True:
+                self.reap_children()
+                try:
+                    conn, address = listener.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(handshake_timeout)
+                try:
+                    self.handle(conn, listener)
+                except Exception as e:
+                    self.logger.error(f'kpfdo server failed to handle request: {e}')
+                    self.logger.debug(traceback.format_exc())
+                finally:
+                    conn.close()
+        except KeyboardInterrupt:
+            self.logger.info('kpfdo server shutting down')
+        finally:
+            listener.close()
+            if self.socket_file.exists():
+                self.socket_file.unlink()
+
+    def reap_children(self):
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0] > 0:
+                pass
+        except ChildProcessError:
+            pass
+
+    def handle(self, conn, listener):
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', creds)
+        if uid != os.getuid():
+            self.logger.warning(f'kpfdo server rejected connection from uid {uid}')
+            return
+        header, fds, flags, address = socket.recv_fds(conn, 4, 3)
+        if len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            return
+        nbytes = struct.unpack('!I', header)[0]
+        request = json.loads(recv_exactly(conn, nbytes))
+        # Pick up edits to the linking table without a restart
+        if self.table_loc.stat().st_mtime != self.table_mtime:
+            self.load_linking_table()
+
+        threads = [t.name for t in threading.enumerate()
+                   if t is not threading.main_thread()]
+        if len(threads) > 0:
+            self.logger.error(f'kpfdo server refused a request, it can not fork '
+                              f'while other threads run: {", ".join(threads)}')
+            for fd in fds:
+                os.close(fd)
+            return
+        child_pid = os.fork()
+        if child_pid == 0:
+            listener.close()
+            conn.settimeout(None)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            exit_code = self.run_request(conn, request, fds)
+            os._exit(exit_code)
+        for fd in fds:
+            os.close(fd)
+
+    def run_request(self, conn, request, fds):
+        '''Executed in the forked child: become the client process as closely
+        as possible and run the command.
+        '''
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+            os.close(fd)
+        try:
+            conn.sendall(struct.pack('!i', os.getpid()))
+            os.chdir(request.get('cwd'))
+            os.environ.clear()
+            os.environ.update(request.get('env', {}))
+            sys.argv = request.get('argv')
+            # The server has no controlling terminal, pass on the client's
+            # login (see kpf.get_login)
+            login = request.get('login', None)
+            if login is not None:
+                os.environ['KPFDO_LOGIN'] = login
+            kpfdo_parser = cli.build_kpfdo_parser()
+            parsed_args, function_args = kpfdo_parser.parse_known_args(sys.argv[1:])
+            cli.main(self.table_loc, parsed_args, function_args, kpfdo_parser,
+                     linking_tbl=self.linking_tbl)
+            exit_code = 0
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        # os._exit skips atexit handlers, write out any buffered metrics and
+        # give the outbox exit_timeout to submit what the command queued
+        if metrics.writer is not None:
+            metrics.writer.flush()
+        outbox = sys.modules.get('kpf.observatoryAPIs.outbox', None)
+        if outbox is not None and outbox.outbox is not None:
+            try:
+                outbox.outbox.stop()
+            except Exception as e:
+                log.error(f"Unable to stop the outbox: {e}")
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        try:
+            conn.sendall(struct.pack('!i', exit_code))
+        except OSError:
+            pass
+        return exit_code
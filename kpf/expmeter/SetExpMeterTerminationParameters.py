@@ -5,6 +5,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 
 
 def expeter_flux_target(Mphotons_per_A, band):
@@ -55,8 +56,7 @@ class SetExpMeterTerminationParameters(KPFFunction):
 
     @classmethod
     def perform(cls, args):
-        tbin = ktl.cache('kpf_expmeter', 'THRESHOLDBIN')
-        allowed_values = list(tbin._getEnumerators())
+        allowed_values = get_enumerators('kpf_expmeter', 'THRESHOLDBIN')
         allowed_values.pop(allowed_values.index('All'))
         allowed_floats = np.array([float(x) for x in allowed_values])
 
@@ -4,6 +4,7 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 from kpf.fiu.ConfigureFIUOnce import ConfigureFIUOnce
 from kpf.fiu.WaitForConfigureFIU import WaitForConfigureFIU
 
@@ -31,8 +32,7 @@ class ConfigureFIU(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        keyword = ktl.cache('kpffiu', 'MODE')
-        allowed_values = list(keyword._getEnumerators())
+        allowed_values = get_enumerators('kpffiu', 'MODE', fresh=True)
         if 'None' in allowed_values:
             allowed_values.pop(allowed_values.index('None'))
         check_input(args, 'mode', allowed_values=allowed_values)
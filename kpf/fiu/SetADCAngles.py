@@ -1,11 +1,13 @@
 import ktl
 import numpy as np
-from astropy.modeling import models, fitting
 
-from kpf import log, cfg
+from kpf import log, cfg, lazy_import
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
 
+models = lazy_import('astropy.modeling.models')
+fitting = lazy_import('astropy.modeling.fitting')
+
 
 def calculate_ADC_delta(za):
     # Zeemax model data to fit
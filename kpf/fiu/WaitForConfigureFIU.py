@@ -1,11 +1,12 @@
 import ktl
 import time
-from datetime import datetime, timedelta
 
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_enumerators
 from kpf.fiu.ConfigureFIU import ConfigureFIUOnce
+from kpf.wait import CompositeWait, fiu_mode_is
 
 
 ##-----------------------------------------------------------------------------
@@ -26,8 +27,7 @@ class WaitForConfigureFIUOnce(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        MODE = ktl.cache('kpffiu', 'MODE')
-        allowed_values = list(MODE._getEnumerators())
+        allowed_values = get_enumerators('kpffiu', 'MODE', fresh=True)
         if 'None' in allowed_values:
             allowed_values.pop(allowed_values.index('None'))
         check_input(args, 'mode', allowed_values=allowed_values)
@@ -35,16 +35,13 @@ class WaitForConfigureFIUOnce(KPFFunction):
     @classmethod
     def perform(cls, args):
         dest = args.get('mode')
-        fiumode = ktl.cache('kpffiu', 'MODE')
-        modes = fiumode.read()
-        start = datetime.utcnow()
         move_times = [cfg.getfloat('times', 'fiu_fold_mirror_move_time', fallback=40),
                       cfg.getfloat('times', 'fiu_hatch_move_time', fallback=2)]
-        end = start + timedelta(seconds=max(move_times))
-        while dest.lower() not in modes.lower().split(',') and datetime.utcnow() <= end:
-            time.sleep(1)
-            modes = fiumode.read()
-        return dest.lower() in modes.lower().split(',')
+        waits = CompositeWait()
+        waits.add('kpffiu', 'MODE', fiu_mode_is(dest), timeout=max(move_times),
+                  description=f"kpffiu.MODE includes {dest}")
+        failed = waits.wait()
+        return len(failed) == 0
 
     @classmethod
     def post_condition(cls, args):
@@ -72,8 +69,7 @@ class WaitForConfigureFIU(KPFFunction):
     '''
     @classmethod
     def pre_condition(cls, args):
-        MODE = ktl.cache('kpffiu', 'MODE')
-        allowed_values = list(MODE._getEnumerators())
+        allowed_values = get_enumerators('kpffiu', 'MODE', fresh=True)
         if 'None' in allowed_values:
             allowed_values.pop(allowed_values.index('None'))
         check_input(args, 'mode', allowed_values=allowed_values)
@@ -0,0 +1,323 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+
+from kpf import log, cfg, lazy_import
+from kpf import metrics
+from kpf.exceptions import KPFException
+
+requests = lazy_import('requests')
+urllib3 = lazy_import('urllib3')
+
+
+##-------------------------------------------------------------------------
+## Shared HTTP client for the observatory APIs and MAGIQ
+##-------------------------------------------------------------------------
+# Responses with these status codes mean the server is overloaded or a
+# proxy could not reach it, so the request may succeed if tried again
+retry_statuses = [429, 502, 503, 504]
+# Of those, the ones where the server did not act on the request
+refused_statuses = [429, 503]
+
+
+class CircuitOpen(KPFException):
+    def __init__(self, endpoint="", retry_in=0):
+        self.endpoint = endpoint
+        msg = f"{endpoint} API is not responding, not retrying for {retry_in:.1f} s"
+        super().__init__(msg)
+
+
+def request_not_sent(exception):
+    '''True if the request failed before it reached the server (so even a
+    POST can safely be sent again).
+    '''
+    if isinstance(exception, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exception.args[0], 'reason', None) if len(exception.args) > 0 else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+class Endpoint(object):
+    '''Settings, circuit breaker, and latency history for one API (e.g.
+    "proposal", "schedule", or "magiq").
+
+    Settings are read from the [httpclient] section of the config, a key
+    prefixed by the endpoint name (e.g. magiq_read_timeout) overrides the
+    default for that endpoint.
+
+    After failure_threshold consecutive failed attempts the circuit opens and
+    requests fail immediately with CircuitOpen for reset_time seconds. Then a
+    single request is let through, if it succeeds the circuit closes again.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.connect_timeout = self.setting('connect_timeout', 3.05)
+        self.read_timeout = self.setting('read_timeout', 20)
+        self.retries = int(self.setting('retries', 2))
+        self.backoff = self.setting('backoff', 0.5)
+        self.max_backoff = self.setting('max_backoff', 4)
+        self.failure_threshold = int(self.setting('failure_threshold', 5))
+        self.reset_time = self.setting('reset_time', 30)
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+        self.latencies = deque(maxlen=1000)
+        self.counts = {'requests': 0, 'attempts': 0, 'failed': 0, 'rejected': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def setting(self, key, default):
+        value = cfg.getfloat('httpclient', key, fallback=default)
+        return cfg.getfloat('httpclient', f"{self.name}_{key}", fallback=value)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def delay(self, attempt, response=None):
+        '''Exponential backoff with full jitter, or the server's Retry-After,
+        but never more than max_backoff.
+        '''
+        if response is not None:
+            try:
+                return min(float(response.headers.get('Retry-After')), self.max_backoff)
+            except (TypeError, ValueError):
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff*2**attempt))
+
+    def allow(self):
+        '''Raise CircuitOpen if the circuit is open. Returns True if this
+        request is the single probe let through a half-open circuit, the
+        caller must then call end_probe once the attempt is over.
+        '''
+        with self.lock:
+            if self.opened is None:
+                return False
+            retry_in = self.opened + self.reset_time - time.monotonic()
+            if retry_in <= 0 and self.probing is False:
+                self.probing = True
+                return True
+        self.count('rejected')
+        raise CircuitOpen(self.name, retry_in=max(retry_in, 0))
+
+    def end_probe(self):
+        '''Let another probe through if this one ended without an outcome
+        being recorded (e.g. KeyboardInterrupt or a bad parameter).
+        '''
+        with self.lock:
+            self.probing = False
+
+    def record(self, success):
+        with self.lock:
+            self.probing = False
+            if success is True:
+                if self.opened is not None:
+                    log.info(f"{self.name} API is responding again")
+                self.failures = 0
+                self.opened = None
+                return
+            self.failures += 1
+            if self.opened is not None or self.failures >= self.failure_threshold:
+                if self.opened is None:
+                    log.warning(f"{self.name} API failed {self.failures} times, "
+                                f"pausing requests for {self.reset_time:.1f} s")
+                self.opened = time.monotonic()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        if time.monotonic() - self.opened >= self.reset_time:
+            return 'half-open'
+        return 'open'
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {**self.counts,
+                'state': self.state,
+                'p50': metrics.percentile(latencies, 50),
+                'p95': metrics.percentile(latencies, 95),
+                'max': latencies[-1] if len(latencies) > 0 else None}
+
+
+class HTTPClient(object):
+    '''A requests Session shared by all API wrappers, so connections are
+    pooled and kept alive between calls, with a timeout on every request,
+    bounded retries with jittered backoff, and a circuit breaker per
+    endpoint (see Endpoint).
+
+    GET requests are retried on connection errors, timeouts, and retry
+    statuses. Other methods are only retried when the server did not act on
+    the request (no connection, 429, or 503), unless idempotent=True. If the retries are used up the last
+    exception is raised, or the last response is returned.
+
+    The latency of each request is recorded per endpoint (see stats) and,
+    when metrics are enabled, written to the execution metrics files as
+    function "HTTP <endpoint>".
+    '''
+    def __init__(self):
+        self.session = None
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                pool_size = cfg.getint('httpclient', 'pool_size', fallback=8)
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                        pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.session = session
+            return self.session
+
+    def endpoint(self, name):
+        with self.lock:
+            if name not in self.endpoints.keys():
+                self.endpoints[name] = Endpoint(name)
+            return self.endpoints[name]
+
+    def request(self, endpoint, method, url, idempotent=None, timeout=None, **kwargs):
+        '''Send a request, kwargs are passed to requests.Session.request.
+
+        Parameters
+        ----------
+        endpoint : str
+            The endpoint name used for settings, circuit breaking, and
+            metrics.
+        method : str
+        url : str
+        idempotent : bool, optional
+            Whether a request which may have reached the server can be sent
+            again (default: True for GET only).
+        timeout : float or Tuple[float, float], optional
+            Overrides the configured (connect, read) timeout.
+
+        Returns
+        -------
+        requests.Response
+        '''
+        endpoint = self.endpoint(endpoint)
+        if idempotent is None:
+            idempotent = method.upper() in ['GET', 'HEAD']
+        if timeout is None:
+            timeout = endpoint.timeout
+        session = self.get_session()
+        endpoint.count('requests')
+        start = time.time()
+        tick = time.perf_counter()
+        attempts = 0
+        response = None
+        exception = None
+        try:
+            while True:
+                probe = endpoint.allow()
+                endpoint.count('attempts')
+                attempts += 1
+                response = None
+                exception = None
+                try:
+                    try:
+                        response = session.request(method, url, timeout=timeout, **kwargs)
+                    except (requests.exceptions.ConnectionError,
+                            requests.exceptions.Timeout) as e:
+                        exception = e
+                    except requests.exceptions.RequestException:
+                        # e.g. an invalid URL, sending it again will not help
+                        endpoint.record(False)
+                        raise
+                    failed = exception is not None or response.status_code in retry_statuses
+                    endpoint.record(not failed)
+                finally:
+                    if probe is True:
+                        endpoint.end_probe()
+                if failed is False:
+                    return response
+                if idempotent is True:
+                    retry = True
+                elif response is not None:
+                    retry = response.status_code in refused_statuses
+                else:
+                    retry = request_not_sent(exception)
+                if attempts > endpoint.retries or retry is False:
+                    if exception is not None:
+                        raise exception
+                    return response
+                wait = endpoint.delay(attempts-1, response)
+                problem = exception if exception is not None else f"HTTP {response.status_code}"
+                log.debug(f"{endpoint.name} API request failed ({problem}), "
+                          f"retrying in {wait:.2f} s")
+                if response is not None:
+                    # Return the connection to the pool (for streamed responses)
+                    response.close()
+                time.sleep(wait)
+        except Exception as e:
+            exception = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - tick
+            success = exception is None and response is not None\
+                      and response.status_code not in retry_statuses
+            if attempts > 0:
+                endpoint.latencies.append(elapsed)
+            if success is False:
+                endpoint.count('failed')
+            self.record_metric(endpoint, method, start, elapsed, attempts,
+                               response, exception, success)
+
+    def get(self, endpoint, url, **kwargs):
+        return self.request(endpoint, 'GET', url, **kwargs)
+
+    def post(self, endpoint, url, **kwargs):
+        return self.request(endpoint, 'POST', url, **kwargs)
+
+    def record_metric(self, endpoint, method, start, elapsed, attempts,
+                      response, exception, success):
+        if metrics.enabled is None:
+            metrics.enabled = metrics.metrics_enabled()
+        if metrics.enabled is False:
+            return
+        try:
+            record = {'time': start,
+                      'function': f"HTTP {endpoint.name}",
+                      'outcome': 'success' if success is True else 'failed',
+                      'phase': None,
+                      'exception': type(exception).__name__ if exception is not None else None,
+                      'total': elapsed,
+                      'pid': os.getpid(),
+                      'method': method,
+                      'attempts': attempts,
+                      'status': response.status_code if response is not None else None}
+            metrics.get_writer().add(record)
+        except Exception:
+            pass
+
+    def stats(self):
+        '''Request counts, circuit state, and latency percentiles (seconds)
+        for each endpoint used so far.
+        '''
+        with self.lock:
+            endpoints = list(self.endpoints.values())
+        return {endpoint.name: endpoint.stats() for endpoint in endpoints}
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+            self.session = None
+
+
+client = None
+
+
+def get_client():
+    global client
+    if client is None:
+        client = HTTPClient()
+    return client
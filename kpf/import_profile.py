@@ -0,0 +1,202 @@
+import sys
+import math
+import subprocess
+from pathlib import Path
+
+import yaml
+
+from kpf import cfg
+
+
+##-------------------------------------------------------------------------
+## Import cost profiling of linking table entries
+##-------------------------------------------------------------------------
+marker = 'KPF_IMPORT_PROFILE_START'
+default_heavy = ['numpy', 'astropy', 'astroquery', 'yaml', 'scipy', 'matplotlib']
+
+
+def get_budget_file():
+    '''Location of the stored import cost budgets. Relative paths are taken
+    relative to the kpf package.
+    '''
+    budget_file = Path(cfg.get('import_profile', 'budget_file',
+                               fallback='import_budget.yml'))
+    if not budget_file.is_absolute():
+        budget_file = Path(__file__).parent / budget_file
+    return budget_file
+
+
+def load_budget(budget_file=None):
+    '''Read the budget file. It holds the list of heavy packages, the list
+    of light entries (which must not import any heavy package), and the
+    number of modules each entry may import.
+    '''
+    budget_file = get_budget_file() if budget_file is None else Path(budget_file)
+    budget = {}
+    if budget_file.exists():
+        with open(budget_file) as f:
+            budget = yaml.safe_load(f) or {}
+    budget['heavy'] = budget.get('heavy', None) or list(default_heavy)
+    budget['light'] = budget.get('light', None) or []
+    budget['default'] = budget.get('default', None)
+    budget['entries'] = budget.get('entries', None) or {}
+    return budget
+
+
+def get_budget(budget, entry):
+    return budget['entries'].get(entry, budget['default'])
+
+
+def heavy_imports(modules, heavy):
+    '''The heavy packages among a list of imported module names.'''
+    packages = set([module.split('.')[0] for module in modules])
+    return sorted([package for package in heavy if package in packages])
+
+
+def measure_import(module_str, module_root):
+    '''Import a module in a fresh interpreter with `-X importtime`, list the
+    modules it imported, and attribute the time spent to top level packages.
+
+    Parameters
+    ----------
+    module_str : str
+        Module to import, e.g. kpf.scripts.RunOB
+    module_root : Path
+        Directory containing the kpf package
+
+    Returns
+    -------
+    Tuple[float, Dict[str, float], List[str], str]
+        Total import time (ms), time (ms) per top level package, the names of
+        the modules imported, and an error message (None if the import
+        succeeded). Interpreter start up imports are excluded.
+    '''
+    code = (f"import sys; sys.stderr.write('{marker}\\n'); sys.stderr.flush(); "
+            f"import {module_str}")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=module_root, capture_output=True, text=True)
+    lines = result.stderr.splitlines()
+    if marker in lines:
+        lines = lines[lines.index(marker)+1:]
+    packages = {}
+    modules = []
+    other = []
+    for line in lines:
+        if not line.startswith('import time:'):
+            other.append(line)
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_us = int(fields[0])
+        except ValueError:
+            continue # column header
+        module = fields[2].strip()
+        modules.append(module)
+        package = module.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us/1000
+    error = None
+    if result.returncode != 0:
+        error = other[-1] if len(other) > 0 else f'exit code {result.returncode}'
+    return sum(packages.values()), packages, modules, error
+
+
+def profile_entries(linking_tbl, entries=None, repeat=None, top=None,
+                    update_budget=False):
+    '''Measure the import cost of linking table entries, print a report, and
+    compare each against its stored budget.
+
+    The budget is the number of modules an entry imports, which unlike the
+    import time does not depend on the load on the machine or the state of
+    the file system cache. Entries listed as light must also not import
+    any of the heavy packages. Times are reported for information only.
+
+    Parameters
+    ----------
+    linking_tbl : LinkingTable
+    entries : List[str], optional
+        Entries to profile, by default all of them
+    repeat : int, optional
+        Number of measurements per entry, the fastest time is reported
+    top : int, optional
+        Number of top contributing packages to list
+    update_budget : bool
+        Write new budgets (measured module count times the configured
+        headroom) and the list of light entries instead of checking
+        against the stored ones
+
+    Returns
+    -------
+    int
+        Exit code: 1 if any entry exceeds its budget, a light entry imports
+        a heavy package, or an entry failed to import.
+    '''
+    if repeat is None:
+        repeat = cfg.getint('import_profile', 'repeat', fallback=1)
+    if top is None:
+        top = cfg.getint('import_profile', 'top', fallback=4)
+    if entries is None or len(entries) == 0:
+        entries = linking_tbl.get_entry_points()
+    budget = load_budget()
+
+    results = {}
+    print(f"{'Entry':32s} {'Modules':>7s} {'Budget':>7s} {'[ms]':>7s}  Top contributors [ms]")
+    for entry in entries:
+        module_str = linking_tbl.get_link(entry).rsplit('.', 1)[0]
+        measurements = [measure_import(module_str, linking_tbl.module_root)
+                        for i in range(repeat)]
+        total, packages, modules, error = min(measurements, key=lambda m: m[0])
+        heavy = heavy_imports(modules, budget['heavy'])
+        results[entry] = (len(modules), heavy, error)
+        if error is not None:
+            print(f"{entry:32s} {'FAILED':>7s} {'':7s} {'':7s}  {error}")
+            continue
+        contributors = sorted(packages.items(), key=lambda p: p[1], reverse=True)
+        contributors = ', '.join([f"{name} {ms:.0f}" for name,ms in contributors[:top]])
+        limit = get_budget(budget, entry)
+        flag = ' OVER' if limit is not None and len(modules) > limit else ''
+        if entry in budget['light'] and len(heavy) > 0:
+            flag += f" HEAVY ({', '.join(heavy)})"
+        limit_str = '' if limit is None else f'{limit:d}'
+        print(f"{entry:32s} {len(modules):7d} {limit_str:>7s} {total:7.0f}  {contributors}{flag}")
+
+    failed = [e for e in results if results[e][2] is not None]
+    if update_budget is True:
+        headroom = cfg.getfloat('import_profile', 'headroom', fallback=1.2)
+        light = set(budget['light'])
+        for entry in results:
+            if entry in failed:
+                continue
+            count, heavy, error = results[entry]
+            budget['entries'][entry] = math.ceil(count*headroom)
+            if len(heavy) == 0:
+                light.add(entry)
+            else:
+                light.discard(entry)
+        budget['light'] = sorted(light)
+        budget_file = get_budget_file()
+        # Keep the comment block at the top of the file
+        header = []
+        if budget_file.exists():
+            with open(budget_file) as f:
+                for line in f:
+                    if not line.startswith('#'):
+                        break
+                    header.append(line)
+        with open(budget_file, 'w') as f:
+            f.writelines(header)
+            yaml.safe_dump(budget, f, sort_keys=False)
+        print(f"Wrote budgets for {len(results)-len(failed)} entries to {budget_file}")
+        return 0
+
+    over = [e for e in results if e not in failed
+            and get_budget(budget, e) is not None
+            and results[e][0] > get_budget(budget, e)]
+    heavy = [e for e in results if e not in failed
+             and e in budget['light'] and len(results[e][1]) > 0]
+    if len(over) > 0:
+        print(f"{len(over)} entries over their import budget: {', '.join(over)}")
+    if len(heavy) > 0:
+        print(f"{len(heavy)} light entries import heavy packages: {', '.join(heavy)}")
+    if len(failed) > 0:
+        print(f"{len(failed)} entries failed to import: {', '.join(failed)}")
+    return 1 if len(over) > 0 or len(heavy) > 0 or len(failed) > 0 else 0
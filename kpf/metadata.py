@@ -0,0 +1,174 @@
+import os
+import time
+import json
+import tempfile
+import threading
+from pathlib import Path
+
+try:
+    import ktl
+except:
+    ktl = None
+
+from kpf import log, cfg, simulate
+
+
+##-------------------------------------------------------------------------
+## Instrument metadata cache
+##-------------------------------------------------------------------------
+class MetadataCache(object):
+    '''Process wide cache of slow changing instrument metadata, such as
+    keyword enumerators (filter wheel and octagon positions) and
+    configuration values like the exposure meter wavelength bins.
+
+    Values are looked up in memory first, and are re-read from KTL once they
+    are older than the TTL. Lookups with fresh=True, as made by the pre and
+    post conditions which check arguments against the instrument, use the
+    much shorter condition TTL instead. Every value read from KTL is also
+    written to a JSON file on disk. If KTL is not available (offline tools, a
+    cold start on a machine without the keyword libraries) the last value on
+    disk is used regardless of its age.
+    '''
+    def __init__(self, cache_file=None, ttl=None):
+        if cache_file is None:
+            cache_file = os.getenv('KPF_METADATA_CACHE', default=None)
+        if cache_file is None:
+            cache_file = cfg.get('metadata', 'cache_file',
+                                 fallback='~/.kpftranslator/metadata_cache.json')
+        self.cache_file = Path(cache_file).expanduser()
+        if ttl is None:
+            ttl = cfg.getfloat('metadata', 'ttl', fallback=3600)
+        self.ttl = ttl
+        self.condition_ttl = cfg.getfloat('metadata', 'condition_ttl', fallback=10)
+        # Don't persist values from the simulated backend
+        self.persist = simulate is False
+        self.lock = threading.RLock()
+        self.values = {}
+        self.disk = None
+        self.stats = {'hits': 0, 'ktl': 0, 'disk': 0, 'fallback': 0}
+
+    def load(self):
+        '''Read the on disk cache (once).'''
+        if self.disk is None:
+            self.disk = {}
+            try:
+                with open(self.cache_file) as f:
+                    self.disk = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                log.debug(f"Unable to read metadata cache {self.cache_file}: {e}")
+        return self.disk
+
+    def save(self):
+        '''Write the on disk cache, keeping entries written by other processes
+        since it was read. The file is written to a temporary file and
+        renamed in to place so that a crash or a concurrent reader never sees
+        a partially written file.
+        '''
+        if self.persist is False:
+            return
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                with open(self.cache_file) as f:
+                    on_disk = json.load(f)
+            except (FileNotFoundError, ValueError):
+                on_disk = {}
+            for name, entry in on_disk.items():
+                if entry.get('time', 0) > self.disk.get(name, {}).get('time', 0):
+                    self.disk[name] = entry
+            fd, tmpname = tempfile.mkstemp(dir=self.cache_file.parent,
+                                           prefix=f'.{self.cache_file.name}.')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self.disk, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmpname, self.cache_file)
+            except:
+                if Path(tmpname).exists():
+                    os.unlink(tmpname)
+                raise
+        except Exception as e:
+            log.debug(f"Unable to write metadata cache {self.cache_file}: {e}")
+
+    def get(self, name, loader, fallback=None, fresh=False):
+        '''Return the cached value for name, calling loader() to read it
+        from KTL if the cached value is missing or expired. If fresh is True
+        the value expires after the condition TTL rather than the TTL.
+
+        Raises the loader's exception if the value can not be read from KTL,
+        is not on disk, and no fallback is given.
+        '''
+        ttl = self.condition_ttl if fresh is True else self.ttl
+        with self.lock:
+            now = time.time()
+            entry = self.values.get(name, None)
+            if entry is not None and now - entry[1] < ttl:
+                self.stats['hits'] += 1
+                return entry[0]
+            try:
+                if ktl is None:
+                    raise ModuleNotFoundError('ktl is not available')
+                value = loader()
+            except Exception as e:
+                disk_entry = self.load().get(name, None)
+                if disk_entry is not None:
+                    self.stats['disk'] += 1
+                    value = disk_entry['value']
+                    # Don't retry KTL on every call while it is unavailable
+                    self.values[name] = (value, now)
+                    return value
+                if fallback is not None:
+                    self.stats['fallback'] += 1
+                    return fallback
+                raise e
+            self.stats['ktl'] += 1
+            self.values[name] = (value, now)
+            disk = self.load()
+            if disk.get(name, {}).get('value', None) != value:
+                disk[name] = {'value': value, 'time': now}
+                self.save()
+            return value
+
+    def invalidate(self, name=None):
+        '''Forget the cached value for name (or all values) so that the next
+        lookup reads from KTL.
+        '''
+        with self.lock:
+            if name is None:
+                self.values = {}
+            else:
+                self.values.pop(name, None)
+
+
+cache = None
+
+
+def get_cache():
+    global cache
+    if cache is None:
+        cache = MetadataCache()
+    return cache
+
+
+def get_enumerators(service, keyword, fallback=None, fresh=False):
+    '''Enumerated values of a keyword, as a new list. Pre and post conditions
+    pass fresh=True so that they check against recently read values.
+    '''
+    enumerators = get_cache().get(f"{service}.{keyword}.enumerators".lower(),
+                      lambda: list(ktl.cache(service, keyword)._getEnumerators()),
+                      fallback=fallback, fresh=fresh)
+    return list(enumerators)
+
+
+def get_value(service, keyword, fallback=None, fresh=False):
+    '''Ascii value of a slow changing keyword.'''
+    return get_cache().get(f"{service}.{keyword}.value".lower(),
+                           lambda: ktl.cache(service, keyword).read(),
+                           fallback=fallback, fresh=fresh)
+
+
+def invalidate(name=None):
+    get_cache().invalidate(name=name)
@@ -0,0 +1,275 @@
+import os
+import sys
+import time
+import math
+import bisect
+import json
+import atexit
+import threading
+import datetime
+from pathlib import Path
+
+from kpf import cfg
+from kpf import tracing
+
+
+##-------------------------------------------------------------------------
+## Execution timing metrics
+##-------------------------------------------------------------------------
+phases = ['pre_condition', 'perform', 'post_condition']
+# Upper edges (s) of the duration histogram bins, the last bin is open ended
+histogram_bins = [0.001, 0.01, 0.1, 1, 10, 100]
+
+
+def metrics_enabled():
+    if os.getenv('KPF_METRICS', default='').lower() in ['0', 'no', 'false']:
+        return False
+    return cfg.getboolean('metrics', 'enabled', fallback=True)
+
+
+def get_metrics_dir():
+    '''Directory holding the metrics files. The KPF_METRICS_DIR environment
+    variable overrides the configured value.
+    '''
+    metrics_dir = os.getenv('KPF_METRICS_DIR', default=None)
+    if metrics_dir is None:
+        metrics_dir = cfg.get('metrics', 'directory',
+                              fallback='/s/sdata1701/KPFTranslator_logs/metrics')
+    return Path(metrics_dir).expanduser()
+
+
+def get_metrics_file(date):
+    '''One line delimited JSON file per UT date.'''
+    return get_metrics_dir() / f"execution_times_{date.strftime('%Y-%m-%d')}.jsonl"
+
+
+class MetricsWriter(object):
+    '''Buffers execution records in memory and appends them to the metrics
+    file in batches, so the cost per call in a tight loop is a dict and a
+    list append. Buffered records are written when the buffer fills, when
+    the oldest record is older than the flush interval, and at exit.
+
+    Failing to write metrics never raises, the records are dropped instead.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.oldest = None
+        self.buffer_size = cfg.getint('metrics', 'buffer_size', fallback=100)
+        self.flush_interval = cfg.getfloat('metrics', 'flush_interval', fallback=5)
+        atexit.register(self.flush)
+
+    def add(self, record):
+        with self.lock:
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            self.buffer.append(record)
+            flush = len(self.buffer) >= self.buffer_size\
+                    or time.monotonic() - self.oldest > self.flush_interval
+        if flush is True:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            records = self.buffer
+            self.buffer = []
+            self.oldest = None
+        if len(records) == 0:
+            return
+        try:
+            by_day = {}
+            for record in records:
+                by_day.setdefault(int(record['time']//86400), []).append(record)
+            for day, file_records in by_day.items():
+                date = datetime.datetime.utcfromtimestamp(day*86400)
+                metrics_file = get_metrics_file(date)
+                metrics_file.parent.mkdir(parents=True, exist_ok=True)
+                lines = ''.join([json.dumps(r)+'\n' for r in file_records])
+                # A single write in append mode so concurrent kpfdo
+                # processes do not interleave partial lines
+                with open(metrics_file, 'a') as f:
+                    f.write(lines)
+        except Exception:
+            pass
+
+
+writer = None
+enabled = None
+
+
+def get_writer():
+    global writer
+    if writer is None:
+        writer = MetricsWriter()
+    return writer
+
+
+class ExecutionTimer(object):
+    '''Times the phases of a single KPFFunction.execute call.
+
+    Call `mark` at the end of each phase which completes, `fail` for the
+    phase which raises, `finish` after the last phase, and `close` when the
+    call is left in any way (in a finally clause). `close` records calls
+    left without `finish` or `fail`, e.g. by KeyboardInterrupt or
+    SystemExit, with the outcome 'interrupted'. The resulting record holds
+    the start time, the duration of each phase in seconds, the outcome, and
+    the exception type if there was one.
+
+    If tracing is enabled (see kpf.tracing) the call is also recorded as a
+    trace span nested under the calling function's span.
+    '''
+    __slots__ = ['name', 'start', 'last', 'durations', 'enabled', 'span',
+                 'finished']
+
+    def __init__(self, name, args=None, OB=None):
+        global enabled
+        if enabled is None:
+            enabled = metrics_enabled()
+        self.enabled = enabled
+        self.name = name
+        self.durations = {}
+        self.span = None
+        self.finished = False
+        if tracing.tracing_enabled() is True:
+            self.span = tracing.start_span(name, args, OB=OB)
+        self.start = time.time()
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.durations[phase] = now - self.last
+        self.last = now
+
+    def fail(self, phase, exception):
+        self.mark(phase)
+        self.finish(outcome='failed', phase=phase,
+                    exception=type(exception).__name__)
+
+    def finish(self, outcome='success', phase=None, exception=None):
+        self.finished = True
+        self.end_span(outcome=outcome, exception=exception)
+        if self.enabled is False:
+            return
+        try:
+            record = {'time': self.start,
+                      'function': self.name,
+                      'outcome': outcome,
+                      'phase': phase,
+                      'exception': exception,
+                      'total': sum(self.durations.values()),
+                      'pid': os.getpid()}
+            record.update(self.durations)
+            get_writer().add(record)
+        except Exception:
+            pass
+
+    def end_span(self, outcome='success', exception=None):
+        if self.span is None or self.span.end is not None:
+            return
+        try:
+            tracing.end_span(self.span, phases=self.durations,
+                             outcome=outcome, exception=exception)
+        except Exception:
+            pass
+
+    def close(self):
+        '''Record the call if neither finish nor fail did, e.g. when it was
+        interrupted by KeyboardInterrupt or SystemExit, and end its trace
+        span. Closing the root span writes the trace.
+        '''
+        if self.finished is True:
+            return
+        phase = next((p for p in phases if p not in self.durations), phases[-1])
+        self.mark(phase)
+        exception = sys.exc_info()[1]
+        if exception is not None:
+            exception = type(exception).__name__
+        self.finish(outcome='interrupted', phase=phase, exception=exception)
+
+
+def read_metrics(start_date, end_date, function=None):
+    '''Read the execution records between two UT dates (inclusive).
+
+    Parameters
+    ----------
+    start_date : datetime.date
+    end_date : datetime.date
+    function : str, optional
+        Only return records for this function
+
+    Returns
+    -------
+    List[Dict]
+    '''
+    if writer is not None:
+        writer.flush()
+    records = []
+    date = start_date
+    while date <= end_date:
+        metrics_file = get_metrics_file(date)
+        date += datetime.timedelta(days=1)
+        if not metrics_file.exists():
+            continue
+        with open(metrics_file) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # e.g. a line truncated by a crash
+                if function is None or record.get('function') == function:
+                    records.append(record)
+    return records
+
+
+def percentile(sorted_values, pct):
+    '''Nearest rank percentile of an already sorted list.'''
+    if len(sorted_values) == 0:
+        return None
+    rank = max(math.ceil(pct/100*len(sorted_values))-1, 0)
+    return sorted_values[min(rank, len(sorted_values)-1)]
+
+
+def histogram(values, bins=histogram_bins):
+    '''Number of values in each bin, given the upper edges of the bins. The
+    last count is of the values above the last edge.
+    '''
+    counts = [0]*(len(bins)+1)
+    for value in values:
+        counts[bisect.bisect_left(bins, value)] += 1
+    return counts
+
+
+def summarize(records):
+    '''Latency statistics per function and phase.
+
+    Returns
+    -------
+    Dict[str, Dict[str, Dict]]
+        {function: {phase: {'n', 'p50', 'p95', 'max', 'histogram'}}} with
+        times in seconds, plus 'failed' and 'interrupted' counts per function.
+        The histogram counts the durations in the histogram_bins.
+    '''
+    durations = {}
+    failures = {}
+    interruptions = {}
+    for record in records:
+        name = record.get('function')
+        function_durations = durations.setdefault(name, {})
+        failures[name] = failures.get(name, 0) + (record.get('outcome') == 'failed')
+        interruptions[name] = interruptions.get(name, 0)\
+                              + (record.get('outcome') == 'interrupted')
+        for phase in phases + ['total']:
+            if phase in record:
+                function_durations.setdefault(phase, []).append(record[phase])
+    summary = {}
+    for name, function_durations in durations.items():
+        summary[name] = {'failed': failures[name],
+                         'interrupted': interruptions[name]}
+        for phase, values in function_durations.items():
+            values = sorted(values)
+            summary[name][phase] = {'n': len(values),
+                                    'p50': percentile(values, 50),
+                                    'p95': percentile(values, 95),
+                                    'max': values[-1],
+                                    'histogram': histogram(values)}
+    return summary
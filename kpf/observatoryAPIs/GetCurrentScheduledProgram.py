@@ -3,7 +3,7 @@ import datetime
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
-from kpf.observatoryAPIs import get_semester_dates, query_observatoryAPI
+from kpf.observatoryAPIs.schedule import get_schedule_store
 
 
 def string_time_to_decimal(time_str):
@@ -18,6 +18,10 @@ class GetCurrentScheduledProgram(KPFFunction):
     start and end times on the schedule. Officially, the night starts and ends
     at 12 degree twilight), so it is possible for observing to be happening
     before there is an officially scheduled program.
+
+    The schedule is looked up in the local schedule store (see
+    kpf.observatoryAPIs.schedule) which only queries the API when tonight's
+    schedule is not stored or is out of date.
     '''
     @classmethod
     def pre_condition(cls, args):
@@ -32,21 +36,10 @@ class GetCurrentScheduledProgram(KPFFunction):
         else:
             inputdateHST = datetime.datetime.strptime(args.get('datetime'), '%Y-%m-%dT%H:%M:%S')
             inputdateUT = inputdateHST + datetime.timedelta(hours=10)
-        startdate = inputdateUT - datetime.timedelta(days=1)
-        UTdecimal_hour = inputdateUT.hour + inputdateUT.minute/60
-
-        params = {'date': startdate.strftime('%Y-%m-%d'),
-                  'numdays': 1,
-                  'telnr': args.get('telnr', 1),
-                  'instrument': 'KPF'}
-        all_programs = query_observatoryAPI('schedule', 'getSchedule', params)
-
+        programs = get_schedule_store().at(inputdateUT, telnr=args.get('telnr', 1))
         progname = None
-        for program in all_programs:
-            prog_start = string_time_to_decimal(program.get('StartTime'))
-            prog_end = string_time_to_decimal(program.get('EndTime'))
-            if UTdecimal_hour >= prog_start and UTdecimal_hour <= prog_end:
-                progname = program.get('ProjCode')
+        if len(programs) > 0:
+            progname = programs[-1].get('ProjCode')
         return progname
 
     @classmethod
@@ -1,7 +1,7 @@
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
-from kpf.observatoryAPIs import get_OBs_from_KPFCC_API
+from kpf.ObservingBlocks.OBCache import get_cache
 
 ##-------------------------------------------------------------------------
 ## GetObservingBlocks
@@ -9,6 +9,16 @@ from kpf.observatoryAPIs import get_OBs_from_KPFCC_API
 class GetObservingBlocks(KPFFunction):
     '''Retrieve the OB associated with the given unique ID in the KPF-CC
     database.
+
+    OBs are kept in the local OB cache (see kpf.ObservingBlocks.OBCache), a
+    recently checked copy is returned without querying the database and
+    the cached copy is used if the database can not be reached.
+
+    Args:
+        OBid (str): The unique identifier for the OB to retrieve.
+        refresh (bool): Revalidate the cached copy against the database even
+                        if it was checked recently.
+        show_history (bool): Print the observing history of the OB.
     '''
     @classmethod
     def pre_condition(cls, args):
@@ -18,8 +28,9 @@ class GetObservingBlocks(KPFFunction):
 
     @classmethod
     def perform(cls, args):
-        params = {'id': args.get('OBid', '')}
-        OBs, failure_messages = get_OBs_from_KPFCC_API(params)
+        OB, failure_messages = get_cache().get(args.get('OBid', ''),
+                                               refresh=args.get('refresh', False))
+        OBs = [OB] if OB is not None else []
         if args.get('show_history', False):
             print(f'# Observing History for {OBs[0].summary()}')
             for i,h in enumerate(OBs[0].History):
@@ -46,6 +57,9 @@ class GetObservingBlocks(KPFFunction):
     def add_cmdline_args(cls, parser):
         parser.add_argument('OBid', type=str,
                             help='The unique identifier for the OB to retrieve.')
+        parser.add_argument('--refresh', dest="refresh",
+            default=False, action="store_true",
+            help='Revalidate the cached copy of the OB against the database')
         parser.add_argument('--history', '--show_history', dest="show_history",
             default=False, action="store_true",
             help='Print history to screen?')
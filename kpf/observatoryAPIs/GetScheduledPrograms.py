@@ -3,7 +3,8 @@ import datetime
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
-from kpf.observatoryAPIs import get_semester_dates, query_observatoryAPI
+from kpf.observatoryAPIs import get_semester_dates
+from kpf.observatoryAPIs.schedule import get_schedule_store
 
 
 class GetScheduledPrograms(KPFFunction):
@@ -22,6 +23,10 @@ class GetScheduledPrograms(KPFFunction):
         If args contains a value for "semester" then that is either interpreted
         as the semester string (e.g. "2025A") or it can be "current" which
         instructs the code to use the current semester.
+
+        The schedule comes from the local schedule store (see
+        kpf.observatoryAPIs.schedule), if "refresh" is True the API is
+        queried for every night.
         '''
         utnow = datetime.datetime.utcnow()
         semester, semester_start, semester_end = get_semester_dates(utnow)
@@ -39,12 +44,11 @@ class GetScheduledPrograms(KPFFunction):
             # Pull programs from the rest of the semester
             start = utnow
             numdays = (semester_end-start).days + 2
-        query = 'getSchedule'
-        params = {'date': start.strftime('%Y-%m-%d'),
-                  'numdays': numdays,
-                  'telnr': args.get('telnr', 1),
-                  'instrument': 'KPF'}
-        all_programs = query_observatoryAPI('schedule', query, params)
+        # Only nights missing from or out of date in the local schedule store
+        # are queried from the API
+        all_programs = get_schedule_store().get(start, numdays,
+                                                telnr=args.get('telnr', 1),
+                                                refresh=args.get('refresh', False))
         classical_programs = [p for p in all_programs if p['Instrument'] == 'KPF' and p['Semester'] == semester]
         cadence_programs = [p for p in all_programs if p['Instrument'] == 'KPF-CC' and p['Semester'] == semester]
         return classical_programs, cadence_programs
@@ -0,0 +1,82 @@
+import datetime
+
+from kpf import log, cfg
+from kpf.exceptions import *
+from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.observatoryAPIs.outbox import get_outbox
+
+
+##-------------------------------------------------------------------------
+## HistoryOutbox
+##-------------------------------------------------------------------------
+class HistoryOutbox(KPFFunction):
+    '''Inspect and flush the outbox of records (e.g. OB execution history)
+    waiting to be submitted to the observatory APIs (see
+    kpf.observatoryAPIs.outbox).
+
+    Args:
+        flush (bool): Submit the pending records now, including those
+                      waiting for a retry.
+        retry_failed (bool): Return records which were given up on to the
+                             queue (and then flush).
+        discard_failed (bool): Delete records which were given up on, so
+                               the later records for the same OB are sent.
+        purge (float): Delete records sent more than this many days ago.
+        all (bool): List sent records as well as pending and failed ones.
+    '''
+    @classmethod
+    def pre_condition(cls, args):
+        pass
+
+    @classmethod
+    def perform(cls, args):
+        outbox = get_outbox()
+        if args.get('retry_failed', False) is True:
+            n = outbox.retry_failed()
+            print(f"Returned {n} failed records to the queue")
+        if args.get('discard_failed', False) is True:
+            n = outbox.discard_failed()
+            print(f"Discarded {n} failed records")
+        if args.get('flush', False) is True or args.get('retry_failed', False) is True\
+           or args.get('discard_failed', False) is True:
+            outbox.flush(force=True)
+        purge = args.get('purge', None)
+        if purge is not None:
+            n = outbox.purge(older_than=float(purge)*24*3600)
+            print(f"Purged {n} records sent more than {purge} days ago")
+
+        print(f"# Outbox {outbox.outbox_file}")
+        for record in outbox.records():
+            if record.status == 'sent' and args.get('all', False) is False:
+                continue
+            created = datetime.datetime.fromtimestamp(record.created)
+            print(f"- {record.seq:5d} {record.status:8s} {record.query} "
+                  f"{record.ordering} (queued {created.strftime('%Y-%m-%d %H:%M:%S')}, "
+                  f"{record.attempts} attempts)")
+            if record.last_error is not None and record.status != 'sent':
+                print(f"        {record.last_error}")
+        counts = outbox.counts()
+        print(', '.join([f"{n} {status}" for status, n in counts.items()]))
+        return counts
+
+    @classmethod
+    def post_condition(cls, args):
+        pass
+
+    @classmethod
+    def add_cmdline_args(cls, parser):
+        parser.add_argument('--flush', dest="flush",
+            default=False, action="store_true",
+            help='Submit pending records now')
+        parser.add_argument('--retry-failed', dest="retry_failed",
+            default=False, action="store_true",
+            help='Queue failed records again and submit them')
+        parser.add_argument('--discard-failed', dest="discard_failed",
+            default=False, action="store_true",
+            help='Delete failed records and submit the records they held back')
+        parser.add_argument('--purge', dest="purge", type=float, default=None,
+            help='Delete records sent more than this many days ago')
+        parser.add_argument('--all', dest="all",
+            default=False, action="store_true",
+            help='List sent records too')
+        return super().add_cmdline_args(parser)
@@ -3,7 +3,6 @@ import sys
 import time
 import datetime
 import json
-import requests
 import numpy as np
 
 import ktl
@@ -12,7 +11,9 @@ import keygrabber
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
-from kpf.observatoryAPIs import addObservingBlockHistory
+from kpf.observatoryAPIs import (round_microseconds, truncate_isoformat,
+                                 queueObservingBlockHistory)
+from kpf.observatoryAPIs.outbox import get_outbox
 
 
 ##-------------------------------------------------------------------------
@@ -87,8 +88,14 @@ class SubmitExecutionHistoryUsingKeywordHistory(KPFFunction):
 
         log.info('Submitting history to DB:')
         log.info(params)
-        result = addObservingBlockHistory(params)
-        log.info(f"Response: {result}")
+        # Through the outbox so history RunOB already queued for these
+        # exposures is not submitted twice
+        key = queueObservingBlockHistory(params)
+        if key is not None:
+            get_outbox().flush(timeout=60)
+            record = get_outbox().record(key)
+            log.info(f"Status: {record.status}")
+            log.info(f"Response: {record.response}")
 
     @classmethod
     def post_condition(cls, args):
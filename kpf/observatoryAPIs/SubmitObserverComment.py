@@ -1,6 +1,5 @@
 import datetime
 import json
-import requests
 
 from kpf import log, cfg
 from kpf.exceptions import *
@@ -2,15 +2,18 @@ import os
 import copy
 import datetime
 import json
-import requests
-import urllib3
-urllib3.disable_warnings() # We're going to do verify=False, so ignore warnings
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import numpy as np
-from astropy.coordinates import Angle
 
-from kpf import log, cfg
-from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf import log, cfg, lazy_import, simulate
+from kpf.httpclient import get_client, CircuitOpen
+from kpf.ObservingBlocks.OBTable import OBTable
+from kpf.ObservingBlocks.serialization import iter_items
+
+requests = lazy_import('requests')
+urllib3 = lazy_import('urllib3')
 
 
 def get_semester_dates(date):
@@ -72,7 +75,9 @@ def truncate_isoformat(ut, ndecimals=2):
 ##-------------------------------------------------------------------------
 ## query_observatoryAPI
 ##-------------------------------------------------------------------------
-def query_observatoryAPI(api, query, params, post=False):
+def add_api_hash(api, params):
+    '''The proposals API needs the hash from the APIHASH environment variable.
+    '''
     if api == 'proposal' and 'hash' not in params.keys():
         hashenv = os.getenv('APIHASH', default=None)
         if hashenv is None:
@@ -82,14 +87,35 @@ def query_observatoryAPI(api, query, params, post=False):
                 log.error('Unable to read environment variable APIHASH')
         else:
             params['hash'] = hashenv
+
+
+def query_observatoryAPI(api, query, params, post=False, headers=None,
+                         full_response=False):
+    '''Query an observatory API and return the parsed JSON result (None if
+    it could not be parsed). With full_response=True a (result, response)
+    tuple is returned so the caller can see the status and headers, result
+    is None for a "304 Not Modified" response.
+    '''
+    add_api_hash(api, params)
     url = cfg.get('ObservatoryAPIs', f'{api}_url')
     log.debug(f"Running {api} API query: {url}{query}")
     log.debug(f"  Input params: {params}")
+    if simulate is True:
+        # Do not read from or write to the real observatory databases when
+        # running against the simulated KTL backend
+        log.debug('Simulated KTL backend in use, skipping API query')
+        result = None if post is True else []
+        return (result, None) if full_response is True else result
     if post == False:
-        r = requests.get(f"{url}{query}", params=params)
+        r = get_client().get(api, f"{url}{query}", params=params, headers=headers)
     else:
         log.debug('Using POST')
-        r = requests.post(f"{url}{query}", json=params, verify=False)
+        urllib3.disable_warnings() # We're going to do verify=False, so ignore warnings
+        r = get_client().post(api, f"{url}{query}", json=params, verify=False,
+                              headers=headers)
+    if r.status_code == 304:
+        log.debug('  Not modified')
+        return (None, r) if full_response is True else None
     try:
         result = json.loads(r.text)
         log.debug(f"  Query result: {result}")
@@ -104,7 +130,48 @@ def query_observatoryAPI(api, query, params, post=False):
         log.error(r.text)
         log.error(e)
         result = None
-    return result
+    return (result, r) if full_response is True else result
+
+
+def stream_observatoryAPI(api, query, params):
+    '''Query an observatory API (GET) and yield the items of the JSON array
+    it returns as each one arrives, rather than after the whole response has
+    been downloaded and parsed (see kpf.ObservingBlocks.serialization.iter_items).
+    A response which is not an array is yielded as a single item. An HTTP
+    error status raises requests.HTTPError before any item is yielded. A
+    response which is cut short or is not valid JSON raises
+    json.JSONDecodeError, and a connection which fails part way raises the
+    requests or urllib3 exception, after the items before it were yielded.
+    '''
+    add_api_hash(api, params)
+    url = cfg.get('ObservatoryAPIs', f'{api}_url')
+    log.debug(f"Streaming {api} API query: {url}{query}")
+    log.debug(f"  Input params: {params}")
+    if simulate is True:
+        log.debug('Simulated KTL backend in use, skipping API query')
+        return
+    r = get_client().get(api, f"{url}{query}", params=params, stream=True)
+    if r.status_code >= 400:
+        log.error(f"Query Failed: HTTP {r.status_code}")
+        log.error(f"  Details: {r.text[:1000]}")
+        r.close()
+        r.raise_for_status()
+    try:
+        r.raw.decode_content = True
+        nitems = 0
+        for item in iter_items(r.raw):
+            if type(item) == dict and item.get('status', '') == 'ERROR':
+                log.error(f"Query Failed: {item.get('message', '')}")
+                log.error(f"  Details: {item.get('details', '')}")
+            nitems += 1
+            yield item
+        log.debug(f"  Query returned {nitems} items")
+    except json.JSONDecodeError as e:
+        log.error(f'Failed to parse result after {nitems} items:')
+        log.error(e)
+        raise
+    finally:
+        r.close()
 
 
 ##-------------------------------------------------------------------------
@@ -122,6 +189,33 @@ def addObservingBlockHistory(history):
     return query_observatoryAPI('proposal', 'addObservingBlockHistory', history, post=True)
 
 
+def queueObservingBlockHistory(history):
+    '''Add execution history to the outbox (kpf.observatoryAPIs.outbox) to be
+    submitted in the background. Returns the record key.
+
+    The key is derived from the OB ID and exposure start times, so the same
+    execution derived again (e.g. by SubmitExecutionHistoryUsingKeywordHistory)
+    is only submitted once. Records for the same OB are submitted in order.
+    If the outbox can not be opened the history is submitted directly and
+    None is returned.
+    '''
+    from kpf.observatoryAPIs.outbox import get_outbox, record_key
+    start_times = history.get('exposure_start_times', [])
+    if len(start_times) > 0:
+        key = record_key('proposal', 'addObservingBlockHistory',
+                         json.dumps([history.get('id', ''), start_times]))
+    else:
+        key = None
+    try:
+        return get_outbox().enqueue('proposal', 'addObservingBlockHistory', history,
+                                    key=key, ordering=history.get('id', None))
+    except (OSError, sqlite3.Error) as e:
+        log.error(f"Unable to queue execution history: {e}")
+        log.error('Submitting it directly')
+        addObservingBlockHistory(history)
+        return None
+
+
 def getObservingBlockHistory(utdate=None):
     if utdate in [None, 'today']:
         utdate = datetime.datetime.utcnow().strftime('%Y-%m-%d')
@@ -137,69 +231,100 @@ def setKPFJunkValue(OBid, timestamp, junk=True):
     return query_observatoryAPI('proposal', 'setKPFJunkValue', params, post=True)
 
 
-def get_OBs_from_KPFCC_API(params):
-    result = query_observatoryAPI('proposal', 'getKPFObservingBlock', params)
-    if result is None:
-        return []
+def get_OB_table_from_KPFCC_API(params):
+    '''Query the KPF-CC database for OBs and return them as an OBTable, which
+    holds the key fields of every OB in columns and only builds the full
+    ObservingBlock for a row when it is accessed.
+    '''
+    result = list(stream_observatoryAPI('proposal', 'getKPFObservingBlock', params))
+    table = OBTable(result)
+    log.debug(f'API returned {len(result)} entries, {len(table)} OBs')
+    return table
+
+
+def iter_OBs_from_KPFCC_API(params, batch_size=None, processes=None):
+    '''Query the KPF-CC database for OBs and yield (OBs, failures) in batches
+    as the response arrives, so OBs can be built, validated, and shown while
+    the rest are still downloading. The first batch is a single OB, batches
+    then double in size up to batch_size (default from the ObservatoryAPIs
+    stream_batch_size config value). Large batches are built in worker
+    processes (see OBTable.get_OBs).
+    '''
+    if batch_size is None:
+        batch_size = cfg.getint('ObservatoryAPIs', 'stream_batch_size', fallback=64)
+    batch = []
+    size = 1
+    nentries = 0
+    for entry in stream_observatoryAPI('proposal', 'getKPFObservingBlock', params):
+        batch.append(entry)
+        nentries += 1
+        if len(batch) >= size:
+            yield OBTable(batch).get_OBs(processes=processes)
+            batch = []
+            size = min(size*2, batch_size)
+    if len(batch) > 0:
+        yield OBTable(batch).get_OBs(processes=processes)
+    log.debug(f'API returned {nentries} entries')
+
+
+def get_OBs_from_KPFCC_API(params, processes=None):
+    '''Query the KPF-CC database for OBs, building and validating them in
+    batches as the response arrives (see iter_OBs_from_KPFCC_API) so the
+    whole response is never held in memory. Batches grow to the
+    ObservatoryAPIs build_batch_size config value, so a large download is
+    still built in worker processes.
+
+    If the query fails, or the response is cut short or can not be parsed,
+    the OBs received before that are returned along with a failure message.
+    '''
+    batch_size = cfg.getint('ObservatoryAPIs', 'build_batch_size', fallback=1000)
     OBs = []
     failures = []
-    n = len(result)
-    for i,entry in enumerate(result):
-        log.debug(f'Parsing entry {i+1} of {n}')
-        if not isinstance(entry, dict):
-            failures.append([f'{entry}', 'Entry is not dict'])
+    try:
+        for batchOBs, batch_failures in iter_OBs_from_KPFCC_API(params, batch_size=batch_size,
+                                                                processes=processes):
+            OBs.extend(batchOBs)
+            failures.extend(batch_failures)
+    except (requests.RequestException, urllib3.exceptions.HTTPError,
+            CircuitOpen, OSError, ValueError) as e:
+        # ValueError includes json.JSONDecodeError
+        if len(OBs) > 0 or len(failures) > 0:
+            failures.append(f"Incomplete response, OBs after the first "
+                            f"{len(OBs)+len(failures)} were not retrieved: {e}")
         else:
-            status = entry.get('status', None)
-            OBid = entry.get('id', None)
-            if status not in ['OB_FOUND']:
-#                 log.error(f"  ID {OBid}: {entry.get('status', 'No status returned')}")
-                failures.append([OBid, status])
-            else:
-                # Parse the result as an OB in dict form
+            failures.append(f"Unable to retrieve OBs: {e}")
+    log.debug(f'  Parsed {len(OBs)} OBs')
+    return OBs, failures
+
+
+##-------------------------------------------------------------------------
+## Concurrent queries
+##-------------------------------------------------------------------------
+def fetch_concurrently(function, keys, skip=None, max_workers=None):
+    '''Call function(key) for each key in a pool of threads and yield
+    (key, result, exception) tuples as each call completes, so results can be
+    used as they arrive. Each key is only fetched once however many times it
+    appears, and keys in skip (e.g. the OBs already downloaded) are not
+    fetched at all.
+
+    The number of threads defaults to the ObservatoryAPIs max_workers config
+    value, requests share the pooled connections of kpf.httpclient.
+    '''
+    if max_workers is None:
+        max_workers = cfg.getint('ObservatoryAPIs', 'max_workers', fallback=8)
+    skip = set(skip) if skip is not None else set()
+    unique = [key for key in dict.fromkeys(keys) if key not in skip]
+    if len(unique) == 0:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as pool:
+        futures = {pool.submit(function, key): key for key in unique}
+        try:
+            for future in as_completed(futures):
                 try:
-                    # Convert proper motions from database units (mas/yr) to keck star list units
-                    try:
-                        if entry.get('Target', None) is not None:
-                            if entry.get('Target').get('PMRA', None) is not None:
-                                # Convert from mas/yr to seconds-of-RA/yr
-                                entry['Target']['PMRA'] /= 1000
-                                dec_str = entry.get('Target').get('Dec')
-                                dec = Angle(dec_str, unit='deg')
-                                entry['Target']['PMRA'] /= 15*np.cos(dec.radian)
-                            if entry.get('Target').get('PMDEC', None) is not None:
-                                # Convert from mas/yr to arcsec/yr
-                                entry['Target']['PMDEC'] /= 1000
-                    except Exception as e:
-                        log.error('Failed to convert proper motion units, setting PM to 0')
-                        log.error(e)
-                        entry['Target']['PMRA'] = 0
-                        entry['Target']['PMDEC'] = 0
-                    OB = ObservingBlock(entry)
+                    yield futures[future], future.result(), None
                 except Exception as e:
-#                     log.error(f'Unable to parse entry {i+1} in to an ObservingBlock')
-#                     log.error(entry)
-#                     log.error(f'{e}')
-                    semid = entry.get('semid', '')
-                    failmsg = f"{OBid} ({semid}): {e}"
-                    failures.append(failmsg)
-                    print(entry)
-                else:
-                    if OB.validate():
-#                         log.debug(f'OB {i+1} is valid')
-                        OBs.append(OB)
-                    else:
-#                         log.debug(f'OB {i+1} is invalid')
-                        semid = entry.get('semid', '')
-                        failmsg = f"{OBid} ({semid}): Failed validataion"
-                        failures.append(failmsg)
-#                         if OB.Target is not None:
-#                             for line in OB.Target.to_lines(comment=True):
-#                                 if line.find('ERR') >= 0:
-#                                     log.warning(line)
-#                         for obs in OB.Observations:
-#                             for line in obs.to_lines(comment=True):
-#                                 if line.find('ERR') >= 0:
-#                                     log.warning(line)
-    log.debug(f'API returned {len(result)} entries')
-    log.debug(f'  Parsed {len(OBs)} OBs from those entries')
-    return OBs, failures
+                    yield futures[future], None, e
+        finally:
+            # If the caller stops early, do not start the remaining queries
+            for future in futures:
+                future.cancel()
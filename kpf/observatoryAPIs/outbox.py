@@ -0,0 +1,334 @@
+import os
+import time
+import json
+import atexit
+import random
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from collections import namedtuple
+
+from kpf import log, cfg
+from kpf import observatoryAPIs
+
+
+OutboxRecord = namedtuple('OutboxRecord', ['seq', 'key', 'api', 'query',
+                                           'payload', 'ordering', 'status',
+                                           'created', 'attempts',
+                                           'next_attempt', 'claimed',
+                                           'last_error', 'sent', 'response'])
+
+
+##-------------------------------------------------------------------------
+## Outbox
+##-------------------------------------------------------------------------
+class Outbox(object):
+    '''Durable (SQLite) queue of records to POST to the observatory APIs,
+    e.g. OB execution history, so that scripts do not wait on the API and
+    nothing is lost if it is slow or down.
+
+    enqueue writes the record to the outbox file and returns, a background
+    thread submits it. Records are:
+
+    - idempotent: each has a key (by default a hash of the payload), a
+      record whose key is already in the outbox is not added again, and the
+      key is sent as the Idempotency-Key header.
+    - ordered: records with the same ordering value (e.g. an OB ID) are
+      submitted strictly in the order they were added, a record which fails
+      holds back the later records of its group but not other groups.
+    - retried with jittered exponential backoff until max_attempts, then
+      marked "failed" and kept for inspection (see kpfdo HistoryOutbox).
+      A failed record still holds back its group, so later history for an
+      OB is never sent ahead of it, until it is retried (retry_failed) or
+      discarded (discard_failed).
+
+    Several processes may share the outbox file: a record is claimed before
+    it is submitted so only one process sends it, claims by a process which
+    died are released after claim_timeout. Pending records are submitted
+    for up to exit_timeout seconds when the process exits, anything left is
+    sent by the next process which uses the outbox.
+    '''
+    def __init__(self, outbox_file=None):
+        if outbox_file is None:
+            outbox_file = os.getenv('KPF_OUTBOX', default=None)
+        if outbox_file is None:
+            outbox_file = cfg.get('outbox', 'outbox_file',
+                                  fallback='~/.kpftranslator/outbox.sqlite')
+        self.outbox_file = Path(outbox_file).expanduser()
+        self.max_attempts = cfg.getint('outbox', 'max_attempts', fallback=20)
+        self.backoff = cfg.getfloat('outbox', 'backoff', fallback=5)
+        self.max_backoff = cfg.getfloat('outbox', 'max_backoff', fallback=600)
+        self.claim_timeout = cfg.getfloat('outbox', 'claim_timeout', fallback=120)
+        self.exit_timeout = cfg.getfloat('outbox', 'exit_timeout', fallback=5)
+        self.lock = threading.RLock()
+        self.connection = None
+        self.wake = threading.Event()
+        self.idle = threading.Event()
+        self.stopping = False
+        self.worker = None
+
+    def connect(self):
+        '''Open (once) the outbox database, creating it if needed.'''
+        with self.lock:
+            if self.connection is None:
+                self.outbox_file.parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(self.outbox_file, timeout=10,
+                                             check_same_thread=False,
+                                             isolation_level=None)
+                # Write ahead logging so enqueue is a single quick append
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=NORMAL')
+                connection.execute('''CREATE TABLE IF NOT EXISTS records
+                                      (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                                       key TEXT UNIQUE, api TEXT, query TEXT,
+                                       payload TEXT, ordering TEXT,
+                                       status TEXT, created REAL,
+                                       attempts INTEGER, next_attempt REAL,
+                                       claimed REAL, last_error TEXT,
+                                       sent REAL, response TEXT)''')
+                connection.execute('''CREATE INDEX IF NOT EXISTS pending
+                                      ON records (status, next_attempt)''')
+                self.connection = connection
+            return self.connection
+
+    def enqueue(self, api, query, payload, key=None, ordering=None):
+        '''Add a record to the outbox and wake the background submitter.
+
+        Parameters
+        ----------
+        api : str
+            The API (see query_observatoryAPI), e.g. "proposal".
+        query : str
+            The API query, e.g. "addObservingBlockHistory".
+        payload : Dict
+            The JSON body to POST.
+        key : str, optional
+            Idempotency key, by default a hash of the API, query and payload.
+        ordering : str, optional
+            Records with the same value are submitted in order.
+
+        Returns
+        -------
+        str
+            The key, or None if the record was not added because the
+            simulated KTL backend is in use.
+        '''
+        if observatoryAPIs.simulate is True:
+            log.debug('Simulated KTL backend in use, not queueing API record')
+            return None
+        data = json.dumps(payload, sort_keys=True)
+        if key is None:
+            key = record_key(api, query, data)
+        now = time.time()
+        with self.lock:
+            cursor = self.connect().execute('INSERT OR IGNORE INTO records '
+                '(key, api, query, payload, ordering, status, created, attempts, next_attempt) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, api, query, data, ordering, 'pending', now, 0, now))
+        if cursor.rowcount == 0:
+            log.debug(f"Outbox already has record {key}")
+        self.start()
+        self.wake.set()
+        return key
+
+    def record(self, key):
+        row = self.connect().execute('SELECT * FROM records WHERE key=?', (key,)).fetchone()
+        return OutboxRecord(*row) if row is not None else None
+
+    def records(self, status=None):
+        if status is None:
+            rows = self.connect().execute('SELECT * FROM records ORDER BY seq').fetchall()
+        else:
+            rows = self.connect().execute('SELECT * FROM records WHERE status=? ORDER BY seq',
+                                          (status,)).fetchall()
+        return [OutboxRecord(*row) for row in rows]
+
+    def counts(self):
+        rows = self.connect().execute('SELECT status, COUNT(*) FROM records GROUP BY status')
+        counts = {'pending': 0, 'sending': 0, 'sent': 0, 'failed': 0}
+        counts.update({status: n for status, n in rows})
+        return counts
+
+    def claim(self):
+        '''Claim the next record which is due: the oldest record of each
+        ordering group which is not waiting for an earlier record.
+        '''
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                # Release claims of processes which died while sending
+                connection.execute("UPDATE records SET status='pending' "
+                                   "WHERE status='sending' AND claimed < ?",
+                                   (now - self.claim_timeout,))
+                row = connection.execute("""SELECT * FROM records r
+                    WHERE status='pending' AND next_attempt <= ?
+                    AND NOT EXISTS (SELECT 1 FROM records e
+                                    WHERE e.ordering = r.ordering AND e.seq < r.seq
+                                    AND e.status IN ('pending', 'sending', 'failed'))
+                    ORDER BY next_attempt, seq LIMIT 1""", (now,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE records SET status='sending', claimed=? "
+                                       "WHERE seq=?", (now, row[0]))
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+        return OutboxRecord(*row) if row is not None else None
+
+    def next_due(self):
+        '''Seconds until the next pending record is due (None if none).'''
+        row = self.connect().execute("SELECT MIN(next_attempt) FROM records "
+                                     "WHERE status='pending'").fetchone()
+        return None if row[0] is None else max(row[0] - time.time(), 0)
+
+    def submit(self, record):
+        '''Send one claimed record and record the outcome.'''
+        payload = json.loads(record.payload)
+        error = None
+        result = None
+        try:
+            result, response = observatoryAPIs.query_observatoryAPI(record.api,
+                        record.query, payload, post=True, full_response=True,
+                        headers={'Idempotency-Key': record.key})
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}"
+            elif result is None:
+                error = 'No parseable response'
+            elif isinstance(result, dict) and result.get('status', '') == 'ERROR':
+                error = f"{result.get('message', '')} {result.get('details', '')}".strip()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        now = time.time()
+        attempts = record.attempts + 1
+        with self.lock:
+            if error is None:
+                self.connect().execute("UPDATE records SET status='sent', attempts=?, "
+                                       "sent=?, response=?, last_error=NULL WHERE seq=?",
+                                       (attempts, now, json.dumps(result), record.seq))
+                log.debug(f"Outbox sent {record.query} record {record.key}")
+                return True
+            if attempts >= self.max_attempts:
+                status = 'failed'
+                log.error(f"Outbox giving up on {record.query} record {record.key} "
+                          f"after {attempts} attempts: {error}")
+            else:
+                status = 'pending'
+                log.warning(f"Outbox {record.query} submission failed ({error}), "
+                            f"attempt {attempts} of {self.max_attempts}")
+            delay = min(self.max_backoff, self.backoff*2**(attempts-1))*random.uniform(0.5, 1)
+            self.connect().execute("UPDATE records SET status=?, attempts=?, "
+                                   "next_attempt=?, last_error=? WHERE seq=?",
+                                   (status, attempts, now + delay, error, record.seq))
+        return False
+
+    def flush(self, timeout=None, force=False):
+        '''Submit the records which are due, in this thread, until there are
+        none left or the timeout (seconds) has passed. With force=True
+        records waiting for a retry are due now.
+
+        Returns
+        -------
+        Dict
+            The count of records in each state.
+        '''
+        if force is True:
+            with self.lock:
+                self.connect().execute("UPDATE records SET next_attempt=? "
+                                       "WHERE status='pending'", (time.time(),))
+        if observatoryAPIs.simulate is True:
+            log.debug('Simulated KTL backend in use, not submitting API records')
+            return self.counts()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while deadline is None or time.monotonic() < deadline:
+            record = self.claim()
+            if record is None:
+                break
+            self.submit(record)
+        return self.counts()
+
+    def retry_failed(self):
+        '''Return failed records to the queue with their attempts reset.'''
+        with self.lock:
+            cursor = self.connect().execute("UPDATE records SET status='pending', attempts=0, "
+                                            "next_attempt=? WHERE status='failed'",
+                                            (time.time(),))
+        self.wake.set()
+        return cursor.rowcount
+
+    def discard_failed(self):
+        '''Delete the failed records, releasing the records they hold back.'''
+        with self.lock:
+            cursor = self.connect().execute("DELETE FROM records WHERE status='failed'")
+        self.wake.set()
+        return cursor.rowcount
+
+    def purge(self, older_than=7*24*3600):
+        '''Delete records which were sent more than older_than seconds ago.'''
+        with self.lock:
+            cursor = self.connect().execute("DELETE FROM records WHERE status='sent' AND sent < ?",
+                                            (time.time() - older_than,))
+        return cursor.rowcount
+
+    ##-------------------------------------------
+    ## Background submission
+    ##-------------------------------------------
+    def start(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.stopping = False
+                self.worker = threading.Thread(target=self.run, daemon=True,
+                                               name='outbox')
+                self.worker.start()
+                atexit.register(self.stop)
+
+    def run(self):
+        while self.stopping is False:
+            try:
+                self.idle.clear()
+                self.flush()
+                self.idle.set()
+                wait = self.next_due()
+                self.wake.wait(timeout=min(wait, 60) if wait is not None else 60)
+                self.wake.clear()
+            except Exception as e:
+                log.error(f"Outbox submission error: {e}")
+                self.wake.wait(timeout=self.backoff)
+                self.wake.clear()
+
+    def wait_idle(self, timeout=None):
+        '''Wait for the background thread to work through the records which
+        are due.
+        '''
+        self.wake.set()
+        time.sleep(0)
+        return self.idle.wait(timeout=timeout)
+
+    def stop(self):
+        '''Stop the background thread, after giving it up to exit_timeout
+        seconds to submit the records which are due.
+        '''
+        if self.worker is None:
+            return
+        self.stopping = True
+        self.wake.set()
+        self.worker.join(timeout=self.exit_timeout)
+        pending = self.counts()['pending']
+        if pending > 0:
+            log.warning(f"{pending} records left in the outbox {self.outbox_file}")
+
+
+def record_key(api, query, data):
+    return hashlib.sha256(f"{api}/{query}/{data}".encode()).hexdigest()
+
+
+outbox = None
+
+
+def get_outbox():
+    global outbox
+    if outbox is None:
+        outbox = Outbox()
+    return outbox
@@ -0,0 +1,282 @@
+import os
+import time
+import json
+import sqlite3
+import datetime
+import threading
+from bisect import bisect_right
+from pathlib import Path
+
+from kpf import log, cfg
+from kpf import observatoryAPIs
+
+
+def night_interval(entry):
+    '''UT start and end of a schedule entry. The Date is the (HST) date the
+    night begins, the StartTime and EndTime are UT on the following day.
+    '''
+    date = datetime.datetime.strptime(entry['Date'], '%Y-%m-%d')
+    date += datetime.timedelta(days=1)
+    h, m = entry['StartTime'].split(':')[:2]
+    start = date + datetime.timedelta(hours=int(h), minutes=int(m))
+    h, m = entry['EndTime'].split(':')[:2]
+    end = date + datetime.timedelta(hours=int(h), minutes=int(m))
+    if end < start:
+        end += datetime.timedelta(days=1)
+    return start, end
+
+
+##-------------------------------------------------------------------------
+## IntervalIndex
+##-------------------------------------------------------------------------
+class IntervalIndex(object):
+    '''Schedule entries sorted by start time, with the running maximum of
+    their end times, so the entries covering a time are found by bisection
+    rather than by scanning the whole schedule.
+    '''
+    def __init__(self, entries):
+        intervals = []
+        for entry in entries:
+            try:
+                intervals.append((*night_interval(entry), entry))
+            except Exception:
+                continue
+        intervals.sort(key=lambda i: i[0])
+        self.starts = [i[0] for i in intervals]
+        self.intervals = intervals
+        self.max_end = []
+        latest = None
+        for start, end, entry in intervals:
+            latest = end if latest is None or end > latest else latest
+            self.max_end.append(latest)
+
+    def at(self, t):
+        '''Entries whose interval contains t (in order of start time).'''
+        found = []
+        j = bisect_right(self.starts, t) - 1
+        while j >= 0 and self.max_end[j] >= t:
+            start, end, entry = self.intervals[j]
+            if end >= t:
+                found.append(entry)
+            j -= 1
+        return found[::-1]
+
+
+##-------------------------------------------------------------------------
+## ScheduleStore
+##-------------------------------------------------------------------------
+class ScheduleStore(object):
+    '''Local copy of the telescope schedule from the observatory schedule
+    API (getSchedule), kept per night in an SQLite file.
+
+    A lookup only queries the API for the nights in the requested range
+    which are missing or out of date, contiguous nights are fetched in one
+    query. How long a night is trusted depends on when it is: nights which
+    have passed rarely change (past_ttl), the next near_days nights may be
+    swapped at short notice (ttl), and nights further ahead are refreshed
+    occasionally (future_ttl). If the API can not be reached the stored
+    nights are used regardless of age.
+
+    Nights are also held in memory, with an interval index per telescope
+    so "which program is scheduled at time t" does not scan the semester.
+    '''
+    def __init__(self, cache_file=None, ttl=None, future_ttl=None, past_ttl=None,
+                 near_days=None):
+        if cache_file is None:
+            cache_file = os.getenv('KPF_SCHEDULE_CACHE', default=None)
+        if cache_file is None:
+            cache_file = cfg.get('schedule', 'cache_file',
+                                 fallback='~/.kpftranslator/schedule.sqlite')
+        self.cache_file = Path(cache_file).expanduser()
+        self.ttl = ttl if ttl is not None else\
+                   cfg.getfloat('schedule', 'ttl', fallback=900)
+        self.future_ttl = future_ttl if future_ttl is not None else\
+                          cfg.getfloat('schedule', 'future_ttl', fallback=21600)
+        self.past_ttl = past_ttl if past_ttl is not None else\
+                        cfg.getfloat('schedule', 'past_ttl', fallback=2592000)
+        self.near_days = near_days if near_days is not None else\
+                         cfg.getint('schedule', 'near_days', fallback=2)
+        self.lock = threading.RLock()
+        self.connection = None
+        self.nights = {} # (telnr, date) : (checked, [entries])
+        self.loaded = set()
+        self.indices = {}
+        self.stats = {'hits': 0, 'queries': 0, 'nights': 0, 'stale': 0}
+
+    def connect(self):
+        '''Open (once) the schedule database, creating it if needed.'''
+        with self.lock:
+            if self.connection is None:
+                self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+                self.connection = sqlite3.connect(self.cache_file, timeout=10,
+                                                  check_same_thread=False)
+                self.connection.execute('''CREATE TABLE IF NOT EXISTS nights
+                                           (telnr INTEGER, date TEXT, checked REAL,
+                                            entries TEXT, PRIMARY KEY (telnr, date))''')
+                self.connection.commit()
+            return self.connection
+
+    def load(self, telnr):
+        '''Read the stored nights for a telescope (once).'''
+        with self.lock:
+            if telnr in self.loaded:
+                return
+            try:
+                rows = self.connect().execute('SELECT date, checked, entries FROM nights '
+                                              'WHERE telnr=?', (telnr,)).fetchall()
+            except Exception as e:
+                log.debug(f"Unable to read schedule cache {self.cache_file}: {e}")
+                rows = []
+            for date, checked, entries in rows:
+                try:
+                    self.nights[(telnr, date)] = (float(checked), json.loads(entries))
+                except Exception as e:
+                    # A corrupt night is fetched again
+                    log.debug(f"Unable to read stored schedule for {date}: {e}")
+            self.loaded.add(telnr)
+            self.indices.pop(telnr, None)
+
+    def max_age(self, date, today):
+        if date < today:
+            return self.past_ttl
+        elif date <= today + datetime.timedelta(days=self.near_days):
+            return self.ttl
+        else:
+            return self.future_ttl
+
+    def stale_ranges(self, dates, telnr, refresh=False):
+        '''Contiguous runs of dates which need to be fetched.'''
+        now = time.time()
+        today = (datetime.datetime.utcnow() - datetime.timedelta(hours=10)).date()
+        ranges = []
+        for date in dates:
+            night = self.nights.get((telnr, date.strftime('%Y-%m-%d')), None)
+            if refresh is True or night is None or now - night[0] > self.max_age(date, today):
+                if len(ranges) > 0 and ranges[-1][1] == date - datetime.timedelta(days=1):
+                    ranges[-1][1] = date
+                else:
+                    ranges.append([date, date])
+        return ranges
+
+    def fetch(self, first, last, telnr):
+        '''Query the API for a range of nights and store the result.'''
+        numdays = (last - first).days + 1
+        params = {'date': first.strftime('%Y-%m-%d'),
+                  'numdays': numdays,
+                  'telnr': telnr,
+                  'instrument': 'KPF'}
+        self.stats['queries'] += 1
+        result = observatoryAPIs.query_observatoryAPI('schedule', 'getSchedule', params)
+        if not isinstance(result, list):
+            raise Exception(f"getSchedule returned {result}")
+        now = time.time()
+        nights = {(first + datetime.timedelta(days=i)).strftime('%Y-%m-%d'): []
+                  for i in range(numdays)}
+        for entry in result:
+            date = str(entry.get('Date', ''))[:10]
+            if date not in nights.keys():
+                # Keep it with the range it came from
+                date = first.strftime('%Y-%m-%d')
+            nights[date].append(entry)
+        with self.lock:
+            for date, entries in nights.items():
+                self.nights[(telnr, date)] = (now, entries)
+            self.indices.pop(telnr, None)
+            self.stats['nights'] += numdays
+            # Don't persist the (empty) schedule of the simulated backend
+            if observatoryAPIs.simulate is True:
+                return
+            try:
+                connection = self.connect()
+                connection.executemany('INSERT OR REPLACE INTO nights VALUES (?, ?, ?, ?)',
+                                       [(telnr, date, now, json.dumps(entries))
+                                        for date, entries in nights.items()])
+                connection.commit()
+            except Exception as e:
+                log.debug(f"Unable to write schedule cache {self.cache_file}: {e}")
+
+    def get(self, start, numdays, telnr=1, refresh=False):
+        '''Schedule entries for numdays nights beginning on the date of
+        start, refreshing the nights which are out of date.
+
+        Parameters
+        ----------
+        start : datetime.date or datetime.datetime
+        numdays : int
+        telnr : int
+        refresh : bool
+            Query the API even if the stored nights are recent.
+
+        Returns
+        -------
+        List
+            The schedule entries, in the order of the nights.
+        '''
+        telnr = int(telnr)
+        if isinstance(start, datetime.datetime):
+            start = start.date()
+        dates = [start + datetime.timedelta(days=i) for i in range(int(numdays))]
+        self.load(telnr)
+        with self.lock:
+            ranges = self.stale_ranges(dates, telnr, refresh=refresh)
+            if len(ranges) == 0:
+                self.stats['hits'] += 1
+            for first, last in ranges:
+                try:
+                    self.fetch(first, last, telnr)
+                except Exception as e:
+                    self.stats['stale'] += 1
+                    log.error(f"Unable to query schedule for {first} to {last}: {e}")
+                    log.error(f"Using stored schedule where available")
+            entries = []
+            for date in dates:
+                checked, night = self.nights.get((telnr, date.strftime('%Y-%m-%d')), (None, []))
+                entries.extend(night)
+        return entries
+
+    def tonight(self, telnr=1, refresh=False):
+        '''Schedule entries for the night which started most recently (by UT
+        date).
+        '''
+        start = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+        return self.get(start, 1, telnr=telnr, refresh=refresh)
+
+    def at(self, t=None, telnr=1, refresh=False):
+        '''Schedule entries whose start and end times (UT) include t, to the
+        minute as in the schedule.
+        '''
+        if t is None:
+            t = datetime.datetime.utcnow()
+        t = t.replace(second=0, microsecond=0)
+        telnr = int(telnr)
+        self.get(t - datetime.timedelta(days=1), 1, telnr=telnr, refresh=refresh)
+        with self.lock:
+            index = self.indices.get(telnr, None)
+            if index is None:
+                entries = [e for (n, date), (checked, night) in sorted(self.nights.items())
+                           if n == telnr for e in night]
+                index = IntervalIndex(entries)
+                self.indices[telnr] = index
+        return index.at(t)
+
+    def invalidate(self):
+        '''Forget the stored schedule.'''
+        with self.lock:
+            self.nights = {}
+            self.loaded = set()
+            self.indices = {}
+            try:
+                self.connect().execute('DELETE FROM nights')
+                self.connection.commit()
+            except Exception as e:
+                log.debug(f"Unable to clear schedule cache {self.cache_file}: {e}")
+
+
+store = None
+
+
+def get_schedule_store():
+    global store
+    if store is None:
+        store = ScheduleStore()
+    return store
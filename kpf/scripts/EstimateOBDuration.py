@@ -2,7 +2,9 @@ import numpy as np
 
 from kpf import log, cfg
 from kpf.exceptions import *
+from kpf.metadata import get_value
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.ObservingBlocks import memoize
 from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
 from kpf.calbench import standardize_lamp_name
 
@@ -18,7 +20,37 @@ def get_readout_time(sequences, cfg, fast=False):
     return max(readouts)
 
 
-def estimate_calibration_time(calibrations, cfg, fast=False):
+lamps_that_need_warmup = ['FF_FIBER', 'BRDBANDFIBER', 'TH_DAILY',
+                          'TH_GOLD', 'U_DAILY', 'U_GOLD']
+
+
+def get_warm_up_time(lamp, cfg):
+    '''Warm up time in seconds of a lamp, from its kpflamps threshold
+    keyword (through the metadata cache) or the configured default.
+    '''
+    fallback = cfg.getfloat('time_estimates', 'lamp_warmup', fallback=1800)
+    try:
+        return float(get_value('kpflamps', f'{lamp}_THRESHOLD', fallback=fallback))
+    except Exception:
+        return fallback
+
+
+def time_estimates():
+    '''The [time_estimates] configuration, as a key for the memoised
+    estimates below, which read it.
+    '''
+    if not cfg.has_section('time_estimates'):
+        return ()
+    return tuple(sorted(cfg.items('time_estimates')))
+
+
+@memoize
+def calibration_time(calibrations, warm_up_times, estimates, fast=False):
+    '''Estimated duration in seconds of the calibrations, given the warm up
+    time of each lamp, and the warm up waits included in it as (lamp,
+    seconds). Memoised on the content of the calibrations and on estimates
+    (see time_estimates).
+    '''
     duration = 0
     readout = get_readout_time(calibrations, cfg, fast=fast)
 
@@ -37,32 +69,41 @@ def estimate_calibration_time(calibrations, cfg, fast=False):
     duration += cfg.getfloat('time_estimates', 'FIU_mode_change',
                         fallback=20)
     # Execute Calibrations
-    lamps_that_need_warmup = ['FF_FIBER', 'BRDBANDFIBER', 'TH_DAILY',
-                              'TH_GOLD', 'U_DAILY', 'U_GOLD']
+    warm_up_times = dict(warm_up_times)
+    waits = []
     for cal in calibrations:
         lamp = standardize_lamp_name(cal.get('CalSource'))
         # Move Octagon
         duration += cfg.getfloat('time_estimates', 'octagon_move',
                             fallback=60)
-        if lamp in lamps_that_need_warmup:
+        if lamp in warm_up_times.keys():
             # Add warm up time
-            try:
-                import ktl
-                warm_up = kpflamps[f'{lamp}_THRESHOLD'].read(binary=True)
-            except:
-                warm_up = cfg.getfloat('time_estimates', 'lamp_warmup',
-                                  fallback=1800)
+            warm_up = warm_up_times.pop(lamp)
             if duration < warm_up:
                 warm_up_wait = warm_up-duration
-                print(f"# {lamp} warm up {warm_up_wait/60:.0f} min")
+                waits.append((lamp, warm_up_wait))
                 duration += warm_up_wait
-            lamps_that_need_warmup.pop(lamps_that_need_warmup.index(lamp))
         duration += int(cal.get('nExp'))*(float(cal.get('ExpTime'))+readout)
 
+    return duration, waits
+
+
+def estimate_calibration_time(calibrations, cfg, fast=False):
+    lamps = set([standardize_lamp_name(cal.get('CalSource')) for cal in calibrations])
+    warm_up_times = tuple([(lamp, get_warm_up_time(lamp, cfg))
+                           for lamp in lamps_that_need_warmup if lamp in lamps])
+    duration, waits = calibration_time(calibrations, warm_up_times,
+                                       time_estimates(), fast=fast)
+    for lamp, warm_up_wait in waits:
+        print(f"# {lamp} warm up {warm_up_wait/60:.0f} min")
     return duration
 
 
-def estimate_observation_time(observations, cfg, fast=False):
+@memoize
+def observation_time(observations, estimates, fast=False):
+    '''Estimated duration in seconds of the observations. Memoised on the
+    content of the observations and on estimates (see time_estimates).
+    '''
     duration = 0
     readout = get_readout_time(observations, cfg, fast=fast)
     # Configure FIU and slew
@@ -79,6 +120,21 @@ def estimate_observation_time(observations, cfg, fast=False):
     return duration
 
 
+def estimate_observation_time(observations, cfg, fast=False):
+    return observation_time(observations, time_estimates(), fast=fast)
+
+
+def estimate_duration(calibrations, observations, fast=False):
+    '''Estimated duration in seconds of the calibrations and observations of
+    an OB.
+    '''
+    duration = 0
+    if calibrations is not None:
+        duration += estimate_calibration_time(calibrations, cfg, fast=fast)
+    if observations is not None:
+        duration += estimate_observation_time(observations, cfg, fast=fast)
+    return duration
+
 
 ##-----------------------------------------------------------------------------
 ## EstimateOBDuration
@@ -106,13 +162,7 @@ class EstimateOBDuration(KPFScript):
         if OB is not None and type(OB) != ObservingBlock:
             OB = ObservingBlock(OB)
         fast = args.get('fast', False)
-        duration = 0
-
-        if OB.Calibrations is not None:
-            duration += estimate_calibration_time(OB.Calibrations, cfg, fast=fast)
-
-        if OB.Observations is not None:
-            duration += estimate_observation_time(OB.Observations, cfg, fast=fast)
+        duration = estimate_duration(OB.Calibrations, OB.Observations, fast=fast)
 
         if args.get('verbose', False):
             decimal_minutes = duration / 60
@@ -19,12 +19,9 @@ from kpf.calbench.SetLFCtoStandbyHigh import SetLFCtoStandbyHigh
 from kpf.calbench.SetND1 import SetND1
 from kpf.calbench.SetND2 import SetND2
 from kpf.calbench.TakeIntensityReading import TakeIntensityReading
-from kpf.calbench.WaitForCalSource import WaitForCalSource
-from kpf.calbench.WaitForFlatFieldFiberPos import WaitForFlatFieldFiberPos
+from kpf.calbench.WaitForCalBench import WaitForCalBench
 from kpf.calbench.WaitForLampWarm import WaitForLampWarm
 from kpf.calbench.WaitForLFCReady import WaitForLFCReady
-from kpf.calbench.WaitForND1 import WaitForND1
-from kpf.calbench.WaitForND2 import WaitForND2
 from kpf.spectrograph.QueryFastReadMode import QueryFastReadMode
 from kpf.spectrograph.SetObject import SetObject
 from kpf.spectrograph.SetExpTime import SetExpTime
@@ -74,12 +71,9 @@ class ExecuteCal(KPFFunction):
     - `kpf.calbench.SetND1`
     - `kpf.calbench.SetND2`
     - `kpf.calbench.TakeIntensityReading`
-    - `kpf.calbench.WaitForCalSource`
-    - `kpf.calbench.WaitForFlatFieldFiberPos`
+    - `kpf.calbench.WaitForCalBench`
     - `kpf.calbench.WaitForLampWarm`
     - `kpf.calbench.WaitForLFCReady`
-    - `kpf.calbench.WaitForND1`
-    - `kpf.calbench.WaitForND2`
     - `kpf.spectrograph.QueryFastReadMode`
     - `kpf.spectrograph.SetObject`
     - `kpf.spectrograph.SetExpTime`
@@ -132,8 +126,8 @@ class ExecuteCal(KPFFunction):
             SetFlatFieldFiberPos.execute({'FF_FiberPos': 'Blank', 'wait': False})
             SetTargetInfo.execute({})
             log.info(f"Waiting for Octagon/CalSource, FF_FiberPos, FIU")
-            WaitForCalSource.execute({'CalSource': 'Home'})
-            WaitForFlatFieldFiberPos.execute({'FF_FiberPos': 'Blank'})
+            WaitForCalBench.execute({'CalSource': 'Home',
+                                     'FF_FiberPos': 'Blank'})
         elif calsource == 'WideFlat':
             log.info('Configuring for WideFlat')
             SetCalSource.execute({'CalSource': 'Home', 'wait': False})
@@ -142,8 +136,8 @@ class ExecuteCal(KPFFunction):
                                           'wait': False})
             SetTargetInfo.execute({})
             log.info(f"Waiting for Octagon/CalSource, FF_FiberPos, FIU")
-            WaitForCalSource.execute({'CalSource': 'Home'})
-            WaitForFlatFieldFiberPos.execute(calibration)
+            WaitForCalBench.execute({'CalSource': 'Home',
+                                     'FF_FiberPos': FF_FiberPos})
         ## Setup Octagon Lamps and LFCFiber
         elif calsource in ['BrdbandFiber', 'U_gold', 'U_daily', 'Th_daily',
                            'Th_gold', 'LFCFiber', 'EtalonFiber']:
@@ -156,9 +150,8 @@ class ExecuteCal(KPFFunction):
             SetND2.execute({'CalND2': nd2, 'wait': False})
             SetTargetInfo.execute({})
             log.info(f"Waiting for Octagon/CalSource, ND1, ND2, FIU")
-            WaitForND1.execute(calibration)
-            WaitForND2.execute(calibration)
-            WaitForCalSource.execute(calibration)
+            WaitForCalBench.execute({'CalSource': calsource,
+                                     'CalND1': nd1, 'CalND2': nd2})
             if calsource == 'LFCFiber':
                 ## If we're using the LFC, set it to AstroComb
                 ## If that fails, skip this calibration
@@ -201,9 +194,8 @@ class ExecuteCal(KPFFunction):
             SetND1.execute({'CalND1': nd1, 'wait': False})
             SetND2.execute({'CalND2': nd2, 'wait': False})
             log.info(f"Waiting for Octagon/CalSource, ND1, ND2, FIU")
-            WaitForND1.execute(calibration)
-            WaitForND2.execute(calibration)
-            WaitForCalSource.execute({'CalSource': calibration})
+            WaitForCalBench.execute({'CalSource': calsource,
+                                     'CalND1': nd1, 'CalND2': nd2})
             # Set target info
             SetTargetInfo.execute({'TargetName': 'Sun',
                                    'GaiaID': '',
@@ -223,9 +215,8 @@ class ExecuteCal(KPFFunction):
             SetND1.execute({'CalND1': nd1, 'wait': False})
             SetND2.execute({'CalND2': nd2, 'wait': False})
             log.info(f"Waiting for Octagon/CalSource, ND1, ND2, FIU")
-            WaitForND1.execute(calibration)
-            WaitForND2.execute(calibration)
-            WaitForCalSource.execute({'CalSource': simulcalsource})
+            WaitForCalBench.execute({'CalSource': simulcalsource,
+                                     'CalND1': nd1, 'CalND2': nd2})
             # Open SoCalSci Shutter
             calibration['OpenSoCalSciShutter'] = True
             # Set target info
@@ -23,8 +23,7 @@ from kpf.spectrograph.WaitForReady import WaitForReady
 from kpf.spectrograph.WaitForReadout import WaitForReadout
 from kpf.calbench.SetND1 import SetND1
 from kpf.calbench.SetND2 import SetND2
-from kpf.calbench.WaitForND1 import WaitForND1
-from kpf.calbench.WaitForND2 import WaitForND2
+from kpf.calbench.WaitForND import WaitForND
 from kpf.calbench.PredictNDFilters import PredictNDFilters
 from kpf.expmeter.PredictExpMeterParameters import PredictExpMeterParameters
 from kpf.expmeter.SetExpMeterExpTime import SetExpMeterExpTime
@@ -67,8 +66,7 @@ class ExecuteSci(KPFFunction):
     - `kpf.spectrograph.WaitForReadout`
     - `kpf.calbench.SetND1`
     - `kpf.calbench.SetND2`
-    - `kpf.calbench.WaitForND1`
-    - `kpf.calbench.WaitForND2`
+    - `kpf.calbench.WaitForND`
     - `kpf.calbench.PredictNDFilters`
     - `kpf.expmeter.PredictExpMeterParameters`
     - `kpf.expmeter.SetExpMeterExpTime`
@@ -131,8 +129,7 @@ class ExecuteSci(KPFFunction):
                 observation['CalND2'] = result['CalND2']
             SetND1.execute({'CalND1': observation['CalND1'], 'wait': False})
             SetND2.execute({'CalND2': observation['CalND2'], 'wait': False})
-            WaitForND1.execute(observation)
-            WaitForND2.execute(observation)
+            WaitForND.execute(observation)
 
         check_scriptstop() # Stop here if requested
 
@@ -25,7 +25,7 @@ from kpf.scripts.WaitForConfigureScience import WaitForConfigureScience
 from kpf.scripts.ExecuteSci import ExecuteSci
 from kpf.scripts.CleanupAfterScience import CleanupAfterScience
 from kpf.spectrograph.SetProgram import SetProgram
-from kpf.observatoryAPIs import addObservingBlockHistory
+from kpf.observatoryAPIs import queueObservingBlockHistory
 from kpf.observatoryAPIs.GetCurrentScheduledProgram import GetCurrentScheduledProgram
 
 
@@ -60,7 +60,7 @@ class RunOB(KPFScript):
     - `kpf.scripts.ExecuteSci`
     - `kpf.scripts.CleanupAfterScience`
     - `kpf.spectrograph.SetProgram`
-    - `kpf.observatoryAPIs.addObservingBlockHistory`
+    - `kpf.observatoryAPIs.queueObservingBlockHistory`
     '''
     @classmethod
     def pre_condition(cls, args, OB=None):
@@ -288,10 +288,10 @@ class RunOB(KPFScript):
                     log.debug(history)
                     if OB.OBID != '':
                         history['id'] = OB.OBID
-                        log.info('Submitting execution history to KPFCC API')
+                        log.info('Queueing execution history for the KPFCC API')
                         log.debug(f"  {history['id']}")
-                        result = addObservingBlockHistory(history)
-                        log.debug(f"KPFCC API Response: {result}")
+                        key = queueObservingBlockHistory(history)
+                        log.debug(f"Outbox record: {key}")
                     if scriptstop:
                         raise ScriptStopTriggered("SCRIPTSTOP triggered")
                 except ScriptStopTriggered as scriptstop:
@@ -9,24 +9,23 @@ import ktl
 from kpf import log, cfg
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
-from kpf.calbench.WaitForCalSource import WaitForCalSource
-from kpf.fiu.WaitForConfigureFIU import WaitForConfigureFIU
-from kpf.spectrograph.WaitForReady import WaitForReady
+from kpf.wait import CompositeWait, fiu_mode_is
 
 
 class WaitForConfigureScience(KPFScript):
     '''Script which waits for the instrument to be configured for Science
     observations.
 
+    The octagon, FIU, and detectors are waited on concurrently, so the worst
+    case is the longest of the timeouts rather than their sum. Raises if any
+    of them did not arrive.
+
     KTL Keywords Used:
 
     - `kpfconfig.SIMULCALSOURCE`
-
-    Functions Called:
-
-    - `kpf.calbench.WaitForCalSource`
-    - `kpf.fiu.WaitForConfigureFIU`
-    - `kpf.spectrograph.WaitForReady`
+    - `kpfcal.OCTAGON`
+    - `kpffiu.MODE`
+    - `kpfexpose.EXPOSE`
     '''
     @classmethod
     def pre_condition(cls, args, OB=None):
@@ -36,9 +35,20 @@ class WaitForConfigureScience(KPFScript):
     def perform(cls, args, OB=None):
         kpfconfig = ktl.cache('kpfconfig')
         calsource = kpfconfig['SIMULCALSOURCE'].read()
-        WaitForCalSource.execute({'CalSource': calsource})
-        WaitForConfigureFIU.execute({'mode': 'Observing'})
-        WaitForReady.execute({})
+        fiu_times = [cfg.getfloat('times', 'fiu_fold_mirror_move_time', fallback=40),
+                     cfg.getfloat('times', 'fiu_hatch_move_time', fallback=2)]
+        read_times = [cfg.getfloat('time_estimates', 'readout_red', fallback=60),
+                      cfg.getfloat('time_estimates', 'readout_green', fallback=60)]
+        buffer_time = cfg.getfloat('times', 'readout_buffer_time', fallback=10)
+        waits = CompositeWait()
+        waits.add('kpfcal', 'OCTAGON', calsource,
+                  timeout=cfg.getfloat('times', 'octagon_move_time', fallback=60))
+        waits.add('kpffiu', 'MODE', fiu_mode_is('Observing'),
+                  timeout=max(fiu_times),
+                  description='kpffiu.MODE includes Observing')
+        waits.add('kpfexpose', 'EXPOSE', 'Ready',
+                  timeout=max(read_times)+buffer_time)
+        waits.wait_or_raise()
 
     @classmethod
     def post_condition(cls, args, OB=None):
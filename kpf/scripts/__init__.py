@@ -11,7 +11,7 @@ import re
 
 import ktl
 
-from kpf import log, cfg
+from kpf import log, cfg, get_login
 from kpf.exceptions import *
 
 
@@ -67,7 +67,7 @@ def set_script_keywords(scriptname, PID):
     log.debug(f"Registering script {scriptname} with PID {PID}")
     kpfconfig['SCRIPTNAME'].write(scriptname)
     kpfconfig['SCRIPTPID'].write(PID)
-    user_at_host = f"{os.getlogin()}@{socket.gethostname()}"
+    user_at_host = f"{get_login()}@{socket.gethostname()}"
     kpfconfig['SCRIPTHOST'].write(user_at_host)
 
 
@@ -0,0 +1,548 @@
+'''Simulated KTL keyword backend.
+
+This module implements the subset of the `ktl` API which the translator uses
+(`ktl.cache`, `ktl.waitFor`, `ktl.read`, `ktl.write`, and the `read`, `write`,
+`waitFor`, `monitor`, `callback`, and `_getEnumerators` methods of keywords)
+on top of an in-process model of the keyword services. The model, including
+enumerators, initial values, motion latencies, and the side effects of writes
+(e.g. starting an exposure) is read from `keyword_model.yaml`.
+
+Setting the KPF_SIMULATE environment variable makes `import ktl` anywhere in
+the translator return this module instead of the real ktl (see
+kpf/__init__.py). KPF_SIMULATE_MODEL points to an alternate model file and
+KPF_SIMULATE_TIME_SCALE scales all simulated latencies (e.g. 0.01 to run
+scripts 100 times faster than real time). Timeouts passed to waitFor are
+scaled as well, but time.sleep calls in the translator itself are not.
+KPF_SIMULATE_READ_LATENCY adds a delay (in seconds) to each keyword read to
+mimic the round trip to a real KTL service.
+'''
+import os
+import re
+import time
+import threading
+import heapq
+import itertools
+from pathlib import Path
+
+from kpf import log, lazy_import
+
+yaml = lazy_import('yaml')
+
+
+##-------------------------------------------------------------------------
+## Expression evaluation
+##-------------------------------------------------------------------------
+token_re = re.compile(r'''\s*(?:
+    (?P<keyword>\$[A-Za-z_]\w*\.[A-Za-z_]\w*)|
+    (?P<string>'[^']*'|"[^"]*")|
+    (?P<number>[-+]?\d+\.?\d*(?:[eE][-+]?\d+)?)|
+    (?P<op>==|!=|<=|>=|<|>|\(|\)|\+|-|\*|/)|
+    (?P<word>[^\s()'"=!<>]+)
+    )''', re.X)
+
+
+def compile_expression(expr):
+    '''Translate a KTL expression such as
+    `($kpfexpose.EXPOSE == Ready) and ($kpfcal.ND1POS == 'OD 0.1')`
+    in to python source. Keyword references become `_kw(service, keyword)`
+    calls, bare words become strings, and "and", "or", "not" are kept.
+
+    Returns
+    -------
+    Tuple[str, List[Tuple[str, str]]]
+        The python source and the keywords referenced.
+    '''
+    source = []
+    keywords = []
+    position = 0
+    expr = expr.strip()
+    while position < len(expr):
+        match = token_re.match(expr, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Unable to parse expression: {expr}")
+        position = match.end()
+        kind = match.lastgroup
+        token = match.group(kind)
+        if kind == 'keyword':
+            service, keyword = token[1:].split('.')
+            keywords.append((service, keyword))
+            source.append(f"_kw({service!r}, {keyword!r})")
+        elif kind == 'word':
+            if token.lower() in ['and', 'or', 'not']:
+                source.append(token.lower())
+            else:
+                source.append(repr(token))
+        else:
+            source.append(token)
+    return ' '.join(source), keywords
+
+
+class KeywordValue(object):
+    '''Value of a keyword inside an expression. Comparisons against numbers
+    use the binary value, comparisons against strings use the ascii value
+    (case insensitive for enumerated keywords).
+    '''
+    __slots__ = ['keyword']
+
+    def __init__(self, keyword):
+        self.keyword = keyword
+
+    def _pair(self, other):
+        if isinstance(other, KeywordValue):
+            other = other.keyword.binary
+        if isinstance(other, (int, float)):
+            binary = self.keyword.binary
+            if isinstance(binary, str):
+                try:
+                    binary = float(binary)
+                except ValueError:
+                    return binary, str(other)
+            return binary, other
+        mine = self.keyword.ascii
+        if self.keyword.type in ['enumerated', 'boolean']:
+            return mine.lower(), str(other).lower()
+        return mine, str(other)
+
+    def __eq__(self, other):
+        a, b = self._pair(other)
+        return a == b
+
+    def __ne__(self, other):
+        a, b = self._pair(other)
+        return a != b
+
+    def __lt__(self, other):
+        a, b = self._pair(other)
+        return a < b
+
+    def __le__(self, other):
+        a, b = self._pair(other)
+        return a <= b
+
+    def __gt__(self, other):
+        a, b = self._pair(other)
+        return a > b
+
+    def __ge__(self, other):
+        a, b = self._pair(other)
+        return a >= b
+
+    def __float__(self):
+        return float(self.keyword.binary)
+
+    def __add__(self, other):
+        return float(self) + other
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return float(self) - other
+
+    def __rsub__(self, other):
+        return other - float(self)
+
+    def __mul__(self, other):
+        return float(self) * other
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return float(self) / other
+
+
+##-------------------------------------------------------------------------
+## Keyword model
+##-------------------------------------------------------------------------
+class Keyword(object):
+    '''A simulated KTL keyword.'''
+    def __init__(self, simulator, service, name, definition=None):
+        definition = definition or {}
+        self.simulator = simulator
+        self.service = service
+        self.name = name
+        self.full_name = f"{service}.{name}"
+        self.type = definition.get('type', 'string')
+        enumerators = definition.get('enumerators', None)
+        if enumerators is None and self.type == 'boolean':
+            enumerators = ['No', 'Yes']
+        self.enumerators = None if enumerators is None else [str(e) for e in enumerators]
+        self.latency = definition.get('latency', 0)
+        self.on_write = definition.get('on_write', {}) or {}
+        self.format = definition.get('format', None)
+        self.callbacks = []
+        self.monitored = False
+        self.counter = itertools.count(1)
+        self.ascii = None
+        self.binary = None
+        self.set_value(definition.get('value', self.default_value()))
+
+    def __repr__(self):
+        return f"<simulated keyword {self.full_name}={self.ascii}>"
+
+    def default_value(self):
+        return {'string': '', 'integer': 0, 'double': 0.0,
+                'enumerated': 0, 'boolean': False, 'array': []}.get(self.type, '')
+
+    def convert(self, value):
+        '''Return the (ascii, binary) pair for a value written to this
+        keyword, raising ValueError if it is not valid.
+        '''
+        if self.type in ['enumerated', 'boolean']:
+            if isinstance(value, bool) or isinstance(value, int):
+                index = int(value)
+            else:
+                value = str(value).strip()
+                lower = [e.lower() for e in self.enumerators]
+                if value.lower() in lower:
+                    index = lower.index(value.lower())
+                elif value.lstrip('-').isdigit():
+                    index = int(value)
+                else:
+                    raise ValueError(f"{value} is not a valid value for "
+                                     f"{self.full_name}: {self.enumerators}")
+            if index < 0 or index >= len(self.enumerators):
+                raise ValueError(f"{value} is not a valid value for "
+                                 f"{self.full_name}: {self.enumerators}")
+            binary = bool(index) if self.type == 'boolean' else index
+            return self.enumerators[index], binary
+        elif self.type == 'integer':
+            binary = int(float(value))
+            return str(binary), binary
+        elif self.type == 'array':
+            if isinstance(value, str):
+                value = value.split()
+            binary = tuple([float(v) for v in value])
+            return ' '.join([str(v) for v in binary]), binary
+        elif self.type == 'double':
+            binary = float(value)
+            ascii = str(binary) if self.format is None else self.format % binary
+            return ascii, binary
+        else:
+            return str(value), str(value)
+
+    def set_value(self, value):
+        self.ascii, self.binary = self.convert(value)
+
+    ## ktl.Keyword API
+    def read(self, binary=False, timeout=None, both=False):
+        self.simulator.round_trip()
+        with self.simulator.condition:
+            self.simulator.stats['reads'] += 1
+        self.simulator.advance()
+        if both is True:
+            return (self.binary, self.ascii)
+        return self.binary if binary is True else self.ascii
+
+    def write(self, value, wait=True, binary=False, timeout=None):
+        self.simulator.write(self, value, wait=wait)
+
+    def waitFor(self, expression, timeout=None):
+        return self.simulator.waitFor(f"${self.full_name} {expression}",
+                                      timeout=timeout)
+
+    waitfor = waitFor
+
+    def monitor(self, start=True, prime=True, wait=True):
+        self.monitored = start
+        if start is True:
+            self.simulator.start_broadcasts()
+
+    def subscribe(self, start=True, prime=True):
+        self.monitor(start=start, prime=prime)
+
+    def callback(self, function, remove=False, preferred=False):
+        if remove is True:
+            if function in self.callbacks:
+                self.callbacks.remove(function)
+        elif function not in self.callbacks:
+            self.callbacks.append(function)
+
+    def _getEnumerators(self):
+        self.simulator.round_trip()
+        return tuple(self.enumerators or [])
+
+    def __getitem__(self, key):
+        if key == 'ascii':
+            return self.read()
+        elif key == 'binary':
+            return self.read(binary=True)
+        elif key == 'enumerators':
+            return self._getEnumerators()
+        elif key == 'name':
+            return self.name
+        raise KeyError(key)
+
+    def __str__(self):
+        return str(self.ascii)
+
+
+class Service(object):
+    '''A simulated KTL service.'''
+    def __init__(self, simulator, name):
+        self.simulator = simulator
+        self.name = name
+
+    def __getitem__(self, keyword):
+        return self.simulator.get_keyword(self.name, keyword)
+
+    def __contains__(self, keyword):
+        return self.simulator.has_keyword(self.name, keyword)
+
+    def keywords(self):
+        return self.simulator.keyword_names(self.name)
+
+    def keys(self):
+        return self.keywords()
+
+    def read(self, keyword, binary=False, timeout=None):
+        return self[keyword].read(binary=binary)
+
+    def write(self, keyword, value, wait=True, binary=False, timeout=None):
+        return self[keyword].write(value, wait=wait)
+
+    def __repr__(self):
+        return f"<simulated service {self.name}>"
+
+
+class Simulator(object):
+    '''Holds the keyword model and a queue of timed keyword changes (e.g. a
+    filter wheel arriving at its destination or a detector finishing
+    readout). Pending changes are applied whenever a keyword is read or a
+    waitFor is evaluated, and waitFor sleeps until the next pending change or
+    until another thread writes a keyword. Once any keyword is monitored a
+    background thread also applies changes as they come due, so callbacks
+    fire without anyone reading the keyword, as with real broadcasts.
+    '''
+    def __init__(self, model_file=None, time_scale=None):
+        if model_file is None:
+            model_file = os.getenv('KPF_SIMULATE_MODEL', default=None)
+        if model_file is None:
+            model_file = Path(__file__).parent / 'keyword_model.yaml'
+        self.model_file = model_file
+        self.requested_time_scale = time_scale
+        self.services = {}
+        self.keywords = {}
+        self.pending = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition(threading.RLock())
+        self.broadcaster = None
+        self.stats = {'reads': 0, 'writes': 0, 'waits': 0, 'wait_time': 0,
+                      'timeouts': 0}
+
+    def __getattr__(self, name):
+        # The keyword model and the settings taken from it are read on first
+        # use, so selecting the simulated backend costs nothing at import
+        if name in ['model', 'time_scale', 'read_latency', 'latencies']:
+            self.load()
+            return self.__dict__[name]
+        raise AttributeError(f"{type(self).__name__} has no attribute {name}")
+
+    def load(self):
+        '''Read the keyword model (once).'''
+        with self.condition:
+            if 'model' in self.__dict__:
+                return
+            with open(self.model_file) as f:
+                model = yaml.safe_load(f)
+            time_scale = self.requested_time_scale
+            if time_scale is None:
+                time_scale = os.getenv('KPF_SIMULATE_TIME_SCALE', default=None)
+            if time_scale is None:
+                time_scale = model.get('time_scale', 1)
+            self.time_scale = float(time_scale)
+            read_latency = os.getenv('KPF_SIMULATE_READ_LATENCY', default=None)
+            if read_latency is None:
+                read_latency = model.get('read_latency', 0)
+            self.read_latency = float(read_latency)
+            self.latencies = model.get('latencies', {}) or {}
+            self.model = model
+
+    ## Keyword lookup
+    def definition(self, service, keyword):
+        service_model = self.model.get('services', {}).get(service, {}) or {}
+        definition = service_model.get('keywords', {}).get(keyword, None)
+        if definition is None:
+            for pattern, pattern_definition in (service_model.get('patterns', {}) or {}).items():
+                if re.fullmatch(pattern, keyword):
+                    return pattern_definition
+        return definition
+
+    def get_keyword(self, service, keyword):
+        # KTL keyword names are case insensitive
+        key = (service.lower(), keyword.upper())
+        with self.condition:
+            if key not in self.keywords:
+                definition = self.definition(*key)
+                if definition is None:
+                    log.debug(f"Simulator: {service}.{keyword} is not in the "
+                              f"model, treating it as a string keyword")
+                self.keywords[key] = Keyword(self, key[0], key[1], definition)
+            return self.keywords[key]
+
+    def has_keyword(self, service, keyword):
+        return self.definition(service.lower(), keyword.upper()) is not None
+
+    def keyword_names(self, service):
+        service_model = self.model.get('services', {}).get(service, {}) or {}
+        return list((service_model.get('keywords', {}) or {}).keys())
+
+    def get_service(self, service):
+        if service not in self.services:
+            self.services[service] = Service(self, service)
+        return self.services[service]
+
+    def round_trip(self):
+        '''Network round trip of a read from a real KTL service (not scaled).'''
+        if self.read_latency > 0:
+            time.sleep(self.read_latency)
+
+    ## Timed changes
+    def evaluate_number(self, value):
+        if isinstance(value, (int, float)):
+            return float(value)
+        source, keywords = compile_expression(str(value))
+        names = {'_kw': lambda s,k: self.get_keyword(s,k).binary}
+        names.update(self.latencies)
+        # Latency names appear as bare words, which compile_expression
+        # turns in to strings; put them back as names
+        for name in self.latencies:
+            source = source.replace(repr(name), name)
+        return float(eval(source, {'__builtins__': {}}, names))
+
+    def schedule(self, delay, keyword, value):
+        due = time.monotonic() + delay*self.time_scale
+        with self.condition:
+            heapq.heappush(self.pending, (due, next(self.sequence), keyword, value))
+            self.condition.notify_all()
+
+    def start_broadcasts(self):
+        with self.condition:
+            if self.broadcaster is None:
+                self.broadcaster = threading.Thread(target=self.broadcast,
+                                                    name='simulated broadcasts',
+                                                    daemon=True)
+                self.broadcaster.start()
+
+    def broadcast(self):
+        while True:
+            with self.condition:
+                wake = None
+                if len(self.pending) > 0:
+                    wake = self.pending[0][0] - time.monotonic()
+                if wake is None or wake > 0:
+                    self.condition.wait(wake)
+            self.advance()
+
+    def advance(self):
+        '''Apply all pending changes which are due.'''
+        fired = []
+        with self.condition:
+            now = time.monotonic()
+            while len(self.pending) > 0 and self.pending[0][0] <= now:
+                due, seq, keyword, value = heapq.heappop(self.pending)
+                self.apply(keyword, value)
+                fired.append(keyword)
+            if len(fired) > 0:
+                self.condition.notify_all()
+        for keyword in fired:
+            for callback in list(keyword.callbacks):
+                try:
+                    callback(keyword)
+                except Exception as e:
+                    log.debug(f"Simulator: callback on {keyword.full_name} failed: {e}")
+
+    def apply(self, keyword, value):
+        if isinstance(value, str) and '{' in value:
+            value = value.format(n=next(keyword.counter),
+                                 time=time.time(), keyword=keyword.ascii)
+        keyword.set_value(value)
+
+    def write(self, keyword, value, wait=True):
+        # Validate now so bad values raise in the caller as they would with
+        # the real dispatcher
+        ascii, binary = keyword.convert(value)
+        with self.condition:
+            self.stats['writes'] += 1
+            delay = self.evaluate_number(keyword.latency)
+            self.schedule(delay, keyword, ascii)
+            effects = keyword.on_write.get(ascii, None)
+            if effects is None:
+                effects = keyword.on_write.get('*', [])
+            for effect in effects:
+                target = effect.get('keyword', keyword.full_name)
+                service, name = target.format(name=keyword.name).split('.')
+                target = self.get_keyword(service, name)
+                effect_value = effect.get('value', ascii)
+                if effect_value == '$value':
+                    effect_value = ascii
+                elif isinstance(effect_value, str) and effect_value.startswith('$'):
+                    effect_value = self.evaluate_number(effect_value)
+                self.schedule(self.evaluate_number(effect.get('delay', 0)),
+                              target, effect_value)
+        self.advance()
+        if wait is True and delay > 0:
+            self.waitFor(f"${keyword.full_name} == {ascii!r}", timeout=delay+1)
+
+    ## Expressions
+    def evaluate(self, source):
+        names = {'_kw': lambda s,k: KeywordValue(self.get_keyword(s,k))}
+        return bool(eval(source, {'__builtins__': {}}, names))
+
+    def waitFor(self, expression, timeout=None):
+        '''Wait for an expression to become true. The timeout is in simulated
+        seconds, so it is scaled along with the latencies.
+        '''
+        source, keywords = compile_expression(expression)
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout*self.time_scale
+        self.stats['waits'] += 1
+        try:
+            while True:
+                self.advance()
+                with self.condition:
+                    if self.evaluate(source) is True:
+                        return True
+                    now = time.monotonic()
+                    if deadline is not None and now >= deadline:
+                        self.stats['timeouts'] += 1
+                        return False
+                    wake = deadline
+                    if len(self.pending) > 0:
+                        wake = self.pending[0][0] if wake is None else min(wake, self.pending[0][0])
+                    self.condition.wait(None if wake is None else max(wake-now, 0))
+        finally:
+            self.stats['wait_time'] += time.monotonic() - start
+
+
+simulator = Simulator()
+
+
+def __getattr__(name):
+    # ktl.time_scale (see kpf.wait.timeout_scale), read from the model
+    if name == 'time_scale':
+        return simulator.time_scale
+    raise AttributeError(f"module {__name__} has no attribute {name}")
+
+
+##-------------------------------------------------------------------------
+## ktl module API
+##-------------------------------------------------------------------------
+def cache(service, keyword=None):
+    if keyword is None:
+        return simulator.get_service(service)
+    return simulator.get_keyword(service, keyword)
+
+
+def read(service, keyword, binary=False, timeout=None):
+    return cache(service, keyword).read(binary=binary)
+
+
+def write(service, keyword, value, wait=True, binary=False, timeout=None):
+    return cache(service, keyword).write(value, wait=wait)
+
+
+def waitFor(expression, timeout=None):
+    return simulator.waitFor(expression, timeout=timeout)
+
+
+waitfor = waitFor
@@ -1,11 +1,11 @@
-from astropy.io import fits
-
 import ktl
 
-from kpf import log, cfg
+from kpf import log, cfg, lazy_import
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
 
+fits = lazy_import('astropy.io.fits')
+
 
 class WaitForL0File(KPFFunction):
     '''Wait a short time to see if `kpfassemble` writes a new L0 file.  If it
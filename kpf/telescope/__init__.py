@@ -1,6 +1,14 @@
-import ktl
+import numpy as np
 
-from kpf import cfg
+try:
+    import ktl
+except:
+    ktl = None
+
+from kpf import cfg, lazy_import
+
+coordinates = lazy_import('astropy.coordinates')
+u = lazy_import('astropy.units')
 
 
 def KPF_is_selected_instrument():
@@ -9,28 +17,48 @@ def KPF_is_selected_instrument():
     return INSTRUME in ['KPF', 'KPF-CC']
 
 
+def get_location():
+    '''The location of the telescope as an astropy EarthLocation (built from
+    the configuration rather than EarthLocation.of_site, which may need to
+    download the site list).
+    '''
+    return coordinates.EarthLocation.from_geodetic(
+                lon=cfg.getfloat('telescope', 'longitude', fallback=-155.47833)*u.deg,
+                lat=cfg.getfloat('telescope', 'latitude', fallback=19.82833)*u.deg,
+                height=cfg.getfloat('telescope', 'elevation', fallback=4160)*u.m)
+
+
 ##-------------------------------------------------------------------------
 ## Keck Horizon
 ##-------------------------------------------------------------------------
+def horizon(az):
+    '''From https://www2.keck.hawaii.edu/inst/common/TelLimits.html
+    Az 5.3 to 146.2, 33.3
+    Az Elsewhere, 18
+
+    Accepts scalars or arrays of azimuth in degrees.
+    '''
+    az = np.asarray(az)
+    return np.where((az >= 5.3) & (az <= 146.2), 33.3, 18.0)
+
+
 def above_horizon(az, el):
     '''From https://www2.keck.hawaii.edu/inst/common/TelLimits.html
     Az 5.3 to 146.2, 33.3
     Az Elsewhere, 18
+
+    Accepts scalars or arrays, returns a bool or a boolean array.
     '''
-    if az >= 5.3 and az <= 146.2:
-        horizon = 33.3
-    else:
-        horizon = 18
-    return el > horizon
+    result = np.asarray(el) > horizon(az)
+    return bool(result) if result.ndim == 0 else result
 
 
 def near_horizon(az, el, margin=5):
     '''From https://www2.keck.hawaii.edu/inst/common/TelLimits.html
     Az 5.3 to 146.2, 33.3
     Az Elsewhere, 18
+
+    Accepts scalars or arrays, returns a bool or a boolean array.
     '''
-    if az >= 5.3 and az <= 146.2:
-        horizon = 33.3 - margin
-    else:
-        horizon = 18 - margin
-    return el > horizon
+    result = np.asarray(el) > horizon(az) - margin
+    return bool(result) if result.ndim == 0 else result
@@ -0,0 +1,229 @@
+import os
+import time
+import json
+import threading
+import functools
+import contextvars
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import ktl
+except:
+    ktl = None
+
+from kpf import log, cfg
+
+
+##-------------------------------------------------------------------------
+## Hierarchical execution tracing
+##-------------------------------------------------------------------------
+current_span = contextvars.ContextVar('kpf_current_span', default=None)
+root_span = None
+enabled = None
+patched = False
+span_ids = iter(range(1, 2**62))
+
+
+def tracing_enabled():
+    '''Tracing is off unless the KPF_TRACE environment variable is set or it
+    is enabled in the [tracing] section of the config file.
+    '''
+    global enabled
+    if enabled is None:
+        env = os.getenv('KPF_TRACE', default=None)
+        if env is not None:
+            enabled = env.lower() not in ['', '0', 'no', 'false']
+        else:
+            enabled = cfg.getboolean('tracing', 'enabled', fallback=False)
+        if enabled is True:
+            patch_ktl_waits()
+    return enabled
+
+
+def get_trace_dir():
+    trace_dir = os.getenv('KPF_TRACE_DIR', default=None)
+    if trace_dir is None:
+        trace_dir = cfg.get('tracing', 'directory',
+                            fallback='/s/sdata1701/KPFTranslator_logs/traces')
+    return Path(trace_dir).expanduser()
+
+
+def summarize_args(args, OB=None, maxlen=60):
+    summary = {}
+    if isinstance(args, dict):
+        for key, value in args.items():
+            value = str(value)
+            summary[key] = value if len(value) <= maxlen else value[:maxlen-3]+'...'
+    if OB is not None:
+        try:
+            summary['OB'] = OB.summary()
+        except Exception:
+            summary['OB'] = str(type(OB))
+    return summary
+
+
+class Span(object):
+    '''One timed region of a trace: a KPFFunction.execute call or a wait.
+    Times are perf_counter values in seconds.
+    '''
+    __slots__ = ['id', 'name', 'category', 'parent', 'root', 'thread',
+                 'start', 'end', 'args', 'events', 'token', 'waits']
+
+    def __init__(self, name, category, parent, args=None):
+        self.id = next(span_ids)
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.root = self if parent is None else parent.root
+        self.thread = threading.get_ident()
+        self.args = args or {}
+        self.events = [] # only used on the root span
+        self.waits = [] # (start, end) of the wait spans, only on the root span
+        self.token = None
+        self.end = None
+        self.start = time.perf_counter()
+
+    def event(self, name, category, start, end, args=None):
+        '''Chrome trace "complete" event, timestamps in microseconds relative
+        to the start of the root span.
+        '''
+        return {'name': name, 'cat': category, 'ph': 'X',
+                'ts': (start-self.root.start)*1e6, 'dur': (end-start)*1e6,
+                'pid': os.getpid(), 'tid': self.thread,
+                'args': args or {}}
+
+
+def start_span(name, args=None, OB=None, category='function'):
+    '''Open a span as a child of the current span. Spans opened in a thread
+    which did not inherit a context are attached to the active root span.
+    '''
+    global root_span
+    parent = current_span.get()
+    if parent is None and root_span is not None and root_span.end is None:
+        parent = root_span
+    span = Span(name, category, parent,
+                args=summarize_args(args, OB=OB) if category == 'function' else args)
+    if parent is None:
+        root_span = span
+    span.token = current_span.set(span)
+    return span
+
+
+def end_span(span, phases=None, outcome='success', exception=None):
+    '''Close a span. `phases` maps phase names to durations (s) in the order
+    they ran and is drawn as nested slices. Closing the root span writes the
+    trace file.
+    '''
+    span.end = time.perf_counter()
+    try:
+        current_span.reset(span.token)
+    except ValueError:
+        # Closed in a different context than it was opened in
+        current_span.set(span.parent)
+    args = dict(span.args)
+    args['outcome'] = outcome
+    if exception is not None:
+        args['exception'] = exception
+    events = [span.event(span.name, span.category, span.start, span.end, args)]
+    if phases is not None:
+        phase_start = span.start
+        for phase, duration in phases.items():
+            events.append(span.event(phase, 'phase', phase_start,
+                                     phase_start+duration))
+            phase_start += duration
+    span.root.events.extend(events)
+    if span.category == 'wait':
+        span.root.waits.append((span.start, span.end))
+    if span.parent is None:
+        write_trace(span)
+
+
+def union_duration(intervals):
+    '''Total time covered by a list of (start, end) intervals, counting time
+    covered by several of them (nested or concurrent waits) once.
+    '''
+    total = 0
+    covered_until = None
+    for start, end in sorted(intervals):
+        if covered_until is not None and start < covered_until:
+            start = covered_until
+        if end > start:
+            total += end - start
+        covered_until = end if covered_until is None else max(covered_until, end)
+    return total
+
+
+def write_trace(root):
+    '''Write the completed trace as Chrome/Perfetto trace JSON and log how
+    the time split between waiting and active commands.
+    '''
+    global root_span
+    if root_span is root:
+        root_span = None
+    total = root.end - root.start
+    wait = union_duration(root.waits)
+    log.info(f"Trace {root.name}: {total:.1f} s total, {wait:.1f} s in waitFor, "
+             f"{total-wait:.1f} s active")
+    trace = {'traceEvents': sorted(root.events, key=lambda e: e['ts']),
+             'displayTimeUnit': 'ms',
+             'otherData': {'root': root.name,
+                           'start': datetime.utcfromtimestamp(time.time()-total).isoformat(),
+                           'total_s': total,
+                           'wait_s': wait,
+                           'active_s': total-wait}}
+    try:
+        trace_dir = get_trace_dir()
+        trace_dir.mkdir(parents=True, exist_ok=True)
+        now = datetime.utcnow().strftime('%Y%m%dat%H%M%S')
+        trace_file = trace_dir / f"{root.name}_{now}_{os.getpid()}.json"
+        with open(trace_file, 'w') as f:
+            json.dump(trace, f)
+        log.info(f"Wrote trace to {trace_file}")
+    except Exception as e:
+        log.warning(f"Unable to write trace: {e}")
+
+
+def traced_wait(wait_function, describe):
+    @functools.wraps(wait_function)
+    def wrapper(*args, **kwargs):
+        if current_span.get() is None and root_span is None:
+            return wait_function(*args, **kwargs)
+        span = start_span(describe(*args, **kwargs), category='wait')
+        outcome = 'interrupted'
+        exception = None
+        try:
+            result = wait_function(*args, **kwargs)
+            span.args['result'] = str(result)
+            outcome = 'success'
+            return result
+        except BaseException as e:
+            if isinstance(e, Exception):
+                outcome = 'failed'
+            exception = type(e).__name__
+            raise
+        finally:
+            # Also on KeyboardInterrupt, so that a trace whose root is this
+            # wait is still written
+            end_span(span, outcome=outcome, exception=exception)
+    wrapper.kpf_traced = True
+    return wrapper
+
+
+def patch_ktl_waits():
+    '''Wrap ktl.waitFor and Keyword.waitFor so time spent waiting shows up
+    as "wait" spans in the trace.
+    '''
+    global patched
+    if patched is True or ktl is None:
+        return
+    patched = True
+    waitFor = getattr(ktl, 'waitFor', None)
+    if waitFor is not None and not hasattr(waitFor, 'kpf_traced'):
+        ktl.waitFor = traced_wait(waitFor,
+                          lambda expr, *a, **k: f"waitFor {str(expr)[:80]}")
+    Keyword = getattr(ktl, 'Keyword', None)
+    keyword_waitFor = getattr(Keyword, 'waitFor', None)
+    if keyword_waitFor is not None and not hasattr(keyword_waitFor, 'kpf_traced'):
+        Keyword.waitFor = traced_wait(keyword_waitFor,
+                          lambda kw, expr='', *a, **k: f"waitFor {getattr(kw, 'full_name', kw)} {str(expr)[:80]}")
@@ -0,0 +1,91 @@
+from pathlib import Path
+
+from kpf import log, cfg
+from kpf.exceptions import *
+from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.ObservingBlocks.conversion import convert_tree, ConversionReport, stages
+
+
+##-----------------------------------------------------------------------------
+## ConvertOBs
+##-----------------------------------------------------------------------------
+class ConvertOBs(KPFFunction):
+    '''Convert a directory tree of OB files (v1 kpf_sci and kpf_cal OBs, or
+    v2 OBs) to the current v2 format and validate them. Files are converted
+    in parallel processes and written atomically to the same relative paths
+    under the output directory.
+
+    A JSON lines report lists each file which failed, did not validate, or
+    produced warnings, followed by a summary with the counts, the throughput,
+    and the time spent reading, building, validating, and writing the OBs.
+
+    Target names in v1 science OBs are resolved through the target resolver
+    cache (see kpf.ObservingBlocks.TargetResolver), set
+    KPF_RESOLVER_OFFLINE=1 to convert without network access.
+
+    Args:
+        input (str): The directory to search for OB files.
+        output (str): The directory to write the converted OBs to.
+        processes (int): Number of worker processes (default: CPU count).
+        report (str): The report file (default: output/conversion_report.jsonl).
+        format (str): Write "yaml" or "json" files (default: as the input).
+        overwrite (bool): Overwrite existing output files.
+    '''
+    @classmethod
+    def pre_condition(cls, args):
+        input_directory = Path(args.get('input')).expanduser()
+        if not input_directory.is_dir():
+            raise FailedPreCondition(f"Input directory not found: {input_directory}")
+        if args.get('format', None) not in [None, 'yaml', 'json']:
+            raise FailedPreCondition(f"Unknown output format: {args.get('format')}")
+
+    @classmethod
+    def perform(cls, args):
+        output_directory = Path(args.get('output')).expanduser()
+        report_file = args.get('report', None)
+        if report_file is None:
+            report_file = output_directory / 'conversion_report.jsonl'
+        report = ConversionReport(report_file)
+        results = convert_tree(args.get('input'), output_directory,
+                               processes=args.get('processes', None),
+                               overwrite=args.get('overwrite', False),
+                               output_format=args.get('format', None))
+        for result in results:
+            report.add(result)
+            if result['status'] in ['invalid', 'failed']:
+                log.warning(f"{result['status']}: {result['file']}")
+                for error in result['errors']:
+                    log.warning(f"  {error}")
+        summary = report.close()
+        print(f"{summary['files']} files: {summary['converted']} converted, "
+              f"{summary['invalid']} invalid, {summary['failed']} failed, "
+              f"{summary['skipped']} skipped ({summary['with_warnings']} with warnings)")
+        print(f"{summary['elapsed']:.1f} s, {summary['OBs_per_s']:.1f} OBs/s")
+        print(f"mean time per OB: " + ', '.join([f"{stage} {summary['stage_mean'][stage]*1000:.2f} ms"
+                                                 for stage in stages]))
+        print(f"Report written to {report_file}")
+        return summary
+
+    @classmethod
+    def post_condition(cls, args):
+        pass
+
+    @classmethod
+    def add_cmdline_args(cls, parser):
+        parser.add_argument('input', type=str,
+                            help='The directory to search for OB files')
+        parser.add_argument('output', type=str,
+                            help='The directory to write the converted OBs to')
+        parser.add_argument("-p", "--processes", dest="processes", type=int,
+                            default=None,
+                            help="Number of worker processes (default: CPU count)")
+        parser.add_argument("-r", "--report", dest="report", type=str,
+                            default=None,
+                            help="Report file (default: output/conversion_report.jsonl)")
+        parser.add_argument("--format", dest="format", type=str,
+                            default=None, choices=['yaml', 'json'],
+                            help="Output file format (default: same as input)")
+        parser.add_argument("--overwrite", dest="overwrite",
+                            default=False, action="store_true",
+                            help="Overwrite existing output files")
+        return super().add_cmdline_args(parser)
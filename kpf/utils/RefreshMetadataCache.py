@@ -0,0 +1,53 @@
+import ktl
+
+from kpf import log, cfg
+from kpf.exceptions import *
+from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metadata import get_cache, get_enumerators, get_value
+
+
+##-----------------------------------------------------------------------------
+## RefreshMetadataCache
+##-----------------------------------------------------------------------------
+class RefreshMetadataCache(KPFFunction):
+    '''Discard the cached instrument metadata (keyword enumerators and slow
+    changing keyword values, see kpf.metadata) and re-read it from KTL. This
+    also updates the copy on disk used by offline tools. Run this after a
+    filter wheel or octagon is reconfigured.
+
+    KTL Keywords Used:
+
+    - `kpfcal.OCTAGON`
+    - `kpfcal.ND1POS`
+    - `kpfcal.ND2POS`
+    - `kpfcal.FF_FIBERPOS`
+    - `kpffiu.MODE`
+    - `kpf_expmeter.THRESHOLDBIN`
+    - `kpf_expmeter.WAVEBINS`
+    '''
+    enumerated = [('kpfcal', 'OCTAGON'),
+                  ('kpfcal', 'ND1POS'),
+                  ('kpfcal', 'ND2POS'),
+                  ('kpfcal', 'FF_FIBERPOS'),
+                  ('kpffiu', 'MODE'),
+                  ('kpf_expmeter', 'THRESHOLDBIN')]
+    values = [('kpf_expmeter', 'WAVEBINS')]
+
+    @classmethod
+    def pre_condition(cls, args):
+        pass
+
+    @classmethod
+    def perform(cls, args):
+        cache = get_cache()
+        cache.invalidate()
+        for service, keyword in cls.enumerated:
+            enumerators = get_enumerators(service, keyword)
+            print(f"{service}.{keyword}: {', '.join(enumerators)}")
+        for service, keyword in cls.values:
+            print(f"{service}.{keyword} = {get_value(service, keyword)}")
+        log.info(f"Refreshed metadata cache ({cache.cache_file})")
+
+    @classmethod
+    def post_condition(cls, args):
+        pass
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+from kpf import log, cfg
+from kpf.exceptions import *
+from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.metrics import read_metrics, summarize, phases, histogram_bins
+
+
+def format_duration(seconds):
+    if seconds < 1:
+        return f"{seconds*1000:.0f}ms"
+    return f"{seconds:.0f}s"
+
+
+##-----------------------------------------------------------------------------
+## ReportExecutionTimes
+##-----------------------------------------------------------------------------
+class ReportExecutionTimes(KPFFunction):
+    '''Summarize the execution times recorded by KPFFunction.execute and
+    KPFScript.execute. For each function and each phase (pre_condition,
+    perform, post_condition, and the total) print the number of calls and the
+    p50, p95, and maximum durations in seconds, then a histogram of the
+    durations with one column per decade.
+
+    Args:
+        start (str): First UT date to include (YYYY-mm-dd). Defaults to today.
+        end (str): Last UT date to include (YYYY-mm-dd). Defaults to start.
+        function (str): Only report on this function.
+    '''
+    @classmethod
+    def pre_condition(cls, args):
+        for key in ['start', 'end']:
+            if args.get(key, None) is not None:
+                try:
+                    datetime.strptime(args.get(key), '%Y-%m-%d')
+                except ValueError:
+                    raise FailedPreCondition(f"Could not parse {key} date: {args.get(key)}")
+
+    @classmethod
+    def perform(cls, args):
+        start = args.get('start', None)
+        if start is None:
+            start = datetime.utcnow().date()
+        else:
+            start = datetime.strptime(start, '%Y-%m-%d').date()
+        end = args.get('end', None)
+        if end is None:
+            end = start
+        else:
+            end = datetime.strptime(end, '%Y-%m-%d').date()
+
+        records = read_metrics(start, end, function=args.get('function', None))
+        print(f"{len(records)} executions recorded from {start} to {end} (UT)")
+        if len(records) == 0:
+            return
+        summary = summarize(records)
+        print(f"{'Function':30s} {'Phase':15s} {'N':>6s} {'p50 [s]':>9s} {'p95 [s]':>9s} {'max [s]':>9s}")
+        for name in sorted(summary.keys()):
+            for phase in phases + ['total']:
+                if phase not in summary[name]:
+                    continue
+                stats = summary[name][phase]
+                print(f"{name:30s} {phase:15s} {stats['n']:6d} "
+                      f"{stats['p50']:9.3f} {stats['p95']:9.3f} {stats['max']:9.3f}")
+            for outcome in ['failed', 'interrupted']:
+                if summary[name][outcome] > 0:
+                    print(f"{name:30s} {outcome:15s} {summary[name][outcome]:6d}")
+
+        print()
+        labels = [f"<{format_duration(edge)}" for edge in histogram_bins]
+        labels.append(f">{format_duration(histogram_bins[-1])}")
+        print(f"{'Function':30s} {'Phase':15s} " + ' '.join([f"{l:>7s}" for l in labels]))
+        for name in sorted(summary.keys()):
+            for phase in phases + ['total']:
+                if phase not in summary[name]:
+                    continue
+                counts = summary[name][phase]['histogram']
+                print(f"{name:30s} {phase:15s} " + ' '.join([f"{c:7d}" for c in counts]))
+
+    @classmethod
+    def post_condition(cls, args):
+        pass
+
+    @classmethod
+    def add_cmdline_args(cls, parser):
+        parser.add_argument("-s", "--start", dest="start", type=str, default=None,
+                            help="First UT date to include (YYYY-mm-dd)")
+        parser.add_argument("-e", "--end", dest="end", type=str, default=None,
+                            help="Last UT date to include (YYYY-mm-dd)")
+        parser.add_argument("-f", "--function", dest="function", type=str, default=None,
+                            help="Only report on this function")
+        return super().add_cmdline_args(parser)
@@ -1,7 +1,7 @@
 import smtplib
 from email.mime.text import MIMEText
 
-from kpf import log, cfg
+from kpf import log, cfg, simulate
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
 
@@ -31,6 +31,9 @@ class SendEmail(KPFFunction):
         log.warning(f"Sending email, To {msg.get('To')}")
         log.warning(f"Sending email, Subject {msg.get('Subject')}")
         log.warning(f"{args.get('Message')}")
+        if simulate is True:
+            log.warning('Simulated KTL backend in use, not sending email')
+            return
         s = smtplib.SMTP('relay.keck.hawaii.edu')
         s.send_message(msg)
         s.quit()
@@ -1,13 +1,13 @@
 import os
 from pathlib import Path
 from datetime import datetime, timedelta
-import numpy as np
 
 import ktl
 
-from kpf import log, cfg
+from kpf import log, cfg, get_login
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
+from kpf.wait import CompositeWait
 
 
 class SetOutdirs(KPFFunction):
@@ -23,7 +23,7 @@ class SetOutdirs(KPFFunction):
         utnow = datetime.utcnow()
         date = utnow-timedelta(days=1)
         date_str = date.strftime('%Y%b%d').lower()
-        outdir = Path(f"/s/sdata1701/{os.getlogin()}/{date_str}")
+        outdir = Path(f"/s/sdata1701/{get_login()}/{date_str}")
         magiq_outdir = Path(f"/s/sdata1701/kpfguide/{date_str}")
         log.debug(f"base outdir: {outdir}")
         log.debug(f"magiq outdir: {magiq_outdir}")
@@ -133,51 +133,29 @@ class SetOutdirs(KPFFunction):
         utnow = datetime.utcnow()
         date = utnow-timedelta(days=1)
         date_str = date.strftime('%Y%b%d').lower()
-        outdir = Path(f"/s/sdata1701/{os.getlogin()}/{date_str}")
-        tests = []
-        if args.get('CRED2', True) is True:
-            expr = f"$kpfguide.OUTDIR == '/s/sdata1701/kpfguide'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+        outdir = Path(f"/s/sdata1701/{get_login()}/{date_str}")
+        magiq_outdir = Path(f"/s/sdata1701/kpfguide/{date_str}")
+        waits = CompositeWait()
         if args.get('CRED2', True) is True:
-            expr = f"$kpfguide.TRIGOUTDIR == '{outdir}/CRED2'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpfguide', 'OUTDIR', f"{magiq_outdir}", timeout=5)
+            waits.add('kpfguide', 'TRIGOUTDIR', f"{outdir}/CRED2", timeout=5)
         if args.get('FVC1', False) is True:
-            expr = f"$kpffvc.SCIOUTDIR == '{outdir}/FVC1'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpffvc', 'SCIOUTDIR', f"{outdir}/FVC1", timeout=5)
         if args.get('FVC2', False) is True:
-            expr = f"$kpffvc.CAHKOUTDIR == '{outdir}/FVC2'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpffvc', 'CAHKOUTDIR', f"{outdir}/FVC2", timeout=5)
         if args.get('FVC3', False) is True:
-            expr = f"$kpffvc.CALOUTDIR == '{outdir}/FVC3'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpffvc', 'CALOUTDIR', f"{outdir}/FVC3", timeout=5)
         if args.get('FVC4', False) is True:
-            expr = f"$kpffvc.EXTOUTDIR == '{outdir}/FVC4'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpffvc', 'EXTOUTDIR', f"{outdir}/FVC4", timeout=5)
         if args.get('ExpMeter', True) is True:
-            expr = f"$kpf_expmeter.DATADIR == '{outdir}/ExpMeter'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpf_expmeter', 'DATADIR', f"{outdir}/ExpMeter", timeout=5)
         if args.get('CaHK', True) is True:
-            expr = f"$kpf_hk.RECORDDIR == '{outdir}/CaHK'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpf_hk', 'RECORDDIR', f"{outdir}/CaHK", timeout=5)
         if args.get('Green', True) is True:
-            expr = f"$kpfgreen.FITSDIR == '{outdir}/Green'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpfgreen', 'FITSDIR', f"{outdir}/Green", timeout=5)
         if args.get('Red', True) is True:
-            expr = f"$kpfred.FITSDIR == '{outdir}/Red'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
+            waits.add('kpfred', 'FITSDIR', f"{outdir}/Red", timeout=5)
         if args.get('L0', True) is True:
-            expr = f"$kpfassemble.OUTDIR == '{outdir}/L0'"
-            success = ktl.waitFor(expr, timeout=5)
-            tests.append(success)
-
-        return np.all(np.array(tests))
+            waits.add('kpfassemble', 'OUTDIR', f"{outdir}/L0", timeout=5)
+        failed = waits.wait()
+        return len(failed) == 0
@@ -3,14 +3,15 @@ import time
 import subprocess
 from datetime import datetime, timedelta
 import re
-from astropy.table import Table
 
 import ktl
 
-from kpf import log, cfg
+from kpf import log, cfg, lazy_import, get_login
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
 
+table = lazy_import('astropy.table')
+
 
 # List of GUIs for KPF
 GUI_list = [
@@ -106,8 +107,8 @@ class StartGUIs(KPFFunction):
         uidisp = {}
         kvncstatus_proc = subprocess.run(['kvncstatus'], env=env,
                                          stdout=subprocess.PIPE)
-        kvncstatus = Table.read(kvncstatus_proc.stdout.decode(), format='ascii')
-        username = os.getlogin()
+        kvncstatus = table.Table.read(kvncstatus_proc.stdout.decode(), format='ascii')
+        username = get_login()
         display = {'control0':  kvncstatus[kvncstatus['Desktop'] == f'kpf-{username}-control0']['Display'][0],
                    'control1':  kvncstatus[kvncstatus['Desktop'] == f'kpf-{username}-control1']['Display'][0],
                    'control2':  kvncstatus[kvncstatus['Desktop'] == f'kpf-{username}-control2']['Display'][0],
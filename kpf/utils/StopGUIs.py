@@ -4,7 +4,7 @@ import subprocess
 import re
 import socket
 
-from kpf import log, cfg
+from kpf import log, cfg, get_login
 from kpf.exceptions import *
 from kpf.KPFTranslatorFunction import KPFFunction, KPFScript
 from kpf.utils.StartGUIs import GUI_list
@@ -16,7 +16,7 @@ def find_process(process, server='kpf'):
     prefix_cmd = []
     if socket.gethostname() != server:
         prefix_cmd = ['ssh', server]
-    pscmd = prefix_cmd + ['ps', '-u', f'{os.getlogin()}', '-f', '--width', '200']
+    pscmd = prefix_cmd + ['ps', '-u', f'{get_login()}', '-f', '--width', '200']
     psout = subprocess.run(pscmd, stdout=subprocess.PIPE)
     psout = psout.stdout.decode().split('\n')
     process_id = None
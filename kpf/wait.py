@@ -0,0 +1,191 @@
+import time
+import threading
+
+try:
+    import ktl
+except:
+    ktl = None
+
+from kpf import log, cfg
+from kpf import tracing
+from kpf.exceptions import *
+
+
+##-------------------------------------------------------------------------
+## Concurrent keyword waits
+##-------------------------------------------------------------------------
+def timeout_scale():
+    '''The simulated ktl backend (see kpf.simulator) runs faster than real
+    time, scale timeouts to match.
+    '''
+    return getattr(ktl, 'time_scale', 1.0)
+
+
+class KeywordCondition(object):
+    '''A keyword which must reach a target within a timeout.
+
+    The target is either a value, which is compared case insensitively to the
+    keyword's ascii value, or a callable which takes the ascii value and
+    returns True when the condition holds.
+    '''
+    __slots__ = ['service', 'keyword', 'target', 'timeout', 'description',
+                 'required', 'kw', 'deadline', 'met', 'value']
+
+    def __init__(self, service, keyword, target, timeout=5, description=None,
+                 required=True):
+        self.service = service
+        self.keyword = keyword
+        self.target = target
+        self.timeout = timeout
+        if description is None:
+            description = f"{service}.{keyword} == {target}"
+        self.description = description
+        self.required = required
+        self.kw = None
+        self.deadline = None
+        self.met = None
+        self.value = None
+
+    def check(self):
+        try:
+            self.value = self.kw['ascii']
+        except Exception as e:
+            log.debug(f"Unable to read {self.service}.{self.keyword}: {e}")
+            return False
+        if callable(self.target):
+            return self.target(self.value) is True
+        return str(self.value).strip().lower() == str(self.target).strip().lower()
+
+    def __str__(self):
+        return f"{self.description} (value={self.value}, timeout={self.timeout} s)"
+
+
+class CompositeWait(object):
+    '''Wait on several keyword conditions at once.
+
+    Each condition has its own timeout. All conditions are evaluated from
+    keyword monitor callbacks (with a slow poll as a backstop for missed
+    broadcasts), so the wait returns as soon as every condition holds and the
+    worst case is the longest timeout rather than the sum of the timeouts.
+    Conditions which do not hold at their deadline are all reported together.
+
+    Example:
+
+        waits = CompositeWait()
+        waits.add('kpfcal', 'ND1POS', 'OD 1.0', timeout=20)
+        waits.add('kpfcal', 'OCTAGON', 'Th_daily', timeout=90)
+        failed = waits.wait()
+    '''
+    def __init__(self, poll_interval=None):
+        self.conditions = []
+        if poll_interval is None:
+            poll_interval = cfg.getfloat('wait', 'poll_interval', fallback=0.5)
+        self.poll_interval = poll_interval
+        self.lock = threading.Condition()
+
+    def add(self, service, keyword, target, timeout=5, description=None,
+            required=True):
+        condition = KeywordCondition(service, keyword, target, timeout=timeout,
+                                     description=description, required=required)
+        self.conditions.append(condition)
+        return condition
+
+    def __len__(self):
+        return len(self.conditions)
+
+    def callback(self, keyword):
+        with self.lock:
+            self.lock.notify_all()
+
+    def evaluate(self, now):
+        '''Check all unresolved conditions, those past their deadline fail.
+        Returns the conditions still pending.
+        '''
+        pending = []
+        for condition in self.conditions:
+            if condition.met is not None:
+                continue
+            if condition.check() is True:
+                condition.met = True
+            elif now >= condition.deadline:
+                condition.met = False
+            else:
+                pending.append(condition)
+        return pending
+
+    def wait(self):
+        '''Block until every condition holds or has timed out.
+
+        Returns
+        -------
+        List[KeywordCondition]
+            The conditions which failed (empty on success).
+        '''
+        if len(self.conditions) == 0:
+            return []
+        span = None
+        if tracing.tracing_enabled() is True:
+            span = tracing.start_span(f"wait {', '.join([c.description for c in self.conditions])}"[:120],
+                                      category='wait')
+        outcome = 'interrupted'
+        try:
+            failed = self.wait_for_conditions()
+            outcome = 'success' if len(failed) == 0 else 'failed'
+        finally:
+            # Also on KeyboardInterrupt, so that the trace is complete
+            if span is not None:
+                tracing.end_span(span, outcome=outcome)
+        for condition in failed:
+            log.warning(f"Timed out waiting for {condition}")
+        return failed
+
+    def wait_for_conditions(self):
+        '''Monitor the keywords and evaluate the conditions until every
+        one has been met or has timed out (see wait).
+        '''
+        scale = timeout_scale()
+        start = time.monotonic()
+        keywords = {}
+        for condition in self.conditions:
+            condition.met = None
+            condition.deadline = start + condition.timeout*scale
+            name = f"{condition.service}.{condition.keyword}".lower()
+            if name not in keywords:
+                keywords[name] = ktl.cache(condition.service, condition.keyword)
+            condition.kw = keywords[name]
+        for kw in keywords.values():
+            kw.callback(self.callback)
+            kw.monitor()
+        try:
+            with self.lock:
+                while True:
+                    now = time.monotonic()
+                    pending = self.evaluate(now)
+                    if len(pending) == 0:
+                        break
+                    next_deadline = min([c.deadline for c in pending])
+                    self.lock.wait(max(min(next_deadline-now, self.poll_interval), 0))
+        finally:
+            for kw in keywords.values():
+                kw.callback(self.callback, remove=True)
+        return [c for c in self.conditions if c.met is False]
+
+    def wait_or_raise(self):
+        '''Wait and raise if any required condition failed. A single failure
+        raises FailedToReachDestination, several raise FailedPostCondition
+        listing all of them. Failed conditions which are not required are only
+        logged.
+        '''
+        failed = [c for c in self.wait() if c.required is True]
+        if len(failed) == 1:
+            target = failed[0].target
+            if callable(target):
+                target = failed[0].description
+            raise FailedToReachDestination(failed[0].value, target)
+        elif len(failed) > 1:
+            raise FailedPostCondition('; '.join([str(c) for c in failed]))
+
+
+def fiu_mode_is(mode):
+    '''kpffiu.MODE is a comma separated list of the modes the FIU is in.'''
+    return lambda modes: mode.lower() in str(modes).lower().split(',')
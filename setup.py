@@ -12,8 +12,10 @@ setup(
     packages=['kpf',
               'kpf.ObservingBlocks',
               'kpf.utils',
+              'kpf.simulator',
               ],
-    package_data={"kpf.ObservingBlocks": ["*.yaml"]},
+    package_data={"kpf.ObservingBlocks": ["*.yaml"],
+                  "kpf.simulator": ["*.yaml"]},
     include_package_data=True,
     install_requires=['numpy'],
 
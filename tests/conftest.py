@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# The tests run against the simulated KTL backend and must not touch the
+# user's caches under ~/.kpftranslator, so point everything which is
+# persisted at a scratch directory before kpf is imported.
+scratch = Path(tempfile.mkdtemp(prefix='kpftranslator_tests_'))
+os.environ['KPF_SIMULATE'] = '1'
+os.environ['KPF_METRICS'] = '0'
+os.environ['KPF_OB_STORE'] = str(scratch / 'OBstore')
+os.environ['KPF_OUTBOX'] = str(scratch / 'outbox.sqlite')
+os.environ['KPF_RESOLVER_CACHE'] = str(scratch / 'target_resolver.sqlite')
+os.environ['KPF_SCHEDULE_CACHE'] = str(scratch / 'schedule.sqlite')
+os.environ['KPF_METADATA_CACHE'] = str(scratch / 'metadata_cache.json')
+os.environ['KPFDO_INDEX'] = str(scratch / 'linking_table_index.json')
+os.environ.setdefault('APIHASH', 'test')
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def serve():
+    '''Start a local HTTP stand-in with the given request handler class and
+    return its base URL, the servers are shut down after the test.
+    '''
+    servers = []
+    def start(handler):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def config():
+    '''Set kpf config values for one test: config(section, key, value).'''
+    from kpf import cfg
+    saved = []
+    def set_value(section, key, value):
+        if not cfg.has_section(section):
+            cfg.add_section(section)
+        saved.append((section, key, cfg.get(section, key, fallback=None)))
+        cfg.set(section, key, str(value))
+    yield set_value
+    for section, key, value in reversed(saved):
+        if value is None:
+            cfg.remove_option(section, key)
+        else:
+            cfg.set(section, key, value)
+
+
+@pytest.fixture
+def live_api(monkeypatch):
+    '''Let the observatory API wrappers send requests (they skip them when
+    the simulated KTL backend is in use).
+    '''
+    from kpf import observatoryAPIs
+    monkeypatch.setattr(observatoryAPIs, 'simulate', False)
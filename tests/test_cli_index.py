@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import logging
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from kpf import cli_interface
+from kpf.cli_interface import LinkingTable, source_fingerprint, get_completions
+
+kpfdo = Path(__file__).parent.parent / 'kpf' / 'kpfdo'
+linking_table = Path(__file__).parent.parent / 'kpf' / 'linking_table.yml'
+logger = logging.getLogger('test_cli_index')
+
+
+def run_kpfdo(args, index_file, importtime=False):
+    env = dict(os.environ, KPFDO_NOSERVER='1', KPFDO_INDEX=str(index_file))
+    options = ['-X', 'importtime'] if importtime is True else []
+    return subprocess.run([sys.executable] + options + [str(kpfdo)] + args,
+                          env=env, capture_output=True, text=True)
+
+
+@pytest.fixture(scope='module')
+def index_file(tmp_path_factory):
+    '''An index built by the first `kpfdo -h` with an empty index.'''
+    index_file = tmp_path_factory.mktemp('index') / 'linking_table_index.json'
+    result = run_kpfdo(['-h', 'SetND'], index_file)
+    assert result.returncode == 0
+    return index_file
+
+
+def test_cold_index_captures_all_functions(index_file):
+    with open(index_file) as f:
+        index = json.load(f)
+    entries = list(index['links'].keys())
+    assert len(index['functions']) > len(entries)/2
+    assert index['sources'] == source_fingerprint(linking_table.parent)
+    assert index['functions']['SetND']['args'] is not None
+
+
+@pytest.mark.parametrize('args', [['-h', 'IsCalSourceEnabled'],
+                                  ['--complete', 'IsCalSourceEnabled', '-']])
+def test_help_and_completion_do_not_import(index_file, args):
+    result = run_kpfdo(args, index_file, importtime=True)
+    assert result.returncode == 0
+    assert 'kpf.calbench.IsCalSourceEnabled' not in result.stderr
+    assert 'kpf.KPFTranslatorFunction' not in result.stderr
+
+
+def test_completion(index_file):
+    table = LinkingTable(linking_table, logger, index_file=index_file)
+    assert 'IsCalSourceEnabled' in get_completions(table, ['IsCal'])
+    assert get_completions(table, ['SetND', '--n']) == ['--nowait']
+
+
+def test_fingerprint_follows_any_source_file(tmp_path):
+    package = tmp_path / 'package'
+    (package / 'sub').mkdir(parents=True)
+    for name in ['a.py', 'sub/helpers.py', 'config.ini', 'notes.txt']:
+        (package / name).write_text('x = 1\n')
+    fingerprint = source_fingerprint(package)
+    (package / 'notes.txt').write_text('changed\n')
+    assert source_fingerprint(package) == fingerprint
+    # e.g. a shared add_cmdline_args helper or a base class
+    os.utime(package / 'sub' / 'helpers.py', ns=(0, 0))
+    assert source_fingerprint(package) != fingerprint
+    fingerprint = source_fingerprint(package)
+    (package / 'config.ini').write_text('[section]\n')
+    assert source_fingerprint(package) != fingerprint
+
+
+def test_changed_sources_rebuild_all_functions(index_file, tmp_path, monkeypatch):
+    stale = tmp_path / 'linking_table_index.json'
+    with open(index_file) as f:
+        index = json.load(f)
+    index['sources'] = 'out of date'
+    index['functions'] = {'SetND': index['functions']['SetND']}
+    with open(stale, 'w') as f:
+        json.dump(index, f)
+    table = LinkingTable(linking_table, logger, index_file=stale)
+    assert table.functions_current() is False
+    assert table.get_function_info('IsCalSourceEnabled') is not None
+    assert table.functions_current() is True
+    assert len(table.functions) > 1
+
+
+def test_stale_index_not_used_without_rebuild(index_file, tmp_path, monkeypatch):
+    table = LinkingTable(linking_table, logger, index_file=index_file)
+    monkeypatch.setattr(table, 'sources', 'out of date')
+    monkeypatch.setattr(table, 'index_built', True)
+    assert table.get_function_info('SetND') is None
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import threading
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from kpf.cli_server import KPFDoServer
+
+kpfdo = Path(__file__).parent.parent / 'kpf' / 'kpfdo'
+kpfdo_server = Path(__file__).parent.parent / 'kpf' / 'kpfdo_server'
+
+
+@pytest.fixture
+def server(tmp_path):
+    '''A kpfdo server in its own process, returns its socket file.'''
+    socket_file = tmp_path / 'kpfdo.sock'
+    env = dict(os.environ, KPFDO_SOCKET=str(socket_file))
+    process = subprocess.Popen([sys.executable, str(kpfdo_server)], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while not socket_file.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert socket_file.exists()
+    yield socket_file
+    process.terminate()
+    process.wait(10)
+
+
+def test_stalled_client_does_not_block_server(server):
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stalled.connect(str(server))
+    try:
+        tick = time.monotonic()
+        env = dict(os.environ, KPFDO_SOCKET=str(server))
+        result = subprocess.run([sys.executable, str(kpfdo), '-l'], env=env,
+                                capture_output=True, text=True, timeout=30)
+        assert result.returncode == 0
+        assert 'IsCalSourceEnabled' in result.stdout
+        assert time.monotonic() - tick < 15
+    finally:
+        stalled.close()
+
+
+def test_no_fork_while_threads_run(tmp_path):
+    server = KPFDoServer(socket_file=tmp_path / 'kpfdo.sock')
+    conn, client = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    payload = json.dumps({'argv': ['kpfdo', '-l'], 'cwd': str(tmp_path),
+                          'env': {}}).encode()
+    r, w = os.pipe()
+    socket.send_fds(client, [struct.pack('!I', len(payload))], [r, w, w])
+    client.sendall(payload)
+    os.close(r)
+    os.close(w)
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait, name='other thread')
+    thread.start()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(2)
+        server.handle(conn, listener)
+    finally:
+        stop.set()
+        thread.join()
+        conn.close()
+        listener.close()
+    # Refused: the client sees the connection closed instead of a child PID
+    client.settimeout(2)
+    assert client.recv(4) == b''
+    client.close()
@@ -0,0 +1,145 @@
+import json
+import types
+import threading
+import multiprocessing
+from pathlib import Path
+
+import pytest
+import yaml
+
+from kpf.ObservingBlocks import TargetResolver
+from kpf.ObservingBlocks import conversion
+from kpf.ObservingBlocks.conversion import convert_tree, ConversionReport
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+GaiaID = 'DR3 5859393710380907776'
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    '''A v1 science OB (its target resolved from the resolver cache), a v1
+    calibration OB, v2 OBs in YAML and JSON, and a broken file.
+    '''
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    with open(exampleOBs / 'Calibrations.yaml') as f:
+        calibrations = yaml.safe_load(f)
+    science['Target']['RA'] = '12:23:11.79'
+    science['Target']['Dec'] = '-67:37:49.47'
+    # The conversion workers open the default resolver cache themselves
+    monkeypatch.setenv('KPF_RESOLVER_OFFLINE', '1')
+    monkeypatch.setenv('KPF_RESOLVER_CACHE', str(tmp_path / 'target_resolver.sqlite'))
+    monkeypatch.setattr(TargetResolver, 'cache', None)
+    TargetResolver.get_cache().write('simbad', f"Gaia {GaiaID}",
+                                     dict(science['Target'], GaiaID=GaiaID))
+    corpus = tmp_path / 'corpus'
+    (corpus / 'v1').mkdir(parents=True)
+    (corpus / 'v2').mkdir(parents=True)
+    files = {
+        'v1/science.yaml': {'Template_Name': 'kpf_sci', 'Template_Version': 1.0,
+                            'TargetName': 'Target001', 'GaiaID': GaiaID,
+                            'SEQ_Observations': [dict(obs, ExpMeterBin=604)
+                                                 for obs in science['Observations']]},
+        'v1/calibration.yaml': {'Template_Name': 'kpf_cal', 'Template_Version': 1.0,
+                                'SEQ_Calibrations': calibrations['Calibrations'][:2]},
+        'v2/science.yaml': science,
+        'v2/calibration.json': calibrations,
+    }
+    for name, OB in files.items():
+        with open(corpus / name, 'w') as f:
+            if name.endswith('.json'):
+                json.dump(OB, f)
+            else:
+                yaml.dump(OB, f)
+    (corpus / 'v2' / 'broken.yaml').write_text(yaml.dump(science)[:-40] + '\n  : [unbalanced\n')
+    return corpus
+
+
+def convert(corpus, output, **kwargs):
+    report = ConversionReport(output / 'conversion_report.jsonl')
+    results = {Path(r['file']).relative_to(corpus).as_posix(): r
+               for r in convert_tree(corpus, output, **kwargs)}
+    for result in results.values():
+        report.add(result)
+    return results, report.close()
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_convert_corpus(corpus, tmp_path, processes):
+    output = tmp_path / 'converted'
+    results, summary = convert(corpus, output, processes=processes)
+    assert results['v1/science.yaml']['format'] == 'kpf_sci'
+    assert results['v1/calibration.yaml']['format'] == 'kpf_cal'
+    assert results['v2/science.yaml']['format'] == 'v2'
+    for name in ['v1/science.yaml', 'v1/calibration.yaml', 'v2/science.yaml',
+                 'v2/calibration.json']:
+        assert results[name]['status'] in ['converted', 'invalid']
+    assert results['v2/broken.yaml']['status'] == 'failed'
+    assert 'YAMLError' in results['v2/broken.yaml']['errors'][0] or\
+           'ScannerError' in results['v2/broken.yaml']['errors'][0]
+
+    with open(exampleOBs / 'Science.yaml') as f:
+        nobservations = len(yaml.safe_load(f)['Observations'])
+    science = ObservingBlock(output / 'v1' / 'science.yaml')
+    assert science.Target.get('GaiaID') == GaiaID
+    assert len(science.Observations) == nobservations
+    assert len(ObservingBlock(output / 'v1' / 'calibration.yaml').Calibrations) == 2
+    assert len(ObservingBlock(output / 'v2' / 'calibration.json').Calibrations) > 0
+    assert not (output / 'v2' / 'broken.yaml').exists()
+    assert len(list(output.rglob('.*.tmp'))) == 0
+
+    # The report lists the broken file and ends with the summary
+    assert summary['files'] == 5 and summary['failed'] == 1
+    assert summary['converted'] + summary['invalid'] == 4
+    with open(output / 'conversion_report.jsonl') as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[-1]['summary'] is True and lines[-1]['files'] == 5
+    assert 'v2/broken.yaml' in [Path(l['file']).relative_to(corpus).as_posix()
+                                for l in lines[:-1] if l['status'] == 'failed']
+
+
+def test_existing_output_skipped(corpus, tmp_path):
+    output = tmp_path / 'converted'
+    convert(corpus, output, processes=1)
+    results, summary = convert(corpus, output, processes=1)
+    assert summary['skipped'] == 4 and summary['failed'] == 1
+    results, summary = convert(corpus, output, processes=1, overwrite=True)
+    assert summary['skipped'] == 0
+
+
+def test_output_format(corpus, tmp_path):
+    output = tmp_path / 'converted'
+    convert(corpus, output, processes=1, output_format='json')
+    assert sorted([f.relative_to(output).as_posix() for f in output.rglob('*.json')]) ==\
+           ['v1/calibration.json', 'v1/science.json', 'v2/calibration.json', 'v2/science.json']
+
+
+def test_serial_while_threads_run(corpus, tmp_path, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError('A process pool was started while threads run')
+    monkeypatch.setattr(conversion, 'multiprocessing',
+                        types.SimpleNamespace(get_context=no_pool, Pool=no_pool))
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        results, summary = convert(corpus, tmp_path / 'converted', processes=2)
+    finally:
+        stop.set()
+        thread.join()
+    assert summary['files'] == 5
+
+
+def test_pool_start_method(corpus, tmp_path, config, monkeypatch):
+    get_context = multiprocessing.get_context
+    methods = []
+    def record(method):
+        methods.append(method)
+        return get_context(method)
+    monkeypatch.setattr(conversion.multiprocessing, 'get_context', record)
+    convert(corpus, tmp_path / 'fork', processes=2)
+    config('OBTable', 'start_method', 'forkserver')
+    results, summary = convert(corpus, tmp_path / 'forkserver', processes=2)
+    assert methods == ['fork', 'forkserver']
+    assert summary['files'] == 5 and summary['failed'] == 1
@@ -0,0 +1,220 @@
+import time
+import json
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from kpf import cfg
+from kpf import httpclient
+from kpf import observatoryAPIs
+
+
+##-------------------------------------------------------------------------
+## Stand-in server
+##-------------------------------------------------------------------------
+class StandIn(object):
+    '''What the server does with the next requests: answer the first
+    nfail requests with fail_status (and a Retry-After header if
+    retry_after is set), hang for hang seconds, or answer with status.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nfail = 0
+        self.fail_status = 503
+        self.retry_after = None
+        self.hang = 0
+        self.status = 200
+        self.received = []
+
+
+def make_handler(standin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def respond(self, body):
+            with standin.lock:
+                standin.received.append((self.command, self.path, body))
+                n = len(standin.received)
+                status = standin.fail_status if n <= standin.nfail else standin.status
+            time.sleep(standin.hang)
+            url = urlparse(self.path)
+            data = json.dumps({'query': url.path, 'params': parse_qs(url.query),
+                               'body': body, 'n': n}).encode()
+            try:
+                self.send_response(status)
+                if status != 200 and standin.retry_after is not None:
+                    self.send_header('Retry-After', str(standin.retry_after))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def do_GET(self):
+            self.respond(None)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.respond(self.rfile.read(length).decode())
+    return Handler
+
+
+@pytest.fixture
+def standin(serve, config, live_api, monkeypatch):
+    standin = StandIn()
+    base = serve(make_handler(standin))
+    standin.base = base
+    config('ObservatoryAPIs', 'proposal_url', f"{base}/api/proposals/")
+    config('ObservatoryAPIs', 'schedule_url', f"{base}/api/schedule/")
+    config('httpclient', 'backoff', 0.01)
+    config('httpclient', 'max_backoff', 0.05)
+    config('httpclient', 'retries', 2)
+    config('httpclient', 'failure_threshold', 5)
+    config('httpclient', 'reset_time', 0.3)
+    client = httpclient.HTTPClient()
+    monkeypatch.setattr(httpclient, 'client', client)
+    yield standin
+    client.close()
+
+
+##-------------------------------------------------------------------------
+## Retries
+##-------------------------------------------------------------------------
+def test_get_is_retried(standin):
+    standin.nfail = 2
+    result = observatoryAPIs.getPI('2026B_N123')
+    assert result['params']['semid'] == ['2026B_N123']
+    assert len(standin.received) == 3
+
+
+def test_retries_are_bounded(standin):
+    standin.nfail = 10
+    url = cfg.get('ObservatoryAPIs', 'proposal_url')
+    r = httpclient.get_client().get('proposal', f"{url}getPI")
+    assert r.status_code == 503
+    assert len(standin.received) == 3
+
+
+def test_retry_after(standin, config):
+    config('httpclient', 'max_backoff', 2)
+    standin.nfail = 1
+    standin.retry_after = 0.3
+    tick = time.perf_counter()
+    observatoryAPIs.getPI('2026B_N123')
+    assert time.perf_counter() - tick >= 0.3
+    assert len(standin.received) == 2
+
+
+def test_retry_after_is_capped():
+    endpoint = httpclient.Endpoint('test')
+    endpoint.max_backoff = 1
+    response = requests.Response()
+    response.headers['Retry-After'] = '120'
+    assert endpoint.delay(0, response) == 1
+    response.headers['Retry-After'] = 'Wed, 21 Oct 2026 07:28:00 GMT'
+    assert 0 <= endpoint.delay(0, response) <= 1
+
+
+def test_hung_server_times_out(standin, config):
+    config('httpclient', 'read_timeout', 0.2)
+    standin.hang = 1
+    tick = time.perf_counter()
+    with pytest.raises(requests.exceptions.Timeout):
+        observatoryAPIs.getPI('2026B_N123')
+    assert time.perf_counter() - tick < 1.5
+    assert len(standin.received) == 3
+
+
+def test_post_not_resent_after_gateway_timeout(standin):
+    standin.nfail = 1
+    standin.fail_status = 504
+    observatoryAPIs.setKPFJunkValue('abc', '2026-10-18T12:00:00', junk=True)
+    assert len(standin.received) == 1
+    assert json.loads(standin.received[0][2])['id'] == 'abc'
+
+
+def test_post_resent_when_refused(standin):
+    standin.nfail = 1
+    standin.fail_status = 503
+    result = observatoryAPIs.setKPFJunkValue('abc', '2026-10-18T12:00:00', junk=True)
+    assert len(standin.received) == 2
+    assert result['n'] == 2
+
+
+##-------------------------------------------------------------------------
+## Circuit breaker
+##-------------------------------------------------------------------------
+def test_circuit_opens_and_recovers(standin):
+    standin.nfail = 5
+    observatoryAPIs.getPI('2026B_N123')
+    assert len(standin.received) == 3
+    with pytest.raises(httpclient.CircuitOpen):
+        observatoryAPIs.getPI('2026B_N123')
+    assert len(standin.received) == 5
+    endpoint = httpclient.get_client().endpoint('proposal')
+    assert endpoint.state == 'open'
+    with pytest.raises(httpclient.CircuitOpen):
+        observatoryAPIs.getPI('2026B_N123')
+    assert len(standin.received) == 5
+    assert endpoint.counts['rejected'] == 2
+    # Other endpoints are not affected
+    assert observatoryAPIs.getObserverInfo('1234')['query'] == '/api/schedule/getObserverInfo'
+    time.sleep(0.35)
+    assert endpoint.state == 'half-open'
+    assert observatoryAPIs.getPI('2026B_N123')['query'] == '/api/proposals/getPI'
+    assert endpoint.state == 'closed'
+
+
+def test_failed_probe_reopens(standin):
+    standin.nfail = 6
+    observatoryAPIs.getPI('2026B_N123')
+    with pytest.raises(httpclient.CircuitOpen):
+        observatoryAPIs.getPI('2026B_N123')
+    time.sleep(0.35)
+    with pytest.raises(httpclient.CircuitOpen):
+        observatoryAPIs.getPI('2026B_N123')
+    assert len(standin.received) == 6
+    assert httpclient.get_client().endpoint('proposal').state == 'open'
+
+
+def test_probe_ending_in_other_exception_releases_circuit(standin, monkeypatch):
+    standin.nfail = 5
+    observatoryAPIs.getPI('2026B_N123')
+    with pytest.raises(httpclient.CircuitOpen):
+        observatoryAPIs.getPI('2026B_N123')
+    time.sleep(0.35)
+    client = httpclient.get_client()
+    session = client.get_session()
+    def bad_request(*args, **kwargs):
+        raise ValueError('bad parameter')
+    with monkeypatch.context() as m:
+        m.setattr(session, 'request', bad_request)
+        with pytest.raises(ValueError):
+            observatoryAPIs.getPI('2026B_N123')
+    assert client.endpoint('proposal').probing is False
+    assert observatoryAPIs.getPI('2026B_N123')['query'] == '/api/proposals/getPI'
+    assert client.endpoint('proposal').state == 'closed'
+
+
+def test_pooled_connections(standin):
+    for i in range(10):
+        observatoryAPIs.getPI('2026B_N123')
+    stats = httpclient.get_client().stats()['proposal']
+    assert stats['requests'] == 10 and stats['failed'] == 0
+    assert stats['p50'] is not None
+
+
+def test_magiq_parameters_are_encoded(standin, config):
+    from kpf.magiq import magiq_server_command
+    config('telescope', 'magiq_server', f"{standin.base}/magiq/")
+    params = {'target': 'HD 12345', 'ra': '12:23:11.79', 'dec': '+67:37:49.5',
+              'options': 'pmra=-0.0160 pmdec=-0.079 epoch=2016.00 #comment'}
+    result = json.loads(magiq_server_command('addTarget', params=params))
+    assert {k: v[0] for k,v in result['params'].items()} == params
@@ -0,0 +1,48 @@
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from kpf.cli_interface import LinkingTable
+from kpf.import_profile import load_budget, measure_import, heavy_imports
+
+linking_table = Path(__file__).parent.parent / 'kpf' / 'linking_table.yml'
+budget = load_budget()
+
+
+@pytest.fixture(scope='module')
+def imports():
+    '''The modules imported by each light entry, each in a fresh interpreter
+    with the simulated KTL backend (the interpreters run in parallel).
+    '''
+    linking_tbl = LinkingTable(linking_table, logging.getLogger('test_import_budget'))
+    def measure(entry):
+        module_str = linking_tbl.get_link(entry).rsplit('.', 1)[0]
+        return measure_import(module_str, linking_tbl.module_root)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = pool.map(measure, budget['light'])
+        return dict(zip(budget['light'], results))
+
+
+def test_heavy_packages_listed():
+    assert set(['numpy', 'astropy', 'yaml']) <= set(budget['heavy'])
+    assert len(budget['light']) > 0
+
+
+@pytest.mark.parametrize('entry', budget['light'])
+def test_light_entry_imports_no_heavy_package(entry, imports):
+    total, packages, modules, error = imports[entry]
+    assert error is None
+    assert heavy_imports(modules, budget['heavy']) == []
+
+
+@pytest.mark.parametrize('entry', budget['light'])
+def test_light_entry_within_module_budget(entry, imports):
+    total, packages, modules, error = imports[entry]
+    assert len(modules) <= budget['entries'][entry]
+
+
+def test_heavy_imports():
+    modules = ['kpf', 'numpy', 'numpy.core', 'yamlish', 'astropy.units']
+    assert heavy_imports(modules, ['numpy', 'astropy', 'yaml']) == ['astropy', 'numpy']
@@ -0,0 +1,107 @@
+import json
+import threading
+
+import pytest
+
+from kpf import metadata
+from kpf.metadata import MetadataCache
+from kpf.exceptions import FailedPreCondition
+from kpf.calbench.SetND1 import SetND1
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = MetadataCache(cache_file=tmp_path / 'metadata_cache.json', ttl=3600)
+    cache.persist = True
+    monkeypatch.setattr(metadata, 'cache', cache)
+    return cache
+
+
+class Loader(object):
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+##-------------------------------------------------------------------------
+## Condition TTL
+##-------------------------------------------------------------------------
+def test_fresh_lookup_uses_condition_ttl(cache):
+    loader = Loader(['A', 'B'])
+    cache.get('x', loader)
+    cache.condition_ttl = 0
+    assert cache.get('x', loader) == ['A', 'B'] and loader.calls == 1
+    loader.value = ['A', 'B', 'C']
+    assert cache.get('x', loader, fresh=True) == ['A', 'B', 'C']
+    assert loader.calls == 2
+    cache.condition_ttl = 60
+    assert cache.get('x', loader, fresh=True) == ['A', 'B', 'C']
+    assert loader.calls == 2
+
+
+def test_pre_condition_sees_new_enumerators(cache, monkeypatch):
+    ND1POS = metadata.ktl.cache('kpfcal', 'ND1POS')
+    enumerators = list(ND1POS.enumerators)
+    assert 'OD 5.0' not in enumerators
+    SetND1.pre_condition({'CalND1': enumerators[1]})
+    # A filter installed after the enumerators were cached
+    monkeypatch.setattr(ND1POS, 'enumerators', enumerators + ['OD 5.0'])
+    assert 'OD 5.0' not in metadata.get_enumerators('kpfcal', 'ND1POS')
+    cache.condition_ttl = 0
+    SetND1.pre_condition({'CalND1': 'OD 5.0'})
+    monkeypatch.setattr(ND1POS, 'enumerators', enumerators)
+    with pytest.raises(FailedPreCondition):
+        SetND1.pre_condition({'CalND1': 'OD 5.0'})
+
+
+##-------------------------------------------------------------------------
+## Cache file
+##-------------------------------------------------------------------------
+def test_save_keeps_other_processes_entries(cache, tmp_path):
+    cache.get('a', Loader(1))
+    other = MetadataCache(cache_file=cache.cache_file)
+    other.persist = True
+    other.get('b', Loader(2))
+    cache.get('c', Loader(3))
+    with open(cache.cache_file) as f:
+        disk = json.load(f)
+    assert {name: entry['value'] for name, entry in disk.items()} == {'a': 1, 'b': 2, 'c': 3}
+    assert [f.name for f in tmp_path.iterdir()] == ['metadata_cache.json']
+
+
+def test_concurrent_readers_never_see_partial_file(cache):
+    done = threading.Event()
+    errors = []
+    def read():
+        while not done.is_set():
+            try:
+                with open(cache.cache_file) as f:
+                    json.load(f)
+            except FileNotFoundError:
+                pass
+            except ValueError as e:
+                errors.append(e)
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for i in range(50):
+            cache.get(f"keyword{i}", Loader(list(range(i))))
+    finally:
+        done.set()
+        reader.join()
+    assert errors == []
+
+
+def test_failed_write_leaves_no_temporary_file(cache, tmp_path, monkeypatch):
+    cache.get('a', Loader(1))
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(metadata.json, 'dump', fail)
+    cache.get('b', Loader(2))
+    assert [f.name for f in tmp_path.iterdir()] == ['metadata_cache.json']
+    with open(cache.cache_file) as f:
+        assert list(json.load(f).keys()) == ['a']
@@ -0,0 +1,110 @@
+import datetime
+
+import pytest
+
+from kpf import metrics
+from kpf.metrics import read_metrics, summarize, histogram
+from kpf.KPFTranslatorFunction import KPFFunction
+from kpf.utils.ReportExecutionTimes import ReportExecutionTimes
+
+
+@pytest.fixture
+def records(tmp_path, monkeypatch):
+    '''Enable metrics for one test and return a function which reads the
+    records written today.
+    '''
+    monkeypatch.setenv('KPF_METRICS_DIR', str(tmp_path))
+    monkeypatch.setattr(metrics, 'enabled', True)
+    monkeypatch.setattr(metrics, 'writer', None)
+    def read():
+        today = datetime.datetime.utcnow().date()
+        return read_metrics(today, today)
+    yield read
+    metrics.writer.flush()
+
+
+class Succeeds(KPFFunction):
+    @classmethod
+    def perform(cls, args):
+        pass
+
+
+class Fails(KPFFunction):
+    @classmethod
+    def perform(cls, args):
+        raise ValueError('fails')
+
+
+class Interrupted(KPFFunction):
+    @classmethod
+    def perform(cls, args):
+        raise args['exception']
+
+
+class InterruptedPostCondition(KPFFunction):
+    @classmethod
+    def post_condition(cls, args):
+        raise KeyboardInterrupt
+
+
+##-------------------------------------------------------------------------
+## Records
+##-------------------------------------------------------------------------
+def test_outcomes(records):
+    Succeeds.execute({})
+    with pytest.raises(ValueError):
+        Fails.execute({})
+    success, failed = records()
+    assert success['outcome'] == 'success' and success['exception'] is None
+    assert failed['outcome'] == 'failed' and failed['phase'] == 'perform'
+    assert failed['exception'] == 'ValueError'
+
+
+@pytest.mark.parametrize('exception', [KeyboardInterrupt, SystemExit])
+def test_interrupted_call_is_recorded(records, exception):
+    with pytest.raises(exception):
+        Interrupted.execute({'exception': exception})
+    with pytest.raises(KeyboardInterrupt):
+        InterruptedPostCondition.execute({})
+    perform, post_condition = records()
+    assert perform['outcome'] == 'interrupted'
+    assert perform['phase'] == 'perform'
+    assert perform['exception'] == exception.__name__
+    assert 'pre_condition' in perform and 'perform' in perform
+    assert post_condition['phase'] == 'post_condition'
+    assert post_condition['total'] == pytest.approx(sum([post_condition[phase]
+                                                         for phase in metrics.phases]))
+
+
+##-------------------------------------------------------------------------
+## Report
+##-------------------------------------------------------------------------
+def test_histogram():
+    assert histogram([]) == [0]*7
+    assert histogram([0.0005, 0.001, 0.002, 0.5, 5, 5000]) == [2, 1, 0, 1, 1, 0, 1]
+
+
+def test_summarize():
+    records = [{'function': 'A', 'outcome': 'success', 'total': 0.05},
+               {'function': 'A', 'outcome': 'failed', 'total': 0.5},
+               {'function': 'A', 'outcome': 'interrupted', 'total': 50}]
+    summary = summarize(records)['A']
+    assert summary['failed'] == 1 and summary['interrupted'] == 1
+    assert summary['total']['n'] == 3 and summary['total']['max'] == 50
+    assert summary['total']['histogram'] == [0, 0, 1, 1, 0, 1, 0]
+
+
+def test_report(records, capsys):
+    for i in range(3):
+        Succeeds.execute({})
+    with pytest.raises(KeyboardInterrupt):
+        Interrupted.execute({'exception': KeyboardInterrupt})
+    ReportExecutionTimes.execute({})
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith('4 executions recorded')
+    assert [l.split()[-1] for l in lines if l.startswith('Interrupted ')
+            and 'interrupted' in l] == ['1']
+    header = [l for l in lines if l.startswith('Function') and '<1ms' in l][0]
+    assert header.split()[2:] == ['<1ms', '<10ms', '<100ms', '<1s', '<10s', '<100s', '>100s']
+    total = [l for l in lines if l.startswith('Succeeds') and ' total ' in l]
+    assert sum([int(c) for c in total[-1].split()[2:]]) == 3
@@ -0,0 +1,251 @@
+import json
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import yaml
+
+from kpf import httpclient
+from kpf.ObservingBlocks.OBCache import OBCache
+from kpf.ObservingBlocks.OBStore import OBStore
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+##-------------------------------------------------------------------------
+## Fake proposals API
+##-------------------------------------------------------------------------
+class FakeAPI(object):
+    '''Answers getKPFObservingBlock with a Science OB per OBID, with an ETag
+    (the hash of the response) if etags is True, or 503 if down is True.
+    '''
+    def __init__(self, number):
+        with open(exampleOBs / 'Science.yaml') as f:
+            science = yaml.safe_load(f)
+        science['Target']['RA'] = '12:23:11.79'
+        science['Target']['Dec'] = '-67:37:49.47'
+        self.entries = {}
+        for i in range(number):
+            target = dict(science['Target'], TargetName=f"Target{i:03d}")
+            OBID = f"{i:024x}"
+            self.entries[OBID] = dict(science, Target=target, id=OBID,
+                                      status='OB_FOUND', semid='2026B_N123')
+        self.etags = True
+        self.down = False
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+
+    def modify(self, OBID, comment):
+        self.entries[OBID] = dict(self.entries[OBID], comment=comment)
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, data=b'', etag=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            if etag is not None:
+                self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if api.down is True:
+                self.send(503)
+                return
+            with api.lock:
+                api.requests += 1
+            OBID = parse_qs(urlparse(self.path).query).get('id', [''])[0]
+            entry = api.entries.get(OBID, {'id': OBID, 'status': 'OB_NOT_FOUND'})
+            data = json.dumps([entry]).encode()
+            etag = f'"{hashlib.md5(data).hexdigest()}"' if api.etags is True else None
+            if etag is not None and self.headers.get('If-None-Match') == etag:
+                with api.lock:
+                    api.not_modified += 1
+                self.send(304, etag=etag)
+            else:
+                self.send(200, data, etag=etag)
+    return Handler
+
+
+@pytest.fixture
+def api(serve, config, live_api, monkeypatch):
+    api = FakeAPI(5)
+    base = serve(make_handler(api))
+    config('ObservatoryAPIs', 'proposal_url', f"{base}/api/proposals/")
+    config('httpclient', 'backoff', 0.01)
+    config('httpclient', 'max_backoff', 0.01)
+    config('httpclient', 'failure_threshold', 1000)
+    client = httpclient.HTTPClient()
+    monkeypatch.setattr(httpclient, 'client', client)
+    yield api
+    client.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OBStore(tmp_path / 'OBstore')
+
+
+def new_cache(store, **kwargs):
+    '''A new process: a new OBCache on the same directory.'''
+    kwargs.setdefault('offline', False)
+    return OBCache(store=OBStore(store.directory), **kwargs)
+
+
+def nobjects(store):
+    return len(list((store.directory / 'objects').rglob('*.json')))
+
+
+##-------------------------------------------------------------------------
+## Tests
+##-------------------------------------------------------------------------
+def test_hit_within_ttl(api, store):
+    OBIDs = list(api.entries.keys())
+    cache = new_cache(store)
+    cold = {OBID: cache.get(OBID)[0] for OBID in OBIDs}
+    assert api.requests == len(OBIDs)
+    assert cache.stats['downloaded'] == len(OBIDs)
+    api.requests = 0
+    cache = new_cache(store)
+    for OBID in OBIDs:
+        OB, failures = cache.get(OBID)
+        assert failures == []
+        assert OB.to_dict() == cold[OBID].to_dict()
+    assert api.requests == 0
+    assert cache.stats['hits'] == len(OBIDs)
+
+
+def test_refresh_skips_ttl(api, store):
+    OBID = list(api.entries.keys())[0]
+    cache = new_cache(store)
+    cache.get(OBID)
+    cache.get(OBID, refresh=True)
+    assert api.requests == 2
+    assert cache.stats['revalidated'] == 1
+
+
+def test_revalidate_with_etag(api, store):
+    OBIDs = list(api.entries.keys())
+    new_cache(store).get_many(OBIDs)
+    cache = new_cache(store, ttl=0)
+    results = cache.get_many(OBIDs)
+    assert all([OB is not None for OB, failures in results.values()])
+    assert api.not_modified == len(OBIDs)
+    assert cache.stats['revalidated'] == len(OBIDs)
+    assert cache.stats['downloaded'] == 0
+
+
+def test_revalidate_with_digest(api, store):
+    OBIDs = list(api.entries.keys())
+    api.etags = False
+    new_cache(store).get_many(OBIDs)
+    api.modify(OBIDs[0], 'Updated')
+    cache = new_cache(store, ttl=0)
+    results = cache.get_many(OBIDs)
+    assert results[OBIDs[0]][0].CommentToObserver == 'Updated'
+    assert cache.stats['downloaded'] == 1
+    assert cache.stats['revalidated'] == len(OBIDs) - 1
+    # The superseded revision is removed from the store
+    assert nobjects(store) == len(OBIDs)
+
+
+def test_deleted_from_database(api, store):
+    OBID = list(api.entries.keys())[0]
+    cache = new_cache(store, ttl=0)
+    cache.get(OBID)
+    del api.entries[OBID]
+    OB, failures = cache.get(OBID)
+    assert OB is None
+    assert cache.read(OBID) is None
+
+
+def test_stale_copy_when_unreachable(api, store):
+    OBIDs = list(api.entries.keys())
+    new_cache(store).get_many(OBIDs)
+    api.down = True
+    cache = new_cache(store, ttl=0)
+    for OBID in OBIDs:
+        OB, failures = cache.get(OBID)
+        assert OB is not None and failures == []
+    assert cache.stats['stale'] == len(OBIDs)
+    OB, failures = cache.get('ffffffffffffffffffffffff')
+    assert OB is None and 'unable to retrieve' in failures[0]
+
+
+def test_offline(api, store):
+    OBIDs = list(api.entries.keys())
+    new_cache(store).get_many(OBIDs)
+    api.requests = 0
+    cache = new_cache(store, ttl=0, offline=True)
+    for OBID in OBIDs:
+        assert cache.get(OBID)[0] is not None
+    OB, failures = cache.get('ffffffffffffffffffffffff')
+    assert OB is None and 'offline' in failures[0]
+    assert api.requests == 0
+
+
+def test_lru_eviction(api, store):
+    OBIDs = list(api.entries.keys())
+    cache = new_cache(store)
+    for OBID in OBIDs:
+        cache.get(OBID)
+    cache = new_cache(store, max_entries=3)
+    cache.get(OBIDs[0])  # most recently used, so kept
+    cache.evict()
+    kept = [OBID for OBID in OBIDs if cache.read(OBID) is not None]
+    assert len(kept) == 3 and OBIDs[0] in kept and OBIDs[1] not in kept
+    assert cache.stats['evicted'] == 2
+    assert nobjects(store) == 3
+    assert len(list((store.directory / 'refs').iterdir())) == 3
+
+
+def test_corrupt_stored_copy(api, store):
+    OBID = list(api.entries.keys())[0]
+    cache = new_cache(store)
+    cache.get(OBID)
+    cache.store.object_file(cache.read(OBID).revision).write_bytes(b'{"Target": ')
+    cache = new_cache(store)
+    OB, failures = cache.get(OBID)
+    assert OB is not None and failures == []
+    assert cache.stats['downloaded'] == 1
+    # and it was written again
+    cache = new_cache(store)
+    assert cache.get(OBID)[0] is not None
+    assert cache.stats['hits'] == 1
+
+
+def test_not_modified_without_stored_copy(api, store):
+    OBID = list(api.entries.keys())[0]
+    cache = new_cache(store, ttl=0)
+    cache.get(OBID)
+    assert cache.read(OBID).etag is not None
+    cache.store.object_file(cache.read(OBID).revision).unlink()
+    api.requests = 0
+    OB, failures = cache.get(OBID)
+    assert OB is not None and failures == []
+    # A conditional request answered 304, then one without the ETag
+    assert api.not_modified == 1 and api.requests == 2
+
+
+def test_unusable_cache(api):
+    OBIDs = list(api.entries.keys())
+    cache = OBCache(store=OBStore('/proc/nonexistent/OBstore'), offline=False)
+    for OBID in OBIDs:
+        OB, failures = cache.get(OBID)
+        assert OB is not None and OB.OBID == OBID
+    assert api.requests == len(OBIDs)
+    assert cache.stats['uncached'] == len(OBIDs)
+    offline = OBCache(store=OBStore('/proc/nonexistent/OBstore'), offline=True)
+    OB, failures = offline.get(OBIDs[0])
+    assert OB is None and 'offline' in failures[0]
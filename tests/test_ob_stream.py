@@ -0,0 +1,153 @@
+import json
+import time
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import yaml
+
+from kpf import httpclient
+from kpf.observatoryAPIs import (query_observatoryAPI, stream_observatoryAPI,
+                                 iter_OBs_from_KPFCC_API, get_OBs_from_KPFCC_API)
+from kpf.ObservingBlocks.OBTable import OBTable
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+number = 150
+
+
+def response_body(n):
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    science['Target']['RA'] = '12:23:11.79'
+    science['Target']['Dec'] = '-67:37:49.47'
+    entries = []
+    for i in range(n):
+        target = dict(science['Target'], TargetName=f"Target {i:05d} é")
+        entries.append(dict(science, Target=target, id=f"{i:024x}", status='OB_FOUND',
+                            semid='2026B_N123'))
+    return json.dumps(entries).encode()
+
+
+def make_handler(body):
+    '''Answers getKPFObservingBlock according to the semid: "full" is the
+    whole body, "error" an ERROR result, "truncated" half of the body,
+    "invalid" a corrupted body, "dropped" half of the body before closing
+    the connection, "stalled" half of the body before stalling, and
+    "server_error" the body with status 500.
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, data, status=200, length=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data) if length is None else length))
+            self.end_headers()
+            self.wfile.write(data)
+            self.wfile.flush()
+
+        def do_GET(self):
+            semid = parse_qs(urlparse(self.path).query)['semid'][0]
+            half = body[:len(body)//2]
+            try:
+                if semid == 'full':
+                    self.send(body)
+                elif semid == 'error':
+                    self.send(json.dumps({'status': 'ERROR', 'message': 'Invalid semid'}).encode())
+                elif semid == 'truncated':
+                    self.send(half)
+                elif semid == 'invalid':
+                    self.send(half + b'}}' + body[len(body)//2:])
+                elif semid == 'dropped':
+                    self.send(half, length=len(body))
+                    self.close_connection = True
+                elif semid == 'stalled':
+                    self.send(half, length=len(body))
+                    time.sleep(1)
+                elif semid == 'server_error':
+                    self.send(body, status=500)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+    return Handler
+
+
+@pytest.fixture(scope='module')
+def body():
+    return response_body(number)
+
+
+@pytest.fixture
+def api(serve, config, live_api, monkeypatch, body):
+    base = serve(make_handler(body))
+    config('ObservatoryAPIs', 'proposal_url', f"{base}/api/proposals/")
+    config('httpclient', 'retries', 0)
+    config('httpclient', 'read_timeout', 0.3)
+    config('httpclient', 'failure_threshold', 1000)
+    client = httpclient.HTTPClient()
+    monkeypatch.setattr(httpclient, 'client', client)
+    yield base
+    client.close()
+
+
+def stream(semid):
+    return stream_observatoryAPI('proposal', 'getKPFObservingBlock', {'semid': semid})
+
+
+##-------------------------------------------------------------------------
+## Complete responses
+##-------------------------------------------------------------------------
+def test_streamed_OBs_match_parse_all(api):
+    result = query_observatoryAPI('proposal', 'getKPFObservingBlock', {'semid': 'full'})
+    OBs, failures = OBTable(result).get_OBs()
+    streamedOBs, streamed_failures = get_OBs_from_KPFCC_API({'semid': 'full'})
+    assert len(OBs) == len(streamedOBs) == number
+    assert [OB.to_dict() for OB in OBs] == [OB.to_dict() for OB in streamedOBs]
+    assert failures == streamed_failures == []
+
+
+def test_batches_grow(api):
+    sizes = [len(OBs) for OBs, failures in iter_OBs_from_KPFCC_API({'semid': 'full'},
+                                                                    batch_size=64)]
+    assert sizes[:7] == [1, 2, 4, 8, 16, 32, 64] and sum(sizes) == number
+
+
+def test_error_result(api):
+    OBs, failures = get_OBs_from_KPFCC_API({'semid': 'error'})
+    assert OBs == [] and failures == [[None, 'ERROR']]
+
+
+def test_server_error_is_not_parsed(api):
+    OBs, failures = get_OBs_from_KPFCC_API({'semid': 'server_error'})
+    assert OBs == [] and len(failures) == 1 and '500' in failures[0]
+
+
+##-------------------------------------------------------------------------
+## Incomplete responses
+##-------------------------------------------------------------------------
+@pytest.mark.parametrize('semid', ['truncated', 'invalid'])
+def test_bad_body_raises(api, semid):
+    entries = []
+    with pytest.raises(json.JSONDecodeError):
+        for entry in stream(semid):
+            entries.append(entry)
+    assert 0 < len(entries) < number
+
+
+@pytest.mark.parametrize('semid', ['truncated', 'invalid', 'dropped', 'stalled'])
+def test_incomplete_response_is_a_failure(api, semid):
+    OBs, failures = get_OBs_from_KPFCC_API({'semid': semid})
+    assert 0 < len(OBs) < number
+    assert len(failures) == 1
+    assert 'Incomplete response' in failures[0]
+    assert f"first {len(OBs)}" in failures[0]
+
+
+def test_unreachable_is_a_failure(api, config):
+    config('ObservatoryAPIs', 'proposal_url', 'http://127.0.0.1:9/api/proposals/')
+    OBs, failures = get_OBs_from_KPFCC_API({'semid': 'full'})
+    assert OBs == [] and len(failures) == 1
+    assert 'Unable to retrieve OBs' in failures[0]
@@ -0,0 +1,231 @@
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from kpf import httpclient
+from kpf import observatoryAPIs
+from kpf.observatoryAPIs import outbox as outbox_module
+from kpf.observatoryAPIs.outbox import Outbox
+
+
+##-------------------------------------------------------------------------
+## Stand-in proposals API
+##-------------------------------------------------------------------------
+class StandIn(object):
+    '''Records the POSTed bodies, acknowledging a repeated Idempotency-Key
+    without recording it again. Answers 503 while down, and an ERROR
+    result while error is True.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.down = False
+        self.error = False
+        self.requests = 0
+        self.received = []
+        self.keys = set()
+
+    def sent(self, OBID):
+        return [body['exposure_start_times'][0] for key, body in self.received
+                if body['id'] == OBID]
+
+
+def make_handler(standin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length))
+            key = self.headers.get('Idempotency-Key')
+            with standin.lock:
+                standin.requests += 1
+                if standin.down is True:
+                    status, result = 503, {}
+                elif standin.error is True:
+                    status, result = 200, {'status': 'ERROR', 'message': 'Rejected'}
+                else:
+                    status, result = 200, {'status': 'COMPLETE'}
+                    if key not in standin.keys:
+                        standin.keys.add(key)
+                        standin.received.append((key, body))
+            data = json.dumps(result).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+    return Handler
+
+
+@pytest.fixture
+def standin(serve, config, live_api, monkeypatch):
+    standin = StandIn()
+    base = serve(make_handler(standin))
+    config('ObservatoryAPIs', 'proposal_url', f"{base}/api/proposals/")
+    config('httpclient', 'retries', 0)
+    config('httpclient', 'failure_threshold', 1000)
+    config('outbox', 'backoff', 60)
+    config('outbox', 'max_backoff', 60)
+    config('outbox', 'max_attempts', 3)
+    config('outbox', 'claim_timeout', 120)
+    client = httpclient.HTTPClient()
+    monkeypatch.setattr(httpclient, 'client', client)
+    yield standin
+    client.close()
+
+
+@pytest.fixture
+def new_outbox(tmp_path, monkeypatch):
+    '''Outboxes on the same file, as used by different processes. They are
+    flushed by the tests rather than by a background thread.
+    '''
+    outboxes = []
+    def new():
+        outbox = Outbox(outbox_file=tmp_path / 'outbox.sqlite')
+        outbox.start = lambda: None
+        monkeypatch.setattr(outbox_module, 'outbox', outbox)
+        outboxes.append(outbox)
+        return outbox
+    yield new
+    for outbox in outboxes:
+        if outbox.connection is not None:
+            outbox.connection.close()
+
+
+def history(OBID, i):
+    return {'id': OBID, 'observer': 'Observer',
+            'exposure_start_times': [f"2026-10-18T10:00:{i:02d}.00"],
+            'exposure_times': [30.0]}
+
+
+##-------------------------------------------------------------------------
+## Tests
+##-------------------------------------------------------------------------
+def test_enqueue_is_idempotent(standin, new_outbox):
+    outbox = new_outbox()
+    key = outbox.enqueue('proposal', 'addObservingBlockHistory', history('A', 1))
+    assert outbox.enqueue('proposal', 'addObservingBlockHistory', history('A', 1)) == key
+    assert outbox.enqueue('proposal', 'addObservingBlockHistory', history('A', 2)) != key
+    assert len(outbox.records()) == 2
+    outbox.flush()
+    # Queued again once sent: still not sent twice
+    outbox.enqueue('proposal', 'addObservingBlockHistory', history('A', 1))
+    counts = outbox.flush()
+    assert counts['sent'] == 2 and counts['pending'] == 0
+    assert standin.requests == 2
+    assert [key for key, body in standin.received][0] == key
+
+
+def test_history_key_ignores_rederived_fields(standin, new_outbox):
+    outbox = new_outbox()
+    h = history('A', 1)
+    key = observatoryAPIs.queueObservingBlockHistory(dict(h))
+    # The same execution derived again, e.g. from keyword history
+    assert observatoryAPIs.queueObservingBlockHistory(dict(h, observer='Other')) == key
+    assert len(outbox.records()) == 1
+
+
+def test_order_held_while_retrying(standin, new_outbox):
+    outbox = new_outbox()
+    for OBID, i in [('A', 1), ('A', 2), ('B', 1), ('A', 3)]:
+        observatoryAPIs.queueObservingBlockHistory(history(OBID, i))
+    standin.down = True
+    outbox.flush()
+    # Only the first record of each OB is attempted
+    attempted = [(r.ordering, r.attempts) for r in outbox.records() if r.attempts > 0]
+    assert attempted == [('A', 1), ('B', 1)]
+    assert standin.requests == 2
+    standin.down = False
+    # Both are waiting for their retry, so nothing is due
+    assert outbox.flush()['sent'] == 0
+    counts = outbox.flush(force=True)
+    assert counts['sent'] == 4
+    assert standin.sent('A') == [history('A', i)['exposure_start_times'][0] for i in [1, 2, 3]]
+
+
+def test_claim_released_after_timeout(standin, new_outbox, config):
+    outbox = new_outbox()
+    observatoryAPIs.queueObservingBlockHistory(history('A', 1))
+    # A process claims the record and dies before sending it
+    assert outbox.claim() is not None
+    outbox = new_outbox()
+    assert outbox.flush()['sending'] == 1
+    assert standin.requests == 0
+    config('outbox', 'claim_timeout', 0)
+    outbox = new_outbox()
+    counts = outbox.flush()
+    assert counts['sent'] == 1 and counts['sending'] == 0
+
+
+def test_failed_after_max_attempts(standin, new_outbox):
+    outbox = new_outbox()
+    key = observatoryAPIs.queueObservingBlockHistory(history('A', 1))
+    later = observatoryAPIs.queueObservingBlockHistory(history('A', 2))
+    standin.error = True
+    for i in range(3):
+        outbox.flush(force=True)
+    record = outbox.record(key)
+    assert record.status == 'failed' and record.attempts == 3
+    assert 'Rejected' in record.last_error
+    # The failed record still holds back the later history for its OB
+    standin.error = False
+    outbox.flush(force=True)
+    assert outbox.record(later).status == 'pending'
+    assert standin.requests == 3
+    assert outbox.retry_failed() == 1
+    assert outbox.record(key).attempts == 0
+    counts = outbox.flush()
+    assert counts['sent'] == 2 and counts['failed'] == 0
+    assert standin.sent('A') == [history('A', i)['exposure_start_times'][0] for i in [1, 2]]
+
+
+def test_discard_failed(standin, new_outbox):
+    outbox = new_outbox()
+    key = observatoryAPIs.queueObservingBlockHistory(history('A', 1))
+    later = observatoryAPIs.queueObservingBlockHistory(history('A', 2))
+    standin.error = True
+    for i in range(3):
+        outbox.flush(force=True)
+    standin.error = False
+    assert outbox.discard_failed() == 1
+    assert outbox.record(key) is None
+    outbox.flush()
+    assert outbox.record(later).status == 'sent'
+
+
+def test_flush_force(standin, new_outbox):
+    outbox = new_outbox()
+    observatoryAPIs.queueObservingBlockHistory(history('A', 1))
+    standin.down = True
+    outbox.flush()
+    standin.down = False
+    assert outbox.flush()['pending'] == 1
+    assert outbox.flush(force=True)['sent'] == 1
+
+
+def test_stop_sends_pending_records(standin, tmp_path, config, monkeypatch):
+    config('outbox', 'exit_timeout', 5)
+    outbox = Outbox(outbox_file=tmp_path / 'outbox.sqlite')
+    monkeypatch.setattr(outbox_module, 'outbox', outbox)
+    # A command run by the kpfdo server ends with os._exit, which skips
+    # atexit, so the server stops the outbox itself (see cli_server)
+    pid = os.fork()
+    if pid == 0:
+        observatoryAPIs.queueObservingBlockHistory(history('A', 1))
+        outbox_module.outbox.stop()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert len(standin.received) == 1
+
+
+def test_unusable_outbox(standin, monkeypatch):
+    outbox = Outbox(outbox_file='/proc/nonexistent/outbox.sqlite')
+    monkeypatch.setattr(outbox_module, 'outbox', outbox)
+    assert observatoryAPIs.queueObservingBlockHistory(history('A', 1)) is None
+    assert len(standin.received) == 1
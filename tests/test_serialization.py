@@ -0,0 +1,153 @@
+import io
+import json
+import random
+
+import pytest
+
+from kpf.ObservingBlocks import get_schema
+from kpf.ObservingBlocks import serialization
+from kpf.ObservingBlocks.serialization import canonical_dumps, dumps, loads, iter_items
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.ObservingBlocks.Calibration import Calibration
+from kpf.ObservingBlocks.OBStore import OBStore
+
+
+def random_value(spec, rng):
+    if spec.valuetype == bool:
+        return rng.random() > 0.5
+    elif spec.valuetype == int:
+        return rng.randint(1, 4)
+    elif spec.valuetype == float:
+        return round(rng.uniform(0, 100), spec.precision or 3)
+    else:
+        return rng.choice(['', 'abc', "quote's", 'ünïcode', 'two words', '12:34:56.7'])
+
+
+def random_component(schema, rng):
+    return {spec.textname: random_value(spec, rng) for spec in schema.properties
+            if rng.random() > 0.2}
+
+
+def random_OB(i, rng):
+    OB = {'id': f"{i:024x}", 'ProgramID': rng.choice(['', 'K123', 'N456']),
+          'semester': '2026B', 'semid': '2026B_K123', 'comment': rng.choice(['', 'note'])}
+    if rng.random() > 0.3:
+        OB['Target'] = random_component(get_schema('TargetProperties.yaml'), rng)
+        OB['Observations'] = [random_component(get_schema('ObservationProperties.yaml'), rng)
+                              for j in range(rng.randint(1, 3))]
+    else:
+        OB['Calibrations'] = [random_component(get_schema('CalibrationProperties.yaml'), rng)
+                              for j in range(rng.randint(1, 5))]
+    if rng.random() > 0.8:
+        OB['History'] = [{'observer': 'someone', 'timestamp': '2026-10-18T10:00:00',
+                          'exposure_times': [30.0, 30.0]}]
+    return ObservingBlock(OB)
+
+
+@pytest.fixture(scope='module')
+def OBs():
+    rng = random.Random(0)
+    return [random_OB(i, rng) for i in range(200)]
+
+
+@pytest.fixture
+def without_orjson(monkeypatch):
+    monkeypatch.setattr(serialization, 'orjson', None)
+
+
+##-------------------------------------------------------------------------
+## Canonical form
+##-------------------------------------------------------------------------
+def test_canonical_form():
+    obj = {'b': [1e-05, 1e20, 0.1, 3.0], 'a': 'ünïcode', 'c': None}
+    assert canonical_dumps(obj) == '{"a":"ünïcode","b":[1e-05,1e+20,0.1,3.0],"c":null}'.encode()
+
+
+def test_canonical_form_rejects_nan():
+    for value in [float('nan'), float('inf')]:
+        with pytest.raises(ValueError):
+            canonical_dumps({'a': value})
+
+
+def test_canonical_form_does_not_depend_on_orjson(OBs, monkeypatch):
+    with_orjson = [canonical_dumps(OB.to_dict()) for OB in OBs]
+    monkeypatch.setattr(serialization, 'orjson', None)
+    assert [canonical_dumps(OB.to_dict()) for OB in OBs] == with_orjson
+
+
+def test_store_revision_does_not_depend_on_orjson(OBs, tmp_path, monkeypatch):
+    OBdict = {'id': 'abc', 'Target': {'TargetName': 'x', 'Parallax': 1e-05}}
+    revision = OBStore.revision_of(OBdict)[0]
+    monkeypatch.setattr(serialization, 'orjson', None)
+    assert OBStore.revision_of(OBdict)[0] == revision
+
+
+def test_snapshot_digest_does_not_depend_on_orjson(OBs, monkeypatch):
+    targets = [OB.Target for OB in OBs if OB.Target is not None]
+    digests = [target.snapshot().digest for target in targets]
+    monkeypatch.setattr(serialization, 'orjson', None)
+    from kpf.ObservingBlocks import ComponentSnapshot
+    assert [ComponentSnapshot(target).digest for target in targets] == digests
+
+
+##-------------------------------------------------------------------------
+## Round trips
+##-------------------------------------------------------------------------
+def test_round_trip_dict(OBs):
+    for OB in OBs:
+        OBdict = OB.to_dict()
+        assert ObservingBlock(OBdict).to_dict() == OBdict
+
+
+@pytest.mark.parametrize('orjson', [True, False])
+def test_round_trip_json(OBs, orjson, monkeypatch):
+    if orjson is False:
+        monkeypatch.setattr(serialization, 'orjson', None)
+    for OB in OBs:
+        OBdict = OB.to_dict()
+        assert ObservingBlock.from_dict(loads(dumps(OBdict))).to_dict() == OBdict
+
+
+def test_round_trip_store(OBs, tmp_path):
+    store = OBStore(directory=tmp_path / 'OBstore')
+    for OB in OBs:
+        OBdict = OB.to_dict()
+        revision = store.put(OB)
+        assert store.get(revision=revision).to_dict() == OBdict
+        assert store.get(OBID=OB.OBID).to_dict() == OBdict
+        # The same content is the same revision
+        assert store.put(ObservingBlock(OBdict)) == store.latest_revision(OB.OBID)
+
+
+def test_unknown_property_is_a_type_error():
+    calibration = {'CalSource': 'EtalonFiber', 'Bogus': 1}
+    with pytest.raises(TypeError, match='No property named Bogus'):
+        Calibration(calibration)
+    with pytest.raises(AttributeError):
+        Calibration(calibration)
+    del calibration['Bogus']
+    assert Calibration(calibration).get('CalSource') == 'EtalonFiber'
+
+
+##-------------------------------------------------------------------------
+## Incremental parsing
+##-------------------------------------------------------------------------
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_iter_items(chunk_size, monkeypatch):
+    monkeypatch.setattr(serialization, 'ijson', None)
+    items = [{'id': i, 'x': 12.5e3, 's': 'ü ]' * i} for i in range(20)] + [1, 'a', None]
+    data = json.dumps(items, ensure_ascii=False).encode()
+    assert list(iter_items(io.BytesIO(data), chunk_size=chunk_size)) == items
+    assert list(iter_items(io.BytesIO(b' [ ] '), chunk_size=chunk_size)) == []
+    assert list(iter_items(io.BytesIO(b'{"a": 1}'), chunk_size=chunk_size)) == [{'a': 1}]
+
+
+def test_iter_items_truncated(monkeypatch):
+    monkeypatch.setattr(serialization, 'ijson', None)
+    data = json.dumps([{'id': i} for i in range(10)]).encode()
+    items = []
+    with pytest.raises(json.JSONDecodeError):
+        for item in iter_items(io.BytesIO(data[:-10]), chunk_size=16):
+            items.append(item)
+    assert items == [{'id': i} for i in range(len(items))]
+    assert 0 < len(items) < 10
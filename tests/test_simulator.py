@@ -0,0 +1,13 @@
+from kpf.simulator import Simulator
+
+
+def test_stats_count_reads():
+    simulator = Simulator(time_scale=0.001)
+    expose = simulator.get_keyword('kpfexpose', 'EXPOSE')
+    assert expose.read() == 'Ready'
+    expose.write('Start', wait=False)
+    assert simulator.waitFor("$kpfexpose.EXPOSE == Ready", timeout=600) is True
+    assert expose.read() == 'Ready'
+    assert simulator.stats['reads'] == 2
+    assert simulator.stats['writes'] == 1
+    assert simulator.stats['waits'] == 1 and simulator.stats['timeouts'] == 0
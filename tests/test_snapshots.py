@@ -0,0 +1,91 @@
+import copy
+import pickle
+from pathlib import Path
+
+import pytest
+import yaml
+
+from kpf import ObservingBlocks
+from kpf.ObservingBlocks.ObservingBlock import ObservingBlock
+from kpf.scripts.EstimateOBDuration import EstimateOBDuration
+
+exampleOBs = Path(__file__).parent.parent / 'kpf' / 'ObservingBlocks' / 'exampleOBs'
+
+
+@pytest.fixture
+def OB():
+    with open(exampleOBs / 'Science.yaml') as f:
+        science = yaml.safe_load(f)
+    science['Target']['RA'] = '12:23:11.79'
+    science['Target']['Dec'] = '-67:37:49.47'
+    return ObservingBlock(science)
+
+
+##-------------------------------------------------------------------------
+## Snapshots
+##-------------------------------------------------------------------------
+def test_snapshot_is_immutable(OB):
+    snapshot = OB.Target.snapshot()
+    assert copy.deepcopy(snapshot) is snapshot
+    with pytest.raises(AttributeError):
+        snapshot.values = ()
+    assert pickle.loads(pickle.dumps(snapshot)) == snapshot
+
+
+def test_snapshot_digest_is_stable(OB):
+    snapshot = OB.Target.snapshot()
+    assert ObservingBlock(OB.to_dict()).Target.snapshot().digest == snapshot.digest
+    assert snapshot.thaw().snapshot() == snapshot
+
+
+def test_copies_are_independent(OB):
+    duplicate = copy.deepcopy(OB)
+    duplicate.Observations[0].set('ExpTime', duplicate.Observations[0].get('ExpTime') + 60)
+    assert OB.Observations[0].snapshot() != duplicate.Observations[0].snapshot()
+    assert OB.Observations[0].get('ExpTime') + 60 == duplicate.Observations[0].get('ExpTime')
+
+
+##-------------------------------------------------------------------------
+## Memoised values
+##-------------------------------------------------------------------------
+def test_duration_follows_edits(OB):
+    duplicate = copy.deepcopy(OB)
+    before = EstimateOBDuration.execute({}, OB=duplicate)
+    nExp = duplicate.Observations[0].get('nExp')
+    duplicate.Observations[0].set('ExpTime', duplicate.Observations[0].get('ExpTime') + 60)
+    assert EstimateOBDuration.execute({}, OB=duplicate) == pytest.approx(before + nExp)
+    assert EstimateOBDuration.execute({}, OB=OB) == before
+
+
+def test_duration_follows_configuration(OB, config):
+    from kpf import cfg
+    before = EstimateOBDuration.execute({}, OB=OB)
+    acquire_time = cfg.getfloat('time_estimates', 'acquire_time', fallback=10)
+    config('time_estimates', 'acquire_time', acquire_time + 60)
+    assert EstimateOBDuration.execute({}, OB=OB) == pytest.approx(before + 1)
+
+
+def test_star_list_follows_edits(OB):
+    duplicate = copy.deepcopy(OB)
+    duplicate.Target.set('TargetName', 'Renamed')
+    assert 'Renamed' in duplicate.Target.to_star_list()
+    assert 'Renamed' not in OB.Target.to_star_list()
+
+
+def test_summary_follows_instrument_options(OB):
+    observation = OB.Observations[0]
+    observation.set('ExpMeterMode', 'control')
+    observation.set('ExpMeterBin', 1)
+    assert f"@{observation.expmeter_bands[0]}" in observation.summary()
+    # The bands come from the instrument, not from the component values
+    observation.expmeter_bands = ('123nm',) + tuple(observation.expmeter_bands[1:])
+    assert '@123nm' in observation.summary()
+
+
+def test_memoised_results_match(OB, monkeypatch):
+    results = {}
+    for memoization in [False, True]:
+        monkeypatch.setattr(ObservingBlocks, 'memoization', memoization)
+        results[memoization] = (EstimateOBDuration.execute({}, OB=OB),
+                                OB.Target.to_star_list())
+    assert results[True] == results[False]
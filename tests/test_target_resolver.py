@@ -0,0 +1,211 @@
+import time
+import types
+import threading
+
+import pytest
+from astropy.table import Table, MaskedColumn
+
+from kpf.ObservingBlocks import TargetResolver
+from kpf.ObservingBlocks.TargetResolver import ResolverCache, normalise_key
+
+
+##-------------------------------------------------------------------------
+## Fake astroquery backend
+##-------------------------------------------------------------------------
+class FakeCatalogs(object):
+    '''Stands in for the astroquery.simbad and astroquery.vizier modules.
+    Target i is HD i, with Gaia DR3 ID 1000+i and 2MASS ID J0000000i. Any
+    name which is not "HD <n>" is unknown.
+    '''
+    def __init__(self):
+        self.queries = 0
+        self.fail = False
+        self.lock = threading.Lock()
+        fake = self
+        class Simbad(object):
+            @staticmethod
+            def query_objectids(name):
+                i = fake.query(name)
+                if i is None:
+                    return None
+                return Table({'ID': [f"HD {i}", f"Gaia DR3 {1000+i}", f"2MASS J{i:08d}"]})
+            @staticmethod
+            def query_object(name):
+                return Table({'RA': ['01 02 03.4'], 'DEC': ['+05 06 07.8']})
+        class Vizier(object):
+            def __init__(self, catalog=None):
+                self.catalog = catalog
+            def query_constraints(self, Source=None):
+                i = int(Source) - 1000
+                fake.query(f"HD {i}")
+                row = {'RA_ICRS': i % 360, 'DE_ICRS': i % 90, 'pmRA': 10.0,
+                       'pmDE': -5.0, 'Plx': 20.0, 'RVDR2': 0.0, 'Gmag': 6.0,
+                       'Tefftemp': 5000.0}
+                table = Table({k: MaskedColumn([v]) for k,v in row.items()})
+                table['RVDR2'].mask[0] = True
+                return [table]
+            def query_object(self, twomassid, radius=None):
+                fake.query(f"HD {int(twomassid[1:])}")
+                return [Table({'Jmag': MaskedColumn([5.0])})]
+        self.simbad = types.SimpleNamespace(Simbad=Simbad)
+        self.vizier = types.SimpleNamespace(Vizier=Vizier)
+
+    def query(self, name):
+        with self.lock:
+            self.queries += 1
+        if self.fail is True:
+            raise ConnectionError('Simulated network failure')
+        if not name.upper().startswith('HD '):
+            return None
+        return int(name[3:])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResolverCache(cache_file=tmp_path / 'target_resolver.sqlite',
+                          ttl=3600, negative_ttl=60, offline=False)
+    monkeypatch.setattr(TargetResolver, 'cache', cache)
+    return cache
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    from kpf.ObservingBlocks import Target
+    fake = FakeCatalogs()
+    monkeypatch.setattr(Target, 'simbad', fake.simbad)
+    monkeypatch.setattr(Target, 'vizier', fake.vizier)
+    return fake
+
+
+class Loader(object):
+    '''Loader for ResolverCache.get which counts its calls.'''
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+##-------------------------------------------------------------------------
+## ResolverCache
+##-------------------------------------------------------------------------
+def test_normalise_key():
+    assert normalise_key('hd  10700') == normalise_key('HD 10700') == 'HD 10700'
+
+
+def test_hit_within_ttl(cache):
+    loader = Loader({'TargetName': 'HD 1'})
+    assert cache.get('simbad', 'HD 1', loader) == {'TargetName': 'HD 1'}
+    assert cache.get('simbad', 'hd   1', loader) == {'TargetName': 'HD 1'}
+    assert loader.calls == 1
+    assert cache.stats['hits'] == 1
+
+
+def test_expired_entry_is_queried_again(cache):
+    loader = Loader({'TargetName': 'HD 1'})
+    cache.get('simbad', 'HD 1', loader)
+    cache.ttl = 0
+    cache.get('simbad', 'HD 1', loader)
+    assert loader.calls == 2
+
+
+def test_negative_cache(cache):
+    loader = Loader(None)
+    assert cache.get('simbad', 'Not A Star', loader) is None
+    assert cache.get('simbad', 'not a star', loader) is None
+    assert loader.calls == 1
+    # Negative entries have their own TTL
+    cache.negative_ttl = 0
+    assert cache.get('simbad', 'Not A Star', loader) is None
+    assert loader.calls == 2
+
+
+def test_stale_entry_used_when_query_fails(cache):
+    cache.get('simbad', 'HD 1', Loader({'TargetName': 'HD 1'}))
+    cache.ttl = 0
+    failing = Loader(ConnectionError('no network'))
+    assert cache.get('simbad', 'HD 1', failing) == {'TargetName': 'HD 1'}
+    assert failing.calls == 1
+    assert cache.stats['stale'] == 1
+
+
+def test_failure_without_entry_raises(cache):
+    with pytest.raises(ConnectionError):
+        cache.get('simbad', 'HD 2', Loader(ConnectionError('no network')))
+
+
+def test_offline(cache):
+    cache.get('simbad', 'HD 1', Loader({'TargetName': 'HD 1'}))
+    cache.ttl = 0
+    cache.offline = True
+    loader = Loader({'TargetName': 'changed'})
+    assert cache.get('simbad', 'HD 1', loader) == {'TargetName': 'HD 1'}
+    assert cache.get('simbad', 'HD 2', loader) is None
+    assert loader.calls == 0
+    assert cache.stats['offline'] == 1
+
+
+def test_unusable_cache_is_a_miss(tmp_path):
+    cache = ResolverCache(cache_file='/proc/nonexistent/target_resolver.sqlite',
+                          offline=False)
+    loader = Loader({'TargetName': 'HD 1'})
+    assert cache.get('simbad', 'HD 1', loader) == {'TargetName': 'HD 1'}
+    assert cache.get('simbad', 'HD 1', loader) == {'TargetName': 'HD 1'}
+    assert loader.calls == 2
+    assert cache.stats['uncached'] == 2
+    values = cache.get_many('simbad', ['HD 1', 'hd 1'], loader)
+    assert values == {'HD 1': {'TargetName': 'HD 1'}, 'hd 1': {'TargetName': 'HD 1'}}
+
+
+def test_get_many_deduplicates(cache):
+    calls = []
+    def loader(key):
+        calls.append(key)
+        if key.upper() == 'BAD':
+            raise ConnectionError('no network')
+        return {'TargetName': key}
+    cache.get('simbad', 'HD 3', Loader({'TargetName': 'HD 3'}))
+    keys = ['HD 1', 'hd  1', 'HD 2', 'HD 1', 'HD 3', 'bad']
+    values = cache.get_many('simbad', keys, loader)
+    assert sorted(calls) == ['HD 1', 'HD 2', 'bad']
+    assert values['hd  1'] == values['HD 1'] == {'TargetName': 'HD 1'}
+    assert values['HD 3'] == {'TargetName': 'HD 3'}
+    assert isinstance(values['bad'], ConnectionError)
+    assert list(values.keys()) == list(dict.fromkeys(keys))
+
+
+##-------------------------------------------------------------------------
+## Target resolution through the cache
+##-------------------------------------------------------------------------
+def test_resolve_names(cache, fake):
+    from kpf.ObservingBlocks.Target import Target
+    names = [f"HD {i % 5 + 1}" if i % 2 else f"hd  {i % 5 + 1}" for i in range(20)]
+    targets = Target.resolve_names(names)
+    # Simbad, Gaia, and 2MASS once per distinct target
+    assert fake.queries == 3*5
+    for name, target in zip(names, targets):
+        assert target.get('TargetName') == name
+        assert target.get('GaiaID') == f"DR3 {1000+int(name.split()[-1])}"
+        assert target.get('Jmag') == 5.0
+    Target.resolve_names(names)
+    assert fake.queries == 3*5
+
+
+def test_resolve_name_falls_back_when_catalogs_fail(cache, fake):
+    from kpf.ObservingBlocks.Target import Target
+    assert Target.resolve_name('HD 1').get('GaiaID') == 'DR3 1001'
+    cache.ttl = 0
+    fake.fail = True
+    assert Target.resolve_name('HD 1').get('GaiaID') == 'DR3 1001'
+    assert cache.stats['stale'] > 0
+
+
+def test_resolve_name_unknown(cache, fake):
+    from kpf.ObservingBlocks.Target import Target
+    assert Target.resolve_name('Not A Star').get('TargetName') == ''
+    assert Target.resolve_name('not a star').get('TargetName') == ''
+    assert fake.queries == 1
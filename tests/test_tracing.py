@@ -0,0 +1,119 @@
+import json
+import time
+import threading
+
+import pytest
+
+from kpf import tracing
+from kpf.tracing import union_duration, traced_wait
+from kpf.KPFTranslatorFunction import KPFFunction
+
+
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    '''Enable tracing for one test and return a function which reads the
+    trace files written.
+    '''
+    monkeypatch.setenv('KPF_TRACE_DIR', str(tmp_path))
+    monkeypatch.setattr(tracing, 'enabled', True)
+    monkeypatch.setattr(tracing, 'root_span', None)
+    def read():
+        traces = []
+        for trace_file in sorted(tmp_path.glob('*.json')):
+            with open(trace_file) as f:
+                traces.append(json.load(f))
+        return traces
+    return read
+
+
+def sleep_in_wait(name, seconds):
+    span = tracing.start_span(name, category='wait')
+    time.sleep(seconds)
+    tracing.end_span(span)
+
+
+class NestedWaits(KPFFunction):
+    @classmethod
+    def perform(cls, args):
+        outer = tracing.start_span('outer wait', category='wait')
+        sleep_in_wait('inner wait', 0.1)
+        time.sleep(0.1)
+        tracing.end_span(outer)
+        time.sleep(0.1)
+
+
+class ConcurrentWaits(KPFFunction):
+    @classmethod
+    def perform(cls, args):
+        threads = [threading.Thread(target=sleep_in_wait, args=(f"wait {i}", 0.2))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+class Interrupted(KPFFunction):
+    @classmethod
+    def perform(cls, args):
+        sleep_in_wait('wait', 0.05)
+        raise KeyboardInterrupt
+
+
+class InterruptedWait(KPFFunction):
+    @classmethod
+    def perform(cls, args):
+        def wait_forever():
+            raise KeyboardInterrupt
+        traced_wait(wait_forever, lambda: 'waitFor forever')()
+
+
+##-------------------------------------------------------------------------
+## Wait time
+##-------------------------------------------------------------------------
+def test_union_duration():
+    assert union_duration([]) == 0
+    assert union_duration([(0, 1), (2, 3)]) == 2
+    assert union_duration([(0, 4), (1, 2)]) == 4
+    assert union_duration([(0, 2), (1, 3), (5, 6)]) == 4
+    assert union_duration([(1, 3), (0, 2), (0, 2)]) == 3
+
+
+def test_nested_waits_counted_once(traces):
+    NestedWaits.execute({})
+    trace, = traces()
+    other = trace['otherData']
+    assert other['wait_s'] == pytest.approx(0.2, abs=0.05)
+    assert other['active_s'] == pytest.approx(0.1, abs=0.05)
+
+
+def test_concurrent_waits_counted_once(traces):
+    ConcurrentWaits.execute({})
+    trace, = traces()
+    assert trace['otherData']['wait_s'] == pytest.approx(0.2, abs=0.05)
+    assert trace['otherData']['wait_s'] <= trace['otherData']['total_s']
+
+
+##-------------------------------------------------------------------------
+## Interrupted calls
+##-------------------------------------------------------------------------
+def test_interrupted_call_writes_trace(traces):
+    with pytest.raises(KeyboardInterrupt):
+        Interrupted.execute({})
+    assert tracing.root_span is None
+    trace, = traces()
+    root = [e for e in trace['traceEvents'] if e['name'] == 'Interrupted'][0]
+    assert root['args']['outcome'] == 'interrupted'
+    assert root['args']['exception'] == 'KeyboardInterrupt'
+    assert 'perform' in [e['name'] for e in trace['traceEvents']]
+    assert trace['otherData']['wait_s'] == pytest.approx(0.05, abs=0.03)
+
+
+def test_interrupted_wait_is_closed(traces):
+    with pytest.raises(KeyboardInterrupt):
+        InterruptedWait.execute({})
+    trace, = traces()
+    wait = [e for e in trace['traceEvents'] if e['name'] == 'waitFor forever'][0]
+    assert wait['args']['outcome'] == 'interrupted'
+    assert wait['args']['exception'] == 'KeyboardInterrupt'
+    assert tracing.current_span.get() is None